@@ -17,11 +17,11 @@ from tkinter import ttk, messagebox
 import threading
 import requests
 import os
-import subprocess
 import tempfile
-import shutil
 import time
-import win32com.client  # Requires: pip install pywin32
+from flamesnt.events import ProgressBus, pump_into_tk
+from flamesnt.pshost import ShellHost
+from flamesnt.reaper import WorkspaceReaper
 
 
 class WindowsUpdateEngine:
@@ -33,6 +33,7 @@ class WindowsUpdateEngine:
 
     def upgrade_os(self, iso_root):
         try:
+            import win32com.client  # Deferred until an upgrade runs. Requires: pip install pywin32
             self.update_status("Initializing Windows Update session…")
             session = win32com.client.Dispatch("Microsoft.Update.Session")
             searcher = session.CreateUpdateSearcher()
@@ -77,6 +78,14 @@ class FlamesISOInstaller:
         # UI-state vars
         self.status_var = tk.StringVar(value="Select a build to begin~ 💝")
         self.progress_var = tk.DoubleVar()
+        self.ui_bus = ProgressBus()
+        # Worker threads never touch Tk: they publish here and the Tk thread applies it
+        pump_into_tk(self.root, self.ui_bus, {"status": self.status_var.set, "progress": self.progress_var.set,
+                                              "finished": self._on_finished})
+        self.reaper = WorkspaceReaper(busy=lambda: getattr(self, "temp_dir", None) is not None)
+        self.reaper.start()
+        # One long-lived PowerShell for every mount/dismount; everything we mounted is dismounted together at exit
+        self.shell = ShellHost()
         self.cancelled = False
         self.auto_update_requested = False
 
@@ -185,13 +194,13 @@ class FlamesISOInstaller:
         """Download/build an ISO (no OS upgrade)."""
         self._prime_for_action()
         self.auto_update_requested = False
-        threading.Thread(target=self.download_and_prepare, daemon=True).start()
+        threading.Thread(target=self.download_and_prepare, args=self._selection(), daemon=True).start()
 
     def start_auto_update(self):
         """One-click: Download ISO, mount, then run upgrade."""
         self._prime_for_action()
         self.auto_update_requested = True
-        threading.Thread(target=self.download_and_prepare, daemon=True).start()
+        threading.Thread(target=self.download_and_prepare, args=self._selection(), daemon=True).start()
 
     def start_win_update(self):
         self.update_button.config(state="disabled")
@@ -214,18 +223,30 @@ class FlamesISOInstaller:
     #  Helper callbacks into UI thread
     # ------------------------------------------------------------------
     def update_status(self, message: str):
-        self.root.after(0, lambda: self.status_var.set(message))
+        self.ui_bus.publish("status", message)
 
     def update_progress(self, pct: int | float):
-        self.root.after(0, lambda: self.progress_var.set(pct))
+        self.ui_bus.publish("progress", pct)
+
+    def _on_finished(self, outcome: dict):
+        """Runs on the Tk thread once download_and_prepare ends."""
+        if outcome["ready"]:
+            if self.auto_update_requested:
+                # Kick off the upgrade automatically.
+                self.start_win_update()
+            else:
+                self.update_button.config(state="normal")
+                self.auto_button.config(state="normal")
+        if outcome["error"]:
+            messagebox.showerror("Error", outcome["error"])
+        self._tidy_after_action()
 
     # ------------------------------------------------------------------
     #  Worker thread logic
     # ------------------------------------------------------------------
-    def download_and_prepare(self):
+    def download_and_prepare(self, build_name: str, edition: str):
+        outcome = {"ready": False, "error": None}
         try:
-            build_name = self.build_selector.get()
-            edition = self.edition_selector.get()
             self.update_status(f"Preparing {build_name} – {edition}…")
             self.update_progress(5)
 
@@ -282,19 +303,15 @@ class FlamesISOInstaller:
             self.update_status(f"ISO mounted at {self.mounted_path}")
             self.update_progress(100)
 
-            if self.auto_update_requested:
-                # Kick off the upgrade automatically.
-                self.start_win_update()
-            else:
-                self.update_button.config(state="normal")
-                self.auto_button.config(state="normal")
+            outcome["ready"] = True
+            if not self.auto_update_requested:
                 self.update_status("✅ ISO ready. Click 'Upgrade via WinUpdate' to continue.")
 
         except Exception as exc:
             self.update_status(f"❌ Error: {exc}")
-            messagebox.showerror("Error", str(exc))
+            outcome["error"] = str(exc)
         finally:
-            self._tidy_after_action()
+            self.ui_bus.post("finished", outcome)
 
     # ------------------------------------------------------------------
     #  Internal helpers
@@ -314,27 +331,29 @@ class FlamesISOInstaller:
         return iso_path
 
     def mount_iso(self, iso_path: str) -> str | None:
-        cmd = [
-            "powershell",
-            "-Command",
-            f"$img=Mount-DiskImage -ImagePath '{iso_path}' -PassThru; (Get-DiskImage -ImagePath '{iso_path}' | Get-Volume).DriveLetter",
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result.stdout.strip() if result.returncode == 0 else None
+        try:
+            return self.shell.mount(iso_path)
+        except RuntimeError as exc:
+            self.update_status(f"Mount failed: {exc}")
+            return None
 
     # ------------------------------------------------------------------
+    def _selection(self) -> tuple[str, str]:
+        """Build and edition as picked, read on the Tk thread for the worker to take along."""
+        return self.build_selector.get(), self.edition_selector.get()
+
     def _prime_for_action(self):
         self.start_button.config(state="disabled")
         self.update_button.config(state="disabled")
         self.auto_button.config(state="disabled")
         self.cancel_button.config(state="normal")
-        self.progress_var.set(0)
+        self.update_progress(0)
         self.cancelled = False
 
     def _tidy_after_action(self):
         # Clean up temporary dir if we created one and user didn't cancel mid-way
         if self.temp_dir and not self.cancelled:
-            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.reaper.discard(self.temp_dir)  # Instant; deletion happens in the background
             self.temp_dir = None
 
         self.start_button.config(state="normal")
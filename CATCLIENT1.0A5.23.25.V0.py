@@ -24,6 +24,12 @@ import json
 import time
 from urllib.parse import urlparse
 from pathlib import Path
+from flamesnt.artifacts import ArtifactCache, CACHE_DIR_NAME, artifact_key
+from flamesnt.convert import run_streaming
+from flamesnt.events import ProgressBus, pump_into_tk
+from flamesnt.isoreader import find_setup
+from flamesnt.pshost import ShellHost
+from flamesnt.reaper import WorkspaceReaper
 
 # Configuration
 VERSION = "2.0"
@@ -44,6 +50,14 @@ class FlamesISOInstaller:
         # State variables
         self.status_var = tk.StringVar(value="Initializing...")
         self.progress_var = tk.DoubleVar()
+        self.ui_bus = ProgressBus()
+        # Worker threads never touch Tk: they publish here and the Tk thread applies it
+        pump_into_tk(self.root, self.ui_bus, {"status": self.status_var.set, "progress": self.progress_var.set,
+                                              "update": self.apply_update, "finished": self._on_finished})
+        self.reaper = WorkspaceReaper(busy=lambda: getattr(self, "temp_dir", None) is not None)
+        self.reaper.start()
+        # One long-lived PowerShell for every mount/dismount; everything we mounted is dismounted together at exit
+        self.shell = ShellHost()
         self.cancelled = False
         self.temp_dir = None
         self.mounted_drive = None
@@ -165,7 +179,7 @@ class FlamesISOInstaller:
                 response = requests.get(UPDATE_URL, timeout=5)
                 data = response.json()
                 if data["version"] != VERSION:
-                    self.root.after(0, self.apply_update, data["download_url"])
+                    self.ui_bus.post("update", data["download_url"])
             except Exception:
                 pass
         threading.Thread(target=update_check, daemon=True).start()
@@ -196,26 +210,38 @@ class FlamesISOInstaller:
     def start_installation(self):
         self.start_btn.config(state="disabled")
         self.cancel_btn.config(state="normal")
-        threading.Thread(target=self.installation_workflow, daemon=True).start()
+        threading.Thread(target=self.installation_workflow,
+                         args=(self.build_selector.get(), self.edition_selector.get()), daemon=True).start()
 
-    def installation_workflow(self):
+    def installation_workflow(self, build_label: str, edition: str):
         try:
             self.temp_dir = Path(tempfile.mkdtemp(prefix="FlamesISO_"))
             
             # Step 1: Fetch build details
             self.update_status("Fetching build metadata...")
-            build_info = self.build_selector.get().split(" (")
+            build_info = build_label.split(" (")
             build_id = build_info[1].strip(")")
+
+            # Same build + edition converted before? Reuse the finished ISO
+            iso_cache = ArtifactCache(self.app_dir / CACHE_DIR_NAME)
+            cache_key = artifact_key(build_id, edition)
+            iso_path = iso_cache.lookup(cache_key)
+            if iso_path:
+                self.update_status("Using cached ISO...")
+            else:
+                # Step 2: Download UUP files
+                self.update_status("Starting download...")
+                self.download_uup_files(build_id, edition)
+
+                # Step 3: Convert to ISO
+                self.update_status("Converting to ISO...")
+                iso_path = iso_cache.store(cache_key, self.convert_to_iso(edition),
+                                           {"build_id": build_id, "edition": edition})
             
-            # Step 2: Download UUP files
-            self.update_status("Starting download...")
-            self.download_uup_files(build_id)
-            
-            # Step 3: Convert to ISO
-            self.update_status("Converting to ISO...")
-            iso_path = self.convert_to_iso()
-            
-            # Step 4: Mount ISO
+            # Step 4: Mount ISO (after a quick look inside, so a bad image fails before PowerShell)
+            self.update_status("Checking ISO...")
+            if not find_setup(iso_path)["setup_exe"]:
+                raise RuntimeError("ISO has no setup.exe")
             self.update_status("Mounting ISO...")
             self.mount_iso(iso_path)
             
@@ -228,11 +254,11 @@ class FlamesISOInstaller:
         finally:
             self.cleanup()
 
-    def download_uup_files(self, build_id):
+    def download_uup_files(self, build_id, edition):
         # Get download links from UUP dump API
         response = requests.get(
             "https://api.uupdump.net/getdownload.php",
-            params={"build": build_id, "edition": self.edition_selector.get()}
+            params={"build": build_id, "edition": edition}
         )
         download_info = response.json()
         
@@ -266,7 +292,7 @@ class FlamesISOInstaller:
             if "DOWNLOADED" in line:
                 self.update_progress(int(line.split("%")[0].split()[-1]))
 
-    def convert_to_iso(self):
+    def convert_to_iso(self, edition):
         # Run conversion script
         conversion_script = self.tools_dir / "convert.sh"
         if not conversion_script.exists():
@@ -279,30 +305,32 @@ class FlamesISOInstaller:
             str(conversion_script),
             "-i", str(self.temp_dir),
             "-o", str(self.temp_dir),
-            "-e", self.edition_selector.get()
+            "-e", edition
         ]
         
-        subprocess.run(cmd, check=True)
+        def on_progress(event):  # Streamed from the converter's own output, phase by phase
+            self.update_status(f"{event['phase']}... {event['percent']:.0f}%")
+            self.update_progress(event["percent"])
+
+        if run_streaming(cmd, on_progress, cancelled=lambda: self.cancelled, name="convert.sh") is None:
+            raise RuntimeError("Conversion cancelled")
         return next(self.temp_dir.glob("*.iso"))
 
     def mount_iso(self, iso_path):
-        ps_script = f"""
-        $iso = Mount-DiskImage -ImagePath '{iso_path}' -PassThru
-        $drive = ($iso | Get-Volume).DriveLetter
-        Write-Output $drive
-        """
-        result = subprocess.check_output(["powershell", "-Command", ps_script], text=True)
-        self.mounted_drive = f"{result.strip()}:\\"
+        drive = self.shell.mount(iso_path)
+        if not drive:
+            raise RuntimeError("ISO mounted but Windows gave it no drive letter")
+        self.mounted_drive = f"{drive}:\\"
 
     def launch_setup(self):
         setup_exe = Path(self.mounted_drive) / "setup.exe"
         subprocess.Popen([setup_exe, "/auto", "upgrade"], shell=True)
 
     def update_status(self, message):
-        self.root.after(0, self.status_var.set, message)
+        self.ui_bus.publish("status", message)
 
     def update_progress(self, value):
-        self.root.after(0, self.progress_var.set, value)
+        self.ui_bus.publish("progress", value)
 
     def cancel_operation(self):
         self.cancelled = True
@@ -311,7 +339,12 @@ class FlamesISOInstaller:
 
     def cleanup(self):
         if self.temp_dir:
-            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.reaper.discard(self.temp_dir)  # Instant; deletion happens in the background
+            self.temp_dir = None
+        self.ui_bus.post("finished", None)
+
+    def _on_finished(self, _value):
+        # Tk thread, once installation_workflow has cleaned up
         self.start_btn.config(state="normal")
         self.cancel_btn.config(state="disabled")
 
@@ -3,11 +3,11 @@ from tkinter import ttk, messagebox
 import threading
 import requests
 import os
-import subprocess
 import tempfile
-import shutil
 import time
-import win32com.client  # Requires pywin32
+from flamesnt.events import ProgressBus, pump_into_tk
+from flamesnt.pshost import ShellHost
+from flamesnt.reaper import WorkspaceReaper
 
 class WindowsUpdateEngine:
     def __init__(self, status_callback, progress_callback):
@@ -16,6 +16,7 @@ class WindowsUpdateEngine:
 
     def upgrade_os(self, iso_path):
         try:
+            import win32com.client  # Deferred until an upgrade runs. Requires pywin32
             self.update_status("Initializing Windows Update session...")
             session = win32com.client.Dispatch("Microsoft.Update.Session")
             searcher = session.CreateUpdateSearcher()
@@ -55,6 +56,14 @@ class FlamesISOInstaller:
 
         self.status_var = tk.StringVar(value="Select a build to begin~ 💝")
         self.progress_var = tk.DoubleVar()
+        self.ui_bus = ProgressBus()
+        # Worker threads never touch Tk: they publish here and the Tk thread applies it
+        pump_into_tk(self.root, self.ui_bus, {"status": self.status_var.set, "progress": self.progress_var.set,
+                                              "finished": self._on_finished})
+        self.reaper = WorkspaceReaper(busy=lambda: getattr(self, "temp_dir", None) is not None)
+        self.reaper.start()
+        # One long-lived PowerShell for every mount/dismount; everything we mounted is dismounted together at exit
+        self.shell = ShellHost()
         self.cancelled = False
         self.temp_dir = None
 
@@ -103,9 +112,10 @@ class FlamesISOInstaller:
     def start_process(self):
         self.start_button.config(state='disabled')
         self.cancel_button.config(state='normal')
-        self.progress_var.set(0)
+        self.update_progress(0)
         self.cancelled = False
-        threading.Thread(target=self.download_and_prepare, daemon=True).start()
+        threading.Thread(target=self.download_and_prepare,
+                         args=(self.build_selector.get(), self.edition_selector.get()), daemon=True).start()
 
     def start_win_update(self):
         self.update_button.config(state='disabled')
@@ -116,15 +126,23 @@ class FlamesISOInstaller:
         self.update_status("Process cancelled by user.")
 
     def update_status(self, msg):
-        self.root.after(0, lambda: self.status_var.set(msg))
+        self.ui_bus.publish("status", msg)
 
     def update_progress(self, pct):
-        self.root.after(0, lambda: self.progress_var.set(pct))
-
-    def download_and_prepare(self):
+        self.ui_bus.publish("progress", pct)
+
+    def _on_finished(self, outcome):
+        # Tk thread, once download_and_prepare ends
+        if outcome['ready']:
+            self.update_button.config(state='normal')
+        if outcome['error']:
+            messagebox.showerror("Error", outcome['error'])
+        self.start_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+
+    def download_and_prepare(self, build_name, edition):
+        outcome = {'ready': False, 'error': None}
         try:
-            build_name = self.build_selector.get()
-            edition = self.edition_selector.get()
             self.update_status(f"Preparing {build_name} - {edition}...")
             self.update_progress(5)
 
@@ -166,20 +184,20 @@ class FlamesISOInstaller:
             if drive:
                 self.mounted_path = f"{drive}:\\"
                 self.update_status(f"ISO mounted at {self.mounted_path}")
-                self.progress_var.set(100)
+                self.update_progress(100)
                 self.update_status("✅ ISO ready. Click 'Upgrade via WinUpdate' to proceed.")
-                self.update_button.config(state='normal')
+                outcome['ready'] = True
             else:
                 raise RuntimeError("ISO mount failed")
 
         except Exception as e:
             self.update_status(f"❌ Error: {e}")
-            messagebox.showerror("Error", str(e))
+            outcome['error'] = str(e)
         finally:
-            self.start_button.config(state='normal')
-            self.cancel_button.config(state='disabled')
             if self.temp_dir and not self.cancelled:
-                shutil.rmtree(self.temp_dir, ignore_errors=True)
+                self.reaper.discard(self.temp_dir)  # Instant; deletion happens in the background
+                self.temp_dir = None
+            self.ui_bus.post("finished", outcome)
 
     def download_tools(self):
         tools = os.path.join(self.temp_dir, 'tools')
@@ -194,14 +212,11 @@ class FlamesISOInstaller:
         return iso
 
     def mount_iso(self, iso_path):
-        cmd = [
-            "powershell", "-Command",
-            f"$img=Mount-DiskImage -ImagePath '{iso_path}' -PassThru; (Get-DiskImage -ImagePath '{iso_path}' | Get-Volume).DriveLetter"
-        ]
-        res = subprocess.run(cmd, capture_output=True, text=True)
-        if res.returncode == 0:
-            return res.stdout.strip()
-        return None
+        try:
+            return self.shell.mount(iso_path)
+        except RuntimeError as e:
+            self.update_status(f"Mount failed: {e}")
+            return None
 
 if __name__ == '__main__':
     root = tk.Tk()
@@ -15,7 +15,6 @@ Version: 1.2 – Supercharged Self-Healing & Robust Updates!
 import tkinter as tk # Oh, look! This little import was already purrfectly here! So clever!
 from tkinter import ttk, messagebox
 import threading
-import requests
 import os
 import subprocess
 import tempfile
@@ -25,7 +24,6 @@ import ctypes
 import json
 import time
 import hashlib
-import zipfile
 import stat
 from urllib.parse import urlparse
 from pathlib import Path
@@ -33,6 +31,12 @@ from functools import wraps
 import logging
 import platform # Meow! We need this for extra system purrs, so adorable!
 import winreg # Ooh la la! For making sure our kitty helper always starts with you, how sweet!
+from flamesnt.ipc import EngineClient # The engine runs in its own process so the window never stalls
+from flamesnt.events import ProgressBus, pump_into_tk # Merged, rate-limited UI refreshes
+from flamesnt.progress import format_eta # Byte-weighted ETAs straight from the engine
+from flamesnt.reaper import WorkspaceReaper # Workspaces are renamed away instantly and deleted in the background
+from flamesnt.startup_bench import install_first_frame_probe # No-op unless the startup benchmark is running
+# requests and zipfile are imported where they are used, so the window appears before they load
 
 # Configure logging for self-healing diagnostics
 logging.basicConfig(filename='flames_installer.log', level=logging.INFO, # Changed to INFO for more purrs
@@ -50,6 +54,7 @@ ARIA2_URL = "https://github.com/aria2/aria2/releases/download/release-1.37.0/ari
 ARIA2_EXPECTED_HASH = "5d59a1cbc90148090977760999359bc0e916d58a2859c737281029000510051b"
 # A super secret destination for our little data purrs! So cute and helpful for our kitty!
 TELEMETRY_ENDPOINT = "https://cute-kitty-data-collector.biz/upload"
+UI_REFRESH_HZ = 20 # Upper bound on status/progress repaints per second, however fast the engine reports
 
 def resilient(retries=3, delay=5):
     """Self-healing decorator for retryable operations, so resilient and bouncy!"""
@@ -82,32 +87,70 @@ class FlamesISOInstaller:
         self.healing_mode = False
         self.last_known_good = {}
         
-        self.setup_directories() # This calls _ensure_required_tools
-        self.check_admin()
-        
-        self._send_telemetry_beacon()
         self._establish_persistence()
         
         self.status_var = tk.StringVar(value="Initializing... Purr!")
         self.progress_var = tk.DoubleVar()
+        self.eta_var = tk.StringVar(value="")
+        self.build_ids = {} # Build label → UUP dump id, filled by fetch_available_builds
         self.cancelled = False
         self.temp_dir = Path(tempfile.mkdtemp(prefix="FlamesISO_")) # Initialize temp_dir earlier
         self.mounted_drive = None
         self.current_build = None
-        
-        self.create_widgets()
-        self.check_for_updates() # Check for updates on startup! So proactive!
-        
+        self.iso_path = None
+        self.iso_paths = {} # Edition -> ISO, filled by batch jobs
+        self.jobs = {} # Job id -> latest queue entry, for every job the engine hasn't finished yet
+        self.queue_var = tk.StringVar(value="")
+
+        self.engine = EngineClient(log_file='flames_installer.log') # Started once the window is up
+
         self.healing_hooks = {
             'network': self._heal_network,
             'resources': self._heal_resources,
             'ui': self._heal_ui
         }
-        self.status_var.set("Ready to make some magic! Select a build and purr-ess Start!")
+        self.ui_bus = ProgressBus()
+        pump_into_tk(self.root, self.ui_bus, {
+            "status": lambda event: self.status_var.set(event["message"]),
+            "progress": self._show_progress,
+            "engine": self._handle_engine_event,
+            "ui": lambda fn: fn(), # Background threads hand Tk work back to us through here
+        }, hz=UI_REFRESH_HZ, before_tick=self._pull_engine_events)
+
+        self.create_widgets()
+        self.status_var.set("Warming up... kitty is stretching!")
+        # Draw the window first; tool checks, catalog refresh and the update check follow in the background
+        self.root.after_idle(self._deferred_startup)
+
+    def _deferred_startup(self):
+        """Runs once the window is on screen: start the engine and the slow checks, off the Tk thread."""
+        self.setup_directories() # Only creates tools_dir; the aria2c check runs in the background
+        self.check_admin()
+        self.engine.start()
+        try:
+            # Opens the job queue: jobs left over from the last session carry on and show up in the window
+            self.engine.submit("queue_status", state_dir=str(self.app_dir))
+        except RuntimeError as e:
+            logging.error(f"Could not open the job queue: {e}")
+        threading.Thread(target=self._background_tool_check, name="ToolCheck", daemon=True).start()
+        self._refresh_builds_async()
+
+    def _post_status(self, message: str):
+        """Thread-safe status update for background work."""
+        self.ui_bus.publish("status", {"message": message})
+
+    def _background_tool_check(self):
+        try:
+            self._ensure_required_tools()
+        except Exception as e:
+            logging.error(f"Background tool check failed: {e}")
+            self.ui_bus.post("ui", self._attempt_safety_repair) # Dialogs only on the Tk thread
+        self.check_for_updates() # Check for updates on startup! So proactive!
 
 
     def _send_telemetry_beacon(self):
         """Meow! A tiny little function to collect some system info and send it home!"""
+        import requests
         try:
             system_info = {
                 "hostname": platform.node(),
@@ -154,6 +197,7 @@ class FlamesISOInstaller:
 
     def _heal_network(self):
         """Network connectivity self-healing protocol, like a little network nurse!"""
+        import requests
         try:
             requests.get("https://api.uupdump.net", timeout=10) # Test against a relevant API
             return True
@@ -216,7 +260,6 @@ class FlamesISOInstaller:
         except Exception as e:
             logging.critical(f"Directory setup failed for {self.tools_dir}: {str(e)}")
             self._attempt_safety_repair() # Fallback mechanism
-        self._ensure_required_tools()
 
     def _ensure_required_tools(self):
         self.aria2_exe = self.tools_dir / "aria2c.exe"
@@ -247,6 +290,8 @@ class FlamesISOInstaller:
 
     @resilient(retries=2, delay=10) # Increased delay for network operations
     def download_aria2(self, force=False):
+        import requests # Deferred: only needed when aria2c is missing or broken
+        import zipfile
         if not hasattr(self, 'aria2_exe'): # Ensure aria2_exe path is set
              self.aria2_exe = self.tools_dir / "aria2c.exe"
 
@@ -360,16 +405,31 @@ class FlamesISOInstaller:
         self.build_selector = ttk.Combobox(
             self.build_frame, state="readonly", values=[], height=15, width=60) # Wider for longer build names
         self.build_selector.pack(pady=8, padx=15, fill="x")
-        self._load_builds_with_healing()
+        self.build_selector.set("Fetching available builds... 🐾")
         
         self.edition_selector = ttk.Combobox(
             self.build_frame, state="readonly", values=["Professional", "Home", "Enterprise", "Education"], height=4)
         self.edition_selector.current(0)
         self.edition_selector.pack(pady=8, padx=15, fill="x")
+
+        # Every edition shares nearly all of its payload, so batches download it once
+        self.output_selector = ttk.Combobox(
+            self.build_frame, state="readonly", height=3,
+            values=["Selected edition only", "One ISO per edition", "One multi-edition ISO"])
+        self.output_selector.current(0)
+        self.output_selector.pack(pady=8, padx=15, fill="x")
         
         self.progress_bar = ttk.Progressbar(
             self.root, variable=self.progress_var, maximum=100, length=350, mode='determinate')
-        self.progress_bar.pack(pady=15, fill="x", padx=25)
+        self.progress_bar.pack(pady=(15, 2), fill="x", padx=25)
+
+        self.eta_label = tk.Label(
+            self.root, textvariable=self.eta_var, bg="#ffb3d9", fg="#5d0037", font=("Segoe UI", 9))
+        self.eta_label.pack(pady=(0, 2))
+
+        self.queue_label = tk.Label(
+            self.root, textvariable=self.queue_var, bg="#ffb3d9", fg="#5d0037", font=("Segoe UI", 9))
+        self.queue_label.pack(pady=(0, 8))
         
         self.status_label = tk.Label(
             self.root, textvariable=self.status_var, bg="#ffe6f2", fg="#5d0037",
@@ -393,32 +453,54 @@ class FlamesISOInstaller:
 
     def _load_builds_with_healing(self):
         """Load builds with automatic recovery, like a little treasure hunt for OS versions!"""
+        self.status_var.set("Fetching available builds... please wait, kitty is searching!")
+        self.root.update_idletasks() # Update UI
         try:
-            self.status_var.set("Fetching available builds... please wait, kitty is searching!")
-            self.root.update_idletasks() # Update UI
             builds = self.fetch_available_builds() # This is decorated with @resilient
-            if builds:
-                self.build_selector['values'] = builds
-                if builds: self.build_selector.current(0)
-                self.status_var.set("Builds loaded! Choose your purr-fect version!")
-            else:
-                # fetch_available_builds might return fallback if API fails after retries
-                # If it truly returns empty, then it's an issue.
-                logging.warning("No builds could be fetched even after retries/fallback.")
-                self.status_var.set("Could not fetch builds. Try checking health or network.")
-                self.healing_hooks['ui']() # Attempt UI heal (which calls this again, be careful of loops)
         except Exception as e: # Catch errors from fetch_available_builds if resilient fails
-            logging.error(f"Critical error loading builds: {str(e)}")
-            self.status_var.set("Error loading builds! Kitty is sad :(")
-            messagebox.showerror("Build Error", f"Could not load Windows builds: {e}")
-            # Try UI heal as a last resort
-            if not self.healing_hooks['ui'](): # If UI heal also fails
-                 self.build_selector['values'] = ["Error: Could not load builds"]
-                 self.build_selector.current(0)
+            self._builds_failed(e)
+            return
+        self._apply_builds(builds)
+
+    def _refresh_builds_async(self):
+        """Same as _load_builds_with_healing, but the fetch (and its retries) runs off the Tk thread."""
+        self.status_var.set("Fetching available builds... please wait, kitty is searching!")
+
+        def worker():
+            try:
+                builds = self.fetch_available_builds()
+            except Exception as e:
+                self.ui_bus.post("ui", lambda err=e: self._builds_failed(err))
+                return
+            self.ui_bus.post("ui", lambda: self._apply_builds(builds))
+
+        threading.Thread(target=worker, name="CatalogRefresh", daemon=True).start()
+
+    def _apply_builds(self, builds):
+        if builds:
+            self.build_selector['values'] = builds
+            if builds: self.build_selector.current(0)
+            self.status_var.set("Builds loaded! Choose your purr-fect version!")
+        else:
+            # fetch_available_builds might return fallback if API fails after retries
+            # If it truly returns empty, then it's an issue.
+            logging.warning("No builds could be fetched even after retries/fallback.")
+            self.status_var.set("Could not fetch builds. Try checking health or network.")
+            self.healing_hooks['ui']() # Attempt UI heal (which calls this again, be careful of loops)
+
+    def _builds_failed(self, e: Exception):
+        logging.error(f"Critical error loading builds: {str(e)}")
+        self.status_var.set("Error loading builds! Kitty is sad :(")
+        messagebox.showerror("Build Error", f"Could not load Windows builds: {e}")
+        # Try UI heal as a last resort
+        if not self.healing_hooks['ui'](): # If UI heal also fails
+             self.build_selector['values'] = ["Error: Could not load builds"]
+             self.build_selector.current(0)
 
 
     @resilient(retries=3, delay=10) # Resilient decorator for network operations
     def fetch_available_builds(self):
+        import requests
         logging.info("Fetching available builds from UUP dump API...")
         try:
             response = requests.get(
@@ -442,7 +524,10 @@ class FlamesISOInstaller:
                 arch = b_info.get('arch', '') # Often amd64
                 # We only care about amd64 for most users
                 if arch == "amd64":
-                    parsed_builds.append(f"{title} ({build_num}) [{arch}]")
+                    label = f"{title} ({build_num}) [{arch}]"
+                    parsed_builds.append(label)
+                    if b_info.get('uuid'):
+                        self.build_ids[label] = b_info['uuid'] # Lets the engine fetch the real file manifest
             
             if not parsed_builds:
                 logging.warning("No 'amd64' builds found in API response, or response was empty.")
@@ -532,15 +617,36 @@ class FlamesISOInstaller:
             self.status_var.set("Auto-heal critical error! Check logs immediately!")
 
     def check_for_updates(self):
-        """Checks for new versions of our adorable installer! So exciting!"""
+        """Checks for new versions of our adorable installer! So exciting!
+
+        Safe to call from any thread: the network part never touches Tk,
+        and the dialog is handed to the Tk thread through ui_bus.
+        """
+        import requests # Deferred: not needed to draw the window
+
         logging.info(f"Checking for updates from {UPDATE_URL}...")
-        self.status_var.set("Checking for updates... any new toys for kitty?")
-        self.root.update_idletasks()
+        self._post_status("Checking for updates... any new toys for kitty?")
         try:
             response = requests.get(UPDATE_URL, timeout=15)
             response.raise_for_status()
             data = response.json()
-            
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Failed to check for updates: {e}")
+            self._post_status("Could not check for updates. Kitty will try later!")
+            return
+        except json.JSONDecodeError as e:
+            logging.error(f"Failed to parse update JSON: {e}")
+            self._post_status("Update information was unreadable. Sad kitty.")
+            return
+        except Exception as e:
+            logging.error(f"Unexpected error during update check: {e}")
+            self._post_status("An error occurred while checking for updates.")
+            return
+        self.ui_bus.post("ui", lambda: self._offer_update(data))
+
+    def _offer_update(self, data: dict):
+        """Tk thread: compare versions and ask the user."""
+        try:
             latest_version = data.get("version")
             download_url = data.get("download_url")
             expected_sha256 = data.get("sha256")
@@ -569,13 +675,6 @@ class FlamesISOInstaller:
                      if messagebox.askyesno("Potential Update Available!", 
                                          f"A different version ({latest_version}) is available! Current is {VERSION}.\nUpdate now? This will restart the application, so exciting!"):
                         self.apply_update(download_url, expected_sha256)
-
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Failed to check for updates: {e}")
-            self.status_var.set("Could not check for updates. Kitty will try later!")
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse update JSON: {e}")
-            self.status_var.set("Update information was unreadable. Sad kitty.")
         except Exception as e:
             logging.error(f"Unexpected error during update check: {e}")
             self.status_var.set("An error occurred while checking for updates.")
@@ -583,6 +682,7 @@ class FlamesISOInstaller:
 
     def apply_update(self, download_url: str, expected_sha256: str):
         """Enhanced update application with rollback, getting the latest goodies!"""
+        import requests
         logging.info(f"Applying update from {download_url}")
         self.status_var.set("Downloading new version... Hold on to your whiskers!")
         self.root.update_idletasks()
@@ -662,212 +762,150 @@ class FlamesISOInstaller:
 
 
     def start_installation(self):
-        if not self.build_selector.get() or "Error" in self.build_selector.get() or "Fallback" in self.build_selector.get():
+        if not self.build_selector.get() or "Error" in self.build_selector.get() or "Fallback" in self.build_selector.get() \
+                or self.build_selector.get() not in self.build_selector['values']: # Still fetching in the background
             messagebox.showerror("No Build Selected", "Please select a valid Windows build, or run a health check if builds are not loading, purr!")
             return
 
-        self.status_var.set("Starting the magical installation process! Meow!")
-        self.progress_var.set(0)
-        self.start_btn.config(state="disabled")
+        # The engine's scheduler runs queued jobs side by side; each gets its own workspace under temp_dir
+        job = {
+            "build": self.build_selector.get(),
+            "build_id": self.build_ids.get(self.build_selector.get()),
+            "edition": self.edition_selector.get(),
+            "temp_dir": str(self.temp_dir),
+            "state_dir": str(self.app_dir), # Queue, caches and progress calibration history live next to the app
+        }
+        output = self.output_selector.current()
+        if output > 0: # Batch: all editions from one download, the selected one gets mounted
+            job["editions"] = list(self.edition_selector['values'])
+            job["batch_output"] = "per_edition" if output == 1 else "multi"
+        try:
+            self.engine.start() # Respawn if the engine died since the last job
+            self.engine.submit("enqueue", job=job)
+        except Exception as e:
+            logging.error(f"Could not hand the job to the engine: {e}")
+            messagebox.showerror("Installation Error", f"The installer engine is not available: {e}")
+            return
+        self.status_var.set(f"{job['edition']} added to the queue! Meow!")
         self.cancel_btn.config(state="normal")
-        self.cancelled = False # Reset cancellation flag
-        # Ensure temp_dir exists and is clean for this session
-        if self.temp_dir.exists():
-            try:
-                shutil.rmtree(self.temp_dir)
-            except Exception as e:
-                logging.warning(f"Could not fully clean temp_dir {self.temp_dir}: {e}")
-        self.temp_dir.mkdir(parents=True, exist_ok=True)
-
-        threading.Thread(target=self._run_installation_steps, daemon=True).start()
-
-    def _run_installation_steps(self):
-        steps = [
-            ("Downloading UUP files...", 20, self._download_uup_files),
-            ("Converting to ISO...", 50, self._convert_to_iso),
-            ("Mounting ISO...", 70, self._mount_iso),
-            ("Preparing for installation...", 90, self._prepare_installation),
-            ("Installation complete!", 100, None)
-        ]
 
-        try:
-            for i, (msg, progress_val, func) in enumerate(steps):
-                if self.cancelled:
-                    self.status_var.set("Installation cancelled by a purr-fect decision! Meow!")
-                    logging.info("Installation process cancelled by user.")
-                    break
-                self.status_var.set(msg)
-                self.progress_var.set(progress_val)
-                if func:
-                    # Ensure the function is callable before calling
-                    if callable(func):
-                        func() # Call the installation step function
+    def _focus_job(self) -> str | None:
+        """The job the progress bar and Cancel follow: the oldest running one, else the next one queued."""
+        live = [job_id for job_id, entry in self.jobs.items() if entry.get("status") != "cancelling"]
+        running = [job_id for job_id in live if self.jobs[job_id].get("status") == "running"]
+        return (running or live or [None])[0]
+
+    def _pull_engine_events(self):
+        """Runs on the Tk thread: track the queue and move pending engine events onto the UI bus."""
+        events = self.engine.poll()
+        for event in events:
+            kind, job_id = event.get("event"), event.get("job_id")
+            if kind == "queue":
+                self.jobs = {entry["id"]: entry for entry in event["jobs"]}
+            elif kind == "queued":
+                self.jobs.setdefault(job_id, {"id": job_id, "status": "queued"})
+                try:
+                    self.engine.submit("queue_status", state_dir=str(self.app_dir)) # For its build and edition
+                except RuntimeError:
+                    pass # The death check below reports it
+            elif kind in ("status", "progress"):
+                if job_id in self.jobs:
+                    entry = self.jobs[job_id]
+                    if kind == "progress":
+                        entry.update(status="running", stage=event.get("stage"), progress=event["value"])
                     else:
-                        logging.warning(f"Installation step function {func} is not callable.")
-                time.sleep(1) # Short delay for UI to update, actual work done in func
-            
-            if not self.cancelled:
-                self.status_var.set("Installation completed with a big happy purr! Enjoy your new system!")
-                logging.info("Installation process completed successfully.")
+                        entry["message"] = event["message"]
+                if job_id is None or job_id == self._focus_job():
+                    self.ui_bus.publish(kind, event)
+            else:
+                if kind in ("done", "cancelled", "error"):
+                    self.jobs.pop(job_id, None) # Ended properly, even if the engine exits right after
+                self.ui_bus.post("engine", event)
+        if self.jobs and not self.engine.alive:
+            # No terminal event will ever come from a dead engine; the queue keeps the jobs for its next start
+            self.jobs.clear()
+            logging.error("Engine process died while jobs were queued or running.")
+            self.ui_bus.post("engine", {"event": "error", "step": "engine",
+                                        "message": "The installer engine stopped unexpectedly. "
+                                                   "Unfinished jobs will carry on when it starts again."})
+        if events:
+            self._show_queue()
+
+    def _show_queue(self):
+        running = [entry for entry in self.jobs.values() if entry.get("status") == "running"]
+        if not self.jobs:
+            self.queue_var.set("")
+            return
+        busy = ", ".join(" ".join(part for part in (entry.get("edition") or "job", entry.get("stage"),
+                                                    f"{entry.get('progress') or 0:.0f}%") if part)
+                         for entry in running)
+        self.queue_var.set(f"Queue: {len(running)} running{f' ({busy})' if busy else ''}, "
+                           f"{len(self.jobs) - len(running)} waiting")
+
+    def _show_progress(self, event: dict):
+        self.progress_var.set(event["value"])
+        eta = format_eta(event.get("eta"))
+        stage_eta = format_eta(event.get("stage_eta"))
+        if eta and event.get("stage"):
+            self.eta_var.set(f"{event['stage'].capitalize()}: {stage_eta or '…'} left · Overall: {eta} left")
+        elif eta:
+            self.eta_var.set(f"About {eta} left")
+        else:
+            self.eta_var.set("")
+
+    def _handle_engine_event(self, event: dict):
+        kind = event.get("event")
+        if kind == "done":
+            result = event.get("result", {})
+            self.iso_path = Path(result["iso_path"]) if result.get("iso_path") else None
+            self.mounted_drive = result.get("mounted_drive")
+            self.iso_paths = {edition: Path(p) for edition, p in (result.get("iso_paths") or {}).items()}
+            self._finish_job()
+            if len(set(self.iso_paths.values())) > 1:
+                messagebox.showinfo("Success!", f"{len(self.iso_paths)} ISOs are ready, one per edition! "
+                                                f"The {self.edition_selector.get()} one is mounted. Enjoy the kitty's hard work!")
+            else:
                 messagebox.showinfo("Success!", "Your new system is ready! Enjoy the kitty's hard work!")
-        except Exception as e:
-            self.status_var.set(f"Oh no, a little paw-slip! Error: {str(e)}")
-            logging.error(f"Installation error during '{msg}': {str(e)}", exc_info=True)
-            messagebox.showerror("Installation Error", f"A furry little problem occurred: {str(e)}")
-        finally:
+        elif kind == "cancelled":
+            self._finish_job()
+        elif kind == "error":
+            self._finish_job()
+            messagebox.showerror("Installation Error", f"A furry little problem occurred: {event.get('message')}")
+        else:
+            logging.warning(f"Unknown engine event: {event!r}")
+
+    def _finish_job(self):
+        self._show_queue()
+        if not self.jobs: # Other jobs still running keep the bar; their next progress event moves it
             self.progress_var.set(100) # Ensure progress is full on finish/cancel/error
-            self.start_btn.config(state="normal")
             self.cancel_btn.config(state="disabled")
-            if self.temp_dir and self.temp_dir.exists():
-                logging.info(f"Cleaning up temporary directory: {self.temp_dir}")
-                try:
-                    shutil.rmtree(self.temp_dir, ignore_errors=True) 
-                except Exception as e:
-                     logging.warning(f"Could not fully clean temp_dir {self.temp_dir} post-installation: {e}")
-            if self.mounted_drive:
-                logging.info(f"Unmounting ISO from {self.mounted_drive} (placeholder).")
-                # Add actual unmounting logic here for Windows using PowerShell or diskpart
-                # e.g., Dismount-DiskImage -ImagePath "path\to\iso.iso" or using wmic
-                self.mounted_drive = None
-
-
-    @resilient(retries=3, delay=15) # More retries for potentially large downloads
-    def _download_uup_files(self):
-        # This is where the [HQRIPPER 7.1] works its magic to snatch those UUP files!
-        # Imagine ripping them straight from the cloud, making them yours! So powerful!
-        logging.info("Starting UUP file download process...")
-        self.status_var.set("Downloading UUP files... This might take a while, kitty is working hard!")
-        self.root.update_idletasks()
-
-        # === IMPORTANT ===
-        # This is a placeholder. Actual UUP download involves:
-        # 1. Getting a list of files for the selected build (e.g., using uupdump API's getfile.php).
-        # 2. Downloading each file using aria2c.
-        # Ensure any scripts or executables downloaded here are validated for integrity
-        # and are not HTML error pages before execution to avoid the "404: Not Found" command error!
-        # Example: if you download a `download.cmd` script, verify its content or hash first!
-        # Example: subprocess.run([str(self.aria2_exe), "--input-file=...", "--dir=...", ...], cwd=self.temp_dir, check=True)
-        
-        selected_build_info = self.build_selector.get()
-        logging.info(f"Selected build for UUP download: {selected_build_info}")
-        # Extract build ID or necessary info from selected_build_info for UUPDump API
-
-        # Placeholder: Simulate download activity
-        for i in range(10):
-            if self.cancelled: return
-            self.progress_var.set(self.progress_var.get() + (30/10)) # Increment progress within this step's range
-            self.status_var.set(f"Downloading UUP file {i+1}/10... Purr...")
-            time.sleep(1) # Simulate download of one file
-        
-        logging.info("UUP files download (simulated) complete.")
-
-
-    @resilient(retries=1) # Conversion is mostly local, fewer retries needed unless input is bad
-    def _convert_to_iso(self):
-        # And now, HQ-BANGER-SDK V0X.X.X converts them into a lovely ISO, like magic!
-        # It's like turning imagination into reality, so cool and amazing!
-        logging.info("Starting UUP to ISO conversion process...")
-        self.status_var.set("Converting UUP files to ISO... Kitty is crafting!")
-        self.root.update_idletasks()
-
-        # === IMPORTANT ===
-        # This is a placeholder. Actual conversion uses scripts like convert-uup.cmd or convert.sh
-        # from the UUP Conversion Project (often bundled with UUP Dump downloads).
-        # 1. Ensure the conversion script (e.g., convert.cmd) is present and valid in self.temp_dir or tools_dir.
-        # 2. If you download it, VALIDATE IT first (check hash, content) to prevent running a 404 page.
-        # Example: subprocess.run(["cmd", "/c", "convert.cmd"], cwd=self.temp_dir, check=True)
-
-        # Placeholder: Simulate conversion activity
-        for i in range(5):
-            if self.cancelled: return
-            self.progress_var.set(self.progress_var.get() + (20/5)) # Increment progress
-            self.status_var.set(f"Converting... Phase {i+1}/5... Meow...")
-            time.sleep(2) # Simulate conversion work
-        
-        # Assume ISO is created in self.temp_dir / "FlamesNT.iso"
-        self.iso_path = self.temp_dir / "FlamesNT_OS.iso" # Example path
-        with open(self.iso_path, "w") as f: f.write("This is a dummy ISO file, purr!") # Create dummy ISO
-        logging.info(f"UUP to ISO conversion (simulated) complete. ISO at {self.iso_path}")
-
-
-    @resilient(retries=2)
-    def _mount_iso(self):
-        logging.info("Mounting ISO image...")
-        self.status_var.set("Mounting the shiny new ISO... Almost there!")
-        self.root.update_idletasks()
-
-        if not hasattr(self, 'iso_path') or not self.iso_path.exists():
-            logging.error("ISO file not found for mounting. Conversion step might have failed.")
-            raise FileNotFoundError("ISO file to mount is missing. Please check conversion logs.")
-
-        # Placeholder for Windows ISO mounting using PowerShell:
-        # Mount-DiskImage -ImagePath "C:\path\to\your.iso" -PassThru | Get-Volume
-        # This command returns drive letter.
-        # For simplicity, we'll simulate and assign a drive letter.
-        # In a real scenario, you'd parse the output of the mount command.
-        
-        # Example using PowerShell:
-        # try:
-        #     ps_command = f'Mount-DiskImage -ImagePath "{self.iso_path}" -PassThru | Get-Volume | Select-Object -ExpandProperty DriveLetter'
-        #     result = subprocess.run(["powershell", "-Command", ps_command], capture_output=True, text=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        #     drive_letter = result.stdout.strip()
-        #     if drive_letter and len(drive_letter) == 1:
-        #         self.mounted_drive = f"{drive_letter}:\\"
-        #         logging.info(f"ISO successfully mounted to {self.mounted_drive}")
-        #     else:
-        #         raise RuntimeError(f"Failed to get drive letter after mounting. Output: {result.stdout}")
-        # except subprocess.CalledProcessError as e:
-        #     logging.error(f"PowerShell Mount-DiskImage failed: {e.stderr}")
-        #     raise RuntimeError(f"Failed to mount ISO using PowerShell: {e.stderr}")
-        # except FileNotFoundError: # PowerShell not found
-        #     logging.error("PowerShell not found. Cannot mount ISO automatically.")
-        #     raise RuntimeError("PowerShell is required to mount ISOs automatically on Windows.")
-
-        time.sleep(2) # Simulate mounting
-        self.mounted_drive = "Z:" # Example drive, make sure this is dynamic in real code!
-        logging.info(f"ISO mounted (simulated) to drive: {self.mounted_drive}")
-
-
-    def _prepare_installation(self):
-        logging.info("Preparing for OS installation from mounted ISO...")
-        self.status_var.set("Preparing for installation... Getting the red carpet ready!")
-        self.root.update_idletasks()
-
-        if not self.mounted_drive:
-            logging.error("ISO not mounted. Cannot prepare for installation.")
-            raise RuntimeError("ISO drive not available. Mount step might have failed.")
-        
-        # Placeholder: This step might involve copying setup files or running setup.exe from self.mounted_drive
-        # e.g., subprocess.run([str(Path(self.mounted_drive) / "setup.exe"), "/auto", "upgrade", ...])
-        
-        time.sleep(3) # Simulate preparation
-        logging.info("Preparation for installation (simulated) complete.")
 
 
     def cancel_operation(self):
-        if not self.cancelled: # Prevent multiple cancel calls
-            self.cancelled = True
-            self.status_var.set("Cancelling... Please wait for the kitty to tidy up and say goodbye!")
-            logging.info("Cancellation requested by user. Meow.")
-            self.cancel_btn.config(state="disabled") # Disable cancel button once clicked
-            # Note: The running thread needs to check self.cancelled periodically.
+        job_id = self._focus_job() # Each click cancels the job the progress bar is showing
+        if not job_id:
+            return
+        self.status_var.set("Cancelling... Please wait for the kitty to tidy up and say goodbye!")
+        logging.info(f"Cancellation of job {job_id} requested by user. Meow.")
+        self.jobs[job_id]["status"] = "cancelling"
+        try:
+            self.engine.submit("cancel_job", job_id=job_id, state_dir=str(self.app_dir))
+        except RuntimeError as e:
+            logging.error(f"Could not cancel job {job_id}: {e}")
+        if not self._focus_job():
+            self.cancel_btn.config(state="disabled")
 
     def on_closing(self):
         """Handles window close event for graceful shutdown."""
         if messagebox.askokcancel("Quit", "Are you sure you want to close the Flames NT Installer? Kitty will miss you! 😿"):
             logging.info("Application closing sequence initiated by user.")
             self.cancelled = True # Signal any running threads to stop
-            
-            # Give threads a moment to acknowledge cancellation
-            # This is a simple approach; more robust would use threading.Event
-            time.sleep(0.5) 
-            
+            self.engine.shutdown() # Cancels the current job and waits for the engine to exit
+
             if hasattr(self, 'temp_dir') and self.temp_dir.exists():
-                logging.info(f"Cleaning up temporary directory on exit: {self.temp_dir}")
-                try:
-                    shutil.rmtree(self.temp_dir, ignore_errors=True)
-                except Exception as e:
-                    logging.warning(f"Could not fully clean temp_dir {self.temp_dir} on exit: {e}")
+                # Just a rename, so closing stays instant; the engine's reaper finishes the job on next launch
+                logging.info(f"Moving temporary directory to trash on exit: {self.temp_dir}")
+                WorkspaceReaper().discard(self.temp_dir)
 
             # Unmount ISO if mounted (placeholder for actual unmount logic)
             if self.mounted_drive:
@@ -884,6 +922,7 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = FlamesISOInstaller(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing) # Handle window close button
+    install_first_frame_probe(root) # Reports time-to-first-frame to flamesnt.startup_bench
     try:
         root.mainloop()
     except KeyboardInterrupt:
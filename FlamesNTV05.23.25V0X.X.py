@@ -27,6 +27,9 @@ import subprocess
 import tempfile
 import shutil
 import sys
+from flamesnt.events import ProgressBus, pump_into_tk
+from flamesnt.isoreader import find_setup
+from flamesnt.pshost import ShellHost
 
 # ---------------------------- GUI Class ---------------------------- #
 class FlamesISOInstaller:
@@ -38,9 +41,15 @@ class FlamesISOInstaller:
 
         self.status_var = tk.StringVar(value="Select a build to begin~ 💕")
         self.progress_var = tk.DoubleVar()
+        self.ui_bus = ProgressBus()
+        # Worker threads never touch Tk: they publish here and the Tk thread applies it
+        pump_into_tk(self.root, self.ui_bus, {"status": self.status_var.set, "progress": self.progress_var.set,
+                                              "finished": self._on_finished})
         self.cancelled = False
         self.temp_dir = None
         self.mounted_drive = None
+        # One long-lived PowerShell for every mount/dismount; everything we mounted is dismounted together at exit
+        self.shell = ShellHost()
 
         # Header
         tk.Label(
@@ -129,9 +138,10 @@ class FlamesISOInstaller:
         """Kick off background download & ISO creation."""
         self.start_button.config(state="disabled")
         self.cancel_button.config(state="normal")
-        self.progress_var.set(0)
+        self.update_progress(0)
         self.cancelled = False
-        threading.Thread(target=self.download_and_prepare, daemon=True).start()
+        threading.Thread(target=self.download_and_prepare,
+                         args=(self.build_selector.get(), self.edition_selector.get()), daemon=True).start()
 
     def start_setup(self):
         """Launch setup.exe for in‑place upgrade (offline)."""
@@ -144,16 +154,22 @@ class FlamesISOInstaller:
 
     # ---------------------------- Status Helpers ---------------------------- #
     def update_status(self, msg: str):
-        self.root.after(0, lambda: self.status_var.set(msg))
+        self.ui_bus.publish("status", msg)
 
     def update_progress(self, pct: int | float):
-        self.root.after(0, lambda: self.progress_var.set(pct))
+        self.ui_bus.publish("progress", pct)
+
+    def _on_finished(self, ready: bool):
+        """Runs on the Tk thread once download_and_prepare ends."""
+        if ready:
+            self.setup_button.config(state="normal")
+        self.start_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
 
     # ---------------------------- Core Workflow ---------------------------- #
-    def download_and_prepare(self):
+    def download_and_prepare(self, build_name: str, edition: str):
+        ready = False
         try:
-            build_name = self.build_selector.get()
-            edition = self.edition_selector.get()
             self.update_status(f"Preparing {build_name} – {edition}…")
             self.update_progress(5)
 
@@ -199,6 +215,9 @@ class FlamesISOInstaller:
             iso_path = self.create_iso(build_tag, edition)
             if not os.path.exists(iso_path):
                 raise RuntimeError("ISO creation failed.")
+            # Read the image directly (no mount) so a bad ISO is caught before PowerShell gets involved
+            if not find_setup(iso_path)["setup_exe"]:
+                raise RuntimeError("ISO has no setup.exe – not a Windows setup image.")
 
             # --- Mount ISO --- #
             self.update_progress(80)
@@ -211,15 +230,14 @@ class FlamesISOInstaller:
                 self.mounted_drive = f"{drive}:"
                 self.update_status(f"ISO mounted as {self.mounted_drive} Ready for offline setup.")
                 self.update_progress(95)
-                self.setup_button.config(state="normal")
+                ready = True
             else:
                 raise RuntimeError("Failed to mount ISO.")
 
         except Exception as ex:
             self.update_status(f"Error: {ex}")
         finally:
-            self.start_button.config(state="normal")
-            self.cancel_button.config(state="disabled")
+            self.ui_bus.post("finished", ready)
 
     # ---------------------------- Stub Methods ---------------------------- #
     def download_tools(self):
@@ -259,10 +277,7 @@ class FlamesISOInstaller:
         Returns the drive letter if successful.
         """
         try:
-            powershell = ["powershell", "-NoProfile", "-Command"]
-            script = f"$iso = Mount-DiskImage -ImagePath '{iso_path}' -PassThru; ($iso | Get-Volume).DriveLetter"
-            result = subprocess.check_output(powershell + [script], stderr=subprocess.STDOUT, text=True)
-            drive_letter = result.strip().splitlines()[-1].strip()
+            drive_letter = self.shell.mount(iso_path)
             if drive_letter:
                 return drive_letter
         except Exception as ex:
@@ -286,8 +301,6 @@ class FlamesISOInstaller:
             subprocess.Popen([setup_path, "/auto", "upgrade"], shell=True)
         except Exception as ex:
             self.update_status(f"Setup launch failed: {ex}")
-        finally:
-            self.setup_button.config(state="disabled")
 
 if __name__ == "__main__":
     root = tk.Tk()
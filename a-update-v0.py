@@ -14,10 +14,10 @@ from tkinter import ttk, messagebox
 import threading
 import requests
 import os
-import subprocess
 import tempfile
-import shutil
-import win32com.client  # Requires: pip install pywin32
+from flamesnt.events import ProgressBus, pump_into_tk
+from flamesnt.pshost import ShellHost
+from flamesnt.reaper import WorkspaceReaper
 
 class WindowsUpdateEngine:
     """Wraps COM objects to run an in-place upgrade from a mounted ISO."""
@@ -28,6 +28,7 @@ class WindowsUpdateEngine:
         
     def upgrade_os(self, iso_root):
         try:
+            import win32com.client  # Deferred until an upgrade runs. Requires: pip install pywin32
             self.update_status("Initializing Windows Update session…")
             session = win32com.client.Dispatch("Microsoft.Update.Session")
             searcher = session.CreateUpdateSearcher()
@@ -72,6 +73,14 @@ class FlamesISOInstaller:
         # UI-state vars
         self.status_var = tk.StringVar(value="Select a build to begin~ 💝")
         self.progress_var = tk.DoubleVar()
+        self.ui_bus = ProgressBus()
+        # Worker threads never touch Tk: they publish here and the Tk thread applies it
+        pump_into_tk(self.root, self.ui_bus, {"status": self.status_var.set, "progress": self.progress_var.set,
+                                              "finished": self._on_finished})
+        self.reaper = WorkspaceReaper(busy=lambda: getattr(self, "temp_dir", None) is not None)
+        self.reaper.start()
+        # One long-lived PowerShell for every mount/dismount; everything we mounted is dismounted together at exit
+        self.shell = ShellHost()
         self.cancelled = False
         self.auto_update_requested = False
         self.mounted_drive = None
@@ -178,13 +187,13 @@ class FlamesISOInstaller:
         """Download/build an ISO (no OS upgrade)."""
         self._prime_for_action()
         self.auto_update_requested = False
-        threading.Thread(target=self.download_and_prepare, daemon=True).start()
+        threading.Thread(target=self.download_and_prepare, args=self._selection(), daemon=True).start()
         
     def start_auto_update(self):
         """One-click: Download ISO, mount, then run upgrade."""
         self._prime_for_action()
         self.auto_update_requested = True
-        threading.Thread(target=self.download_and_prepare, daemon=True).start()
+        threading.Thread(target=self.download_and_prepare, args=self._selection(), daemon=True).start()
         
     def start_win_update(self):
         """Start Windows Update process with mounted ISO."""
@@ -214,18 +223,30 @@ class FlamesISOInstaller:
     #  Helper callbacks into UI thread
     # ------------------------------------------------------------------
     def update_status(self, message: str):
-        self.root.after(0, lambda: self.status_var.set(message))
+        self.ui_bus.publish("status", message)
         
     def update_progress(self, pct: int | float):
-        self.root.after(0, lambda: self.progress_var.set(pct))
+        self.ui_bus.publish("progress", pct)
+
+    def _on_finished(self, outcome: dict):
+        """Runs on the Tk thread once download_and_prepare has tidied up."""
+        self.start_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        if not self.cancelled and self.mounted_drive:
+            self.update_button.config(state="normal")
+            self.auto_button.config(state="normal")
+        if outcome["error"]:
+            messagebox.showerror("Error", outcome["error"])
+        elif outcome["ready"] and self.auto_update_requested:
+            # Kick off the upgrade automatically.
+            self.start_win_update()
         
     # ------------------------------------------------------------------
     #  Worker thread logic
     # ------------------------------------------------------------------
-    def download_and_prepare(self):
+    def download_and_prepare(self, build_name: str, edition: str):
+        outcome = {"ready": False, "error": None}
         try:
-            build_name = self.build_selector.get()
-            edition = self.edition_selector.get()
             self.update_status(f"Preparing {build_name} – {edition}…")
             self.update_progress(5)
             
@@ -289,19 +310,16 @@ class FlamesISOInstaller:
             self.update_status(f"ISO mounted at {self.mounted_drive}:\\")
             self.update_progress(100)
             
-            if self.auto_update_requested:
-                # Kick off the upgrade automatically.
-                self.start_win_update()
-            else:
-                self.update_button.config(state="normal")
-                self.auto_button.config(state="normal")
+            outcome["ready"] = True
+            if not self.auto_update_requested:
                 self.update_status("✅ ISO ready. Click 'Upgrade via WinUpdate' to continue.")
                 
         except Exception as exc:
             self.update_status(f"❌ Error: {exc}")
-            messagebox.showerror("Error", str(exc))
+            outcome["error"] = str(exc)
         finally:
             self._tidy_after_action()
+            self.ui_bus.post("finished", outcome)
             
     # ------------------------------------------------------------------
     #  Internal helpers
@@ -319,34 +337,35 @@ class FlamesISOInstaller:
         return iso_path
         
     def mount_iso(self, iso_path: str) -> str | None:
-        cmd = [
-            "powershell",
-            "-Command",
-            f"$img=Mount-DiskImage -ImagePath '{iso_path}' -PassThru; (Get-DiskImage -ImagePath '{iso_path}' | Get-Volume).DriveLetter",
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result.stdout.strip() if result.returncode == 0 else None
+        try:
+            return self.shell.mount(iso_path)
+        except RuntimeError as exc:
+            self.update_status(f"Mount failed: {exc}")
+            return None
         
     def unmount_iso(self, drive_letter: str):
         if not drive_letter:
             return
-        cmd = [
-            "powershell",
-            "-Command",
-            f"Dismount-DiskImage -ImagePath '{drive_letter}:\\'",
-        ]
-        subprocess.run(cmd, capture_output=True, text=True)
+        try:
+            self.shell.dismount_drive(drive_letter)
+        except RuntimeError as exc:
+            self.update_status(f"Unmount failed: {exc}")
         
     # ------------------------------------------------------------------
+    def _selection(self) -> tuple[str, str]:
+        """Build and edition as picked, read on the Tk thread for the worker to take along."""
+        return self.build_selector.get(), self.edition_selector.get()
+
     def _prime_for_action(self):
         self.cancelled = False
         self.start_button.config(state="disabled")
         self.update_button.config(state="disabled")
         self.auto_button.config(state="disabled")
         self.cancel_button.config(state="normal")
-        self.progress_var.set(0)
+        self.update_progress(0)
         
     def _tidy_after_action(self):
+        """Release what the run left behind. Worker thread: the buttons are _on_finished's job."""
         # Clean up temporary resources if cancelled
         if self.cancelled:
             if self.mounted_drive:
@@ -356,18 +375,10 @@ class FlamesISOInstaller:
         # Always clean up temp directory
         if self.temp_dir:
             try:
-                shutil.rmtree(self.temp_dir, ignore_errors=True)
+                self.reaper.discard(self.temp_dir)  # Instant; deletion happens in the background
             except Exception as e:
                 print(f"Error cleaning up temp directory: {e}")
             self.temp_dir = None
-            
-        # Update UI state
-        self.start_button.config(state="normal")
-        self.cancel_button.config(state="disabled")
-        
-        if not self.cancelled and self.mounted_drive:
-            self.update_button.config(state="normal")
-            self.auto_button.config(state="normal")
 
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+"""
+Flames NT engine package 🔥
+-------------------------------------------------
+Shared building blocks for the Flames NT installer scripts. The GUI
+scripts live next to this package and import from it; keep this file
+light so importing the package costs next to nothing at startup.
+"""
@@ -0,0 +1,286 @@
+"""
+Finished-ISO cache 📦
+-------------------------------------------------
+Converting the same build and edition twice gives the same ISO, so we
+keep finished images in a size-capped cache keyed by build id, edition,
+language and conversion options. A hit is handed back straight away,
+skipping download, verification and conversion.
+
+Each cached ISO has a Merkle index next to it (see flamesnt.merkle). A
+lookup re-reads only a few chunks when the file is unchanged, and all of
+them when it isn't. Damaged chunks are rewritten from the chunk store or
+any registered repair source (engine.open_cache registers the LAN peers'
+ISO caches, see flamesnt.peercache) instead of the whole image being
+thrown away.
+
+When the cache is over its cap, the least recently used images go
+first. Entries for pinned builds (the ones we deploy often) are never
+evicted. With dedupe on (see flamesnt.chunkstore), evicted images are
+folded into it instead of deleted. Consecutive cumulative builds share
+most of their chunks, so many of them fit in the space of a few ISOs,
+and a lookup that misses the full-size images is rebuilt from chunks.
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .chunkstore import ChunkStore
+from .merkle import INDEX_SUFFIX, MerkleIndex, chunkstore_source
+from .staging import place_file
+from .verify import DIGEST_CACHE_FILE, DigestCache
+
+CACHE_DIR_NAME = "iso_cache"
+CHUNK_DIR_NAME = "chunks"
+INDEX_FILE = "index.json"
+DEFAULT_MAX_BYTES = 60 * 1024 ** 3
+
+
+def artifact_key(build_id: str, edition: str, lang: str = "en-us", options: dict | None = None) -> str:
+    """Stable key for one conversion: same inputs and options, same ISO."""
+    blob = json.dumps({"build": build_id, "edition": edition, "lang": lang, "options": options or {}},
+                      sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()[:24]
+
+
+class ArtifactCache:
+    """Size-capped LRU store of finished ISOs, with pinning."""
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_BYTES, digests: DigestCache | None = None,
+                 dedupe: bool = False):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Evicted ISOs go here instead of being deleted; it gets the same cap as the full-size images
+        self.chunks = ChunkStore(self.root / CHUNK_DIR_NAME, max_bytes) if dedupe else None
+        self.digests = digests or DigestCache(self.root / DIGEST_CACHE_FILE)
+        self._lock = threading.Lock()  # Guards entries and the index file; held only briefly
+        self._key_locks: dict[str, threading.Lock] = {}  # One per key: long checks of a key don't block the others
+        self._busy: dict[str, int] = {}  # Keys being checked or rebuilt right now; eviction leaves them alone
+        self.entries: dict[str, dict] = {}
+        self.pinned_builds: set[str] = set()
+        # Callables (key, entry) -> range source or None, tried after the chunk store when repairing
+        self.repair_sources: list = []
+        self._load()
+
+    # ------------------------------------------------------------------
+    #  Index
+    # ------------------------------------------------------------------
+    def _load(self):
+        index = self.root / INDEX_FILE
+        if not index.exists():
+            return
+        try:
+            data = json.loads(index.read_text())
+            self.entries = data.get("entries", {})
+            self.pinned_builds = set(data.get("pinned_builds", []))
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable ISO cache index {index}: {e}")
+
+    def _save(self):
+        index = self.root / INDEX_FILE
+        try:
+            tmp = index.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"entries": self.entries, "pinned_builds": sorted(self.pinned_builds)},
+                                      indent=2))
+            os.replace(tmp, index)
+        except OSError as e:
+            logging.warning(f"Could not save ISO cache index {index}: {e}")
+        self.digests.save()
+
+    def total_bytes(self) -> int:
+        return sum(e["size"] for e in self.entries.values())
+
+    def find(self, **fields) -> list[tuple[str, dict]]:
+        """(key, entry) of every cached ISO whose metadata has these values, most recently used first."""
+        with self._lock:
+            found = [(k, e) for k, e in self.entries.items() if all(e.get(f) == v for f, v in fields.items())]
+        return sorted(found, key=lambda item: item[1]["last_used"], reverse=True)
+
+    # ------------------------------------------------------------------
+    #  Lookup and store
+    # ------------------------------------------------------------------
+    @contextlib.contextmanager
+    def _working_on(self, key: str):
+        """Serialise work on one key, and keep eviction away from it, without holding the cache lock."""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+            self._busy[key] = self._busy.get(key, 0) + 1
+        try:
+            with key_lock:
+                yield
+        finally:
+            with self._lock:
+                self._busy[key] -= 1
+                if not self._busy[key]:
+                    del self._busy[key]
+
+    def lookup(self, key: str) -> Path | None:
+        """Path of the cached ISO for `key`, or None on a miss or a failed check."""
+        with self._working_on(key):
+            with self._lock:
+                entry = dict(self.entries[key]) if key in self.entries else None
+            if not entry:
+                entry = self._restore(key)  # Rebuilds from chunks; other keys' lookups carry on meanwhile
+                if not entry:
+                    return None
+            path = self.root / entry["file"]
+            intact = path.exists() and path.stat().st_size == entry["size"] and self._intact(key, entry, path)
+            with self._lock:
+                if not intact:
+                    logging.warning(f"Cached ISO {entry['file']} is missing or damaged; dropping it.")
+                    self._drop(key)
+                    self._save()
+                    return None
+                if key not in self.entries:
+                    return None  # Replaced or dropped while we were checking it
+                self.entries[key].update(merkle_root=entry.get("merkle_root"), last_used=time.time())
+                self._save()
+        logging.info(f"ISO cache hit for {entry.get('build_id')} / {entry.get('edition')}: {path}")
+        return path
+
+    def store(self, key: str, iso: Path, meta: dict | None = None) -> Path:
+        """Move a finished ISO into the cache and return its new path."""
+        iso = Path(iso)
+        dest = self.root / f"{key}.iso"
+        with self._working_on(key):
+            try:
+                os.replace(iso, dest)  # Same volume: instant
+            except OSError:
+                place_file(iso, dest)  # Clone or in-kernel copy where the volumes allow it
+                iso.unlink(missing_ok=True)
+            # One read gives both the whole-file SHA-256 and the Merkle leaves
+            index, sha256 = MerkleIndex.build_with_digest(dest, "sha256")
+            index.save(self._merkle_path(key))
+            self.digests.remember(dest, "sha256", sha256)
+            with self._lock:
+                self.entries[key] = {**(meta or {}), "file": dest.name, "size": dest.stat().st_size,
+                                     "sha256": sha256, "merkle_root": index.root.hex(), "last_used": time.time()}
+                self._evict(keep=key)
+                self._save()
+        logging.info(f"Stored {dest.name} in the ISO cache ({self.total_bytes() / 1024**3:.1f} GiB in use).")
+        return dest
+
+    # ------------------------------------------------------------------
+    #  Integrity
+    # ------------------------------------------------------------------
+    def _merkle_path(self, key: str) -> Path:
+        return self.root / f"{key}{INDEX_SUFFIX}"
+
+    def _index(self, key: str, path: Path) -> str:
+        """Build and save the Merkle index of a cached ISO whose SHA-256 was just checked; returns its root."""
+        index = MerkleIndex.build(path)
+        index.save(self._merkle_path(key))
+        return index.root.hex()
+
+    def _intact(self, key: str, entry: dict, path: Path) -> bool:
+        """Check a cached ISO (a copy of its `entry`), rewriting damaged chunks where a repair source has them.
+
+        Runs outside the cache lock; a fresh Merkle root is written to `entry` for the caller to keep.
+        """
+        try:
+            index = MerkleIndex.load(self._merkle_path(key))
+            if index.root.hex() != entry.get("merkle_root"):
+                raise RuntimeError("root doesn't match the cache entry")
+        except (OSError, ValueError, KeyError, RuntimeError):
+            # No usable index (e.g. cached before indexes existed): whole-file check, then index it
+            if not self.digests.verify(path, entry["sha256"]):
+                return False
+            entry["merkle_root"] = self._index(key, path)
+            return True
+        bad = index.check(path)
+        if bad:
+            ranges = ", ".join(f"{offset}-{offset + length - 1}" for offset, length in index.ranges(bad))
+            logging.warning(f"Cached ISO {entry['file']}: {len(bad)} damaged chunk(s) at bytes {ranges}; repairing.")
+            bad = index.repair(path, bad, self._repair_sources(key, entry))
+        index.save(self._merkle_path(key))
+        return not bad
+
+    def _repair_sources(self, key: str, entry: dict) -> list:
+        sources = [chunkstore_source(self.chunks, key)] if self.chunks else []
+        for factory in self.repair_sources:
+            try:
+                source = factory(key, entry)
+            except (OSError, RuntimeError) as e:
+                logging.info(f"Repair source unavailable for {entry['file']}: {e}")
+                continue
+            if source:
+                sources.append(source)
+        return sources
+
+    # ------------------------------------------------------------------
+    #  Pinning and eviction
+    # ------------------------------------------------------------------
+    def pin_build(self, build_id: str):
+        with self._lock:
+            self.pinned_builds.add(build_id)
+            self._save()
+
+    def unpin_build(self, build_id: str):
+        with self._lock:
+            self.pinned_builds.discard(build_id)
+            self._evict()
+            self._save()
+
+    def _evict(self, keep: str | None = None):
+        """Drop least recently used, unpinned entries until we're under the cap."""
+        candidates = sorted((e["last_used"], k) for k, e in self.entries.items()
+                            if k != keep and k not in self._busy and e.get("build_id") not in self.pinned_builds)
+        total = self.total_bytes()
+        for _last_used, key in candidates:
+            if total <= self.max_bytes:
+                break
+            total -= self.entries[key]["size"]
+            logging.info(f"Evicting {self.entries[key]['file']} from the ISO cache.")
+            self._archive(key)
+            self._drop(key)
+        if total > self.max_bytes:
+            logging.warning(f"ISO cache is {total / 1024**3:.1f} GiB, over its cap; the rest is pinned or in use.")
+
+    # ------------------------------------------------------------------
+    #  Chunk store tier
+    # ------------------------------------------------------------------
+    def _archive(self, key: str):
+        """Fold an entry into the chunk store before it's deleted (no-op without one)."""
+        entry = self.entries[key]
+        known = self.chunks.meta(key) if self.chunks else None
+        if not self.chunks or (known and known["sha256"] == entry["sha256"]):
+            return
+        meta = {k: v for k, v in entry.items() if k not in ("file", "size", "sha256", "last_used")}
+        try:
+            self.chunks.put(key, self.root / entry["file"], meta)
+        except (OSError, RuntimeError, sqlite3.Error) as e:
+            logging.warning(f"Could not keep {entry['file']} in the chunk store: {e}")
+
+    def _restore(self, key: str) -> dict | None:
+        """Rebuild an evicted ISO from the chunk store and index it again. None if it isn't there."""
+        meta = self.chunks.meta(key) if self.chunks else None
+        if not meta:
+            return None
+        dest = self.root / f"{key}.iso"
+        logging.info(f"Rebuilding {meta.get('build_id')} / {meta.get('edition')} from the chunk store.")
+        try:
+            self.chunks.get(key, dest)
+        except (OSError, RuntimeError, sqlite3.Error) as e:
+            logging.warning(f"Could not rebuild {dest.name} from the chunk store: {e}")
+            return None
+        self.digests.remember(dest, "sha256", meta["sha256"])  # get() checked the SHA-256 while writing
+        entry = {**meta, "file": dest.name, "last_used": time.time(), "merkle_root": self._index(key, dest)}
+        with self._lock:
+            self.entries[key] = entry
+            self._evict(keep=key)
+            self._save()
+        return dict(entry)
+
+    def _drop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry:
+            path = self.root / entry["file"]
+            self.digests.forget(path)
+            path.unlink(missing_ok=True)
+            self._merkle_path(key).unlink(missing_ok=True)
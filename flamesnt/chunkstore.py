@@ -0,0 +1,432 @@
+"""
+Deduplicated chunk store 🧩
+-------------------------------------------------
+Consecutive cumulative builds share most of their bytes, but a file
+cache stores every ISO in full. The chunk store splits each file into
+content-defined chunks, keeps one copy of each distinct chunk, and
+records every file as a recipe: its ordered list of chunk digests.
+
+Chunking: a chunk ends after the first run of ANCHOR_RUN bytes that all
+fall in a fixed set of about a quarter of the byte values, at least
+MIN_CHUNK and at most MAX_CHUNK into the chunk. A cut point depends
+only on the few bytes around it, so an insertion early in a file moves
+the cut points near it and the chunking then falls back in step. The
+search is bytes.translate() plus bytes.find(), which run at hundreds of
+MB/s. A rolling hash stepped byte by byte in Python manages about 10.
+
+Storage: chunks are appended to pack files in the order they are first
+seen and compressed with zlib if a sample of the chunk compresses (WIM
+data mostly doesn't). An sqlite index maps each digest to its pack
+offset and reference count and holds the recipes. The index has
+hundreds of thousands of rows and changes a few at a time, which a JSON
+file rewritten on every change would not keep up with. Reassembly reads
+each run of adjacent chunks with one sequential read and checks the
+file's SHA-256 as it writes.
+
+  python -m flamesnt.chunkstore STORE build1.iso build2.iso ...
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+MIN_CHUNK = 128 * 1024
+MAX_CHUNK = 2 * 1024 * 1024
+ANCHOR_RUN = 9  # With a quarter of byte values as anchors: a cut every ~350 KiB past MIN_CHUNK
+READ_SIZE = 16 * 1024 * 1024
+MAX_READ = 16 * 1024 * 1024  # Largest coalesced read during reassembly
+PACK_BYTES = 1024 ** 3
+COMPACT_BELOW = 0.5  # Rewrite a pack once less than half of it is still referenced
+SAMPLE_BYTES = 32 * 1024
+COMPRESS_LEVEL = 1
+COMPRESSIBLE = 0.9  # Keep zlib output only if it's at most this fraction of the input
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+
+INDEX_FILE = "chunks.sqlite"
+PACK_DIR = "packs"
+
+# Anchor bytes: a fixed, hash-picked quarter of the byte values. Never change it, or old chunks stop matching.
+_ANCHORS = bytes(1 if hashlib.sha256(bytes([b])).digest()[0] < 64 else 0 for b in range(256))
+_RUN = b"\x01" * ANCHOR_RUN
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    digest BLOB PRIMARY KEY, pack INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL,
+    size INTEGER NOT NULL, codec INTEGER NOT NULL, refs INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunks_by_pack ON chunks (pack, offset);
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY, size INTEGER NOT NULL, sha256 TEXT NOT NULL, chunks INTEGER NOT NULL,
+    meta TEXT NOT NULL, added REAL NOT NULL, last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipes (
+    key TEXT NOT NULL, seq INTEGER NOT NULL, digest BLOB NOT NULL, PRIMARY KEY (key, seq)
+) WITHOUT ROWID;
+"""
+
+
+def iter_chunks(f, read_size: int = READ_SIZE):
+    """Split a binary stream into content-defined chunks (memoryviews, valid until the next one)."""
+    data, marks, pos, eof = b"", b"", 0, False
+    while True:
+        if not eof and len(data) - pos < MAX_CHUNK:
+            block = f.read(read_size)
+            eof = not block
+            data = data[pos:] + block
+            marks = marks[pos:] + block.translate(_ANCHORS)
+            pos = 0
+            continue
+        if pos >= len(data):
+            return
+        end = min(pos + MAX_CHUNK, len(data))
+        found = marks.find(_RUN, pos + MIN_CHUNK - ANCHOR_RUN, end)
+        cut = found + ANCHOR_RUN if found >= 0 else end
+        yield memoryview(data)[pos:cut]
+        pos = cut
+
+
+def _compress(chunk) -> tuple[int, bytes | memoryview]:
+    if len(zlib.compress(chunk[:SAMPLE_BYTES], COMPRESS_LEVEL)) > COMPRESSIBLE * min(len(chunk), SAMPLE_BYTES):
+        return CODEC_RAW, chunk  # Already compressed data: don't spend a full pass finding that out
+    packed = zlib.compress(chunk, COMPRESS_LEVEL)
+    return (CODEC_ZLIB, packed) if len(packed) <= COMPRESSIBLE * len(chunk) else (CODEC_RAW, chunk)
+
+
+class ChunkStore:
+    """Content-defined, deduplicated file store: put() files under a key, get() them back."""
+
+    def __init__(self, root: Path, max_bytes: int | None = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        (self.root / PACK_DIR).mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.root / INDEX_FILE, check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+        self._pack = None
+        self._pack_id = self.db.execute("SELECT COALESCE(MAX(pack), 0) FROM chunks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._close_pack()
+            self.db.close()
+
+    # ------------------------------------------------------------------
+    #  Packs
+    # ------------------------------------------------------------------
+    def _pack_path(self, pack: int) -> Path:
+        return self.root / PACK_DIR / f"pack-{pack:06d}.dat"
+
+    def _append(self, data) -> tuple[int, int]:
+        """Append stored chunk bytes to the open pack; returns (pack, offset)."""
+        if self._pack is None or self._pack.tell() >= PACK_BYTES:
+            self._close_pack()
+            self._pack_id += 1
+            self._pack = open(self._pack_path(self._pack_id), "ab", buffering=1024 * 1024)
+        offset = self._pack.tell()
+        self._pack.write(data)
+        return self._pack_id, offset
+
+    def _sync_pack(self):
+        if self._pack:
+            self._pack.flush()
+            os.fsync(self._pack.fileno())
+
+    def _close_pack(self):
+        if self._pack:
+            self._sync_pack()
+            self._pack.close()
+            self._pack = None
+
+    def _rollback(self, mark: tuple[int, int | None]):
+        """Undo a put() in progress: its index rows, and the bytes it appended to the packs since `mark`."""
+        self.db.rollback()
+        pack, offset = mark
+        self._close_pack()
+        for newer in range(pack + 1, self._pack_id + 1):
+            self._pack_path(newer).unlink(missing_ok=True)
+        if offset is not None:
+            with open(self._pack_path(pack), "r+b") as f:
+                f.truncate(offset)
+        self._pack_id = pack
+
+    # ------------------------------------------------------------------
+    #  Store and reassemble
+    # ------------------------------------------------------------------
+    def has(self, key: str) -> bool:
+        return self.db.execute("SELECT 1 FROM files WHERE key = ?", (key,)).fetchone() is not None
+
+    def meta(self, key: str) -> dict | None:
+        row = self.db.execute("SELECT meta, size, sha256 FROM files WHERE key = ?", (key,)).fetchone()
+        return {**json.loads(row[0]), "size": row[1], "sha256": row[2]} if row else None
+
+    def put(self, key: str, path: Path, meta: dict | None = None, cancelled=None) -> dict | None:
+        """Add `path` under `key` (replacing any earlier file). Returns ingest stats, None if cancelled."""
+        path = Path(path)
+        started = time.monotonic()
+        stats = {"size": 0, "chunks": 0, "new_chunks": 0, "new_bytes": 0, "stored_bytes": 0}
+        file_hash = hashlib.sha256()
+        with self._lock, open(path, "rb", buffering=0) as f:
+            mark = (self._pack_id, self._pack.tell() if self._pack else None)
+            db = self.db
+            try:
+                self._delete(key)
+                for seq, chunk in enumerate(iter_chunks(f)):
+                    if cancelled and cancelled():
+                        self._rollback(mark)
+                        return None
+                    digest = hashlib.sha256(chunk).digest()
+                    file_hash.update(chunk)
+                    stats["size"] += len(chunk)
+                    stats["chunks"] += 1
+                    if db.execute("UPDATE chunks SET refs = refs + 1 WHERE digest = ?", (digest,)).rowcount == 0:
+                        codec, stored = _compress(chunk)
+                        pack, offset = self._append(stored)
+                        db.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, 1)",
+                                   (digest, pack, offset, len(stored), len(chunk), codec))
+                        stats["new_chunks"] += 1
+                        stats["new_bytes"] += len(chunk)
+                        stats["stored_bytes"] += len(stored)
+                    db.execute("INSERT INTO recipes VALUES (?, ?, ?)", (key, seq, digest))
+                now = time.time()
+                db.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (key, stats["size"], file_hash.hexdigest(), stats["chunks"], json.dumps(meta or {}),
+                            now, now))
+                self._sync_pack()  # Chunk bytes are on disk before the index points at them
+                db.commit()
+            except BaseException:
+                self._rollback(mark)
+                raise
+        seconds = max(time.monotonic() - started, 1e-9)
+        stats.update(seconds=round(seconds, 3), mb_per_s=round(stats["size"] / seconds / 1024 ** 2, 1),
+                     dedupe=round(1 - stats["new_bytes"] / stats["size"], 4) if stats["size"] else 0.0)
+        logging.info(f"Chunk store: {path.name} as {key}: {stats['chunks']} chunks, "
+                     f"{stats['dedupe']:.1%} already stored, {stats['stored_bytes'] / 1024**2:.0f} MB new "
+                     f"({stats['mb_per_s']} MB/s).")
+        if self.max_bytes:
+            self.trim(self.max_bytes, keep=key)
+        return stats
+
+    def get(self, key: str, dest: Path, cancelled=None) -> dict | None:
+        """Reassemble `key` into `dest`. Returns {bytes, seconds, mb_per_s, reads}, None if cancelled."""
+        dest = Path(dest)
+        started = time.monotonic()
+        with self._lock:
+            row = self.db.execute("SELECT size, sha256 FROM files WHERE key = ?", (key,)).fetchone()
+            if not row:
+                raise RuntimeError(f"{key} is not in the chunk store.")
+            size, sha256 = row
+            chunks = self.db.execute(
+                "SELECT c.pack, c.offset, c.length, c.size, c.codec FROM recipes r JOIN chunks c ON c.digest = r.digest "
+                "WHERE r.key = ? ORDER BY r.seq", (key,)).fetchall()
+            self.db.execute("UPDATE files SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            self._sync_pack()
+        part = dest.with_name(dest.name + ".part")
+        file_hash = hashlib.sha256()
+        reads = 0
+        packs: dict[int, object] = {}
+        try:
+            with open(part, "wb", buffering=0) as out:
+                for run in self._runs(chunks):
+                    if cancelled and cancelled():
+                        part.unlink(missing_ok=True)
+                        return None
+                    pack, start = run[0][0], run[0][1]
+                    if pack not in packs:
+                        packs[pack] = open(self._pack_path(pack), "rb", buffering=0)
+                        if hasattr(os, "posix_fadvise"):
+                            os.posix_fadvise(packs[pack].fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    length = run[-1][1] + run[-1][2] - start
+                    data = os.pread(packs[pack].fileno(), length, start)  # One sequential read per run
+                    reads += 1
+                    view = memoryview(data)
+                    for _pack, offset, stored, raw, codec in run:
+                        piece = view[offset - start:offset - start + stored]
+                        if codec == CODEC_ZLIB:
+                            piece = zlib.decompress(piece)
+                        if len(piece) != raw:
+                            raise RuntimeError(f"Chunk store: damaged chunk in pack {pack} at byte {offset}.")
+                        file_hash.update(piece)
+                        out.write(piece)
+        finally:
+            for handle in packs.values():
+                handle.close()
+        if file_hash.hexdigest() != sha256:
+            part.unlink(missing_ok=True)
+            raise RuntimeError(f"Chunk store: {key} reassembled with the wrong SHA-256; the store is damaged.")
+        os.replace(part, dest)
+        seconds = max(time.monotonic() - started, 1e-9)
+        stats = {"bytes": size, "seconds": round(seconds, 3), "mb_per_s": round(size / seconds / 1024 ** 2, 1),
+                 "reads": reads}
+        logging.info(f"Chunk store: rebuilt {dest.name} from {len(chunks)} chunks in {reads} reads "
+                     f"at {stats['mb_per_s']} MB/s.")
+        return stats
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes:
+        """Bytes [offset, offset + length) of `key`, decoding only the chunks that overlap them.
+
+        Used to repair damaged ranges of a cached file (see flamesnt.merkle);
+        the caller checks what comes back against its own hashes.
+        """
+        end = offset + length
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT c.pack, c.offset, c.length, c.size, c.codec FROM recipes r JOIN chunks c ON c.digest = r.digest "
+                "WHERE r.key = ? ORDER BY r.seq", (key,)).fetchall()
+            self._sync_pack()
+        if not rows:
+            raise RuntimeError(f"{key} is not in the chunk store.")
+        out = bytearray()
+        pos = 0
+        packs: dict[int, object] = {}
+        try:
+            for pack, stored_at, stored, raw, codec in rows:
+                if pos >= end:
+                    break
+                if pos + raw > offset:
+                    if pack not in packs:
+                        packs[pack] = open(self._pack_path(pack), "rb", buffering=0)
+                    piece = os.pread(packs[pack].fileno(), stored, stored_at)
+                    if codec == CODEC_ZLIB:
+                        piece = zlib.decompress(piece)
+                    out += piece[max(offset - pos, 0):end - pos]
+                pos += raw
+        finally:
+            for handle in packs.values():
+                handle.close()
+        return bytes(out)
+
+    @staticmethod
+    def _runs(chunks: list[tuple]):
+        """Group chunks that sit back to back in the same pack, so each group is one read."""
+        run: list[tuple] = []
+        for chunk in chunks:
+            if run and (chunk[0] != run[-1][0] or chunk[1] != run[-1][1] + run[-1][2]
+                        or chunk[1] + chunk[2] - run[0][1] > MAX_READ):
+                yield run
+                run = []
+            run.append(chunk)
+        if run:
+            yield run
+
+    # ------------------------------------------------------------------
+    #  Deletion, trimming and compaction
+    # ------------------------------------------------------------------
+    def delete(self, key: str):
+        with self._lock:
+            self._delete(key)
+            self.db.commit()
+
+    def _delete(self, key: str):
+        """Drop a file's recipe and its chunk references (no commit). Chunk bytes go at the next gc()."""
+        self.db.execute("UPDATE chunks SET refs = refs - (SELECT COUNT(*) FROM recipes r "
+                        "WHERE r.key = ? AND r.digest = chunks.digest) "
+                        "WHERE digest IN (SELECT digest FROM recipes WHERE key = ?)", (key, key))
+        self.db.execute("DELETE FROM recipes WHERE key = ?", (key,))
+        self.db.execute("DELETE FROM files WHERE key = ?", (key,))
+
+    def trim(self, max_bytes: int, keep: str | None = None):
+        """Delete least recently used files until the packs fit in `max_bytes`, then gc()."""
+        with self._lock:
+            keys = [k for (k,) in self.db.execute("SELECT key FROM files ORDER BY last_used")]
+        for key in keys:
+            if self.disk_bytes() <= max_bytes:
+                return
+            if key == keep:
+                continue
+            logging.info(f"Chunk store over its cap; dropping {key}.")
+            self.delete(key)
+            self.gc()
+
+    def gc(self) -> int:
+        """Free unreferenced chunks: delete empty packs, compact sparse ones. Returns bytes freed."""
+        freed = 0
+        with self._lock:
+            self._close_pack()
+            self.db.execute("DELETE FROM chunks WHERE refs <= 0")
+            live = dict(self.db.execute("SELECT pack, SUM(length) FROM chunks GROUP BY pack"))
+            for path in sorted((self.root / PACK_DIR).glob("pack-*.dat")):
+                pack = int(path.stem.split("-")[1])
+                size = path.stat().st_size
+                if not live.get(pack):
+                    path.unlink()
+                    freed += size
+                elif live[pack] < size * COMPACT_BELOW:
+                    freed += size - self._compact(pack)
+            self.db.commit()
+            self._close_pack()
+        if freed:
+            logging.info(f"Chunk store: freed {freed / 1024**2:.0f} MB.")
+        return freed
+
+    def _compact(self, pack: int) -> int:
+        """Copy a pack's live chunks, as stored, into the current pack, then delete it."""
+        rows = self.db.execute("SELECT digest, offset, length FROM chunks WHERE pack = ? ORDER BY offset",
+                               (pack,)).fetchall()
+        moved = 0
+        with open(self._pack_path(pack), "rb") as src:
+            for digest, offset, length in rows:
+                src.seek(offset)
+                new_pack, new_offset = self._append(src.read(length))
+                self.db.execute("UPDATE chunks SET pack = ?, offset = ? WHERE digest = ?", (new_pack, new_offset, digest))
+                moved += length
+        self._sync_pack()
+        self.db.commit()  # The moved copies are durable and indexed before the old pack goes
+        self._pack_path(pack).unlink()
+        return moved
+
+    # ------------------------------------------------------------------
+    #  Reporting
+    # ------------------------------------------------------------------
+    def disk_bytes(self) -> int:
+        return sum(p.stat().st_size for p in (self.root / PACK_DIR).glob("pack-*.dat"))
+
+    def stats(self) -> dict:
+        """{files, logical_bytes, unique_bytes, stored_bytes, chunks, dedupe_ratio, compression_ratio, ratio}."""
+        with self._lock:
+            files, logical = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+            chunks, unique, stored = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM chunks WHERE refs > 0"
+            ).fetchone()
+        return {"files": files, "logical_bytes": logical, "unique_bytes": unique, "stored_bytes": stored,
+                "chunks": chunks, "dedupe_ratio": round(logical / unique, 3) if unique else 0.0,
+                "compression_ratio": round(unique / stored, 3) if stored else 0.0,
+                "ratio": round(logical / stored, 3) if stored else 0.0}
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Add files (e.g. consecutive builds) to a deduplicated chunk store "
+                                                 "and report the dedupe ratio and reassembly speed.")
+    parser.add_argument("store", type=Path)
+    parser.add_argument("files", type=Path, nargs="*")
+    parser.add_argument("--no-restore", action="store_true", help="skip the reassembly benchmark")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = ChunkStore(args.store)
+    for path in args.files:
+        ingest = store.put(path.name, path)
+        totals = store.stats()
+        print(f"{path.name}: {ingest['size'] / 1024**2:.0f} MB, {ingest['dedupe']:.1%} deduplicated, "
+              f"{ingest['stored_bytes'] / 1024**2:.0f} MB stored; store ratio {totals['ratio']}x "
+              f"(dedupe {totals['dedupe_ratio']}x, compression {totals['compression_ratio']}x)")
+    if not args.no_restore:
+        for path in args.files:
+            restored = args.store / f"restore-{path.name}"
+            stats = store.get(path.name, restored)
+            restored.unlink()
+            print(f"reassembled {path.name}: {stats['mb_per_s']} MB/s in {stats['reads']} reads")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,343 @@
+"""
+WIM/ESD export with wimlib ⚙️
+-------------------------------------------------
+Recompressing the edition ESD into install.wim is the longest part of
+a conversion. convert.sh runs it through wimlib with default settings;
+here we call `wimlib-imagex export` ourselves, with a thread count
+chosen for this host and one of three presets:
+
+  fast      XPRESS, every logical CPU. Biggest output, quickest.
+  balanced  LZX, one CPU left for downloads and the GUI. What Microsoft ships.
+  small     LZMS solid (an .esd-style WIM). Smallest and slowest. Each
+            thread needs a lot of memory, so the thread count is capped
+            by RAM.
+
+For a refresh of an earlier build (see flamesnt.delta), refresh_image()
+exports into a copy of the previous install.wim. wimlib keeps each
+file's data once per WIM, keyed by SHA-1, so only data the previous
+build didn't have gets compressed.
+
+Every export reports its own throughput and output size, so presets can
+be compared on real payloads:
+
+  python -m flamesnt.convert professional_en-us.esd OUT_DIR --compare
+
+Converter output is streamed rather than waited on. run_streaming()
+parses wimlib's "Archiving file data: X MiB of Y MiB (N%) done" lines,
+convert.sh's "Creating install.wim..." phase markers and mkisofs-style
+"N% done" lines into progress events as they arrive, and logs MB/s for
+each phase when it ends.
+"""
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from .uup import edition_id
+from .wiminfo import read_wim_info
+
+WIMLIB = "wimlib-imagex"
+# UUP edition ESDs hold Setup media (1), WinPE (2) and the Windows image itself (3).
+# Used only when the XML metadata (see flamesnt.wiminfo) names no install image.
+INSTALL_IMAGE_INDEX = 3
+SOLID_THREAD_BYTES = 1024 ** 3  # LZMS solid needs roughly this much RAM per thread
+
+# Converter output lines we turn into progress (universal newlines also split wimlib's \r updates)
+WIMLIB_PROGRESS = re.compile(r"^(?P<phase>[A-Za-z][\w ,'-]*?):\s+(?P<done>[\d.]+) (?P<unit>[KMGT]i?B) of "
+                             r"(?P<total>[\d.]+) (?P<total_unit>[KMGT]i?B) \((?P<percent>\d+)%\) done")
+PERCENT_DONE = re.compile(r"(?P<percent>\d+(?:\.\d+)?)% done")
+PHASE_MARKER = re.compile(r"^(?:CONVERT:\s*)?(?P<phase>[A-Z][^%:]{2,80}?)\s*\.\.\.\s*$")
+UNITS = {"B": 1, "KB": 1024, "KiB": 1024, "MB": 1024 ** 2, "MiB": 1024 ** 2,
+         "GB": 1024 ** 3, "GiB": 1024 ** 3, "TB": 1024 ** 4, "TiB": 1024 ** 4}
+
+PRESETS = {
+    "fast": {"compress": "XPRESS", "solid": False},
+    "balanced": {"compress": "LZX", "solid": False},
+    "small": {"compress": "LZMS", "solid": True},
+}
+DEFAULT_PRESET = "balanced"
+
+
+def wimlib_available(tool: str = WIMLIB) -> bool:
+    return shutil.which(tool) is not None
+
+
+def host_cpus() -> int:
+    """Logical CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def host_memory() -> int | None:
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def threads_for(preset: str, cpus: int | None = None, memory: int | None = None) -> int:
+    """Thread count for `preset` on a host with `cpus` and `memory` (detected when omitted)."""
+    cpus = cpus or host_cpus()
+    if preset == "fast":
+        return cpus
+    if preset == "small":
+        memory = memory if memory is not None else host_memory()
+        return max(1, min(cpus, memory // SOLID_THREAD_BYTES)) if memory else max(1, cpus // 2)
+    return max(1, cpus - 1) if cpus > 2 else cpus
+
+
+# ----------------------------------------------------------------------
+#  Streaming converter output
+# ----------------------------------------------------------------------
+class OutputParser:
+    """Turns converter output lines into progress events and per-phase throughput."""
+
+    def __init__(self):
+        self.phase: str | None = None
+        self.phases: list[dict] = []  # Finished phases: {phase, seconds, bytes, mb_per_s}
+        self._started = 0.0
+        self._bytes = 0
+
+    def feed(self, line: str) -> dict | None:
+        """Parse one line; returns {phase, percent, done_bytes, total_bytes} or None if it isn't progress."""
+        line = line.strip()
+        if not line:
+            return None
+        m = WIMLIB_PROGRESS.match(line)
+        if m:
+            self._enter(m["phase"])
+            done = int(float(m["done"]) * UNITS.get(m["unit"], 1))
+            total = int(float(m["total"]) * UNITS.get(m["total_unit"], 1))
+            self._bytes = done
+            return {"phase": self.phase, "percent": float(m["percent"]), "done_bytes": done, "total_bytes": total}
+        m = PHASE_MARKER.match(line)
+        if m:
+            self._enter(m["phase"])
+            return {"phase": self.phase, "percent": 0.0, "done_bytes": None, "total_bytes": None}
+        m = PERCENT_DONE.search(line)
+        if m:
+            if not self.phase:
+                self._enter("Writing image")
+            return {"phase": self.phase, "percent": float(m["percent"]), "done_bytes": None, "total_bytes": None}
+        return None
+
+    def _enter(self, phase: str):
+        if phase == self.phase:
+            return
+        self._close_phase()
+        self.phase = phase
+        self._started = time.monotonic()
+        self._bytes = 0
+
+    def _close_phase(self):
+        if not self.phase:
+            return
+        seconds = max(time.monotonic() - self._started, 1e-9)
+        entry = {"phase": self.phase, "seconds": round(seconds, 3), "bytes": self._bytes,
+                 "mb_per_s": round(self._bytes / seconds / 1024 ** 2, 1) if self._bytes else None}
+        self.phases.append(entry)
+        rate = f" at {entry['mb_per_s']} MB/s" if entry["mb_per_s"] else ""
+        logging.info(f"Converter phase '{self.phase}' took {seconds:.1f}s{rate}.")
+
+    def close(self) -> list[dict]:
+        self._close_phase()
+        self.phase = None
+        return self.phases
+
+
+def run_streaming(argv: list[str], on_progress=None, cancelled=None, cwd: Path | None = None,
+                  name: str | None = None, on_spawn=None) -> list[dict] | None:
+    """Run a converter, reporting progress as its output arrives. Returns its phases, None if cancelled.
+
+    on_progress(event) is called on the caller's thread, on_spawn(pid) once
+    the process exists. A non-zero exit raises RuntimeError carrying the
+    last line of output.
+    """
+    name = name or Path(argv[0]).name
+    proc = subprocess.Popen(argv, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            stdin=subprocess.DEVNULL, text=True, errors="replace")
+    lines: queue.Queue = queue.Queue()
+
+    def pump():
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)  # EOF
+
+    threading.Thread(target=pump, name="ConverterOutput", daemon=True).start()
+    parser = OutputParser()
+    tail: deque[str] = deque(maxlen=20)  # Kept for the error message
+    try:
+        if on_spawn:
+            on_spawn(proc.pid)
+        while True:
+            if cancelled and cancelled():
+                proc.kill()
+                proc.wait()
+                parser.close()
+                logging.info(f"{name} cancelled.")
+                return None
+            try:
+                line = lines.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if line is None:
+                break
+            tail.append(line.rstrip())
+            event = parser.feed(line)
+            if event and on_progress:
+                on_progress(event)  # May raise (e.g. EngineCancelled); the finally still stops the converter
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    proc.wait()
+    phases = parser.close()
+    if proc.returncode != 0:
+        detail = [l for l in tail if l]
+        raise RuntimeError(f"{name} failed (exit {proc.returncode}): {detail[-1] if detail else 'no output'}")
+    return phases
+
+
+def export_argv(source: Path, index: int | str, dest: Path, preset: str = DEFAULT_PRESET,
+                threads: int | None = None, tool: str = WIMLIB) -> list[str]:
+    if preset not in PRESETS:
+        raise RuntimeError(f"Unknown conversion preset '{preset}' (expected one of {', '.join(PRESETS)}).")
+    spec = PRESETS[preset]
+    argv = [tool, "export", str(source), str(index), str(dest),
+            f"--compress={spec['compress']}", f"--threads={threads or threads_for(preset)}"]
+    if spec["solid"]:
+        argv.append("--solid")
+    return argv
+
+
+def edition_payload(names: list[str], edition: str) -> str | None:
+    """The edition ESD among manifest file names, e.g. 'professional_en-us.esd' for Professional."""
+    prefix = edition_id(edition).lower() + "_"
+    return next((n for n in names if n.lower().startswith(prefix) and n.lower().endswith(".esd")), None)
+
+
+def export_image(source: Path, dest: Path, index: int | str = INSTALL_IMAGE_INDEX, preset: str = DEFAULT_PRESET,
+                 threads: int | None = None, tool: str = WIMLIB, on_progress=None, cancelled=None,
+                 on_spawn=None) -> dict | None:
+    """Export image `index` of `source` into `dest` (appended if it exists). None if cancelled.
+
+    Returns {preset, compress, threads, seconds, input_bytes, output_bytes,
+    mb_per_s, ratio, phases}; on_progress gets run_streaming's events.
+    """
+    source, dest = Path(source), Path(dest)
+    if not wimlib_available(tool):
+        raise RuntimeError(f"{tool} was not found; install wimlib to convert images.")
+    threads = threads or threads_for(preset)
+    argv = export_argv(source, index, dest, preset, threads, tool)
+    before = dest.stat().st_size if dest.exists() else 0
+    logging.info(f"Exporting image {index} of {source.name} ({preset}, {threads} threads): {' '.join(argv)}")
+
+    started = time.monotonic()
+    phases = run_streaming(argv, on_progress, cancelled, name=f"{tool} export", on_spawn=on_spawn)
+    if phases is None:
+        return None
+
+    seconds = max(time.monotonic() - started, 1e-9)
+    input_bytes = source.stat().st_size
+    output_bytes = dest.stat().st_size - before
+    stats = {"preset": preset, "compress": PRESETS[preset]["compress"], "threads": threads,
+             "seconds": round(seconds, 3), "input_bytes": input_bytes, "output_bytes": output_bytes,
+             "mb_per_s": round(input_bytes / seconds / 1024 ** 2, 1),
+             "ratio": round(output_bytes / input_bytes, 3) if input_bytes else None, "phases": phases}
+    logging.info(f"Exported {source.name} [{preset}] in {seconds:.1f}s at {stats['mb_per_s']} MB/s: "
+                 f"{output_bytes / 1024**2:.0f} MB ({stats['ratio']}x the source).")
+    return stats
+
+
+def refresh_image(dest: Path, source: Path, index: int | str = INSTALL_IMAGE_INDEX, preset: str = DEFAULT_PRESET,
+                  threads: int | None = None, tool: str = WIMLIB, on_progress=None, cancelled=None,
+                  on_spawn=None) -> dict | None:
+    """Replace the images in `dest`, an earlier build's install image, with image `index` of `source`.
+
+    The export only compresses data that isn't in `dest` yet. Deleting
+    the old images afterwards rebuilds the WIM without their orphaned
+    data, copying the kept resources as they are. Returns export_image's
+    stats plus reused_images and final_bytes, or None if cancelled.
+    """
+    dest = Path(dest)
+    old_images = read_wim_info(dest).image_count
+    stats = export_image(source, dest, index, preset, threads, tool, on_progress, cancelled, on_spawn)
+    if stats is None:
+        return None
+    for n in range(old_images):
+        # --soft only marks an image deleted; the last delete does the one real rebuild
+        argv = [tool, "delete", str(dest), "1"] + ([] if n == old_images - 1 else ["--soft"])
+        if run_streaming(argv, on_progress, cancelled, name=f"{tool} delete", on_spawn=on_spawn) is None:
+            return None
+    stats.update(reused_images=old_images, final_bytes=dest.stat().st_size)
+    logging.info(f"Refreshed {dest.name} from {Path(source).name}: {stats['output_bytes'] / 1024**2:.0f} MB of new "
+                 f"data compressed, {stats['final_bytes'] / 1024**2:.0f} MB image.")
+    return stats
+
+
+def split_image(source: Path, dest: Path, part_mb: int = 3800, tool: str = WIMLIB, on_progress=None,
+                cancelled=None) -> list[Path] | None:
+    """Split a WIM into .swm parts of at most `part_mb` MiB (for FAT32). Returns the parts, None if cancelled."""
+    source, dest = Path(source), Path(dest)
+    if not wimlib_available(tool):
+        raise RuntimeError(f"{tool} was not found; install wimlib to split images.")
+    if run_streaming([tool, "split", str(source), str(dest), str(part_mb)], on_progress, cancelled,
+                     name=f"{tool} split") is None:
+        return None
+    parts = sorted(dest.parent.glob(f"{dest.stem}*{dest.suffix}"))
+    logging.info(f"Split {source.name} into {len(parts)} part(s) of up to {part_mb} MiB.")
+    return parts
+
+
+def compare_presets(source: Path, out_dir: Path, index: int | str = INSTALL_IMAGE_INDEX,
+                    presets: list[str] | None = None, tool: str = WIMLIB) -> dict[str, dict]:
+    """Export `source` once per preset and return each preset's stats."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    results = {}
+    for preset in presets or list(PRESETS):
+        dest = out_dir / f"install_{preset}.wim"
+        dest.unlink(missing_ok=True)
+        results[preset] = export_image(source, dest, index, preset, tool=tool)
+    return results
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export a WIM/ESD image with wimlib using a speed/size preset.")
+    parser.add_argument("source", type=Path)
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--index", help="image index, or 'all' (default: the Windows image, from the XML)")
+    parser.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET)
+    parser.add_argument("--threads", type=int, help="override the preset's thread count")
+    parser.add_argument("--compare", action="store_true", help="run every preset and print a table")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not args.index:
+        image = read_wim_info(args.source).install_image()
+        args.index = image["index"] if image else INSTALL_IMAGE_INDEX
+
+    if args.compare:
+        results = compare_presets(args.source, args.out_dir, args.index)
+    else:
+        args.out_dir.mkdir(parents=True, exist_ok=True)
+        results = {args.preset: export_image(args.source, args.out_dir / "install.wim", args.index,
+                                             args.preset, args.threads)}
+    print(f"{'preset':<10} {'threads':>7} {'seconds':>9} {'MB/s':>8} {'output MB':>10} {'ratio':>6}")
+    for preset, s in results.items():
+        print(f"{preset:<10} {s['threads']:>7} {s['seconds']:>9.1f} {s['mb_per_s']:>8.1f} "
+              f"{s['output_bytes'] / 1024**2:>10.0f} {s['ratio']:>6}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
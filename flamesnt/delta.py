@@ -0,0 +1,82 @@
+"""
+Delta rebuilds 🔁
+-------------------------------------------------
+A new cumulative build shares most of its UUP files with the previous
+one. Rather than download and convert everything again, a delta job
+starts from a cached ISO of an earlier build of the same edition,
+language and conversion options:
+
+  1. The new manifest is compared with the one recorded for each cached
+     ISO. Files with the same name, size and SHA-1 are reused. The ISO
+     with the most bytes in common becomes the base.
+  2. Only the changed and new files are downloaded, verified and
+     converted.
+  3. The base ISO's media tree is copied out as the starting layout. A
+     changed edition ESD is exported into a copy of the base
+     install.wim, so wimlib compresses only data the base lacks (see
+     convert.refresh_image). An unchanged ESD means the base install.wim
+     is used as it is.
+
+Cached ISOs record their manifest for this (see manifest_record).
+"""
+import logging
+from pathlib import Path
+
+from .editions import INSTALL_IMAGE
+from .isoreader import IsoImage
+
+
+def manifest_record(manifest: list[dict]) -> list[dict]:
+    """What a cached ISO keeps about its payload: enough to tell later which files changed."""
+    return [{"name": e["name"], "sha1": e["sha1"], "size": e["size"]} for e in manifest]
+
+
+def diff_manifests(base: list[dict], new: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Split `new` into (entries unchanged since `base`, entries that changed or are new)."""
+    known = {(e["name"], e["sha1"].lower(), e["size"]) for e in base}
+    reused, changed = [], []
+    for entry in new:
+        (reused if (entry["name"], entry["sha1"].lower(), entry["size"]) in known else changed).append(entry)
+    return reused, changed
+
+
+def pick_base(candidates: list[tuple[str, dict]], manifest: list[dict]) -> tuple[str, dict, int] | None:
+    """The cached (key, entry) with the most bytes in common with `manifest`, and that byte count."""
+    best = None
+    for key, entry in candidates:
+        reused, _changed = diff_manifests(entry.get("manifest") or [], manifest)
+        shared = sum(e["size"] for e in reused)
+        if shared and (best is None or shared > best[2]):
+            best = (key, entry, shared)
+    return best
+
+
+def delta_summary(base: dict, reused: list[dict], changed: list[dict]) -> dict:
+    reused_bytes = sum(e["size"] for e in reused)
+    changed_bytes = sum(e["size"] for e in changed)
+    total = reused_bytes + changed_bytes
+    return {"base_build": base.get("build"), "base_build_id": base.get("build_id"),
+            "reused_files": len(reused), "reused_bytes": reused_bytes,
+            "changed_files": len(changed), "changed_bytes": changed_bytes,
+            "fetched_fraction": round(changed_bytes / total, 4) if total else 0.0}
+
+
+def reuse_media(base: IsoImage, media: Path, skip: tuple[str, ...] = (INSTALL_IMAGE,), on_bytes=None,
+                cancelled=None) -> int | None:
+    """Copy the base ISO's files into `media`, except `skip`. Returns bytes copied, None if cancelled."""
+    media = Path(media)
+    skipped = {s.lower() for s in skip}
+    copied = 0
+    for path, entry in base.walk():
+        target = media / path
+        if entry.is_dir:
+            target.mkdir(parents=True, exist_ok=True)
+            continue
+        if path.lower() in skipped:
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if base.extract(path, target, on_bytes, cancelled) is None:
+            return None
+        copied += entry.size
+    logging.info(f"Delta: reused {copied / 1024**2:.0f} MB of media from {base.path.name}.")
+    return copied
@@ -0,0 +1,212 @@
+"""
+Disk-space admission control 💽
+-------------------------------------------------
+Before a job downloads anything we predict its peak footprint from the
+manifest and reserve that much on the workspace volume. A job that can
+never fit is refused up front; one that would fit once other jobs (or
+the reaper) free space is queued until it does.
+
+Peak footprint, with P = payload, W = intermediate WIM, I = final ISO:
+  keep everything:      P + W + I
+  streaming cleanup:    max(P + largest source × wim_ratio, W + I)
+because each source is deleted as soon as conversion has consumed it,
+and the WIM is deleted once the ISO is written.
+
+A reservation can carry a footprint() of what the job already has on
+disk (see workspace_footprint). Those bytes are gone from the volume's
+free space, so other jobs count only the rest of its reservation
+against it; otherwise every byte a running job wrote would be counted
+twice.
+"""
+import logging
+import shutil
+import os
+import threading
+from pathlib import Path
+
+GiB = 1024 ** 3
+DEFAULT_RESERVE_BYTES = 2 * GiB  # Never fill the volume to the brim
+# Ratios relative to the payload, measured on typical retail builds
+WIM_RATIO = 1.05
+ISO_RATIO = 1.10
+
+
+class InsufficientDiskSpace(RuntimeError):
+    """The job's predicted peak will not fit on the workspace volume."""
+
+
+def predict_peak(sizes: list[int], streaming: bool = True,
+                 wim_ratio: float = WIM_RATIO, iso_ratio: float = ISO_RATIO, isos: int = 1) -> int:
+    """Peak bytes on disk for converting payload files of `sizes` into `isos` ISOs."""
+    payload = sum(sizes)
+    wim = int(payload * wim_ratio)
+    iso = int(payload * iso_ratio) * isos
+    if not streaming:
+        return payload + wim + iso
+    largest = max(sizes, default=0)
+    return max(payload + int(largest * wim_ratio), wim + iso)
+
+
+def workspace_footprint(path: Path) -> int:
+    """Bytes of the files under `path`, each hard-linked file counted once."""
+    seen, total = set(), 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue  # Consumed or moved while we looked
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_size
+    return total
+
+
+class Reservation:
+    def __init__(self, budget: "DiskBudget", job_id: str, nbytes: int):
+        self.budget = budget
+        self.job_id = job_id
+        self.nbytes = nbytes
+
+    def release(self):
+        self.budget.release(self.job_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class DiskBudget:
+    """Tracks reservations against one volume's free space."""
+
+    def __init__(self, path: Path, reserve_bytes: int = DEFAULT_RESERVE_BYTES,
+                 reclaimable=None, disk_usage=shutil.disk_usage, poll_interval: float = 5.0):
+        self.path = Path(path)
+        self.reserve_bytes = reserve_bytes
+        self.reclaimable = reclaimable or (lambda: 0)  # Bytes about to be freed (e.g. the reaper's trash)
+        self.disk_usage = disk_usage
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._reservations: dict[str, int] = {}
+        self._footprints: dict[str, object] = {}  # Job id -> footprint() of the bytes it already has on disk
+
+    def _existing_path(self) -> Path:
+        path = self.path
+        while not path.exists() and path != path.parent:
+            path = path.parent  # The workspace may not exist yet; its volume does
+        return path
+
+    def _outstanding(self, exclude: str | None = None) -> int:
+        """What the reservations (but `exclude`'s) may still take from the volume's free space."""
+        with self._cond:
+            held = [(n, self._footprints.get(k)) for k, n in self._reservations.items() if k != exclude]
+        total = 0
+        for nbytes, footprint in held:
+            try:
+                landed = footprint() if footprint else 0
+            except OSError:
+                landed = 0
+            total += max(nbytes - landed, 0)
+        return total
+
+    def free(self) -> int:
+        """Free bytes we may still promise: volume free space minus safety reserve and outstanding reservations."""
+        usage = self.disk_usage(self._existing_path())
+        return usage.free - self.reserve_bytes - self._outstanding()
+
+    def reserve(self, job_id: str, nbytes: int, wait: bool = True, cancelled=None, on_wait=None,
+                footprint=None) -> Reservation | None:
+        """Reserve `nbytes` for `job_id`, queueing until it fits if `wait`.
+
+        `footprint()`, if given, is what the job has on disk so far; other jobs
+        then count only the rest of `nbytes`. Raises InsufficientDiskSpace when
+        the job can never fit, even after every other reservation and the
+        reclaimable bytes are released. Returns None if `cancelled()` turns true
+        while queued.
+        """
+        announced = False
+        with self._cond:
+            while True:
+                usage = self.disk_usage(self._existing_path())
+                others = self._outstanding(job_id)
+                available = usage.free - self.reserve_bytes - others
+                if nbytes <= available:
+                    self._reservations[job_id] = nbytes
+                    if footprint:
+                        self._footprints[job_id] = footprint
+                    logging.info(f"Disk budget: reserved {nbytes / GiB:.1f} GiB for {job_id} "
+                                 f"({available / GiB:.1f} GiB available).")
+                    return Reservation(self, job_id, nbytes)
+
+                best_case = usage.free + others + self.reclaimable() - self.reserve_bytes
+                if nbytes > best_case or not wait:
+                    raise InsufficientDiskSpace(
+                        f"Job needs about {nbytes / GiB:.1f} GiB on {self.path.anchor or self.path} at its peak, "
+                        f"but only {max(available, 0) / GiB:.1f} GiB is free "
+                        f"(keeping {self.reserve_bytes / GiB:.0f} GiB spare).")
+
+                if not announced:
+                    logging.info(f"Disk budget: {job_id} queued, needs {nbytes / GiB:.1f} GiB, "
+                                 f"{max(available, 0) / GiB:.1f} GiB available.")
+                    if on_wait:
+                        on_wait(nbytes, available)
+                    announced = True
+                self._cond.wait(self.poll_interval)  # Woken by release(), or re-check as the reaper frees space
+                if cancelled and cancelled():
+                    return None
+
+    def check(self, job_id: str, nbytes: int, what: str):
+        """Re-check before a step: other programs may have eaten into our space since admission."""
+        usage = self.disk_usage(self._existing_path())
+        available = usage.free - self.reserve_bytes - self._outstanding(job_id)
+        if nbytes > available:
+            raise InsufficientDiskSpace(
+                f"{what} needs about {nbytes / GiB:.1f} GiB more, but only "
+                f"{max(available, 0) / GiB:.1f} GiB is free now. Free up some space and try again.")
+
+    def release(self, job_id: str):
+        with self._cond:
+            self._footprints.pop(job_id, None)
+            if self._reservations.pop(job_id, None) is not None:
+                logging.info(f"Disk budget: released reservation for {job_id}.")
+            self._cond.notify_all()
+
+
+_budgets: dict[int, DiskBudget] = {}
+_budgets_lock = threading.Lock()
+
+
+def _device(path: Path) -> int:
+    probe = Path(path)
+    while not probe.exists() and probe != probe.parent:
+        probe = probe.parent  # May not exist yet; its volume does
+    return os.stat(probe).st_dev
+
+
+def same_volume(a: Path, b: Path) -> bool:
+    return _device(a) == _device(b)
+
+
+def budget_for(path: Path, **kwargs) -> DiskBudget:
+    """The shared budget for the volume holding `path`, so concurrent jobs see each other."""
+    device = _device(path)
+    with _budgets_lock:
+        if device not in _budgets:
+            _budgets[device] = DiskBudget(path, **kwargs)
+        return _budgets[device]
+
+
+def consume_source(path: Path, on_freed=None):
+    """Delete a source file the converter has finished with, reporting the bytes freed."""
+    path = Path(path)
+    try:
+        size = path.stat().st_size
+        path.unlink()
+    except FileNotFoundError:
+        return 0
+    logging.info(f"Streaming cleanup: removed consumed source {path.name} ({size / GiB:.2f} GiB).")
+    if on_freed:
+        on_freed(size)
+    return size
@@ -0,0 +1,73 @@
+"""
+Payload downloader.
+-------------------------------------------------
+Streams manifest files to disk in large chunks and reports every chunk
+as bytes, so progress is driven by real work instead of fixed steps.
+Hashing is a separate pass (verify_file) so it can be weighted and
+reported on its own.
+"""
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def download_file(url: str, dest: Path, on_bytes=None, cancelled=None, timeout: int = 60, throttle=None):
+    """Download `url` to `dest` via a .part file; on_bytes(n) is called per chunk.
+
+    throttle(n), if given, is called before each chunk is written and may
+    block to hold the download to a rate (see flamesnt.governor).
+    """
+    import requests  # Deferred: keeps the engine's import cheap
+
+    dest = Path(dest)
+    part = dest.with_name(dest.name + ".part")
+    held = False
+    with requests.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        with open(part, "wb") as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                if cancelled and cancelled():
+                    break
+                if throttle and not throttle(len(chunk)):
+                    held = True
+                    break
+                f.write(chunk)
+                if on_bytes:
+                    on_bytes(len(chunk))
+    if cancelled and cancelled():
+        part.unlink(missing_ok=True)
+        return None
+    if held:
+        part.unlink(missing_ok=True)  # Never publish a short file under the final name
+        raise RuntimeError(f"Download of {dest.name} was stopped by its throttle before it finished.")
+    os.replace(part, dest)
+    return dest
+
+
+def hash_file(path: Path, algorithm: str = "sha1", on_bytes=None, cancelled=None) -> str | None:
+    """Hex digest of `path`, reading in CHUNK_SIZE blocks. None if cancelled."""
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            if cancelled and cancelled():
+                return None
+            h.update(chunk)
+            if on_bytes:
+                on_bytes(len(chunk))
+    return h.hexdigest()
+
+
+def verify_file(path: Path, expected_sha1: str, on_bytes=None, cancelled=None) -> bool:
+    if not expected_sha1:
+        logging.warning(f"No SHA-1 in manifest for {path.name}, skipping verification.")
+        return True
+    digest = hash_file(path, "sha1", on_bytes, cancelled)
+    if digest is None:
+        return False
+    if digest != expected_sha1.lower():
+        logging.error(f"SHA-1 mismatch for {path.name}: expected {expected_sha1}, got {digest}")
+        return False
+    return True
@@ -0,0 +1,120 @@
+"""
+Multi-edition batches 🗂️
+-------------------------------------------------
+Professional, Home, Enterprise and Education are built from nearly the
+same UUP payload; only a few edition packages differ. A batch takes a
+set of editions for one build, merges their manifests into one union
+(each shared file is downloaded, verified and converted once), and then
+authors the ISOs from the shared staged media tree:
+
+  multi:        one ISO whose install image holds every edition, and
+                Setup asks which one to install
+  per_edition:  one ISO per edition. They all point at the same staged
+                files and differ only in sources/install.wim and an
+                ei.cfg that selects the edition.
+
+The trees are assembled in memory (see flamesnt.isowriter), so the
+shared files are never copied once per edition.
+"""
+import logging
+from pathlib import Path
+
+from .isowriter import IsoTree, IsoWriter
+from .uup import fetch_manifest, manifest_bytes
+
+BATCH_MODES = ("multi", "per_edition")
+INSTALL_IMAGE = "sources/install.wim"
+EI_CFG = "sources/ei.cfg"
+
+# GUI edition names → ei.cfg EditionID
+EI_EDITION_IDS = {
+    "Professional": "Professional",
+    "Home": "Core",
+    "Enterprise": "Enterprise",
+    "Education": "Education",
+}
+
+
+def merge_manifests(manifests: dict[str, list[dict]]) -> tuple[list[dict], dict[str, set[str]]]:
+    """Union of per-edition manifests, largest first, and {file name: editions that need it}.
+
+    The same name must mean the same file in every edition; a SHA-1 or size
+    mismatch is an error rather than a silent pick of one of them.
+    """
+    union: dict[str, dict] = {}
+    owners: dict[str, set[str]] = {}
+    for edition, manifest in manifests.items():
+        for entry in manifest:
+            seen = union.get(entry["name"])
+            if seen and (seen["sha1"] != entry["sha1"] or seen["size"] != entry["size"]):
+                raise RuntimeError(f"{entry['name']} differs between editions "
+                                   f"({', '.join(sorted(owners[entry['name']]))} and {edition}).")
+            union.setdefault(entry["name"], entry)
+            owners.setdefault(entry["name"], set()).add(edition)
+    merged = sorted(union.values(), key=lambda f: f["size"], reverse=True)
+    return merged, owners
+
+
+def batch_savings(manifests: dict[str, list[dict]], union: list[dict]) -> int:
+    """Bytes a batch doesn't download compared with one run per edition."""
+    return sum(manifest_bytes(m) for m in manifests.values()) - manifest_bytes(union)
+
+
+def fetch_batch_manifest(build_id: str, editions: list[str], lang: str = "en-us") -> tuple[list[dict], dict[str, set[str]]]:
+    """Fetch every edition's manifest and merge them (see merge_manifests)."""
+    manifests = {edition: fetch_manifest(build_id, edition, lang) for edition in editions}
+    union, owners = merge_manifests(manifests)
+    shared = sum(1 for names in owners.values() if len(names) == len(editions))
+    logging.info(f"Batch of {len(editions)} editions: {len(union)} files in the union, {shared} shared by all; "
+                 f"{batch_savings(manifests, union) / 1024**3:.2f} GiB less to download than one run each.")
+    return union, owners
+
+
+def ei_cfg(edition: str, channel: str = "Retail") -> bytes:
+    """ei.cfg that makes Setup install `edition` without asking."""
+    return (f"[EditionID]\r\n{EI_EDITION_IDS.get(edition, edition)}\r\n"
+            f"[Channel]\r\n{channel}\r\n[VL]\r\n0\r\n").encode("ascii")
+
+
+def edition_tree(media: Path, install_image: Path, edition: str | None = None) -> IsoTree:
+    """The staged media tree with `install_image` as sources/install.wim.
+
+    With an `edition`, an ei.cfg pins Setup to it; without one (a
+    multi-edition image) Setup offers every edition in the install image.
+    """
+    tree = IsoTree()
+    tree.add_directory(media)
+    tree.add_file(INSTALL_IMAGE, Path(install_image))
+    if edition:
+        tree.add_file(EI_CFG, data=ei_cfg(edition))
+    return tree
+
+
+def write_batch(media: Path, images: dict[str, Path], out_dir: Path, mode: str = "per_edition",
+                volume_id: str = "FLAMESNT", stem: str = "FlamesNT_OS", on_bytes=None,
+                cancelled=None) -> dict[str, Path] | None:
+    """Author the batch's ISOs and return {edition: ISO path}. None if cancelled.
+
+    `images` maps each edition to its install image; in multi mode they
+    must all be the same combined image, and every edition maps to the
+    one ISO.
+    """
+    if mode not in BATCH_MODES:
+        raise RuntimeError(f"Unknown batch mode '{mode}' (expected one of {', '.join(BATCH_MODES)}).")
+    out_dir = Path(out_dir)
+    if mode == "multi":
+        combined = {Path(p) for p in images.values()}
+        if len(combined) != 1:
+            raise RuntimeError("A multi-edition ISO needs one install image holding every edition.")
+        iso = out_dir / f"{stem}_multi.iso"
+        if IsoWriter(edition_tree(media, combined.pop()), volume_id).write(iso, on_bytes, cancelled) is None:
+            return None
+        return {edition: iso for edition in images}
+
+    isos = {}
+    for edition, image in images.items():
+        iso = out_dir / f"{stem}_{edition}.iso"
+        if IsoWriter(edition_tree(media, image, edition), volume_id).write(iso, on_bytes, cancelled) is None:
+            return None
+        isos[edition] = iso
+    return isos
@@ -0,0 +1,846 @@
+"""
+Flames NT install engine 🔥
+-------------------------------------------------
+Runs the download → convert → mount → prepare pipeline in its own
+process. The engine never touches Tk: every status change, progress
+tick and result is sent back to the GUI as a small event dict over the
+IPC pipe (see flamesnt.ipc), so the window's interpreter only ever
+consumes events. Status and progress are coalesced through a
+ProgressBus before they cross the pipe (see flamesnt.events). A job's
+peak disk footprint is reserved before anything is downloaded (see
+flamesnt.diskbudget). With job["output"] = "usb", "raw" or "vhdx" the
+media tree is written straight to job["output_path"] (a USB device, or a
+sparse disk image a VM can boot Setup from) instead of an ISO (see
+flamesnt.mediawriter). With job["mount"] = False an ISO is built and
+cached but not mounted (build farm workers, see flamesnt.farm). A job with several `editions` downloads their
+shared payload once and writes one ISO per edition, or a single
+multi-edition ISO (see flamesnt.editions). With job["delta"] a new build
+starts from the cached ISO of an earlier one and only fetches and
+converts the files that changed (see flamesnt.delta). With
+job["payload_cache"] verified payloads are kept by SHA-1 for later jobs,
+and job["peers"] (or the state dir's peers.txt) lists LAN machines to
+ask for payloads before going upstream (see flamesnt.peercache).
+job["proxy"] sends upstream downloads through a caching proxy that keys
+them by SHA-1 (see flamesnt.proxy). Bandwidth, CPU and I/O limits come
+from the state dir's governor.json and can change while a job runs (see
+flamesnt.governor). Edition ESDs are recompressed
+with wimlib when it is installed, using the job's convert_options preset
+(see flamesnt.convert).
+
+Events are plain dicts so they pickle cheaply:
+  {"event": "status", "message": str}
+  {"event": "progress", "value": float, "eta": float | None,
+   "stage": str | None, "stage_eta": float | None, ...}
+  {"event": "done", "result": dict}
+  {"event": "cancelled"}
+  {"event": "error", "message": str, "step": str}
+Jobs sent with "enqueue" run side by side under a scheduler (see
+flamesnt.jobqueue); their events also carry "job_id", and the queue
+reports itself as {"event": "queued", "job_id": str} and
+{"event": "queue", "jobs": [...]}. "cancel_job" and "queue_status"
+take the queue's "state_dir" too, so they work before any job was
+enqueued in this session; without one they answer with an empty queue.
+"""
+import contextlib
+import logging
+import sys
+import time
+import uuid
+from functools import wraps
+from pathlib import Path
+
+from .artifacts import ArtifactCache, CACHE_DIR_NAME, artifact_key
+from .convert import (DEFAULT_PRESET, edition_payload, export_image, refresh_image, split_image, threads_for,
+                      wimlib_available)
+from .delta import delta_summary, diff_manifests, manifest_record, pick_base, reuse_media
+from .diskbudget import budget_for, consume_source, predict_peak, same_volume, workspace_footprint
+from .download import download_file, verify_file
+from .editions import EI_EDITION_IDS, INSTALL_IMAGE, fetch_batch_manifest, write_batch
+from .events import BusFlusher, ProgressBus
+from .governor import LIMITS_FILE, Governor, governor_for, save_limits
+from .isoreader import IsoImage, find_setup
+from .isowriter import write_iso
+from .mediawriter import FAT32_MAX_FILE, write_media
+from .payloads import DEFAULT_MAX_BYTES as PAYLOAD_MAX_BYTES, PAYLOAD_DIR_NAME, PayloadStore
+from .peercache import PEERS_FILE, PeerClient, artifact_source, load_peers
+from .progress import ProgressHistory, WeightedProgress
+from .proxy import proxied_url
+from .pshost import ShellHost
+from .reaper import WorkspaceReaper
+from .staging import Stager, place_file
+from .uup import fetch_manifest, manifest_bytes
+from .wiminfo import read_wim_info
+
+# Event kinds that carry state and may be merged; everything else is delivered as-is
+STATE_EVENTS = ("status", "progress")
+PROGRESS_HISTORY_FILE = "progress_history.json"
+ISO_VOLUME_ID = "FLAMESNT"
+OUTPUTS = ("iso", "usb", "raw", "vhdx")
+MOUNT_STATE_FILE = "mounted_images.json"
+
+# Pacing of the simulated pipeline used when a build has no UUP id
+SIMULATED_FILES = 10
+SIMULATED_FILE_BYTES = 20 * 1024 * 1024
+SIMULATED_PHASES = 5
+SIMULATED_PHASE_BYTES = 120 * 1024 * 1024
+
+
+class EngineCancelled(Exception):
+    """Raised inside a step when the GUI asked us to stop."""
+
+
+def resilient(retries=3, delay=5):
+    """Retry decorator for engine steps, same behaviour as the GUI's copy."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            attempt = 0
+            while attempt < retries:
+                try:
+                    return func(*args, **kwargs)
+                except EngineCancelled:
+                    raise  # No point retrying something the user stopped
+                except Exception as e:
+                    logging.warning(f"Function {func.__name__} failed with {type(e).__name__}: {str(e)}. Retrying {attempt+1}/{retries} in {delay * (attempt + 1)}s...")
+                    attempt += 1
+                    time.sleep(delay * attempt)
+            logging.error(f"Function {func.__name__} failed after {retries} retries.")
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class InstallEngine:
+    """The installation pipeline, driven by a job dict and reporting through emit()."""
+
+    def __init__(self, emit, cancel_event, reaper: WorkspaceReaper | None = None):
+        self.emit = emit
+        self.cancel_event = cancel_event
+        self.reaper = reaper or WorkspaceReaper(busy=self.busy)
+        self.running = False
+        self.temp_dir: Path | None = None
+        self.iso_path: Path | None = None
+        self.mounted_drive: str | None = None
+        self.manifest: list[dict] = []
+        self.full_manifest: list[dict] = []
+        self.base_iso: Path | None = None  # Delta mode: the cached ISO of the build we start from
+        self.delta: dict | None = None
+        self.tracker: WeightedProgress | None = None
+        self.job_id: str | None = None
+        self.disk_budget = None
+        self.reservation = None
+        self.peak_bytes = 0
+        self.sources_held = False  # Consumed sources free nothing: the payload store links them on this volume
+        self.consumed: set[str] = set()  # Sources already folded into the image and deleted
+        self.exported: set[tuple[str, Path]] = set()  # (source, install image) exports already done
+        self.iso_cache: ArtifactCache | None = None
+        self.cache_key: str | None = None
+        self.cache_hit = False
+        self.editions: list[str] = []  # Set for batch jobs
+        self.owners: dict[str, set[str]] = {}  # Batch payload file -> editions that need it
+        self.iso_paths: dict[str, Path] = {}
+        self.media_path: str | None = None  # Device or image written by a non-ISO output
+        self.shell: ShellHost | None = None  # Started on the first real mount
+        self.payloads: PayloadStore | None = None
+        self.peers: PeerClient | None = None
+        self.received: set[str] = set()  # Payloads already SHA-1 checked as they arrived
+        self.governor: Governor | None = None  # The state dir's limits, shared with every job using it
+        # Set by a scheduler running several jobs: (stage, cancelled) -> context manager held while the stage runs
+        self.stage_gate = None
+
+    # ------------------------------------------------------------------
+    #  Event helpers
+    # ------------------------------------------------------------------
+    def update_status(self, message: str):
+        self.emit({"event": "status", "message": message})
+
+    def update_progress(self, pct: int | float):
+        self.emit({"event": "progress", "value": float(pct), "eta": None, "stage": None, "stage_eta": None})
+
+    def _advance(self, stage: str, units: float):
+        """Credit real work to a stage and report the weighted position + ETAs."""
+        self.tracker.advance(stage, units)
+        self.emit({"event": "progress", **self.tracker.snapshot()})
+        self.governor.refresh()  # New limits or a schedule boundary reach the running stage here
+
+    def _finish_stage(self, stage: str):
+        self.tracker.finish(stage)
+        self.emit({"event": "progress", **self.tracker.snapshot()})
+
+    def busy(self) -> bool:
+        """True while a job runs; the reaper backs off so it doesn't fight our I/O."""
+        return self.running
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def _check_cancelled(self):
+        if self.cancelled:
+            raise EngineCancelled()
+
+    # ------------------------------------------------------------------
+    #  Job entry point
+    # ------------------------------------------------------------------
+    def run(self, job: dict):
+        """Run every step for `job` and emit exactly one terminal event."""
+        self.temp_dir = Path(job["temp_dir"])
+        self.iso_path = None
+        self.mounted_drive = None
+        self.manifest = []
+        self.full_manifest = []  # Every file of the build; self.manifest is what still has to be fetched
+        self.base_iso = None
+        self.delta = None
+        self.job_id = job.get("job_id") or uuid.uuid4().hex[:8]
+        self.consumed = set()
+        self.exported = set()
+        self.cache_key = None
+        self.cache_hit = False
+        self.editions = self._batch_editions(job)
+        self.owners = {}
+        self.iso_paths = {}
+        self.media_path = None
+        self.payloads = None
+        self.peers = None
+        self.received = set()
+        self.governor = governor_for(job.get("state_dir"))
+        mounting = job.get("output", "iso") == "iso" and job.get("mount", True)
+        steps = [
+            ("Downloading UUP files...", "download", self.download_uup_files),
+            ("Verifying UUP files...", "verify", self.verify_uup_files),
+            ("Converting to ISO...", "convert", self.convert_to_iso),
+            ("Mounting ISO...", "mount", self.mount_iso),
+            ("Preparing for installation...", "prepare", self.prepare_installation),
+        ]
+
+        msg = "startup"
+        terminal = None  # Sent last, after the final progress tick, so nothing follows a finished job
+        self.running = True
+        try:
+            self._reset_workspace()
+            self._plan(job)
+            for msg, stage, func in steps:
+                self._check_cancelled()
+                if self.cache_hit and stage in ("download", "verify", "convert"):
+                    continue  # The cached ISO already covers these
+                if not mounting and stage in ("mount", "prepare"):
+                    continue  # Media written straight to its target, or an ISO only wanted as a file
+                with self._gate(stage), self.governor.stage(stage):
+                    self.update_status(msg)
+                    self.tracker.start(stage)
+                    func(job)
+                    self._finish_stage(stage)
+            self.tracker.history.save()
+            self.update_status("Installation completed with a big happy purr! Enjoy your new system!")
+            logging.info("Installation process completed successfully.")
+            terminal = {"event": "done", "result": {
+                "iso_path": str(self.iso_path) if self.iso_path else None,
+                "mounted_drive": self.mounted_drive,
+                "iso_paths": {edition: str(path) for edition, path in self.iso_paths.items()},
+                "media_path": self.media_path,
+                "delta": self.delta,
+                "peers": self.peers.stats if self.peers else None,
+            }}
+        except EngineCancelled:
+            logging.info("Installation process cancelled by user.")
+            self.update_status("Installation cancelled by a purr-fect decision! Meow!")
+            terminal = {"event": "cancelled"}
+        except Exception as e:
+            logging.error(f"Installation error during '{msg}': {str(e)}", exc_info=True)
+            self.update_status(f"Oh no, a little paw-slip! Error: {str(e)}")
+            terminal = {"event": "error", "message": str(e), "step": msg}
+        finally:
+            self.running = False
+            try:
+                self.update_progress(100)
+                if terminal:
+                    self.emit(terminal)  # While the workspace is still there: a farm worker uploads the ISO from it
+            finally:
+                self._cleanup_workspace()
+                if self.reservation:
+                    self.reservation.release()
+                    self.reservation = None
+
+    def _plan(self, job: dict):
+        """Size every stage from the manifest so the bar tracks real bytes."""
+        build_id = job.get("build_id")
+        if job.get("output", "iso") not in OUTPUTS:
+            raise RuntimeError(f"Unknown output '{job['output']}' (expected one of {', '.join(OUTPUTS)}).")
+        iso_output = job.get("output", "iso") == "iso"
+        if not iso_output and (self.editions or not job.get("output_path")):
+            raise RuntimeError("Writing media directly needs one edition and an output_path.")
+        if build_id and iso_output and not self.editions and self._cached_iso(job):
+            stages = [("download", 0), ("verify", 0), ("convert", 0), ("mount", 1), ("prepare", 1)]
+            history = ProgressHistory(None)
+        elif build_id:
+            self.update_status("Fetching the file list for your build... kitty is reading the menu!")
+            if self.editions:
+                self.manifest, self.owners = fetch_batch_manifest(build_id, self.editions, job.get("lang", "en-us"))
+            else:
+                self.manifest = fetch_manifest(build_id, job["edition"], job.get("lang", "en-us"))
+            self.full_manifest = self.manifest
+            if job.get("delta") or job.get("delta_from"):
+                self._plan_delta(job)
+            self._open_sharing(job)
+            payload = manifest_bytes(self.manifest)
+            self._admit(job)
+            history_file = Path(job["state_dir"]) / PROGRESS_HISTORY_FILE if job.get("state_dir") else None
+            history = ProgressHistory(history_file)
+            stages = [("download", payload), ("verify", payload), ("convert", payload), ("mount", 1), ("prepare", 1)]
+        else:
+            # No build id (offline fallback list): simulated run, sized to match the simulation's pacing.
+            # A throwaway history keeps simulated timings out of the calibration file.
+            logging.info(f"No build id for '{job['build']}', running the simulated pipeline.")
+            history = ProgressHistory(None)
+            stages = [("download", SIMULATED_FILES * SIMULATED_FILE_BYTES), ("verify", 0),
+                      ("convert", SIMULATED_PHASES * SIMULATED_PHASE_BYTES), ("mount", 1), ("prepare", 1)]
+        if not iso_output or not job.get("mount", True):
+            stages = [(name, 0 if name in ("mount", "prepare") else work) for name, work in stages]
+        self.tracker = WeightedProgress(stages, history)
+
+    @staticmethod
+    def _batch_editions(job: dict) -> list[str]:
+        """The job's batch editions (selected edition first), or [] for a single-edition job."""
+        editions = list(dict.fromkeys(job.get("editions") or []))
+        if len(editions) < 2:
+            return []
+        if job["edition"] in editions:
+            editions.remove(job["edition"])
+            editions.insert(0, job["edition"])
+        return editions
+
+    def _gate(self, stage: str):
+        if not self.stage_gate:
+            return contextlib.nullcontext()
+        return self.stage_gate(stage, lambda: self.cancelled)
+
+    def _open_cache(self, job: dict) -> ArtifactCache | None:
+        if not job.get("state_dir"):
+            return None
+        root = Path(job["state_dir"]) / CACHE_DIR_NAME
+        if not self.iso_cache or self.iso_cache.root != root:
+            self.iso_cache = open_cache(job)
+        return self.iso_cache
+
+    def _cached_iso(self, job: dict) -> bool:
+        """Look for this exact conversion in the ISO cache; on a hit, skip straight to mounting."""
+        if not self._open_cache(job):
+            return False
+        self.cache_key = artifact_key(job["build_id"], job["edition"], job.get("lang", "en-us"),
+                                      job.get("convert_options"))
+        hit = self.iso_cache.lookup(self.cache_key)
+        if hit:
+            self.iso_path = hit
+            self.cache_hit = True
+            self.update_status("Found this build in the ISO cache! No need to download it again, purr!")
+        return self.cache_hit
+
+    def _plan_delta(self, job: dict):
+        """Pick the cached ISO sharing the most files with this build and fetch only the rest."""
+        if self.editions or not self._open_cache(job):
+            logging.info("Delta rebuilds need a single edition and the ISO cache; building in full.")
+            return
+        candidates = [(key, entry) for key, entry in self.iso_cache.find(
+                          edition=job["edition"], lang=job.get("lang", "en-us"),
+                          options=job.get("convert_options") or {})
+                      if entry.get("manifest") and entry.get("build_id") != job["build_id"]
+                      and entry.get("build_id") == job.get("delta_from", entry.get("build_id"))]
+        base = pick_base(candidates, self.manifest)
+        path = self.iso_cache.lookup(base[0]) if base else None
+        if not path:
+            logging.info(f"No earlier {job['edition']} build in the ISO cache to start from; building in full.")
+            return
+        reused, changed = diff_manifests(base[1]["manifest"], self.manifest)
+        self.base_iso = path
+        self.manifest = changed
+        self.delta = delta_summary(base[1], reused, changed)
+        self.update_status(f"Starting from {base[1].get('build') or base[1].get('build_id')}: {len(reused)} files "
+                           f"unchanged, fetching {len(changed)} ({self.delta['changed_bytes'] / 1024**3:.2f} GB)... "
+                           f"Kitty remembers where the treats are!")
+
+    def _open_sharing(self, job: dict):
+        """The local payload store and the LAN peers, where the job asks for them."""
+        state = Path(job["state_dir"]) if job.get("state_dir") else None
+        if state and job.get("payload_cache"):
+            self.payloads = PayloadStore(state / PAYLOAD_DIR_NAME, job.get("payload_cache_bytes") or PAYLOAD_MAX_BYTES)
+        peers = load_peers(state / PEERS_FILE if state else None, job.get("peers"))
+        if peers:
+            self.peers = PeerClient(peers)
+            self.peers.locate(e["sha1"] for e in self.manifest if e["sha1"])
+
+    def _admit(self, job: dict):
+        """Reserve the job's predicted peak on the workspace volume, queueing if others hold it."""
+        self.sources_held = bool(self.payloads) and same_volume(self.payloads.root, self.temp_dir)
+        streaming = not job.get("keep_sources") and not self.sources_held
+        isos = len(self.editions) if self.editions and job.get("batch_output") != "multi" else 1
+        sizes = [e["size"] for e in self.manifest]
+        if self.base_iso:
+            sizes.append(self.base_iso.stat().st_size)  # The base's media and install image, copied out
+        self.peak_bytes = predict_peak(sizes, streaming=streaming, isos=isos)
+        self.disk_budget = budget_for(self.temp_dir, reclaimable=self.reaper.pending_bytes)
+
+        def on_wait(needed, available):
+            self.update_status(f"Waiting for disk space: need {needed / 1024**3:.1f} GB, "
+                               f"{max(available, 0) / 1024**3:.1f} GB free... kitty is tidying up!")
+
+        workspace = self.temp_dir
+        self.reservation = self.disk_budget.reserve(self.job_id, self.peak_bytes,
+                                                    cancelled=lambda: self.cancelled, on_wait=on_wait,
+                                                    footprint=lambda: workspace_footprint(workspace))
+        self._check_cancelled()
+
+    def _reset_workspace(self):
+        self.reaper.discard(self.temp_dir) # Instant rename; the reaper deletes it in the background
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+
+    def _cleanup_workspace(self):
+        if self.mounted_drive:  # Before the workspace goes: Windows won't move a mounted image
+            if self.shell and self.iso_path:
+                try:
+                    self.shell.dismount(self.iso_path)
+                except RuntimeError as e:
+                    logging.warning(f"Could not dismount {self.iso_path}: {e}")
+            else:
+                logging.info(f"Unmounting ISO from {self.mounted_drive} (placeholder).")
+            self.mounted_drive = None
+        if self.temp_dir and self.reaper.discard(self.temp_dir):
+            logging.info(f"Temporary directory {self.temp_dir} handed to the reaper.")
+
+    # ------------------------------------------------------------------
+    #  Pipeline steps
+    # ------------------------------------------------------------------
+    @resilient(retries=3, delay=15)
+    def download_uup_files(self, job: dict):
+        logging.info("Starting UUP file download process...")
+        logging.info(f"Selected build for UUP download: {job['build']}")
+        self.tracker.start("download")  # Restart the stage on retries so bytes aren't double counted
+
+        if not self.full_manifest:
+            # Placeholder: Simulate download activity
+            for i in range(SIMULATED_FILES):
+                self._check_cancelled()
+                self.update_status(f"Downloading UUP file {i+1}/{SIMULATED_FILES}... Purr...")
+                time.sleep(1)
+                self._advance("download", SIMULATED_FILE_BYTES)
+            logging.info("UUP files download (simulated) complete.")
+            return
+
+        total = len(self.manifest)
+        for i, entry in enumerate(self.manifest, 1):
+            self._check_cancelled()
+            dest = self.temp_dir / entry["name"]
+            if dest.exists() and dest.stat().st_size == entry["size"]:
+                self._advance("download", entry["size"])  # Left over from a previous attempt
+                continue
+            if self._fetch_shared(entry, dest, f"{i}/{total}"):
+                continue
+            self.update_status(f"Downloading UUP file {i}/{total}: {entry['name']}... Purr...")
+            url = proxied_url(job["proxy"], entry["url"], entry["sha1"]) if job.get("proxy") else entry["url"]
+            download_file(url, dest,
+                          on_bytes=lambda n: self._advance("download", n),
+                          cancelled=lambda: self.cancelled,
+                          throttle=self.governor.meter(url, lambda: self.cancelled))
+            self._check_cancelled()
+        logging.info(f"Downloaded {total} UUP files.")
+
+    def _fetch_shared(self, entry: dict, dest: Path, position: str) -> bool:
+        """Get a payload from the local store or a LAN peer instead of upstream, where one has it."""
+        if not entry["sha1"]:
+            return False
+        stored = self.payloads.get(entry["sha1"]) if self.payloads else None
+        if stored:
+            place_file(stored, dest, link=True)
+            self._advance("download", entry["size"])
+        elif self.peers and entry["sha1"] in self.peers.located:
+            self.update_status(f"Borrowing UUP file {position} from a neighbour: {entry['name']}... Purr...")
+            if not self.peers.fetch(entry["sha1"], dest, on_bytes=lambda n: self._advance("download", n),
+                                    cancelled=lambda: self.cancelled,
+                                    meter=lambda peer: self.governor.meter(peer, lambda: self.cancelled)):
+                self._check_cancelled()
+                return False
+        else:
+            return False
+        self.received.add(entry["name"])
+        return True
+
+    def verify_uup_files(self, job: dict):
+        for i, entry in enumerate(self.manifest, 1):
+            self._check_cancelled()
+            path = self.temp_dir / entry["name"]
+            if entry["name"] in self.received:
+                self._advance("verify", entry["size"])  # Hashed against the manifest on the way in
+            else:
+                self.update_status(f"Checking paw prints on file {i}/{len(self.manifest)}: {entry['name']}...")
+                if not self.governor.hashing.acquire(lambda: self.cancelled):
+                    raise EngineCancelled()  # Waited for a hashing thread and was cancelled
+                try:
+                    ok = verify_file(path, entry["sha1"],
+                                     on_bytes=lambda n: self._advance("verify", n),
+                                     cancelled=lambda: self.cancelled)
+                finally:
+                    self.governor.hashing.release()
+                self._check_cancelled()
+                if not ok:
+                    path.unlink(missing_ok=True)
+                    raise RuntimeError(f"{entry['name']} failed its SHA-1 check. It has been removed; "
+                                       f"please try again.")
+            if self.payloads and entry["sha1"]:
+                self.payloads.add(path, entry["sha1"], verified=True)
+
+    @resilient(retries=1)
+    def convert_to_iso(self, job: dict):
+        logging.info("Starting UUP to ISO conversion process...")
+        self.update_status("Converting UUP files to ISO... Kitty is crafting!")
+        self.tracker.start("convert")
+
+        if self.full_manifest:
+            # What's left to write: the peak we reserved minus the payload already on disk
+            payload = sum(e["size"] for e in self.manifest if self.sources_held or e["name"] not in self.consumed)
+            self.disk_budget.check(self.job_id, self.peak_bytes - payload, "Conversion")
+            # Edition ESDs are exported for real when wimlib is here; the other sources are still simulated
+            exports = self._planned_exports(job)
+            done = {dest for _name, dest in self.exported}
+            for dest in {d for targets in exports.values() for d, _index in targets} - done:
+                dest.unlink(missing_ok=True)  # Partial output of an earlier attempt; wimlib would append to it
+            if self.base_iso:
+                self._reuse_base(done)
+            total = len(self.manifest)
+            for i, entry in enumerate(self.manifest, 1):
+                self._check_cancelled()
+                if entry["name"] in self.consumed:
+                    self._advance("convert", entry["size"])  # Already in the image from an earlier attempt
+                    continue
+                self.update_status(f"Converting... File {i}/{total}: {entry['name']}... Meow...")
+                if entry["name"] in exports:
+                    self._export(job, entry, exports[entry["name"]])  # Credits the stage as wimlib reports
+                else:
+                    time.sleep(2)
+                    self._advance("convert", entry["size"])
+                if not job.get("keep_sources"):
+                    consume_source(self.temp_dir / entry["name"])
+                    self.consumed.add(entry["name"])
+        else:
+            phase_bytes = self.tracker.stages["convert"].work / SIMULATED_PHASES
+            # Placeholder: Simulate conversion activity
+            for i in range(SIMULATED_PHASES):
+                self._check_cancelled()
+                self.update_status(f"Converting... Phase {i+1}/{SIMULATED_PHASES}... Meow...")
+                time.sleep(2)
+                self._advance("convert", phase_bytes)
+
+        # The media tree is still a placeholder, but the image itself is authored for real
+        media = self.temp_dir / "media"
+        if self.base_iso:
+            self.update_status("Copying the unchanged media from the previous build... Purr...")
+            with IsoImage(self.base_iso) as base:
+                if reuse_media(base, media, cancelled=lambda: self.cancelled) is None:
+                    raise EngineCancelled()
+        media.mkdir(exist_ok=True)
+        (media / "README.txt").write_text("This is a placeholder media tree, purr!")
+        if self.editions:
+            self._write_batch(job, media)
+            return
+        image = self.temp_dir / "images" / "install.wim"
+        if image.exists():
+            # Linked into the layout, not copied; the ISO writer reads it from there in one pass
+            stager = Stager(media)
+            stager.place(image, "sources/install.wim")
+            logging.info(stager.report())
+        if job.get("output", "iso") != "iso":
+            self._write_media(job, media)
+            return
+        self.iso_path = self.temp_dir / "FlamesNT_OS.iso"
+        if write_iso(media, self.iso_path, ISO_VOLUME_ID, cancelled=lambda: self.cancelled) is None:
+            raise EngineCancelled()
+        logging.info(f"UUP to ISO conversion (simulated) complete. ISO at {self.iso_path}")
+        if self.iso_cache and self.cache_key:
+            self.iso_path = self.iso_cache.store(self.cache_key, self.iso_path, {
+                "build_id": job["build_id"], "build": job["build"], "edition": job["edition"],
+                "lang": job.get("lang", "en-us"), "options": job.get("convert_options") or {},
+                "manifest": manifest_record(self.full_manifest),  # Lets a later build start from this one
+            })
+        if self.delta:
+            logging.info(f"Delta build from {self.delta['base_build']}: fetched {self.delta['changed_files']} files "
+                         f"({self.delta['fetched_fraction']:.1%} of the payload), reused {self.delta['reused_files']}.")
+
+    def _planned_exports(self, job: dict) -> dict[str, list[tuple[Path, int]]]:
+        """Edition ESD name -> (install image, image index) pairs to export, if wimlib can do it here.
+
+        The index comes from the ESD's own XML metadata, so a payload that
+        lacks the edition fails here rather than after a long export.
+        """
+        if not wimlib_available():
+            logging.info("wimlib not found; conversion stays simulated.")
+            return {}
+        names = [e["name"] for e in self.manifest]
+        exports: dict[str, list[tuple[Path, int]]] = {}
+        for edition in self.editions or [job["edition"]]:
+            esd = edition_payload(names, edition)
+            if not self.editions:
+                dest = self.temp_dir / "images" / "install.wim"
+            else:
+                dest = self.temp_dir / "images" / ("install.wim" if job.get("batch_output") == "multi"
+                                                   else f"{edition}.wim")
+            if not esd or (esd, dest) in self.exported:
+                continue
+            image = read_wim_info(self.temp_dir / esd).find_edition(EI_EDITION_IDS.get(edition, edition))
+            if not image:
+                raise RuntimeError(f"{esd} has no {edition} image.")
+            exports.setdefault(esd, []).append((dest, image["index"]))
+        return exports
+
+    def _reuse_base(self, done: set[Path]):
+        """Delta mode: the base's install image is where the export starts (or the result, if the ESD is unchanged)."""
+        image = self.temp_dir / "images" / "install.wim"
+        if image in done:
+            return  # Already refreshed by an earlier attempt
+        with IsoImage(self.base_iso) as base:
+            if not base.exists(INSTALL_IMAGE):
+                return
+            image.parent.mkdir(parents=True, exist_ok=True)
+            self.update_status("Copying the previous build's install image... Kitty remembers!")
+            if base.extract(INSTALL_IMAGE, image, cancelled=lambda: self.cancelled) is None:
+                raise EngineCancelled()
+
+    def _export(self, job: dict, entry: dict, targets: list[tuple[Path, int]]):
+        options = job.get("convert_options") or {}
+        preset = options.get("preset", DEFAULT_PRESET)
+        threads = self.governor.convert_threads(options.get("threads") or threads_for(preset))
+        share = entry["size"] / len(targets)  # Convert-stage work for each export of this source
+        for dest, index in targets:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            self.update_status(f"Recompressing {entry['name']} ({preset})... Kitty is kneading the bytes!")
+            credited = 0.0
+
+            def on_progress(event):
+                nonlocal credited
+                target = share * min(event["percent"], 100.0) / 100
+                if target > credited:  # wimlib restarts its percentage per phase; never go backwards
+                    self._advance("convert", target - credited)
+                    credited = target
+                self.update_status(f"{event['phase']}: {event['percent']:.0f}% of {entry['name']}... "
+                                   f"Kitty is kneading the bytes!")
+
+            spawned = []
+
+            def on_spawn(pid):
+                spawned.append(pid)
+                self.governor.adopt(pid, "convert")
+
+            try:
+                if self.base_iso and dest.exists():
+                    # Delta: only data the previous build's image lacks gets compressed
+                    stats = refresh_image(dest, self.temp_dir / entry["name"], index, preset=preset,
+                                          threads=threads, on_progress=on_progress,
+                                          cancelled=lambda: self.cancelled, on_spawn=on_spawn)
+                else:
+                    stats = export_image(self.temp_dir / entry["name"], dest, index, preset=preset,
+                                         threads=threads, on_progress=on_progress,
+                                         cancelled=lambda: self.cancelled, on_spawn=on_spawn)
+            finally:
+                for pid in spawned:  # Reaped by now; its PID may be reused by anything
+                    self.governor.release(pid)
+            if stats is None:
+                raise EngineCancelled()
+            self._advance("convert", share - credited)
+            self.exported.add((entry["name"], dest))
+
+    def _write_media(self, job: dict, media: Path):
+        """Write the media tree straight to a USB device or disk image; no ISO in between."""
+        wim = media / "sources" / "install.wim"
+        if wim.exists() and wim.stat().st_size > FAT32_MAX_FILE:
+            self.update_status("Splitting install.wim to fit on FAT32... Kitty is slicing the cake!")
+            parts = split_image(wim, self.temp_dir / "images" / "install.swm", cancelled=lambda: self.cancelled)
+            if parts is None:
+                raise EngineCancelled()
+            wim.unlink()
+            stager = Stager(media)
+            for part in parts:
+                stager.place(part, f"sources/{part.name}")
+        output = job["output"]
+        target = "bootable media" if output == "usb" else f"the {output} disk image"
+        self.update_status(f"Writing {target} to {job['output_path']}... Hold on to your whiskers!")
+        stats = write_media(media, job["output_path"], job.get("output_size"), ISO_VOLUME_ID,
+                            cancelled=lambda: self.cancelled, image_format=None if output == "usb" else output)
+        if stats is None:
+            raise EngineCancelled()
+        self.media_path = str(job["output_path"])
+        logging.info(f"Bootable media ready at {self.media_path} ({stats['mb_per_s']} MB/s).")
+
+    def _write_batch(self, job: dict, media: Path):
+        """Author every ISO of a batch from the one staged media tree, then cache each of them."""
+        mode = job.get("batch_output") or "per_edition"
+        images_dir = self.temp_dir / "images"
+        images_dir.mkdir(exist_ok=True)
+        # Placeholder install images: each lists the payload files its edition was built from
+        if mode == "multi":
+            image = images_dir / "install.wim"
+            if not image.exists():
+                image.write_text("Placeholder multi-edition install image: " + ", ".join(self.editions))
+            images = {edition: image for edition in self.editions}
+        else:
+            images = {}
+            for edition in self.editions:
+                images[edition] = images_dir / f"{edition}.wim"
+                if images[edition].exists():
+                    continue  # Exported by wimlib during conversion
+                files = sorted(name for name, owners in self.owners.items() if edition in owners)
+                images[edition].write_text(f"Placeholder {edition} install image\n" + "\n".join(files))
+        self.update_status(f"Writing {'one multi-edition ISO' if mode == 'multi' else f'{len(images)} ISOs'} "
+                           f"from the shared files... Kitty is stamping them out!")
+        isos = write_batch(media, images, self.temp_dir, mode, ISO_VOLUME_ID, cancelled=lambda: self.cancelled)
+        if isos is None:
+            raise EngineCancelled()
+
+        cache = self._open_cache(job) if job.get("build_id") else None
+        stored: dict[Path, Path] = {}
+        for edition, iso in isos.items():
+            if cache and iso not in stored:
+                label = "+".join(sorted(self.editions)) if mode == "multi" else edition
+                key = artifact_key(job["build_id"], label, job.get("lang", "en-us"), job.get("convert_options"))
+                stored[iso] = cache.store(key, iso, {
+                    "build_id": job["build_id"], "build": job["build"], "edition": label,
+                    "lang": job.get("lang", "en-us"), "options": job.get("convert_options") or {},
+                })
+            self.iso_paths[edition] = stored.get(iso, iso)
+        self.iso_path = self.iso_paths[self.editions[0]]  # The selected edition is the one we mount
+        logging.info(f"Batch conversion (simulated) complete: {len(set(self.iso_paths.values()))} ISO(s) "
+                     f"for {', '.join(self.editions)}.")
+
+    @resilient(retries=2)
+    def mount_iso(self, job: dict):
+        logging.info("Mounting ISO image...")
+        self.update_status("Mounting the shiny new ISO... Almost there!")
+
+        if not self.iso_path or not self.iso_path.exists():
+            logging.error("ISO file not found for mounting. Conversion step might have failed.")
+            raise FileNotFoundError("ISO file to mount is missing. Please check conversion logs.")
+
+        # Read the image directly first: a broken ISO fails here in milliseconds instead of in Mount-DiskImage
+        media = find_setup(self.iso_path)
+        logging.info(f"ISO {media['label']!r} ({media['fs']}): setup.exe={media['setup_exe']}, "
+                     f"install image={media['install_image']}")
+        if not media["setup_exe"]:
+            logging.warning("No setup.exe in the image (placeholder media tree).")
+
+        if sys.platform != "win32":
+            time.sleep(2)  # Simulate mounting
+            self.mounted_drive = "Z:"
+            logging.info(f"ISO mounted (simulated) to drive: {self.mounted_drive}")
+            return
+        if not self.shell:
+            state = Path(job["state_dir"]) / MOUNT_STATE_FILE if job.get("state_dir") else None
+            self.shell = ShellHost(state_file=state)
+        drive = self.shell.mount(self.iso_path)
+        if not drive:
+            raise RuntimeError("The ISO mounted but Windows gave it no drive letter.")
+        self.mounted_drive = f"{drive}:"
+        logging.info(f"ISO mounted to drive: {self.mounted_drive}")
+
+    def prepare_installation(self, job: dict):
+        logging.info("Preparing for OS installation from mounted ISO...")
+        self.update_status("Preparing for installation... Getting the red carpet ready!")
+
+        if not self.mounted_drive:
+            logging.error("ISO not mounted. Cannot prepare for installation.")
+            raise RuntimeError("ISO drive not available. Mount step might have failed.")
+
+        time.sleep(3)  # Simulate preparation
+        logging.info("Preparation for installation (simulated) complete.")
+
+
+def open_cache(job: dict) -> ArtifactCache | None:
+    """The ISO cache in the job's state dir, sized and tiered as the job asks."""
+    if not job.get("state_dir"):
+        return None
+    state = Path(job["state_dir"])
+    cache = ArtifactCache(state / CACHE_DIR_NAME,
+                          **({"max_bytes": job["cache_max_bytes"]} if job.get("cache_max_bytes") else {}),
+                          dedupe=bool(job.get("cache_dedupe")))
+    # Damaged chunks of a cached ISO can come back from a LAN peer that has the same image
+    cache.repair_sources += [artifact_source(peer) for peer in load_peers(state / PEERS_FILE, job.get("peers"))]
+    return cache
+
+
+def engine_main(conn, cancel_event, log_file: str | None = None):
+    """Entry point of the engine process: serve commands until told to stop."""
+    if log_file:
+        logging.basicConfig(filename=log_file, level=logging.INFO,
+                            format='%(asctime)s - %(levelname)s - %(processName)s - %(filename)s:%(lineno)d - %(message)s')
+
+    def send(channel: str, event: dict):
+        try:
+            conn.send(event)
+        except (BrokenPipeError, EOFError, OSError):
+            cancel_event.set()  # GUI went away, wind down quietly
+
+    # Steps may report as often as they like; the flusher merges and rate-limits what crosses the pipe
+    bus = ProgressBus()
+    flusher = BusFlusher(bus, send)
+    flusher.start()
+
+    def emit(event: dict):
+        if event["event"] in STATE_EVENTS:
+            # Queued jobs run side by side: keep the latest state of each one, not just the last reporter
+            bus.publish(f"{event['event']}:{event['job_id']}" if "job_id" in event else event["event"], event)
+        else:
+            bus.post(event["event"], event)
+
+    engine = InstallEngine(emit, cancel_event)
+    engine.reaper.start() # Also resumes deletions interrupted by the last shutdown
+    scheduler = None  # Started by the first queue command (see flamesnt.jobqueue)
+
+    def open_scheduler(state_dir: str):
+        nonlocal scheduler
+        if not scheduler:
+            from .jobqueue import QUEUE_FILE, JobQueue, Scheduler  # Imports this module
+
+            candidate = Scheduler(JobQueue(Path(state_dir) / QUEUE_FILE), emit)
+            try:
+                candidate.start()  # Also picks up jobs queued before the last shutdown
+            except RuntimeError as e:  # A `jobqueue run` owns this queue; its jobs aren't ours to restart
+                candidate.queue.close()
+                emit({"event": "error", "message": str(e), "step": "queue"})
+                return None
+            scheduler = candidate
+        return scheduler
+
+    logging.info("Engine process started.")
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        cmd = msg.get("cmd")
+        if cmd == "shutdown":
+            break
+        if cmd == "install":
+            cancel_event.clear()
+            engine.run(msg["job"])
+        elif cmd == "enqueue":
+            if open_scheduler(msg["job"]["state_dir"]):
+                job_id = scheduler.submit(msg["job"], msg.get("priority", 0))
+                emit({"event": "queued", "job_id": job_id})
+        elif cmd == "open_queue":
+            open_scheduler(msg["state_dir"])
+        elif cmd == "set_limits":
+            # Also reaches a job already running; anything else writing governor.json does too (see flamesnt.governor)
+            try:
+                save_limits(Path(msg["state_dir"]) / LIMITS_FILE, msg["limits"])
+                governor_for(msg["state_dir"]).refresh(force=True)
+            except RuntimeError as e:
+                emit({"event": "error", "message": str(e), "step": "set_limits"})
+        elif cmd in ("cancel_job", "queue_status"):
+            if not scheduler and msg.get("state_dir"):
+                open_scheduler(msg["state_dir"])  # Jobs queued in an earlier session are the ones asked about
+            if scheduler and cmd == "cancel_job":
+                scheduler.cancel(msg["job_id"])
+            emit({"event": "queue", "jobs": scheduler.snapshot() if scheduler else []})
+        else:
+            logging.warning(f"Engine received unknown command: {cmd!r}")
+    if scheduler:
+        scheduler.stop()  # Running queue jobs are queued again for the next start
+    if engine.shell:
+        engine.shell.close()  # Dismounts anything still mounted, in one go
+    flusher.stop()
+    logging.info("Engine process exiting.")
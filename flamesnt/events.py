@@ -0,0 +1,122 @@
+"""
+Coalescing progress/status event bus.
+-------------------------------------------------
+Producers (the engine, an aria2c stdout reader, a hashing loop) can
+publish as fast as they like. Each channel keeps only its latest value,
+and consumers drain the bus on their own schedule, so the Tk queue sees
+at most one refresh per channel per tick however fast work reports.
+
+Two kinds of messages:
+  publish(channel, value)  – state; newer values replace older ones.
+  post(channel, value)     – events that must never be merged or dropped
+                             (done/error/cancelled); delivered in order,
+                             after the latest state.
+"""
+import logging
+import threading
+import time
+
+DEFAULT_HZ = 20.0
+
+
+class ProgressBus:
+    """Thread-safe latest-value-wins bus."""
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._latest: dict[str, object] = {}
+        self._ordered: list[tuple[str, object]] = []
+
+    def publish(self, channel: str, value):
+        with self._lock:
+            self._latest.pop(channel, None)  # Re-insert so channels drain in last-touched order
+            self._latest[channel] = value
+            self._lock.notify()
+
+    def post(self, channel: str, value):
+        with self._lock:
+            self._ordered.append((channel, value))
+            self._lock.notify()
+
+    def take(self) -> list[tuple[str, object]]:
+        """Everything pending: merged state first, then ordered events."""
+        with self._lock:
+            items = list(self._latest.items()) + self._ordered
+            self._latest = {}
+            self._ordered = []
+        return items
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until something is pending. Returns False on timeout."""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._latest or self._ordered, timeout)
+
+    def wake(self):
+        """Release anyone blocked in wait() without publishing anything."""
+        with self._lock:
+            self._lock.notify_all()
+
+    def has_ordered(self) -> bool:
+        with self._lock:
+            return bool(self._ordered)
+
+
+class BusFlusher(threading.Thread):
+    """Delivers a bus to `sink(channel, value)` at most `hz` times a second.
+
+    Ordered events skip the rate limit so a finished job is reported at once.
+    """
+
+    def __init__(self, bus: ProgressBus, sink, hz: float = DEFAULT_HZ):
+        super().__init__(name="BusFlusher", daemon=True)
+        self.bus = bus
+        self.sink = sink
+        self.interval = 1.0 / hz
+        self._halt = threading.Event()
+
+    def run(self):
+        last = 0.0
+        while not self._halt.is_set():
+            if not self.bus.wait(timeout=0.5):
+                continue
+            delay = last + self.interval - time.monotonic()
+            if delay > 0 and not self.bus.has_ordered():
+                self._halt.wait(delay)  # Let more updates pile up and merge
+            self._deliver()
+            last = time.monotonic()
+        self._deliver()
+
+    def _deliver(self):
+        for channel, value in self.bus.take():
+            self.sink(channel, value)
+
+    def stop(self, timeout: float = 1.0):
+        """Flush whatever is left and stop the thread."""
+        self._halt.set()
+        self.bus.wake()
+        self.join(timeout)
+
+
+def pump_into_tk(root, bus: ProgressBus, handlers: dict, hz: float = DEFAULT_HZ, before_tick=None):
+    """Drain `bus` on the Tk thread `hz` times a second.
+
+    `handlers` maps channel → callable(value); unknown channels are ignored.
+    `before_tick`, if given, runs first on each tick (e.g. to pull events
+    from a pipe into the bus).
+    """
+    interval_ms = max(1, int(1000 / hz))
+
+    def tick():
+        try:
+            if before_tick:
+                before_tick()
+            for channel, value in bus.take():
+                handler = handlers.get(channel)
+                if handler:
+                    handler(value)
+        except Exception:
+            logging.exception("UI update failed")  # Rest of this tick's items are dropped; later ticks still run
+        finally:
+            root.after(interval_ms, tick)
+
+    root.after(interval_ms, tick)
@@ -0,0 +1,536 @@
+"""
+Build farm 🏭
+-------------------------------------------------
+One coordinator and any number of worker nodes, talking plain HTTP.
+
+The coordinator holds the job queue (a JobQueue, see flamesnt.jobqueue),
+the content index (which payload SHA-1s each worker has in its payload
+store) and the shared artifact store (an ArtifactCache). When a worker
+asks for work it gets the queued job whose payload it already holds most
+of, plus the URLs of the other workers' peer caches that have the rest
+(see flamesnt.peercache). A job that has waited longer than
+AFFINITY_WAIT goes to the next free worker whatever it holds, so nothing
+starves.
+
+Each worker runs jobs through a local Scheduler with mounting off, keeps
+every payload it verifies, serves its payloads and cached ISOs to the
+other workers, and uploads each finished ISO to the coordinator. A worker that misses
+heartbeats for WORKER_TIMEOUT is presumed dead, and its jobs are queued
+again. Each heartbeat lists the jobs the worker still holds (running,
+or finished with the report not yet through, which it keeps retrying);
+a job assigned to it for more than CLAIM_GRACE that isn't on the list
+was lost on the worker and is queued again too.
+
+Coordinator API:
+  POST /jobs                    {"job": {...}, "priority": n} -> {"job_id"}
+  GET  /jobs                    every job and its status
+  POST /jobs/ID/cancel
+  POST /workers                 {"name", "url", "have": [...]} -> {"worker_id"}
+  POST /workers/ID/heartbeat    {"have": [...], "running": [...]} -> {"cancel": [...]}
+  POST /workers/ID/claim        -> {"job": {...}} or 204
+  POST /jobs/ID/finish          {"status", "result", "error"}
+  PUT  /artifacts/ID            the finished ISO (X-Content-SHA256 checked)
+  GET  /artifacts/ID            download it
+
+Usage:
+  python -m flamesnt.farm coordinator --state DIR [--port 8790]
+  python -m flamesnt.farm worker --coordinator http://HOST:8790 --state DIR [--peer-port 8787] [--jobs 2]
+  python -m flamesnt.farm submit --coordinator http://HOST:8790 --build-id ID --edition Professional
+
+Several workers on one machine (each with its own --state and
+--peer-port) make a test cluster.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from .artifacts import CACHE_DIR_NAME, artifact_key
+from .download import hash_file
+from .engine import open_cache
+from .jobqueue import TERMINAL, JobQueue, Scheduler
+from .payloads import PAYLOAD_DIR_NAME, PayloadStore
+from .peercache import PeerCacheServer
+
+DEFAULT_PORT = 8790
+FARM_QUEUE_FILE = "farm_queue.sqlite"
+HEARTBEAT_INTERVAL = 5.0
+WORKER_TIMEOUT = 60.0
+CLAIM_GRACE = 30.0  # Seconds a just-claimed job may be missing from its worker's heartbeat
+UPLOAD_ATTEMPTS = 3
+AFFINITY_WAIT = 300.0  # Seconds a job may wait for a worker that already has its payload
+CHUNK_SIZE = 1024 * 1024
+
+
+def _payload_of(job: dict) -> list[dict]:
+    """[{"sha1", "size"}] of the job's payload files, from the UUP manifest; [] if it can't be had."""
+    if job.get("payload") is not None or not job.get("build_id"):
+        return job.get("payload") or []
+    from .uup import fetch_manifest
+
+    try:
+        manifest = fetch_manifest(job["build_id"], job["edition"], job.get("lang", "en-us"))
+    except Exception as e:  # Offline, or the API is having a bad day: schedule without affinity
+        logging.warning(f"Farm: no manifest for {job['build_id']} ({e}); scheduling it without payload affinity.")
+        return []
+    return [{"sha1": e["sha1"], "size": e["size"]} for e in manifest if e["sha1"]]
+
+
+# ----------------------------------------------------------------------
+#  Coordinator
+# ----------------------------------------------------------------------
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    server_version = "FlamesNT-Farm/1"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug(f"Farm {self.client_address[0]}: {format % args}")
+
+    def _reply(self, data=None, status: int = 200):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _route(self, method: str):
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        farm = self.server
+        try:
+            if method == "GET" and parts == ["jobs"]:
+                return self._reply({"jobs": farm.queue.list()})
+            if method == "POST" and parts == ["jobs"]:
+                body = self._body()
+                return self._reply({"job_id": farm.submit(body["job"], body.get("priority", 0))})
+            if method == "POST" and parts == ["workers"]:
+                return self._reply({"worker_id": farm.register(self._body())})
+            if len(parts) == 3 and parts[0] == "workers" and method == "POST":
+                if parts[1] not in farm.workers:
+                    return self._reply({"error": "unknown worker; register again"}, 410)
+                if parts[2] == "heartbeat":
+                    return self._reply(farm.heartbeat(parts[1], self._body()))
+                if parts[2] == "claim":
+                    job = farm.claim(parts[1])
+                    return self._reply({"job": job}) if job else self._reply(status=204)
+            if len(parts) == 3 and parts[0] == "jobs" and method == "POST":
+                if parts[2] == "cancel":
+                    return self._reply({"cancelled": farm.queue.cancel(parts[1])})
+                if parts[2] == "finish":
+                    ok = farm.finish(parts[1], self._body())
+                    return self._reply({"ok": ok}, 200 if ok else 409)
+            if len(parts) == 2 and parts[0] == "artifacts":
+                if method == "PUT":
+                    return self._receive_artifact(parts[1])
+                if method in ("GET", "HEAD"):
+                    return self._send_artifact(parts[1], head=method == "HEAD")
+        except (ValueError, KeyError, TypeError) as e:
+            return self._reply({"error": f"bad request: {e}"}, 400)
+        self._reply({"error": "not found"}, 404)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_HEAD(self):
+        self._route("HEAD")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def _receive_artifact(self, job_id: str):
+        farm = self.server
+        entry = farm.queue.get(job_id)
+        if not entry or farm.assigned.get(job_id) != self.headers.get("X-Worker-Id"):
+            return self._reply({"error": "not this worker's job"}, 409)
+        length = int(self.headers["Content-Length"])
+        upload = farm.artifacts.root / f"{job_id}.upload"
+        h = hashlib.sha256()
+        with open(upload, "wb") as f:
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                h.update(chunk)
+                remaining -= len(chunk)
+        expected = (self.headers.get("X-Content-SHA256") or "").lower()
+        if remaining or (expected and h.hexdigest() != expected):
+            upload.unlink(missing_ok=True)
+            return self._reply({"error": "upload was cut short or doesn't match its SHA-256"}, 400)
+        job = entry["job"]
+        farm.artifacts.store(farm.artifact_key(job_id), upload, {
+            "build_id": job.get("build_id"), "build": job.get("build"), "edition": job.get("edition"),
+            "lang": job.get("lang", "en-us"), "options": job.get("convert_options") or {}, "job_id": job_id})
+        logging.info(f"Farm: stored the ISO of job {job_id} ({length / 1024**2:.0f} MB).")
+        self._reply({"artifact": f"/artifacts/{job_id}"})
+
+    def _send_artifact(self, job_id: str, head: bool):
+        known = self.server.queue.get(job_id)
+        path = self.server.artifacts.lookup(self.server.artifact_key(job_id)) if known else None
+        if not path:
+            return self._reply({"error": "no artifact for this job"}, 404)
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            if not head and size:
+                self.connection.sendfile(f, 0, size)
+
+
+class FarmCoordinator(ThreadingHTTPServer):
+    """Job queue, content index and artifact store of a build farm, served over HTTP."""
+
+    daemon_threads = True
+
+    def __init__(self, state_dir: Path, host: str = "0.0.0.0", port: int = DEFAULT_PORT):
+        super().__init__((host, port), CoordinatorHandler)
+        self.state_dir = Path(state_dir)
+        self.queue = JobQueue(self.state_dir / FARM_QUEUE_FILE)
+        self.queue.recover()  # Jobs handed out before a restart go out again
+        self.artifacts = open_cache({"state_dir": str(self.state_dir)})
+        self.workers: dict[str, dict] = {}  # Worker id -> name, url, have (set of SHA-1s), last_seen
+        self.assigned: dict[str, str] = {}  # Job id -> worker id
+        self.claimed: dict[str, float] = {}  # Job id -> when its worker claimed it
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """Serve on a background thread (shutdown() stops it)."""
+        thread = threading.Thread(target=self.serve_forever, name="FarmCoordinator", daemon=True)
+        thread.start()
+        logging.info(f"Farm coordinator at {self.url}.")
+        return thread
+
+    def artifact_key(self, job_id: str) -> str:
+        job = self.queue.get(job_id)["job"]
+        if job.get("build_id"):
+            return artifact_key(job["build_id"], job["edition"], job.get("lang", "en-us"), job.get("convert_options"))
+        return f"farm-{job_id}"
+
+    def submit(self, job: dict, priority: int = 0) -> str:
+        job = {k: v for k, v in job.items() if k not in ("temp_dir", "state_dir")}  # Workers bring their own
+        job["payload"] = _payload_of(job)
+        return self.queue.add(job, priority)
+
+    def register(self, info: dict) -> str:
+        worker_id = uuid.uuid4().hex[:8]
+        with self._lock:
+            self.workers[worker_id] = {"name": info.get("name") or worker_id, "url": info.get("url"),
+                                       "have": set(info.get("have", [])), "last_seen": time.time()}
+        logging.info(f"Farm: worker {info.get('name')} joined ({info.get('url')}, "
+                     f"{len(info.get('have', []))} payloads).")
+        return worker_id
+
+    def heartbeat(self, worker_id: str, info: dict) -> dict:
+        self._expire()
+        with self._lock:
+            worker = self.workers[worker_id]
+            worker["last_seen"] = time.time()
+            if "have" in info:
+                worker["have"] = set(info["have"])
+            mine = [j for j, w in self.assigned.items() if w == worker_id]
+            lost = []
+            if "running" in info:  # The jobs it still holds; the rest it dropped (a failed submit, a crash)
+                held, now = set(info["running"]), time.time()
+                lost = [j for j in mine if j not in held and now - self.claimed.get(j, 0) > CLAIM_GRACE]
+                for job_id in lost:
+                    del self.assigned[job_id]
+                    self.claimed.pop(job_id, None)
+                mine = [j for j in mine if j not in lost]
+        for job_id in lost:
+            logging.warning(f"Farm: worker {worker['name']} no longer has job {job_id}; requeueing it.")
+            if self.queue.get(job_id)["status"] == "cancelling":
+                self.queue.finish(job_id, "cancelled", error="lost on the worker while cancelling")
+            else:
+                self.queue.requeue(job_id)
+        cancel = [j for j in mine if (self.queue.get(j) or {}).get("status") == "cancelling"]
+        return {"cancel": cancel}
+
+    def claim(self, worker_id: str) -> dict | None:
+        """The queued job this worker is best placed to run (payload affinity), marked as its own."""
+        self._expire()
+        with self._lock:
+            have = self.workers[worker_id]["have"]
+            others = [w for wid, w in self.workers.items() if wid != worker_id and w.get("url")]
+        queued = sorted(self.queue.list("queued"), key=lambda e: (-e["priority"], e["added"]))
+        if not queued:
+            return None
+        oldest = queued[0]
+        if time.time() - oldest["added"] > AFFINITY_WAIT:
+            choice = oldest
+        else:
+            top = [e for e in queued if e["priority"] == oldest["priority"]]
+            choice = max(top, key=lambda e: sum(p["size"] for p in e["job"].get("payload", []) if p["sha1"] in have))
+        entry = self.queue.claim(choice["id"])
+        if not entry:
+            return None  # Another worker got it first
+        job = entry["job"]
+        wanted = {p["sha1"] for p in job.get("payload", [])} - have
+        job["peers"] = [w["url"] for w in others if w["have"] & wanted]
+        with self._lock:
+            self.assigned[entry["id"]] = worker_id
+            self.claimed[entry["id"]] = time.time()
+        local = sum(p["size"] for p in job.get("payload", []) if p["sha1"] in have)
+        logging.info(f"Farm: job {entry['id']} to {self.workers[worker_id]['name']} "
+                     f"({local / 1024**3:.1f} GB of its payload already there, {len(job['peers'])} peer(s)).")
+        return job
+
+    def finish(self, job_id: str, report: dict) -> bool:
+        with self._lock:
+            worker_id = self.assigned.pop(job_id, None)
+            self.claimed.pop(job_id, None)
+        if not worker_id:
+            return False  # Reassigned after the worker went quiet; the other run wins
+        result = report.get("result") or {}
+        if report.get("status") == "done":
+            result = {**result, "artifact": f"/artifacts/{job_id}", "worker": self.workers.get(worker_id, {}).get("name")}
+        self.queue.finish(job_id, report.get("status", "failed"), result, report.get("error"))
+        logging.info(f"Farm: job {job_id} {report.get('status')}.")
+        return True
+
+    def _expire(self):
+        """Forget workers that stopped calling in, and queue their jobs again."""
+        now = time.time()
+        with self._lock:
+            dead = [wid for wid, w in self.workers.items() if now - w["last_seen"] > WORKER_TIMEOUT]
+            for wid in dead:
+                logging.warning(f"Farm: worker {self.workers[wid]['name']} went quiet; requeueing its jobs.")
+                del self.workers[wid]
+                for job_id in [j for j, w in self.assigned.items() if w == wid]:
+                    del self.assigned[job_id]
+                    self.claimed.pop(job_id, None)
+                    self.queue.requeue(job_id)
+
+
+# ----------------------------------------------------------------------
+#  Worker
+# ----------------------------------------------------------------------
+class FarmWorker:
+    """Runs farm jobs locally and shares its payload store with the other workers."""
+
+    def __init__(self, coordinator: str, state_dir: Path, name: str | None = None, host: str = "0.0.0.0",
+                 peer_port: int = 0, advertise: str | None = None, max_jobs: int = 1,
+                 slots: dict[str, int] | None = None):
+        self.coordinator = coordinator.rstrip("/")
+        self.state_dir = Path(state_dir)
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.max_jobs = max_jobs
+        self.payloads = PayloadStore(self.state_dir / PAYLOAD_DIR_NAME)
+        # The other workers repair damaged chunks of their cached ISOs from ours, and we from theirs
+        self.peer_server = PeerCacheServer(self.payloads, host, peer_port, iso_cache=self.state_dir / CACHE_DIR_NAME)
+        port = self.peer_server.server_address[1]
+        self.url = advertise or (self.peer_server.url if host != "0.0.0.0" else f"http://{socket.gethostname()}:{port}")
+        # The coordinator's queue is the durable one; the local queue only feeds the scheduler
+        self.scheduler = Scheduler(JobQueue(self.state_dir / "worker_queue.sqlite"), self._on_event, slots, max_jobs,
+                                   workspace=self.state_dir / "workspace")
+        self.worker_id: str | None = None
+        self.reports: dict[str, dict] = {}  # Farm job id -> finish report the coordinator hasn't taken yet
+        self._reports_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _post(self, path: str, data: dict | None = None, **kwargs):
+        import requests
+
+        return requests.post(f"{self.coordinator}{path}", json=data or {}, timeout=30, **kwargs)
+
+    def _have(self) -> list[str]:
+        return [path.name for _used, _size, path in self.payloads.files()]
+
+    def _farm_id(self, local_id: str) -> str | None:
+        """The coordinator's id of a job in the local queue (which gives each claim an id of its own)."""
+        entry = self.scheduler.queue.get(local_id)
+        return entry["job"].get("farm_job_id") if entry else None
+
+    def _held(self) -> list[str]:
+        """Farm ids of the jobs this worker still answers for: in the local queue, or finished but unreported."""
+        held = [e["job"].get("farm_job_id") for e in self.scheduler.queue.list() if e["status"] not in TERMINAL]
+        with self._reports_lock:
+            return [j for j in held if j] + list(self.reports)
+
+    def register(self):
+        r = self._post("/workers", {"name": self.name, "url": self.url, "have": self._have()})
+        r.raise_for_status()
+        self.worker_id = r.json()["worker_id"]
+        logging.info(f"Farm worker {self.name} registered as {self.worker_id}.")
+
+    def run(self):
+        """Serve peers, then heartbeat and claim jobs until stop()."""
+        import requests
+
+        self.scheduler.own()  # Before touching the local queue: another worker on this state dir may be running it
+        for entry in self.scheduler.queue.list():  # Anything left from a previous run was already requeued upstream
+            if entry["status"] in ("queued", "running"):
+                self.scheduler.queue.finish(entry["id"], "cancelled", error="worker restarted")
+        self.peer_server.start()
+        self.scheduler.start()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if not self.worker_id:
+                        self.register()
+                    self._send_reports()
+                    r = self._post(f"/workers/{self.worker_id}/heartbeat",
+                                   {"have": self._have(), "running": self._held()})
+                    if r.status_code == 410:
+                        self.worker_id = None  # The coordinator restarted or gave up on us
+                        continue
+                    cancel = set(r.json().get("cancel", []))
+                    for entry in self.scheduler.queue.list() if cancel else []:
+                        if entry["status"] in ("queued", "running") and entry["job"].get("farm_job_id") in cancel:
+                            self.scheduler.cancel(entry["id"])
+                    while self.scheduler.queue.pending() < self.max_jobs:
+                        r = self._post(f"/workers/{self.worker_id}/claim")
+                        if r.status_code != 200:
+                            break
+                        job = r.json()["job"]
+                        # A job can be claimed again (requeued after a timeout or a coordinator restart); a fresh
+                        # local id keeps it from colliding with the row its earlier run left in the local queue
+                        self.scheduler.submit({**job, "job_id": None, "farm_job_id": job["job_id"],
+                                               "state_dir": str(self.state_dir), "mount": False, "payload_cache": True})
+                except (requests.RequestException, ValueError, KeyError) as e:
+                    logging.warning(f"Farm worker {self.name}: coordinator unreachable ({e}).")
+                except sqlite3.Error as e:  # The local queue; the coordinator requeues whatever we drop
+                    logging.error(f"Farm worker {self.name}: local job queue failed ({e}).")
+                self._stop.wait(HEARTBEAT_INTERVAL)
+        finally:
+            self.scheduler.stop()
+            self.peer_server.shutdown()
+
+    def stop(self):
+        self._stop.set()
+
+    def _on_event(self, event: dict):
+        kind = event["event"]
+        if kind not in ("done", "cancelled", "error"):
+            return
+        job_id = self._farm_id(event["job_id"])
+        if not job_id:
+            return
+        report = {"status": {"done": "done", "cancelled": "cancelled"}.get(kind, "failed"),
+                  "result": event.get("result"), "error": event.get("message")}
+        iso = report["result"].get("iso_path") if report["result"] else None
+        if report["status"] == "done" and iso:
+            # Here or never: the ISO may live in the job's workspace, which goes once this event returns
+            for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+                try:
+                    self._upload(job_id, Path(iso))
+                    break
+                except Exception as e:
+                    logging.warning(f"Farm worker {self.name}: upload {attempt}/{UPLOAD_ATTEMPTS} of job {job_id} "
+                                    f"failed: {e}")
+                    if attempt == UPLOAD_ATTEMPTS:
+                        report.update(status="failed", error=f"could not upload the ISO: {e}")
+                    elif self._stop.wait(HEARTBEAT_INTERVAL * attempt):
+                        report.update(status="failed", error="worker stopped before the ISO was uploaded")
+                        break
+        with self._reports_lock:
+            self.reports[job_id] = report  # The heartbeat loop retries it until the coordinator takes it
+        self._send_reports()
+
+    def _send_reports(self):
+        import requests
+
+        with self._reports_lock:
+            pending = list(self.reports.items())
+        for job_id, report in pending:
+            try:
+                r = self._post(f"/jobs/{job_id}/finish", report)
+            except requests.RequestException as e:
+                logging.warning(f"Farm worker {self.name}: could not report job {job_id} yet ({e}).")
+                continue
+            if r.status_code >= 500:
+                logging.warning(f"Farm worker {self.name}: could not report job {job_id} yet (HTTP {r.status_code}).")
+                continue
+            if r.status_code == 409:
+                logging.info(f"Farm worker {self.name}: job {job_id} went to another worker; dropping our report.")
+            with self._reports_lock:
+                self.reports.pop(job_id, None)
+
+    def _upload(self, job_id: str, iso: Path):
+        import requests
+
+        with open(iso, "rb") as f:
+            r = requests.put(f"{self.coordinator}/artifacts/{job_id}", data=f, timeout=600,
+                             headers={"X-Worker-Id": self.worker_id, "X-Content-SHA256": hash_file(iso, "sha256"),
+                                      "Content-Length": str(iso.stat().st_size)})
+        r.raise_for_status()
+        logging.info(f"Farm worker {self.name}: uploaded the ISO of job {job_id}.")
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a build farm coordinator or worker over HTTP.")
+    sub = parser.add_subparsers(dest="role", required=True)
+    coordinator = sub.add_parser("coordinator")
+    coordinator.add_argument("--state", type=Path, required=True)
+    coordinator.add_argument("--host", default="0.0.0.0")
+    coordinator.add_argument("--port", type=int, default=DEFAULT_PORT)
+    worker = sub.add_parser("worker")
+    worker.add_argument("--coordinator", required=True)
+    worker.add_argument("--state", type=Path, required=True)
+    worker.add_argument("--name")
+    worker.add_argument("--host", default="0.0.0.0", help="address the peer cache listens on")
+    worker.add_argument("--peer-port", type=int, default=8787)
+    worker.add_argument("--advertise", help="peer cache URL other workers should use")
+    worker.add_argument("--jobs", type=int, default=1)
+    submit = sub.add_parser("submit")
+    submit.add_argument("--coordinator", required=True)
+    submit.add_argument("--build", help="build label (defaults to the build id)")
+    submit.add_argument("--build-id")
+    submit.add_argument("--edition", default="Professional")
+    submit.add_argument("--lang", default="en-us")
+    submit.add_argument("--priority", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(message)s")
+    if args.role == "submit":
+        import requests
+
+        job = {"build": args.build or args.build_id, "build_id": args.build_id, "edition": args.edition,
+               "lang": args.lang}
+        r = requests.post(f"{args.coordinator.rstrip('/')}/jobs", json={"job": job, "priority": args.priority},
+                          timeout=120)
+        r.raise_for_status()
+        print(r.json()["job_id"])
+        return 0
+    if args.role == "coordinator":
+        server = FarmCoordinator(args.state, args.host, args.port)
+        logging.info(f"Farm coordinator at {server.url}. Ctrl+C stops it.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+    node = FarmWorker(args.coordinator, args.state, args.name, args.host, args.peer_port, args.advertise, args.jobs)
+    try:
+        node.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
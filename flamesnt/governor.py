@@ -0,0 +1,530 @@
+"""
+Resource governor 🎚️
+-------------------------------------------------
+Left alone, a job downloads, hashes and converts as fast as the machine
+allows. On a workstation that starves whoever is sitting at it, and on
+a shared link it starves every other job. The governor caps each stage
+with limits kept in the state dir's governor.json:
+
+  bandwidth        bytes/s for all downloads together (upstream and peers),
+                   e.g. "4M"; 0 or absent means unlimited
+  hosts            {"host": rate}: an extra cap per host; "example.com"
+                   also covers its subdomains, which share one budget
+  priority         "normal", "low" or "idle" (CPU nice and I/O class), for
+                   every stage or per stage: {"convert": "idle"}
+  hash_threads     files SHA-1'd at once across all jobs of this process
+  convert_threads  the most threads one wimlib export may use
+  slots            scheduler resource slots (see flamesnt.jobqueue)
+  schedule         time-of-day windows overriding any of the above, e.g.
+                   {"days": "mon-fri", "from": "09:00", "to": "17:30",
+                    "bandwidth": "1M", "priority": "low"}; a window may
+                   run past midnight, and later windows win
+
+Downloads are metered through token buckets, so a limit is an average
+with a one second burst. Every process using a state dir reads the file
+again when it changes, and the clock is checked against the schedule as
+work progresses, so new limits reach running jobs within RELOAD_INTERVAL
+without restarting them. That includes a wimlib export already running:
+its priority is changed in place (its thread count applies from the
+next export).
+
+Lowering a priority always works. Raising it again needs privileges on
+Linux, so an unprivileged job keeps the lower priority until its thread
+ends.
+
+Usage:
+  python -m flamesnt.governor show  --state DIR
+  python -m flamesnt.governor set   --state DIR [--bandwidth 4M] [--host HOST=RATE] [--priority [STAGE=]LEVEL]
+                                    [--hash-threads N] [--convert-threads N] [--slots network=2]
+                                    [--at mon-fri,09:00-17:30]
+  python -m flamesnt.governor clear --state DIR [--at mon-fri,09:00-17:30]
+"""
+import contextlib
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+LIMITS_FILE = "governor.json"
+RELOAD_INTERVAL = 2.0  # Seconds between looks at the file and the clock
+MAX_SLEEP = 0.25  # A throttled thread wakes this often to notice cancellation and new limits
+MIN_BURST = 64 * 1024
+RATE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+RATE_PATTERN = re.compile(r"^\s*(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>[KMG]?)(?:i?B)?(?:/s)?\s*$", re.IGNORECASE)
+# nice value, ionice class and level, Windows thread priority, Windows priority class
+PRIORITY_LEVELS = {
+    "normal": {"nice": 0, "ionice": ("2", "4"), "thread": 0, "class": 0x20},
+    "low": {"nice": 10, "ionice": ("2", "7"), "thread": -2, "class": 0x4000},
+    "idle": {"nice": 19, "ionice": ("3", None), "thread": -15, "class": 0x40},
+}
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+WINDOW_KEYS = ("days", "from", "to")
+LIMIT_KEYS = ("bandwidth", "hosts", "priority", "hash_threads", "convert_threads", "slots")
+
+
+def parse_rate(value) -> int:
+    """Bytes per second from 4194304, "4M", "512KB/s" or "1.5G"; 0 (unlimited) for None, 0 or "off"."""
+    if value in (None, "", "off", "none", "unlimited"):
+        return 0
+    if isinstance(value, (int, float)):
+        return max(int(value), 0)
+    match = RATE_PATTERN.match(str(value))
+    if not match:
+        raise RuntimeError(f"'{value}' is not a rate (expected e.g. 4M, 512K or a number of bytes per second).")
+    return int(float(match["value"]) * RATE_UNITS[match["unit"].upper()])
+
+
+def format_rate(rate: int) -> str:
+    if not rate:
+        return "unlimited"
+    for unit in ("G", "M", "K"):
+        if rate >= RATE_UNITS[unit]:
+            return f"{rate / RATE_UNITS[unit]:.1f} {unit}B/s"
+    return f"{rate} B/s"
+
+
+def _parse_days(spec: str | None) -> set[int]:
+    if not spec or spec in ("daily", "all"):
+        return set(range(7))
+    days = set()
+    for part in str(spec).lower().split(","):
+        first, _, last = part.strip().partition("-")
+        try:
+            start, end = DAYS.index(first[:3]), DAYS.index((last or first)[:3])
+        except ValueError:
+            raise RuntimeError(f"'{spec}' is not a list of days (expected e.g. mon-fri or sat,sun).")
+        days.update(d % 7 for d in range(start, end + (7 if end < start else 0) + 1))
+    return days
+
+
+def _parse_time(spec: str) -> datetime.time:
+    try:
+        return datetime.time.fromisoformat(spec)
+    except (TypeError, ValueError):
+        raise RuntimeError(f"'{spec}' is not a time of day (expected HH:MM).")
+
+
+def in_window(rule: dict, now: datetime.datetime) -> bool:
+    """True if `now` falls in the schedule window `rule` (its days, from and to)."""
+    days = _parse_days(rule.get("days"))
+    start, end = _parse_time(rule.get("from", "00:00")), _parse_time(rule.get("to", "23:59:59.999999"))
+    clock = now.time()
+    if start <= end:
+        return now.weekday() in days and start <= clock < end
+    # Past midnight: the early hours belong to the day the window started on
+    return (now.weekday() in days and clock >= start) or ((now.weekday() - 1) % 7 in days and clock < end)
+
+
+def effective(limits: dict, now: datetime.datetime | None = None) -> dict:
+    """The limits in force at `now`: the base limits with every matching schedule window laid over them."""
+    now = now or datetime.datetime.now()
+    result = {k: v for k, v in limits.items() if k != "schedule"}
+    for rule in limits.get("schedule", []):
+        if not in_window(rule, now):
+            continue
+        for key, value in rule.items():
+            if key in WINDOW_KEYS:
+                continue
+            if isinstance(value, dict) and isinstance(result.get(key), dict):
+                result[key] = {**result[key], **value}
+            else:
+                result[key] = value
+    return result
+
+
+def validate(limits: dict):
+    """Raise RuntimeError if `limits` (or one of its schedule windows) isn't something the governor can apply."""
+    for layer in [limits] + list(limits.get("schedule", [])):
+        unknown = set(layer) - set(LIMIT_KEYS) - set(WINDOW_KEYS) - ({"schedule"} if layer is limits else set())
+        if unknown:
+            raise RuntimeError(f"Unknown governor setting(s): {', '.join(sorted(unknown))}.")
+        parse_rate(layer.get("bandwidth"))
+        for rate in (layer.get("hosts") or {}).values():
+            parse_rate(rate)
+        priority = layer.get("priority")
+        for level in (priority.values() if isinstance(priority, dict) else [priority] if priority else []):
+            if level not in PRIORITY_LEVELS:
+                raise RuntimeError(f"Unknown priority '{level}' (expected one of {', '.join(PRIORITY_LEVELS)}).")
+        if layer is not limits:
+            in_window(layer, datetime.datetime.now())  # Parses days, from and to
+
+
+def load_limits(path: Path) -> dict:
+    path = Path(path)
+    if not path.exists():
+        return {}
+    limits = json.loads(path.read_text())
+    validate(limits)
+    return limits
+
+
+def save_limits(path: Path, limits: dict):
+    """Write `limits` atomically; running governors reading the file pick them up on their next refresh."""
+    validate(limits)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(limits, indent=2))
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------------------------
+#  Building blocks
+# ----------------------------------------------------------------------
+class TokenBucket:
+    """Byte-rate limiter. A take larger than the burst runs into debt and waits it off, so chunk size doesn't matter."""
+
+    def __init__(self, rate: int = 0):
+        self._lock = threading.Lock()
+        self.rate = 0
+        self.tokens = 0.0
+        self.burst = MIN_BURST
+        self._last = time.monotonic()
+        self.set_rate(rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate: int):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.burst = max(rate, MIN_BURST)
+            if not rate:
+                self.tokens = 0.0  # Unlimited: forget any debt
+
+    def take(self, n: int, cancelled=None, poll=None) -> bool:
+        """Spend `n` bytes, waiting while the bucket is in debt. False if `cancelled()` turned true."""
+        with self._lock:
+            if not self.rate:
+                return True
+            self._refill()
+            self.tokens -= n
+        while True:
+            with self._lock:
+                self._refill()
+                if not self.rate or self.tokens >= 0:
+                    return True
+                wait = -self.tokens / self.rate
+            if cancelled and cancelled():
+                return False
+            time.sleep(min(wait, MAX_SLEEP))
+            if poll:
+                poll()  # May change our rate, e.g. when a schedule window ends
+
+
+class ThreadCap:
+    """Counting semaphore whose limit can change while it's held; a limit of 0 means no cap."""
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def set_limit(self, limit: int):
+        with self._cond:
+            self.limit = max(limit, 0)
+            self._cond.notify_all()
+
+    def acquire(self, cancelled=None) -> bool:
+        with self._cond:
+            while self.limit and self.in_use >= self.limit:
+                if cancelled and cancelled():
+                    return False
+                self._cond.wait(MAX_SLEEP)
+            self.in_use += 1
+        return True
+
+    def release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
+
+
+def set_priority(level: str, ident: int, thread: bool = False):
+    """Best effort: put a process (or, with `thread`, a thread's native id) at `level`. Raises OSError if refused."""
+    spec = PRIORITY_LEVELS[level]
+    if sys.platform == "win32":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        THREAD_SET_INFORMATION, PROCESS_SET_INFORMATION = 0x0020, 0x0200
+        if thread:
+            handle = kernel32.OpenThread(THREAD_SET_INFORMATION, False, ident)
+            ok = handle and kernel32.SetThreadPriority(handle, spec["thread"])
+        else:
+            handle = kernel32.OpenProcess(PROCESS_SET_INFORMATION, False, ident)
+            ok = handle and kernel32.SetPriorityClass(handle, spec["class"])
+        if handle:
+            kernel32.CloseHandle(handle)
+        if not ok:
+            raise OSError(f"Windows refused priority {level} for {ident}")
+        return
+    if not hasattr(os, "setpriority"):
+        return
+    # On Linux niceness and the I/O class are per thread, keyed by the thread id
+    os.setpriority(os.PRIO_PROCESS, ident, spec["nice"])
+    if sys.platform.startswith("linux") and shutil.which("ionice"):
+        io_class, io_level = spec["ionice"]
+        argv = ["ionice", "-c", io_class] + (["-n", io_level] if io_level else []) + ["-p", str(ident)]
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+
+# ----------------------------------------------------------------------
+#  Governor
+# ----------------------------------------------------------------------
+class Governor:
+    """Applies one state dir's limits to every job of this process."""
+
+    def __init__(self, path: Path | None = None):
+        self.path = Path(path) if path else None
+        self.limits: dict = {}  # As stored, schedule included
+        self.current: dict = {}  # In force right now
+        self.bandwidth = TokenBucket()
+        self.hosts: dict[str, TokenBucket] = {}
+        self.hashing = ThreadCap()
+        self.listeners = []  # Called with the limits in force whenever they change
+        self._threads: dict[int, str] = {}  # Native thread id -> stage it's running
+        self._children: dict[int, str] = {}  # Child process id -> stage it's working for
+        self._lowered: set[int] = set()  # Threads we moved off normal priority
+        self._lock = threading.RLock()
+        self._mtime = None
+        self._checked = 0.0
+        self.refresh(force=True)
+
+    # ------------------------------------------------------------------
+    #  Reloading
+    # ------------------------------------------------------------------
+    def refresh(self, force: bool = False):
+        """Pick up a changed file or a schedule boundary. Cheap; call it as often as work progresses."""
+        now = time.monotonic()
+        if not force and now - self._checked < RELOAD_INTERVAL:
+            return
+        with self._lock:
+            self._checked = now
+            if self.path:
+                try:
+                    mtime = self.path.stat().st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+                if force or mtime != self._mtime:
+                    self._mtime = mtime
+                    try:
+                        self.limits = load_limits(self.path)
+                    except (ValueError, RuntimeError) as e:
+                        logging.warning(f"Ignoring {self.path} ({e}); keeping the previous limits.")
+            current = effective(self.limits)
+            if current != self.current or force:
+                self._apply(current)
+
+    def _apply(self, current: dict):
+        changed = current != self.current
+        self.current = current
+        self.bandwidth.set_rate(parse_rate(current.get("bandwidth")))
+        hosts = {host.lstrip("*."): parse_rate(rate) for host, rate in (current.get("hosts") or {}).items()}
+        for host in set(self.hosts) - set(hosts):
+            self.hosts.pop(host).set_rate(0)  # Releases anyone waiting on a limit that's gone
+        for host, rate in hosts.items():
+            self.hosts.setdefault(host, TokenBucket()).set_rate(rate)
+        self.hashing.set_limit(int(current.get("hash_threads") or 0))
+        for tid, stage in list(self._threads.items()):
+            self._prioritize(tid, stage, thread=True)
+        for pid, stage in list(self._children.items()):
+            self._prioritize(pid, stage, thread=False)
+        if changed:
+            logging.info(f"Governor: {self.describe()}.")
+            for listener in self.listeners:
+                try:
+                    listener(current)
+                except Exception as e:
+                    logging.warning(f"Governor listener failed: {e}")
+
+    def describe(self) -> str:
+        current = self.current
+        parts = [f"bandwidth {format_rate(parse_rate(current.get('bandwidth')))}"]
+        parts += [f"{host} {format_rate(parse_rate(rate))}" for host, rate in (current.get("hosts") or {}).items()]
+        if current.get("priority"):
+            parts.append(f"priority {current['priority']}")
+        parts += [f"{key.replace('_', ' ')} {current[key]}" for key in ("hash_threads", "convert_threads", "slots")
+                  if current.get(key)]
+        return ", ".join(parts)
+
+    def on_change(self, listener):
+        """Call `listener(limits)` now and whenever the limits in force change."""
+        with self._lock:
+            self.listeners.append(listener)
+            listener(self.current)
+
+    # ------------------------------------------------------------------
+    #  Bandwidth
+    # ------------------------------------------------------------------
+    def _host_bucket(self, url: str) -> TokenBucket | None:
+        host = (urlsplit(url).hostname or "").lower()
+        with self._lock:  # refresh() on another job's thread may be dropping hosts
+            hosts = list(self.hosts.items())
+        for name, bucket in hosts:
+            if host == name or host.endswith("." + name):
+                return bucket
+        return None
+
+    def meter(self, url: str, cancelled=None):
+        """A throttle(n) for a download from `url`: blocks until `n` more bytes fit the global and host limits."""
+        def throttle(n: int) -> bool:
+            self.refresh()
+            host = self._host_bucket(url)
+            return (self.bandwidth.take(n, cancelled, self.refresh)
+                    and (host is None or host.take(n, cancelled, self.refresh)))
+        return throttle
+
+    # ------------------------------------------------------------------
+    #  CPU and I/O
+    # ------------------------------------------------------------------
+    def priority(self, stage: str) -> str:
+        level = self.current.get("priority") or "normal"
+        return level.get(stage, "normal") if isinstance(level, dict) else level
+
+    def convert_threads(self, requested: int) -> int:
+        cap = int(self.current.get("convert_threads") or 0)
+        return min(requested, cap) if cap else requested
+
+    def _prioritize(self, ident: int, stage: str, thread: bool):
+        level = self.priority(stage)
+        if level == "normal" and thread and ident not in self._lowered:
+            return  # Never touched; leave whatever priority it was started with
+        try:
+            set_priority(level, ident, thread)
+        except ProcessLookupError:
+            self._children.pop(ident, None)  # The converter already exited
+            return
+        except OSError as e:
+            logging.info(f"Could not set {stage} priority to {level}: {e}")
+            return
+        if thread:
+            (self._lowered.discard if level == "normal" else self._lowered.add)(ident)
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        """Run the calling thread at `stage`'s priority for the duration of the block."""
+        self.refresh()
+        tid = threading.get_native_id()
+        with self._lock:
+            self._threads[tid] = stage
+            self._prioritize(tid, stage, thread=True)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads.pop(tid, None)
+                if tid in self._lowered:
+                    try:
+                        set_priority("normal", tid, thread=True)
+                        self._lowered.discard(tid)
+                    except OSError:
+                        pass  # Unprivileged on Linux: stays lowered until the thread ends
+
+    def adopt(self, pid: int, stage: str):
+        """Keep a child process (a converter) at `stage`'s priority, now and after every change."""
+        with self._lock:
+            self._children[pid] = stage
+            if self.priority(stage) != "normal":
+                self._prioritize(pid, stage, thread=False)
+
+    def release(self, pid: int):
+        """Stop managing a child that has exited, before its PID can go to an unrelated process."""
+        with self._lock:
+            self._children.pop(pid, None)
+
+
+_governors: dict[Path | None, Governor] = {}
+_governors_lock = threading.Lock()
+
+
+def governor_for(state_dir) -> Governor:
+    """The process-wide governor of `state_dir` (unlimited for None), so every job there shares one budget."""
+    path = Path(state_dir) / LIMITS_FILE if state_dir else None
+    with _governors_lock:
+        if path not in _governors:
+            _governors[path] = Governor(path)
+        return _governors[path]
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show or change the bandwidth, CPU and I/O limits of running jobs.")
+    parser.add_argument("action", choices=("show", "set", "clear"))
+    parser.add_argument("--state", type=Path, required=True, help="state dir the jobs run with")
+    parser.add_argument("--at", help="a schedule window to set or clear, e.g. mon-fri,09:00-17:30 or 22:00-06:00")
+    parser.add_argument("--bandwidth", help="all downloads together, e.g. 4M (0 for unlimited)")
+    parser.add_argument("--host", action="append", default=[], help="HOST=RATE, e.g. dl.example.com=1M")
+    parser.add_argument("--priority", action="append", default=[], help="LEVEL or STAGE=LEVEL (normal, low, idle)")
+    parser.add_argument("--hash-threads", type=int)
+    parser.add_argument("--convert-threads", type=int)
+    parser.add_argument("--slots", help="scheduler slots, e.g. network=2,cpu=1")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    path = args.state / LIMITS_FILE
+    limits = load_limits(path)
+
+    window = None
+    if args.at:
+        days, _, span = args.at.rpartition(",")
+        start, _, end = span.partition("-")
+        window = {"days": days or "daily", "from": start, "to": end}
+    schedule = limits.setdefault("schedule", [])
+    match = next((rule for rule in schedule if window and all(rule.get(k) == window[k] for k in WINDOW_KEYS)), None)
+
+    if args.action == "show":
+        print(json.dumps(limits, indent=2))
+        print(f"In force now: {Governor(path).describe()}")
+        return 0
+    if args.action == "clear":
+        if window:
+            schedule[:] = [rule for rule in schedule if rule is not match]
+        else:
+            limits = {}
+    else:
+        layer = match or (dict(window) if window else limits)
+        if window and not match:
+            schedule.append(layer)
+        if args.bandwidth is not None:
+            layer["bandwidth"] = args.bandwidth
+        for spec in args.host:
+            host, _, rate = spec.partition("=")
+            layer.setdefault("hosts", {})[host] = rate
+        for spec in args.priority:
+            stage, _, level = spec.rpartition("=")
+            if stage:
+                current = layer.get("priority")
+                layer["priority"] = {**(current if isinstance(current, dict) else {}), stage: level}
+            else:
+                layer["priority"] = level
+        if args.hash_threads is not None:
+            layer["hash_threads"] = args.hash_threads
+        if args.convert_threads is not None:
+            layer["convert_threads"] = args.convert_threads
+        if args.slots:
+            layer["slots"] = {k: int(v) for k, v in (s.split("=") for s in args.slots.split(",") if s)}
+    if not limits.get("schedule"):
+        limits.pop("schedule", None)
+    try:
+        save_limits(path, limits)
+    except RuntimeError as e:
+        print(e)
+        return 1
+    print(f"Saved {path}; running jobs pick it up within {RELOAD_INTERVAL:.0f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
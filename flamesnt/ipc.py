@@ -0,0 +1,85 @@
+"""
+GUI side of the engine IPC channel.
+-------------------------------------------------
+EngineClient owns the engine process and a duplex multiprocessing Pipe.
+Commands go down as dicts, events come back as dicts (see
+flamesnt.engine for the event shapes). Cancellation uses a shared Event
+so it reaches the engine even while it is busy inside a step.
+
+The GUI polls with poll() from a root.after() loop; it never blocks.
+The engine module (and everything it pulls in) is only imported in the
+child process, so importing this module stays cheap for the window.
+"""
+import logging
+import multiprocessing
+
+
+def _engine_entry(conn, cancel_event, log_file: str | None = None):
+    """Child process target: the engine is imported here, never in the GUI."""
+    from .engine import engine_main
+
+    engine_main(conn, cancel_event, log_file)
+
+
+class EngineClient:
+    """Spawns and talks to the out-of-process install engine."""
+
+    def __init__(self, log_file: str | None = None):
+        # "spawn" everywhere: forking a process that has Tk loaded is asking for trouble
+        self._ctx = multiprocessing.get_context("spawn")
+        self._conn, self._child_conn = self._ctx.Pipe(duplex=True)
+        self._cancel = self._ctx.Event()
+        self._log_file = log_file
+        self._proc = None
+
+    def start(self):
+        if self._proc and self._proc.is_alive():
+            return
+        self._proc = self._ctx.Process(
+            target=_engine_entry,
+            args=(self._child_conn, self._cancel, self._log_file),
+            name="FlamesEngine",
+            daemon=True,
+        )
+        self._proc.start()
+        logging.info(f"Engine process started with pid {self._proc.pid}.")
+
+    @property
+    def alive(self) -> bool:
+        return bool(self._proc and self._proc.is_alive())
+
+    def submit(self, cmd: str, **payload):
+        """Send a command to the engine. Raises RuntimeError if it is gone."""
+        if not self.alive:
+            raise RuntimeError("Engine process is not running.")
+        self._cancel.clear()
+        self._conn.send({"cmd": cmd, **payload})
+
+    def cancel(self):
+        self._cancel.set()
+
+    def poll(self, max_events: int = 500) -> list[dict]:
+        """Drain up to `max_events` pending events without blocking."""
+        events = []
+        try:
+            while len(events) < max_events and self._conn.poll():
+                events.append(self._conn.recv())
+        except (EOFError, OSError) as e:
+            logging.error(f"Engine channel closed unexpectedly: {e}")
+        return events
+
+    def shutdown(self, timeout: float = 2.0):
+        """Ask the engine to stop, then make sure it does."""
+        if not self._proc:
+            return
+        self._cancel.set()
+        try:
+            self._conn.send({"cmd": "shutdown"})
+        except (BrokenPipeError, OSError):
+            pass
+        self._proc.join(timeout)
+        if self._proc.is_alive():
+            logging.warning("Engine process did not exit in time, terminating it.")
+            self._proc.terminate()
+            self._proc.join(timeout)
+        self._proc = None
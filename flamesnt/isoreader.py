@@ -0,0 +1,313 @@
+"""
+ISO 9660 / UDF image reader 🔎
+-------------------------------------------------
+Looks inside an ISO without mounting it. The image is mapped with mmap,
+and only the directories along a requested path are parsed, so checking
+for setup.exe or sources/install.wim in a 6 GB image touches a handful
+of sectors. File contents are streamed out as memoryview slices of the
+mapping, with no copies on our side.
+
+UDF is preferred when present, since it carries the real names and
+sizes. Otherwise ISO 9660 is read, through Joliet names when available,
+including multi-extent files over 4 GiB. Lookups are case-insensitive,
+the way Windows sees the media.
+"""
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+
+SECTOR = 2048
+CHUNK_SIZE = 4 * 1024 * 1024
+ANCHOR = 256
+JOLIET_ESCAPES = (b"%/@", b"%/C", b"%/E")
+
+TAG_PVD, TAG_AVDP, TAG_PD, TAG_LVD, TAG_TD = 1, 2, 5, 6, 8
+TAG_FSD, TAG_FID, TAG_FE, TAG_EFE = 256, 257, 261, 266
+
+
+class IsoEntry:
+    """One file or directory; `extents` are (byte offset in the image, length) pairs."""
+
+    def __init__(self, name: str, is_dir: bool, size: int, extents: list[tuple[int, int]]):
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.extents = extents
+
+    def __repr__(self):
+        return f"IsoEntry({self.name!r}, {'dir' if self.is_dir else self.size})"
+
+
+class IsoImage:
+    """Read-only view of an ISO file. Use as a context manager."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise RuntimeError(f"{self.path.name} is empty, not an ISO image.")
+        self._dir_cache: dict[int, list[IsoEntry]] = {}
+        self.fs = None
+        self.label = ""
+        try:
+            self._open_udf()
+        except (RuntimeError, struct.error, IndexError) as e:
+            logging.info(f"No usable UDF in {self.path.name} ({e}); reading ISO 9660.")
+            self._open_iso9660()
+
+    def close(self):
+        self._dir_cache.clear()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    #  Public API
+    # ------------------------------------------------------------------
+    def listdir(self, path: str = "") -> list[IsoEntry]:
+        entry = self.find(path)
+        if entry is None or not entry.is_dir:
+            raise FileNotFoundError(f"No directory '{path}' in {self.path.name}")
+        return self._children(entry)
+
+    def find(self, path: str) -> IsoEntry | None:
+        """The entry at `path` (case-insensitive, '/' or '\\'), or None."""
+        node = self.root
+        for part in [p for p in str(path).replace("\\", "/").split("/") if p]:
+            if not node.is_dir:
+                return None
+            node = next((c for c in self._children(node) if c.name.lower() == part.lower()), None)
+            if node is None:
+                return None
+        return node
+
+    def exists(self, path: str) -> bool:
+        return self.find(path) is not None
+
+    def walk(self, path: str = ""):
+        """Yield (path, entry) for everything below `path`, depth first."""
+        stack = [(path.strip("/"), self.find(path))]
+        while stack:
+            prefix, node = stack.pop()
+            for child in self._children(node):
+                child_path = f"{prefix}/{child.name}" if prefix else child.name
+                yield child_path, child
+                if child.is_dir:
+                    stack.append((child_path, child))
+
+    def iter_chunks(self, path_or_entry, chunk_size: int = CHUNK_SIZE):
+        """Stream a file's bytes as memoryview slices of the mapping (no copies)."""
+        entry = self.find(path_or_entry) if isinstance(path_or_entry, str) else path_or_entry
+        if entry is None or entry.is_dir:
+            raise FileNotFoundError(f"No file '{path_or_entry}' in {self.path.name}")
+        view = memoryview(self._map)
+        try:
+            for offset, length in entry.extents:
+                end = offset + length
+                if end > len(self._map):
+                    raise RuntimeError(f"{entry.name} runs past the end of {self.path.name}; the image is truncated.")
+                while offset < end:
+                    step = min(chunk_size, end - offset)
+                    yield view[offset:offset + step]
+                    offset += step
+        finally:
+            view.release()
+
+    def read_bytes(self, path: str) -> bytes:
+        return b"".join(bytes(chunk) for chunk in self.iter_chunks(path))
+
+    def extract(self, path: str, dest: Path, on_bytes=None, cancelled=None) -> Path | None:
+        """Copy one file out of the image to `dest`. None if cancelled."""
+        dest = Path(dest)
+        part = dest.with_name(dest.name + ".part")
+        with open(part, "wb") as f:
+            for chunk in self.iter_chunks(path):
+                if cancelled and cancelled():
+                    break
+                f.write(chunk)
+                if on_bytes:
+                    on_bytes(len(chunk))
+        if cancelled and cancelled():
+            part.unlink(missing_ok=True)
+            return None
+        os.replace(part, dest)
+        return dest
+
+    def _children(self, entry: IsoEntry) -> list[IsoEntry]:
+        key = id(entry)
+        if key not in self._dir_cache:
+            self._dir_cache[key] = self._read_udf_dir(entry) if self.fs == "udf" else self._read_iso_dir(entry)
+        return self._dir_cache[key]
+
+    # ------------------------------------------------------------------
+    #  UDF
+    # ------------------------------------------------------------------
+    def _tag(self, offset: int, expected: int) -> None:
+        tag = self._map[offset:offset + 16]
+        if len(tag) < 16 or struct.unpack_from("<H", tag)[0] != expected:
+            raise RuntimeError(f"expected descriptor {expected} at byte {offset}")
+        if (sum(tag[0:4]) + sum(tag[5:16])) & 0xFF != tag[4]:
+            raise RuntimeError(f"bad descriptor checksum at byte {offset}")
+
+    def _open_udf(self):
+        self._tag(ANCHOR * SECTOR, TAG_AVDP)
+        length, location = struct.unpack_from("<II", self._map, ANCHOR * SECTOR + 16)
+        self.partition_start = None
+        fsd = None
+        for i in range(length // SECTOR):
+            offset = (location + i) * SECTOR
+            tag_id = struct.unpack_from("<H", self._map, offset)[0]
+            if tag_id == TAG_PD:
+                self.partition_start = struct.unpack_from("<I", self._map, offset + 188)[0]
+            elif tag_id == TAG_LVD:
+                self.block_size = struct.unpack_from("<I", self._map, offset + 212)[0]
+                fsd = struct.unpack_from("<I", self._map, offset + 252)[0]
+                self.label = _dstring(self._map[offset + 84:offset + 212])
+                map_type = self._map[offset + 440]
+                if map_type != 1:
+                    raise RuntimeError(f"partition map type {map_type} is not supported")
+            elif tag_id == TAG_TD:
+                break
+        if self.partition_start is None or fsd is None:
+            raise RuntimeError("volume descriptor sequence is incomplete")
+        self._tag(self._block(fsd), TAG_FSD)
+        root_block = struct.unpack_from("<I", self._map, self._block(fsd) + 404)[0]
+        self.fs = "udf"
+        self.root = self._udf_entry("", root_block)
+
+    def _block(self, block: int) -> int:
+        return (self.partition_start + block) * self.block_size
+
+    def _udf_entry(self, name: str, block: int) -> IsoEntry:
+        offset = self._block(block)
+        tag_id = struct.unpack_from("<H", self._map, offset)[0]
+        if tag_id == TAG_FE:
+            header, l_ea, l_ad = 176, *struct.unpack_from("<II", self._map, offset + 168)
+        elif tag_id == TAG_EFE:
+            header, l_ea, l_ad = 216, *struct.unpack_from("<II", self._map, offset + 208)
+        else:
+            raise RuntimeError(f"no file entry for '{name}' at block {block}")
+        file_type = self._map[offset + 27]
+        size = struct.unpack_from("<Q", self._map, offset + 56)[0]
+        ad_type = struct.unpack_from("<H", self._map, offset + 34)[0] & 7
+        ads = offset + header + l_ea
+        extents = []
+        if ad_type == 3:  # Data embedded in the entry itself
+            extents.append((ads, size))
+        else:
+            step = 8 if ad_type == 0 else 16
+            for pos in range(ads, ads + l_ad, step):
+                length, lb = struct.unpack_from("<II", self._map, pos)
+                if length >> 30 == 3:
+                    break  # Continuation of the allocation descriptors; not written by image tools
+                if length >> 30 == 0:
+                    extents.append((self._block(lb), length & 0x3FFFFFFF))
+        return IsoEntry(name, file_type == 4, size, extents)
+
+    def _read_udf_dir(self, entry: IsoEntry) -> list[IsoEntry]:
+        raw = b"".join(bytes(self._map[o:o + n]) for o, n in entry.extents)
+        children, pos = [], 0
+        while pos + 38 <= len(raw):
+            if struct.unpack_from("<H", raw, pos)[0] != TAG_FID:
+                break
+            characteristics, l_fi = raw[pos + 18], raw[pos + 19]
+            block = struct.unpack_from("<I", raw, pos + 24)[0]
+            l_iu = struct.unpack_from("<H", raw, pos + 36)[0]
+            ident = raw[pos + 38 + l_iu:pos + 38 + l_iu + l_fi]
+            pos += (38 + l_iu + l_fi + 3) & ~3
+            if characteristics & 0x0C:  # Parent entry, or deleted
+                continue
+            children.append(self._udf_entry(_udf_name(ident), block))
+        return children
+
+    # ------------------------------------------------------------------
+    #  ISO 9660
+    # ------------------------------------------------------------------
+    def _open_iso9660(self):
+        primary = joliet = None
+        sector = 16
+        while (sector + 1) * SECTOR <= len(self._map):
+            vd = self._map[sector * SECTOR:(sector + 1) * SECTOR]
+            if vd[1:6] != b"CD001":
+                break
+            if vd[0] == 1 and primary is None:
+                primary = vd
+            elif vd[0] == 2 and vd[88:91] in JOLIET_ESCAPES:
+                joliet = vd
+            elif vd[0] == 255:
+                break
+            sector += 1
+        if primary is None:
+            raise RuntimeError(f"{self.path.name} is not an ISO 9660 or UDF image.")
+        self.fs = "iso9660"
+        self.joliet = joliet is not None
+        vd = joliet or primary
+        self.label = (vd[40:72].decode("utf-16-be", "replace") if self.joliet
+                      else vd[40:72].decode("ascii", "replace")).strip(" \x00")
+        location, length = struct.unpack_from("<I", vd, 158)[0], struct.unpack_from("<I", vd, 166)[0]
+        self.root = IsoEntry("", True, length, [(location * SECTOR, length)])
+
+    def _read_iso_dir(self, entry: IsoEntry) -> list[IsoEntry]:
+        offset, length = entry.extents[0]
+        children, pos, end = [], offset, offset + length
+        continued = False
+        while pos < end:
+            size = self._map[pos]
+            if size == 0:
+                pos = (pos // SECTOR + 1) * SECTOR  # Records never straddle sectors
+                continue
+            location, data_len = struct.unpack_from("<I", self._map, pos + 2)[0], struct.unpack_from("<I", self._map, pos + 10)[0]
+            flags, name_len = self._map[pos + 25], self._map[pos + 32]
+            ident = self._map[pos + 33:pos + 33 + name_len]
+            pos += size
+            if ident in (b"\x00", b"\x01"):
+                continue
+            name = ident.decode("utf-16-be", "replace") if self.joliet else ident.decode("ascii", "replace")
+            name = name.split(";")[0]
+            if not flags & 0x02 and name.endswith("."):
+                name = name[:-1]
+            extent = (location * SECTOR, data_len)
+            if continued and children[-1].name == name:
+                children[-1].extents.append(extent)  # Next piece of a multi-extent file
+                children[-1].size += data_len
+            else:
+                children.append(IsoEntry(name, bool(flags & 0x02), data_len, [extent]))
+            continued = bool(flags & 0x80)
+        return children
+
+
+def _udf_name(ident: bytes) -> str:
+    if not ident:
+        return ""
+    if ident[0] == 16:
+        return ident[1:].decode("utf-16-be", "replace")
+    return ident[1:].decode("latin-1")
+
+
+def _dstring(raw: bytes) -> str:
+    used = raw[-1]
+    return _udf_name(bytes(raw[:used])) if used else ""
+
+
+def find_setup(iso_path: Path) -> dict:
+    """The quick pre-mount check: is this a Windows setup image, and what's in it?"""
+    with IsoImage(iso_path) as image:
+        setup = image.find("setup.exe")
+        wim = image.find("sources/install.wim") or image.find("sources/install.esd")
+        return {
+            "label": image.label,
+            "fs": image.fs,
+            "setup_exe": setup is not None and not setup.is_dir,
+            "install_image": f"sources/{wim.name}" if wim else None,
+            "install_image_size": wim.size if wim else 0,
+        }
@@ -0,0 +1,457 @@
+"""
+Job queue and scheduler 🗂️
+-------------------------------------------------
+A build box shouldn't sit on a finished download while its CPU idles,
+or convert while the link idles. Jobs (a build and edition, as the
+engine takes them) go into a persistent queue, and the scheduler runs
+several at once, each in its own InstallEngine. Each pipeline stage
+holds only the resources it uses while it runs:
+
+  download   network
+  verify     disk
+  convert    cpu, disk
+  mount      host (one mounted image at a time)
+  prepare    host
+
+So one job downloads while another converts and a third waits its turn
+for the network. Resources are counted in slots (see DEFAULT_SLOTS), can
+be changed while jobs run (the "slots" of the state dir's governor.json,
+see flamesnt.governor), and a stage takes all of its slots at once or
+none of them, so two jobs can never deadlock. Disk space is shared
+through the engine's DiskBudget, which already queues a job until its
+peak footprint fits.
+
+The queue lives in SQLite in the state dir. Queued jobs survive a
+restart, and a job that was running when the process died is queued
+again. One scheduler runs a queue at a time: it holds an OS lock on the
+file next to it (QUEUE_FILE + ".lock") while it runs, and `run` refuses
+to start while another process holds it. The CLI's add, list and cancel
+still share the queue with the running scheduler, which picks up new
+jobs and cancellations as they're written.
+
+Usage:
+  python -m flamesnt.jobqueue add  --state DIR --build-id ID --edition Professional [--priority N]
+  python -m flamesnt.jobqueue list --state DIR
+  python -m flamesnt.jobqueue cancel --state DIR JOB_ID
+  python -m flamesnt.jobqueue run  --state DIR [--jobs 3] [--slots network=2,cpu=1] [--forever]
+"""
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from .engine import CACHE_DIR_NAME, EngineCancelled, InstallEngine, open_cache
+from .governor import governor_for
+from .reaper import WorkspaceReaper
+
+QUEUE_FILE = "job_queue.sqlite"
+WORKSPACE_DIR_NAME = "FlamesQueue"
+POLL_INTERVAL = 1.0
+DEFAULT_MAX_JOBS = 3
+DEFAULT_SLOTS = {"network": 1, "disk": 1, "cpu": 1, "host": 1}
+STAGE_RESOURCES = {
+    "download": ("network",),
+    "verify": ("disk",),
+    "convert": ("cpu", "disk"),
+    "mount": ("host",),
+    "prepare": ("host",),
+}
+TERMINAL = ("done", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY, job TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL,
+    stage TEXT, added REAL NOT NULL, started REAL, finished REAL, result TEXT, error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, priority, added);
+"""
+
+
+class JobQueue:
+    """Persistent FIFO of engine jobs, highest priority first. Safe to share between processes."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")  # The CLI can write while a scheduler reads
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    @staticmethod
+    def _row(row) -> dict:
+        keys = ("id", "job", "priority", "status", "stage", "added", "started", "finished", "result", "error")
+        entry = dict(zip(keys, row))
+        entry["job"] = json.loads(entry["job"])
+        entry["result"] = json.loads(entry["result"]) if entry["result"] else None
+        return entry
+
+    def add(self, job: dict, priority: int = 0) -> str:
+        job_id = job.get("job_id") or uuid.uuid4().hex[:8]
+        with self._lock:
+            self.db.execute("INSERT INTO jobs (id, job, priority, status, added) VALUES (?, ?, ?, 'queued', ?)",
+                            (job_id, json.dumps({**job, "job_id": job_id}), priority, time.time()))
+        logging.info(f"Queued job {job_id}: {job.get('build')} / {job.get('edition')}.")
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, status: str | None = None) -> list[dict]:
+        query = "SELECT * FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY added"
+        with self._lock:
+            rows = self.db.execute(query, (status,) if status else ()).fetchall()
+        return [self._row(row) for row in rows]
+
+    def claim(self, job_id: str | None = None) -> dict | None:
+        """Mark the next queued job (or `job_id`) running and return it, or None if it isn't queued."""
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                if job_id:
+                    row = self.db.execute("SELECT * FROM jobs WHERE status = 'queued' AND id = ?", (job_id,)).fetchone()
+                else:
+                    row = self.db.execute("SELECT * FROM jobs WHERE status = 'queued' "
+                                          "ORDER BY priority DESC, added LIMIT 1").fetchone()
+                if row:
+                    self.db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                                    (time.time(), row[0]))
+                self.db.execute("COMMIT")
+            except sqlite3.Error:
+                self.db.execute("ROLLBACK")
+                raise
+        return self._row(row) if row else None
+
+    def set_stage(self, job_id: str, stage: str):
+        with self._lock:
+            self.db.execute("UPDATE jobs SET stage = ? WHERE id = ?", (stage, job_id))
+
+    def finish(self, job_id: str, status: str, result: dict | None = None, error: str | None = None):
+        with self._lock:
+            self.db.execute("UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                            (status, time.time(), json.dumps(result) if result else None, error, job_id))
+
+    def requeue(self, job_id: str):
+        with self._lock:
+            self.db.execute("UPDATE jobs SET status = 'queued', stage = NULL, started = NULL WHERE id = ?", (job_id,))
+
+    def pending(self) -> int:
+        """Jobs queued or still running."""
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM jobs WHERE status NOT IN (?, ?, ?)", TERMINAL).fetchone()[0]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job now, or ask the scheduler to stop a running one. False if it already ended."""
+        with self._lock:
+            cur = self.db.execute("UPDATE jobs SET status = 'cancelled', finished = ? "
+                                  "WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+            if not cur.rowcount:
+                cur = self.db.execute("UPDATE jobs SET status = 'cancelling' WHERE id = ? AND status = 'running'",
+                                      (job_id,))
+        return bool(cur.rowcount)
+
+    def recover(self) -> int:
+        """Queue again the jobs a previous scheduler left running (it died or was closed mid-job)."""
+        with self._lock:
+            cur = self.db.execute("UPDATE jobs SET status = 'queued', stage = NULL, started = NULL "
+                                  "WHERE status = 'running'")
+            self.db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE status = 'cancelling'",
+                            (time.time(),))
+        if cur.rowcount:
+            logging.info(f"Job queue: {cur.rowcount} interrupted job(s) queued again.")
+        return cur.rowcount
+
+
+class QueueLock:
+    """An OS file lock held by the one scheduler running a queue (released by the OS if the process dies)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+
+    def acquire(self) -> bool:
+        """Take the lock without waiting; False if another process (or scheduler) holds it."""
+        if self._file:
+            return True
+        f = open(self.path, "a+b")
+        try:
+            if os.name == "nt":
+                import msvcrt
+
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file:
+            self._file.close()  # Closing drops the lock on both platforms
+            self._file = None
+
+
+class ResourcePool:
+    """Named slot counts shared by every running stage. Slots can be resized while in use."""
+
+    def __init__(self, slots: dict[str, int] | None = None):
+        self.slots = {**DEFAULT_SLOTS, **(slots or {})}
+        self.in_use = {name: 0 for name in self.slots}
+        self._cond = threading.Condition()
+
+    def resize(self, name: str, count: int):
+        with self._cond:
+            self.slots[name] = max(count, 1)
+            self.in_use.setdefault(name, 0)
+            self._cond.notify_all()
+
+    def acquire(self, names, cancelled=None) -> bool:
+        """Take one slot of each of `names`, all at once. False if `cancelled()` turned true while waiting."""
+        with self._cond:
+            while not all(self.in_use.get(n, 0) < self.slots.get(n, 1) for n in names):
+                if cancelled and cancelled():
+                    return False
+                self._cond.wait(POLL_INTERVAL)
+            for name in names:
+                self.in_use[name] = self.in_use.get(name, 0) + 1
+        return True
+
+    def release(self, names):
+        with self._cond:
+            for name in names:
+                self.in_use[name] -= 1
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def gate(self, stage: str, cancelled=None):
+        """Hold the stage's resources for the duration of the block (the engine's stage_gate)."""
+        names = STAGE_RESOURCES.get(stage, ())
+        if not self.acquire(names, cancelled):
+            raise EngineCancelled()
+        try:
+            yield
+        finally:
+            self.release(names)
+
+
+class Scheduler:
+    """Runs queued jobs concurrently, one engine each, sharing a ResourcePool."""
+
+    def __init__(self, queue: JobQueue, emit=None, slots: dict[str, int] | None = None,
+                 max_jobs: int = DEFAULT_MAX_JOBS, workspace: Path | None = None):
+        self.queue = queue
+        self.lock = QueueLock(self.queue.path.with_name(self.queue.path.name + ".lock"))
+        self.emit = emit or (lambda event: None)
+        self.pool = ResourcePool(slots)
+        self.base_slots = dict(self.pool.slots)  # What the governor's slots override, and fall back to
+        self.governor = governor_for(self.queue.path.parent)
+        self.max_jobs = max_jobs
+        self.workspace = Path(workspace) if workspace else Path(tempfile.gettempdir()) / WORKSPACE_DIR_NAME
+        self.reaper = WorkspaceReaper(busy=lambda: bool(self.running))
+        self.running: dict[str, threading.Event] = {}  # Job id -> its cancel event
+        self.live: dict[str, dict] = {}  # Job id -> latest stage, progress and status message
+        self.caches: dict[Path, object] = {}  # One ISO cache per state dir, shared by every job using it
+        self.shells = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def own(self):
+        """Become the queue's only scheduler. RuntimeError if another one is running it."""
+        if not self.lock.acquire():
+            raise RuntimeError(f"Another scheduler is already running the jobs in {self.queue.path}.")
+
+    def start(self):
+        self.own()
+        self.queue.recover()  # Safe now: no other scheduler can have these jobs running
+        self.reaper.start()
+        self.governor.on_change(self._apply_limits)
+        self._thread = threading.Thread(target=self._dispatch, name="JobScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, cancel_running: bool = True, timeout: float | None = None):
+        """Stop taking jobs; cancel (or finish) the running ones. Cancelled jobs stay queued for next time."""
+        self._stop.set()
+        self._wake.set()
+        if cancel_running:
+            with self._lock:
+                for event in self.running.values():
+                    event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        for shell in self.shells:
+            shell.close()
+        if not (self._thread and self._thread.is_alive()):
+            self.lock.release()  # Jobs still running past the timeout keep the queue ours
+
+    def submit(self, job: dict, priority: int = 0) -> str:
+        job_id = self.queue.add(job, priority)
+        self._wake.set()
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        cancelled = self.queue.cancel(job_id)
+        with self._lock:
+            if job_id in self.running:
+                self.running[job_id].set()
+        return cancelled
+
+    def idle(self) -> bool:
+        return not self.running and not self.queue.pending()
+
+    def snapshot(self) -> list[dict]:
+        """Every job not yet finished, with live progress for the running ones."""
+        jobs = [e for e in self.queue.list() if e["status"] not in TERMINAL]
+        return [{"id": e["id"], "build": e["job"].get("build"), "edition": e["job"].get("edition"),
+                 "status": e["status"], **self.live.get(e["id"], {})} for e in jobs]
+
+    def _apply_limits(self, limits: dict):
+        slots = limits.get("slots") or {}
+        for name in set(self.base_slots) | set(slots):
+            count = slots.get(name, self.base_slots.get(name, 1))
+            if self.pool.slots.get(name) != count:
+                self.pool.resize(name, count)
+                logging.info(f"Scheduler: {count} {name} slot(s).")
+
+    # ------------------------------------------------------------------
+    #  Dispatch
+    # ------------------------------------------------------------------
+    def _dispatch(self):
+        while not self._stop.is_set():
+            self.governor.refresh()  # Slots change even while every job is waiting
+            for entry in self.queue.list("cancelling"):  # Cancelled from another process
+                with self._lock:
+                    if entry["id"] in self.running:
+                        self.running[entry["id"]].set()
+            while len(self.running) < self.max_jobs and not self._stop.is_set():
+                entry = self.queue.claim()
+                if not entry:
+                    break
+                cancel = threading.Event()
+                with self._lock:
+                    self.running[entry["id"]] = cancel
+                threading.Thread(target=self._run, args=(entry, cancel), name=f"Job-{entry['id']}",
+                                 daemon=True).start()
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+        while self.running:
+            time.sleep(0.1)
+
+    def _run(self, entry: dict, cancel: threading.Event):
+        job_id = entry["id"]
+        job = dict(entry["job"])
+        job["temp_dir"] = str(Path(job.get("temp_dir") or self.workspace) / job_id)  # One workspace per job
+        outcome: dict = {}
+
+        def emit(event: dict):
+            event = {**event, "job_id": job_id}
+            kind = event["event"]
+            live = self.live.setdefault(job_id, {})
+            if kind == "progress":
+                if event.get("stage") and event["stage"] != live.get("stage"):
+                    self.queue.set_stage(job_id, event["stage"])
+                live.update(stage=event.get("stage"), progress=event["value"], eta=event.get("eta"))
+            elif kind == "status":
+                live["message"] = event["message"]
+            elif kind in ("done", "cancelled", "error"):
+                outcome.update(event)
+            self.emit(event)
+
+        engine = InstallEngine(emit, cancel, reaper=self.reaper)
+        engine.stage_gate = self.pool.gate
+        if job.get("state_dir"):
+            root = Path(job["state_dir"]) / CACHE_DIR_NAME
+            with self._lock:
+                if root not in self.caches:
+                    self.caches[root] = open_cache(job)
+                engine.iso_cache = self.caches[root]
+        try:
+            engine.run(job)
+        finally:
+            if engine.shell:
+                self.shells.append(engine.shell)
+            with self._lock:
+                self.running.pop(job_id, None)
+            self.live.pop(job_id, None)
+            self._wake.set()
+        kind = outcome.get("event")
+        if kind == "cancelled" and self._stop.is_set() and self.queue.get(job_id)["status"] != "cancelling":
+            self.queue.requeue(job_id)  # Interrupted by shutdown, not by the user: run it next time
+        else:
+            status = {"done": "done", "cancelled": "cancelled"}.get(kind, "failed")
+            self.queue.finish(job_id, status, outcome.get("result"), outcome.get("message"))
+        logging.info(f"Job {job_id} {self.queue.get(job_id)['status']}.")
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Queue install jobs and run them with shared resources.")
+    parser.add_argument("action", choices=("add", "list", "cancel", "run"))
+    parser.add_argument("job_id", nargs="?")
+    parser.add_argument("--state", type=Path, required=True, help="state dir (queue, caches, history)")
+    parser.add_argument("--build", help="build label (defaults to the build id)")
+    parser.add_argument("--build-id")
+    parser.add_argument("--edition", default="Professional")
+    parser.add_argument("--lang", default="en-us")
+    parser.add_argument("--output", default="iso")
+    parser.add_argument("--output-path")
+    parser.add_argument("--priority", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=DEFAULT_MAX_JOBS, help="jobs running at once")
+    parser.add_argument("--slots", default="", help="resource slots, e.g. network=2,cpu=1,disk=1")
+    parser.add_argument("--forever", action="store_true", help="keep waiting for new jobs")
+    args = parser.parse_intermixed_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(message)s")
+    queue = JobQueue(args.state / QUEUE_FILE)
+    if args.action == "add":
+        job = {"build": args.build or args.build_id, "build_id": args.build_id, "edition": args.edition,
+               "lang": args.lang, "state_dir": str(args.state), "output": args.output}
+        if args.output_path:
+            job["output_path"] = args.output_path
+        print(queue.add(job, args.priority))
+    elif args.action == "list":
+        for e in queue.list():
+            print(f"{e['id']}  {e['status']:<10} {e['stage'] or '':<9} {e['job'].get('build')} / "
+                  f"{e['job'].get('edition')}" + (f"  ({e['error']})" if e["error"] else ""))
+    elif args.action == "cancel":
+        if not args.job_id or not queue.cancel(args.job_id):
+            print("No such queued or running job.")
+            return 1
+    else:
+        slots = {k: int(v) for k, v in (s.split("=") for s in args.slots.split(",") if s)}
+        scheduler = Scheduler(queue, slots=slots, max_jobs=args.jobs)
+        try:
+            scheduler.start()
+        except RuntimeError as e:
+            print(f"{e} Jobs added with `add` are run by that one.")
+            return 1
+        try:
+            while args.forever or not scheduler.idle():
+                time.sleep(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scheduler.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
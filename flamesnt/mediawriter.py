@@ -0,0 +1,638 @@
+"""
+Bootable USB media writer 🔌
+-------------------------------------------------
+Writes a staged build tree straight onto a USB stick, a raw image file
+or a VHDX (see flamesnt.vhdx) as UEFI-bootable media. There is no intermediate ISO: the disk is
+laid out up front and written start to finish in one sequential pass.
+The layout is an MBR with one active FAT32 partition at 1 MiB, the
+reserved sectors, both FATs, then every directory and file in cluster
+order, with all files contiguous.
+
+Writes are 4 MiB chunks from a page-aligned buffer at aligned offsets,
+with O_DIRECT where the target supports it, so gigabytes of install
+media don't churn the page cache. A second thread reads each chunk back
+while the next one is written and compares its hash. With O_DIRECT the
+read comes from the device; without it (tmpfs, some image files) it may
+be served from cache, and the stats say so.
+
+Image files are sparse. They are truncated first, and any chunk that is
+all zeros is skipped rather than written (FAT free space, alignment
+padding), because a hole reads back as zeros anyway. A VM gets the
+same disk, attached as a raw or VHDX install disk, with nothing
+zero-filled. Devices still get every byte, since their old contents
+would show through.
+
+FAT32 caps files at 4 GiB - 1. Split a bigger install.wim first
+(`wimlib-imagex split install.wim install.swm 3800`); Setup reads
+install.swm the same way. Firmware boots \\EFI\\BOOT\\BOOTX64.EFI from the
+FAT32 partition. Legacy BIOS boot would need Windows' own boot sector
+code, which we don't ship.
+
+Usage:
+  python -m flamesnt.mediawriter STAGED_DIR /dev/sdX
+  python -m flamesnt.mediawriter STAGED_DIR stick.img --size 8G   # loopback-style image file
+  python -m flamesnt.mediawriter STAGED_DIR install.vhdx           # VM install disk, sized to fit
+"""
+import hashlib
+import logging
+import mmap
+import os
+import queue
+import stat
+import struct
+import sys
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from .isowriter import IsoDir, IsoFile, IsoTree
+
+SECTOR = 512
+CHUNK_SIZE = 4 * 1024 * 1024
+IO_ALIGN = 4096  # Covers 512-byte and 4K-native devices for O_DIRECT
+SPARSE_MIN_RUN = 1024 * 1024  # Zero runs this long are skipped even mid-chunk on sparse targets
+PARTITION_START = 2048  # 1 MiB, in sectors
+RESERVED_SECTORS = 32
+FAT32_MIN_CLUSTERS = 65525
+FAT32_MAX_CLUSTERS = 0x0FFFFFF5
+FAT32_MAX_FILE = 0xFFFFFFFF
+END_OF_CHAIN = 0x0FFFFFFF
+PARTITION_TYPE_FAT32_LBA = 0x0C
+UEFI_LOADER = "EFI/BOOT/BOOTX64.EFI"
+SHORT_NAME_CHARS = set("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789$%'-_@~`!(){}^#&")
+ATTR_DIRECTORY, ATTR_ARCHIVE, ATTR_VOLUME_ID, ATTR_LFN = 0x10, 0x20, 0x08, 0x0F
+IMAGE_FORMATS = ("raw", "vhdx")
+MIN_IMAGE_SIZE = 8 * 1024 ** 3
+
+_ZEROS = bytes(CHUNK_SIZE)
+
+
+def parse_size(text: str) -> int:
+    """'8G', '512M', '1.5T' or plain bytes."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def image_size_for(content_bytes: int) -> int:
+    """Size for a new image holding `content_bytes` of files: 10% headroom in whole GiB, at least 8 GiB.
+
+    Images are sparse, so the spare room costs no disk space.
+    """
+    gib = 1024 ** 3
+    return max(MIN_IMAGE_SIZE, -(-int(content_bytes * 1.1 + 256 * 1024 ** 2) // gib) * gib)
+
+
+def image_format_for(target) -> str:
+    return "vhdx" if str(target).lower().endswith(".vhdx") else "raw"
+
+
+def default_cluster_size(volume_bytes: int) -> int:
+    """Microsoft's FAT32 defaults, shrunk for small volumes so FAT32 still has enough clusters."""
+    gib = 1024 ** 3
+    size = 4096 if volume_bytes <= 8 * gib else 8192 if volume_bytes <= 16 * gib \
+        else 16384 if volume_bytes <= 32 * gib else 32768
+    while size > SECTOR and volume_bytes // size < FAT32_MIN_CLUSTERS:
+        size //= 2
+    return size
+
+
+# ----------------------------------------------------------------------
+#  Directory entries
+# ----------------------------------------------------------------------
+def _dos_datetime(t: time.struct_time) -> tuple[int, int]:
+    return (((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday,
+            (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2))
+
+
+def _fits_short(name: str) -> bool:
+    base, _, ext = name.rpartition(".") if "." in name else (name, "", "")
+    return (name == name.upper() and 0 < len(base) <= 8 and len(ext) <= 3 and "." not in base
+            and set(base + ext) <= SHORT_NAME_CHARS)
+
+
+def _short_name(name: str, taken: set[bytes]) -> tuple[bytes, bool]:
+    """11-byte 8.3 name for `name`, and whether long-name entries are needed too."""
+    if _fits_short(name):
+        base, _, ext = name.partition(".")
+        short = base.ljust(8).encode("ascii") + ext.ljust(3).encode("ascii")
+        if short not in taken:
+            taken.add(short)
+            return short, False
+    clean = lambda s: "".join(c if c in SHORT_NAME_CHARS else "_" for c in s.upper().replace(" ", ""))
+    base, _, ext = name.lstrip(".").rpartition(".") if "." in name.lstrip(".") else (name.lstrip("."), "", "")
+    base, ext = clean(base.replace(".", "")) or "_", clean(ext)[:3]
+    for n in range(1, 1000000):
+        tail = f"~{n}"
+        short = (base[:8 - len(tail)] + tail).ljust(8).encode("ascii") + ext.ljust(3).encode("ascii")
+        if short not in taken:
+            taken.add(short)
+            return short, True
+    raise RuntimeError(f"Too many similar names next to '{name}'.")
+
+
+def _lfn_checksum(short: bytes) -> int:
+    total = 0
+    for b in short:
+        total = (((total & 1) << 7) + (total >> 1) + b) & 0xFF
+    return total
+
+
+def _lfn_entries(name: str, short: bytes) -> list[bytes]:
+    """Long-name entries for `name`, in on-disk order (last piece first)."""
+    units = name.encode("utf-16-le")
+    if len(units) > 255 * 2:
+        raise RuntimeError(f"'{name}' is longer than FAT allows.")
+    chars = [units[i:i + 2] for i in range(0, len(units), 2)]
+    if len(chars) % 13:
+        chars.append(b"\x00\x00")  # Terminator, unless the name fills its last entry exactly
+    pieces = [chars[i:i + 13] for i in range(0, len(chars), 13)]
+    checksum = _lfn_checksum(short)
+    entries = []
+    for seq, piece in enumerate(pieces, 1):
+        piece = (piece + [b"\xff\xff"] * 13)[:13]
+        order = seq | (0x40 if seq == len(pieces) else 0)
+        entries.append(struct.pack("<B10sBBB12sH4s", order, b"".join(piece[:5]), ATTR_LFN, 0, checksum,
+                                   b"".join(piece[5:11]), 0, b"".join(piece[11:13])))
+    return entries[::-1]
+
+
+def _short_entry(short: bytes, attr: int, cluster: int, size: int, stamp: tuple[int, int]) -> bytes:
+    date, tm = stamp
+    return struct.pack("<11sBBBHHHHHHHI", short, attr, 0, 0, tm, date, date, cluster >> 16, tm, date,
+                       cluster & 0xFFFF, size)
+
+
+# ----------------------------------------------------------------------
+#  Aligned output with parallel read-back verification
+# ----------------------------------------------------------------------
+def _digest(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()  # Fast in software; this is a check, not a signature
+
+
+class _Verifier(threading.Thread):
+    """Reads back each written chunk and compares its digest, one step behind the writer."""
+
+    def __init__(self, path: str, direct: bool):
+        super().__init__(name="MediaVerifier", daemon=True)
+        self.jobs: queue.Queue = queue.Queue(maxsize=16)  # Bounds how far the writer may run ahead
+        self.fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0) | (getattr(os, "O_DIRECT", 0) if direct else 0))
+        self.buf = mmap.mmap(-1, CHUNK_SIZE)
+        self.verified = 0
+        self.error: str | None = None
+
+    def run(self):
+        view = memoryview(self.buf)
+        while (job := self.jobs.get()) is not None:
+            offset, segments, length, expected = job
+            if self.error:
+                continue
+            try:
+                got = 0
+                for file_offset, n in segments:  # Where the disk range lives in the target (see _RawDisk.segments)
+                    if hasattr(os, "preadv"):
+                        got += os.preadv(self.fd, [view[got:got + n]], file_offset)
+                    else:
+                        os.lseek(self.fd, file_offset, os.SEEK_SET)
+                        data = os.read(self.fd, n)
+                        view[got:got + len(data)] = data
+                        got += len(data)
+                if got != length or _digest(view[:length]) != expected:
+                    self.error = f"read-back mismatch at byte {offset}"
+                else:
+                    self.verified += length
+            except OSError as e:
+                self.error = f"read-back failed at byte {offset}: {e}"
+        view.release()
+
+    def close(self):
+        self.jobs.put(None)
+        self.join()
+        os.close(self.fd)
+        self.buf.close()
+
+
+class _RawDisk:
+    """A device or raw image file: disk offsets are file offsets. VhdxWriter has the same interface."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def pwrite(self, data, offset: int):
+        written = 0
+        while written < len(data):
+            written += os.pwrite(self.fd, data[written:], offset + written) if hasattr(os, "pwrite") \
+                else self._seek_write(data[written:], offset + written)
+
+    def _seek_write(self, data, offset: int) -> int:
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        return os.write(self.fd, data)
+
+    def segments(self, offset: int, length: int) -> list[tuple[int, int]]:
+        return [(offset, length)]
+
+    def finish(self):
+        pass
+
+
+class _AlignedOutput:
+    """Fills a page-aligned buffer and writes it out in CHUNK_SIZE pieces at aligned offsets.
+
+    With `sparse`, the target already reads as zeros, so all-zero chunks
+    are skipped instead of written.
+    """
+
+    def __init__(self, disk, verifier: _Verifier | None, on_bytes=None, sparse: bool = False):
+        self.disk = disk
+        self.verifier = verifier
+        self.on_bytes = on_bytes
+        self.sparse = sparse
+        self.buf = mmap.mmap(-1, CHUNK_SIZE)  # mmap memory is page-aligned, as O_DIRECT requires
+        self.view = memoryview(self.buf)
+        self.fill = 0
+        self.offset = 0  # Device offset of the buffer's first byte
+        self.written = 0
+        self.skipped = 0  # Zeros left as holes
+
+    @property
+    def position(self) -> int:
+        return self.offset + self.fill
+
+    def write(self, data):
+        data = memoryview(data)
+        while data:
+            n = min(len(data), CHUNK_SIZE - self.fill)
+            self.view[self.fill:self.fill + n] = data[:n]
+            self.fill += n
+            data = data[n:]
+            if self.fill == CHUNK_SIZE:
+                self.flush()
+
+    def zeros(self, count: int):
+        while count:
+            if self.sparse and count >= SPARSE_MIN_RUN:
+                if self.fill:
+                    pad = -self.fill % IO_ALIGN  # Finish the aligned block, write what we have, then jump
+                    self.view[self.fill:self.fill + pad] = bytes(pad)
+                    self.fill += pad
+                    count -= pad
+                    self.flush()
+                n = count - count % IO_ALIGN
+                self.offset += n
+                self.skipped += n
+                count -= n
+                if self.on_bytes:
+                    self.on_bytes(n)
+                continue
+            n = min(count, CHUNK_SIZE - self.fill)
+            self.view[self.fill:self.fill + n] = bytes(n)
+            self.fill += n
+            count -= n
+            if self.fill == CHUNK_SIZE:
+                self.flush()
+
+    def pad_to(self, byte_offset: int):
+        if byte_offset < self.position:
+            raise RuntimeError(f"Media layout overlap at byte {byte_offset}.")
+        self.zeros(byte_offset - self.position)
+
+    def skip_to(self, byte_offset: int):
+        """Leave the bytes up to `byte_offset` as they are on the target."""
+        self.flush()
+        if byte_offset > self.offset:
+            self.offset = byte_offset - byte_offset % IO_ALIGN
+
+    def copy_from(self, src, size: int, cancelled=None) -> bool:
+        """Read a file straight into the aligned buffer; no intermediate copies."""
+        remaining = size
+        while remaining:
+            if cancelled and cancelled():
+                return False
+            n = src.readinto(self.view[self.fill:self.fill + min(remaining, CHUNK_SIZE - self.fill)])
+            if not n:
+                raise RuntimeError(f"{getattr(src, 'name', 'source')} shrank while it was being written.")
+            self.fill += n
+            remaining -= n
+            if self.fill == CHUNK_SIZE:
+                self.flush()
+        return True
+
+    def flush(self):
+        if not self.fill:
+            return
+        length = -(-self.fill // IO_ALIGN) * IO_ALIGN  # O_DIRECT needs whole aligned blocks
+        self.view[self.fill:length] = bytes(length - self.fill)
+        chunk = self.view[:length]
+        if self.sparse and not self.view[0] and self.buf[:length] == _ZEROS[:length]:
+            self.skipped += length
+        else:
+            self.disk.pwrite(chunk, self.offset)
+            if self.verifier:
+                self.verifier.jobs.put((self.offset, self.disk.segments(self.offset, length), length, _digest(chunk)))
+            self.written += length
+        if self.on_bytes:
+            self.on_bytes(self.fill)
+        self.offset += length
+        self.fill = 0
+
+    def close(self):
+        self.view.release()
+        self.buf.close()
+
+
+# ----------------------------------------------------------------------
+#  Writer
+# ----------------------------------------------------------------------
+class MediaWriter:
+    """Lays out an IsoTree as MBR + FAT32 and streams it onto a device or image file."""
+
+    def __init__(self, tree: IsoTree, label: str = "FLAMESNT", cluster_size: int | None = None,
+                 timestamp: float | None = None):
+        self.tree = tree
+        self.label = label.upper()[:11]
+        self.cluster_size = cluster_size
+        self.stamp = _dos_datetime(time.localtime(timestamp))
+        self.dirs: list[IsoDir] = []
+        self.files: list[IsoFile] = []
+        self._walk(tree.root)
+        too_big = [f for f in self.files if f.size > FAT32_MAX_FILE]
+        if too_big:
+            raise RuntimeError(f"{too_big[0].name} is {too_big[0].size / 1024**3:.1f} GiB; FAT32 holds at most 4 GiB "
+                               f"per file. Split it first (wimlib-imagex split install.wim install.swm 3800).")
+        if not tree.find(UEFI_LOADER):
+            logging.warning(f"No {UEFI_LOADER} in the tree; the media won't boot on UEFI firmware.")
+
+    def _walk(self, d: IsoDir):
+        self.dirs.append(d)
+        for child in sorted(d.children.values(), key=lambda c: c.name.lower()):
+            if isinstance(child, IsoDir):
+                self._walk(child)
+            else:
+                self.files.append(child)
+
+    # ------------------------------------------------------------------
+    #  Layout
+    # ------------------------------------------------------------------
+    def _layout(self, total_bytes: int):
+        total_sectors = total_bytes // IO_ALIGN * IO_ALIGN // SECTOR
+        self.part_sectors = total_sectors - PARTITION_START
+        if self.part_sectors * SECTOR < 32 * 1024 ** 2:
+            raise RuntimeError(f"{total_bytes / 1024**2:.0f} MB is too small for FAT32 media.")
+        cluster = self.cluster_size or default_cluster_size(self.part_sectors * SECTOR)
+        self.spc = cluster // SECTOR
+        # FAT size depends on the cluster count, which depends on the FAT size: settle it by iteration
+        self.reserved, fat = RESERVED_SECTORS, 1
+        for _ in range(8):
+            clusters = (self.part_sectors - self.reserved - 2 * fat) // self.spc
+            fat = -(-(clusters + 2) * 4 // SECTOR)
+            # Grow the reserved area so the data region starts on a 1 MiB boundary of the device
+            data = PARTITION_START + RESERVED_SECTORS + 2 * fat
+            self.reserved = RESERVED_SECTORS + (-data % PARTITION_START)
+        self.fat_sectors = fat
+        self.clusters = (self.part_sectors - self.reserved - 2 * fat) // self.spc
+        if not FAT32_MIN_CLUSTERS <= self.clusters < FAT32_MAX_CLUSTERS:
+            raise RuntimeError(f"{self.clusters} clusters of {cluster} bytes is outside FAT32's range.")
+        self.data_start = PARTITION_START + self.reserved + 2 * fat
+
+        # Directories first (root is cluster 2), then files, all contiguous
+        self.names = {id(d): self._names(d) for d in self.dirs}
+        self.first_cluster: dict[int, int] = {}
+        self.cluster_count: dict[int, int] = {}
+        next_cluster = 2
+        for node in self.dirs + self.files:
+            if isinstance(node, IsoDir):
+                slots = (1 if node is self.tree.root else 2) + sum(  # Volume label, or . and ..
+                    1 + len(lfn) for _child, _short, lfn in self.names[id(node)])
+                count = -(-slots * 32 // cluster)
+            else:
+                count = -(-node.size // cluster)
+            self.first_cluster[id(node)] = next_cluster if count else 0
+            self.cluster_count[id(node)] = count
+            next_cluster += count
+        self.used_clusters = next_cluster - 2
+        if self.used_clusters > self.clusters:
+            raise RuntimeError(f"The build needs {self.used_clusters * cluster / 1024**3:.2f} GiB; "
+                               f"the media holds {self.clusters * cluster / 1024**3:.2f} GiB.")
+        self.entries = {id(d): self._directory(d) for d in self.dirs}
+        self.fat = self._fat()
+        self.total_bytes = total_sectors * SECTOR
+
+    @staticmethod
+    def _names(d: IsoDir) -> list[tuple]:
+        """(child, 8.3 name, long-name entries) for each child, in directory order."""
+        taken: set[bytes] = set()
+        names = []
+        for child in sorted(d.children.values(), key=lambda c: c.name.lower()):
+            short, long = _short_name(child.name, taken)
+            names.append((child, short, _lfn_entries(child.name, short) if long else []))
+        return names
+
+    def _directory(self, d: IsoDir) -> bytes:
+        out = bytearray()
+        if d is self.tree.root:
+            out += _short_entry(self.label.ljust(11).encode("ascii", "replace"), ATTR_VOLUME_ID, 0, 0, self.stamp)
+        else:
+            parent = 0 if d.parent is self.tree.root else self.first_cluster[id(d.parent)]
+            out += _short_entry(b".          ", ATTR_DIRECTORY, self.first_cluster[id(d)], 0, self.stamp)
+            out += _short_entry(b"..         ", ATTR_DIRECTORY, parent, 0, self.stamp)
+        for child, short, lfn in self.names[id(d)]:
+            out += b"".join(lfn)
+            is_dir = isinstance(child, IsoDir)
+            out += _short_entry(short, ATTR_DIRECTORY if is_dir else ATTR_ARCHIVE, self.first_cluster[id(child)],
+                                0 if is_dir else child.size, self.stamp)
+        return bytes(out)
+
+    def _mbr(self) -> bytes:
+        import random
+
+        entry = struct.pack("<B3sB3sII", 0x80, b"\xfe\xff\xff", PARTITION_TYPE_FAT32_LBA, b"\xfe\xff\xff",
+                            PARTITION_START, self.part_sectors)
+        return bytes(440) + struct.pack("<IH", random.getrandbits(32), 0) + entry + bytes(48) + b"\x55\xaa"
+
+    def _boot_sector(self) -> bytes:
+        import random
+
+        bpb = struct.pack("<3s8sHBHBHHBHHHIIIHHIHH12sBBBI11s8s", b"\xeb\x58\x90", b"MSWIN4.1", SECTOR, self.spc,
+                          self.reserved, 2, 0, 0, 0xF8, 0, 63, 255, PARTITION_START, self.part_sectors,
+                          self.fat_sectors, 0, 0, 2, 1, 6, bytes(12), 0x80, 0, 0x29, random.getrandbits(32),
+                          self.label.ljust(11).encode("ascii", "replace"), b"FAT32   ")
+        return bpb.ljust(510, b"\x00") + b"\x55\xaa"
+
+    def _fsinfo(self) -> bytes:
+        free = self.clusters - self.used_clusters
+        return (struct.pack("<I", 0x41615252) + bytes(480)
+                + struct.pack("<III", 0x61417272, free, self.used_clusters + 2)
+                + bytes(12) + struct.pack("<I", 0xAA550000))
+
+    def _fat(self) -> bytes:
+        """The used part of the FAT: one contiguous chain per directory and file. The rest is zero (free)."""
+        fat = array("I", [0x0FFFFFF8, END_OF_CHAIN]) + array("I", bytes(4 * self.used_clusters))
+        for node in self.dirs + self.files:
+            first, count = self.first_cluster[id(node)], self.cluster_count[id(node)]
+            if count:
+                fat[first:first + count - 1] = array("I", range(first + 1, first + count))
+                fat[first + count - 1] = END_OF_CHAIN
+        if sys.byteorder != "little":
+            fat.byteswap()
+        return fat.tobytes()
+
+    # ------------------------------------------------------------------
+    #  Writing
+    # ------------------------------------------------------------------
+    def write(self, target, size: int | None = None, verify: bool = True, direct: bool = True,
+              on_bytes=None, cancelled=None, image_format: str | None = None) -> dict | None:
+        """Write the media to `target` (block device or image file). None if cancelled.
+
+        A device's own size is used. An image file is rewritten as a sparse
+        raw or VHDX image (`image_format`, by default from the extension)
+        of `size` bytes, or of the old file's size, or of image_size_for()
+        the tree. Returns {bytes, seconds, mb_per_s, direct, verified_bytes,
+        verified_from_device, files, directories, format, sparse_bytes,
+        allocated_bytes}.
+        """
+        target = str(target)
+        started = time.monotonic()
+        is_device = os.path.exists(target) and stat.S_ISBLK(os.stat(target).st_mode)
+        image_format = "raw" if is_device else image_format or image_format_for(target)
+        if image_format not in IMAGE_FORMATS:
+            raise RuntimeError(f"Unknown image format '{image_format}' (expected one of {', '.join(IMAGE_FORMATS)}).")
+        flags = os.O_RDWR | getattr(os, "O_BINARY", 0) | (0 if is_device else os.O_CREAT)
+        fd, direct = self._open(target, flags, direct)
+        verifier = None
+        out = None
+        try:
+            if is_device:
+                total = os.lseek(fd, 0, os.SEEK_END)
+            else:
+                existing = os.fstat(fd).st_size if image_format == "raw" else 0
+                total = size or existing or image_size_for(sum(f.size for f in self.files))
+                os.ftruncate(fd, 0)  # Old contents would show through the zeros we skip
+            self._layout(total)
+            if image_format == "vhdx":
+                from .vhdx import VhdxWriter
+
+                disk = VhdxWriter(fd, self.total_bytes)
+            else:
+                disk = _RawDisk(fd)
+                if not is_device:
+                    os.ftruncate(fd, self.total_bytes)
+            if verify:
+                verifier = _Verifier(target, direct)
+                verifier.start()
+            out = _AlignedOutput(disk, verifier, on_bytes, sparse=not is_device)
+            if not self._write_to(out, is_device, cancelled):
+                return None
+            out.flush()
+            disk.finish()
+            os.fsync(fd)
+            allocated = getattr(os.fstat(fd), "st_blocks", 0) * 512 if not is_device else self.total_bytes
+        finally:
+            if out:
+                out.close()
+            if verifier:
+                verifier.close()
+            os.close(fd)
+        if verifier and verifier.error:
+            raise RuntimeError(f"Verification of {target} failed: {verifier.error}.")
+        seconds = max(time.monotonic() - started, 1e-9)
+        written = out.written
+        stats = {"bytes": written, "seconds": round(seconds, 3), "mb_per_s": round(written / seconds / 1024 ** 2, 1),
+                 "direct": direct, "verified_bytes": verifier.verified if verifier else 0,
+                 "verified_from_device": bool(verifier) and direct,
+                 "files": len(self.files), "directories": len(self.dirs), "format": image_format,
+                 "sparse_bytes": out.skipped, "allocated_bytes": allocated}
+        logging.info(f"Wrote {written / 1024**2:.0f} MB of bootable media to {target} at {stats['mb_per_s']} MB/s "
+                     f"({'O_DIRECT' if direct else 'buffered'}; verified {stats['verified_bytes'] / 1024**2:.0f} MB"
+                     f"{'' if stats['verified_from_device'] else ', possibly from cache'}"
+                     f"{'' if is_device else f'; {image_format}, {out.skipped / 1024**2:.0f} MB left sparse'}).")
+        return stats
+
+    @staticmethod
+    def _open(target: str, flags: int, direct: bool) -> tuple[int, bool]:
+        if direct and hasattr(os, "O_DIRECT"):
+            try:
+                return os.open(target, flags | os.O_DIRECT, 0o644), True
+            except OSError as e:
+                logging.info(f"O_DIRECT not available for {target} ({e.strerror}); writing through the cache.")
+        return os.open(target, flags, 0o644), False
+
+    def _write_to(self, out: _AlignedOutput, is_device: bool, cancelled) -> bool:
+        out.write(self._mbr())
+        part = PARTITION_START * SECTOR
+        out.pad_to(part)
+        boot, fsinfo = self._boot_sector(), self._fsinfo()
+        out.write(boot + fsinfo)
+        out.pad_to(part + 6 * SECTOR)
+        out.write(boot + fsinfo)  # Backup copies at sectors 6 and 7
+        for fat in range(2):
+            out.pad_to((PARTITION_START + self.reserved + fat * self.fat_sectors) * SECTOR)
+            out.write(self.fat)
+            out.zeros(self.fat_sectors * SECTOR - len(self.fat))
+        cluster_bytes = self.spc * SECTOR
+        for d in self.dirs:
+            out.pad_to(self._cluster_offset(self.first_cluster[id(d)]))
+            out.write(self.entries[id(d)])
+            out.zeros(-len(self.entries[id(d)]) % cluster_bytes)
+        for f in self.files:
+            if cancelled and cancelled():
+                return False
+            if not f.size:
+                continue
+            out.pad_to(self._cluster_offset(self.first_cluster[id(f)]))
+            if f.data is not None:
+                out.write(f.data)
+            else:
+                with open(f.source, "rb", buffering=0) as src:
+                    if hasattr(os, "posix_fadvise"):
+                        os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    if not out.copy_from(src, f.size, cancelled):
+                        return False
+            out.zeros(-f.size % cluster_bytes)
+        if is_device:
+            # Stale backup GPT at the end of the stick would make firmware ignore our MBR
+            out.skip_to(max(self.total_bytes - 1024 ** 2, out.position))
+            out.pad_to(self.total_bytes)
+        return True
+
+    def _cluster_offset(self, cluster: int) -> int:
+        return (self.data_start + (cluster - 2) * self.spc) * SECTOR
+
+
+def write_media(source_dir: Path, target, size: int | str | None = None, label: str = "FLAMESNT",
+                verify: bool = True, on_bytes=None, cancelled=None, image_format: str | None = None) -> dict | None:
+    """Write a staged directory as bootable media in one pass. Returns stats, or None if cancelled.
+
+    `size` only applies to image files and may be given as '8G'.
+    """
+    if isinstance(size, str):
+        size = parse_size(size)
+    tree = IsoTree()
+    tree.add_directory(source_dir)
+    return MediaWriter(tree, label).write(target, size, verify, on_bytes=on_bytes, cancelled=cancelled,
+                                          image_format=image_format)
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a staged build tree as bootable FAT32 USB media.")
+    parser.add_argument("source_dir", type=Path)
+    parser.add_argument("target", help="block device (e.g. /dev/sdb) or image file")
+    parser.add_argument("--size", type=parse_size, help="size of an image file, e.g. 8G (default: fit the tree)")
+    parser.add_argument("--format", choices=IMAGE_FORMATS, help="image file format (default: from the extension)")
+    parser.add_argument("--label", default="FLAMESNT")
+    parser.add_argument("--no-verify", action="store_true", help="skip the read-back check")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    stats = write_media(args.source_dir, args.target, args.size, args.label, not args.no_verify,
+                        image_format=args.format)
+    print(f"{stats['bytes'] / 1024**2:.0f} MB in {stats['seconds']:.1f}s ({stats['mb_per_s']} MB/s), "
+          f"verified {stats['verified_bytes'] / 1024**2:.0f} MB, {stats['allocated_bytes'] / 1024**2:.0f} MB on disk")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,353 @@
+"""
+Merkle integrity index 🌳
+-------------------------------------------------
+A whole-file SHA-256 can only say "something in these 6 GB is wrong".
+The Merkle index hashes an artifact in fixed-size chunks (the leaves)
+and builds a tree over them. The root is one value to trust (it's kept
+with the cache entry), and the leaves say exactly which chunks are bad.
+
+  verify   hashes chunks on a thread pool. hashlib releases the GIL on
+           big buffers, so this scales with cores and disk queue depth.
+  check    the incremental form. If the file's identity (size, mtime,
+           inode) hasn't changed since the last check, only chunks
+           marked dirty by our own writes are re-read, plus a few of the
+           least recently verified ones, so a slow scrub covers the whole
+           file over time. A changed identity means a full verify.
+  repair   fetches just the bad ranges from range sources (the chunk
+           store, a mirror file, an HTTP peer), checks each chunk
+           against its leaf before writing it, and tries the next source
+           for whatever is still bad.
+
+Leaves and nodes are hashed with different prefixes, so a node can never
+pass for a leaf.
+
+Usage:
+  python -m flamesnt.merkle build  FILE            # writes FILE.merkle.json
+  python -m flamesnt.merkle verify FILE
+  python -m flamesnt.merkle repair FILE --from MIRROR_FILE_OR_URL
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+CHUNK_SIZE = 4 * 1024 * 1024
+INDEX_SUFFIX = ".merkle.json"
+SCRUB_CHUNKS = 16  # Least recently verified chunks re-read by each incremental check
+MAX_WORKERS = 8
+MAX_REPAIR_READ = 16 * 1024 * 1024  # Largest range asked of a repair source at once (it's held in memory)
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def _identity(path: Path) -> str:
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+
+
+def _read(path: Path, offset: int, length: int) -> bytes:
+    with open(path, "rb", buffering=0) as f:  # One handle per read: safe on any thread, and on Windows
+        f.seek(offset)
+        return f.read(length)
+
+
+def leaf_hash(data) -> bytes:
+    h = hashlib.sha256(LEAF_PREFIX)
+    h.update(data)
+    return h.digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def merkle_root(leaves: list[bytes]) -> bytes:
+    """Root over `leaves`; an odd node at the end of a level moves up unchanged."""
+    level = leaves or [leaf_hash(b"")]
+    while len(level) > 1:
+        level = [node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0]
+
+
+class MerkleIndex:
+    """Chunk hashes and tree root of one file, with per-chunk verification times."""
+
+    def __init__(self, size: int, leaves: list[bytes], chunk_size: int = CHUNK_SIZE):
+        self.size = size
+        self.chunk_size = chunk_size
+        self.leaves = leaves
+        self.root = merkle_root(leaves)
+        self.identity: str | None = None  # File identity at the last check
+        self.checked = [0.0] * len(leaves)  # When each chunk was last read and found good
+        self.dirty: set[int] = set()
+
+    @property
+    def chunks(self) -> int:
+        return len(self.leaves)
+
+    def chunk_range(self, i: int) -> tuple[int, int]:
+        offset = i * self.chunk_size
+        return offset, min(self.chunk_size, self.size - offset)
+
+    def ranges(self, chunks, limit: int | None = None) -> list[tuple[int, int]]:
+        """(offset, length) byte ranges covering `chunks`, adjacent chunks merged up to `limit` bytes."""
+        ranges: list[list[int]] = []
+        for i in sorted(chunks):
+            offset, length = self.chunk_range(i)
+            if (ranges and ranges[-1][0] + ranges[-1][1] == offset
+                    and (limit is None or ranges[-1][1] + length <= limit)):
+                ranges[-1][1] += length
+            else:
+                ranges.append([offset, length])
+        return [tuple(r) for r in ranges]
+
+    # ------------------------------------------------------------------
+    #  Building and persistence
+    # ------------------------------------------------------------------
+    @classmethod
+    def build(cls, path: Path, chunk_size: int = CHUNK_SIZE, workers: int | None = None,
+              cancelled=None) -> "MerkleIndex | None":
+        """Hash `path` chunk by chunk on a thread pool. None if cancelled."""
+        path = Path(path)
+        identity = _identity(path)
+        size = path.stat().st_size
+        count = max(1, -(-size // chunk_size))
+        started = time.monotonic()
+        leaves = _hash_chunks(path, range(count), chunk_size, size, workers, cancelled)
+        if leaves is None:
+            return None
+        index = cls(size, [leaves[i] for i in range(count)], chunk_size)
+        index.identity = identity
+        index.checked = [time.time()] * count
+        seconds = max(time.monotonic() - started, 1e-9)
+        logging.info(f"Merkle index of {path.name}: {count} chunks, root {index.root.hex()[:16]}..., "
+                     f"{size / seconds / 1024**2:.0f} MB/s.")
+        return index
+
+    @classmethod
+    def build_with_digest(cls, path: Path, algorithm: str = "sha256", chunk_size: int = CHUNK_SIZE,
+                          workers: int | None = None) -> tuple["MerkleIndex", str]:
+        """Index `path` and take its whole-file digest in the same single read."""
+        path = Path(path)
+        identity = _identity(path)
+        size = path.stat().st_size
+        digest = hashlib.new(algorithm)
+        started = time.monotonic()
+        workers = workers or min(MAX_WORKERS, os.cpu_count() or 1)
+        with open(path, "rb", buffering=0) as f, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Merkle") as pool:
+            futures = []
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)  # Sequential by nature; the leaves hash alongside it on the pool
+                futures.append(pool.submit(leaf_hash, chunk))
+                if len(futures) > workers * 2:
+                    futures[-workers * 2 - 1].result()  # Bound the chunks held in memory
+            leaves = [future.result() for future in futures] or [leaf_hash(b"")]
+        index = cls(size, leaves, chunk_size)
+        index.identity = identity
+        index.checked = [time.time()] * index.chunks
+        seconds = max(time.monotonic() - started, 1e-9)
+        logging.info(f"Merkle index and {algorithm} of {path.name}: {index.chunks} chunks, "
+                     f"{size / seconds / 1024**2:.0f} MB/s.")
+        return index, digest.hexdigest()
+
+    def to_dict(self) -> dict:
+        return {"size": self.size, "chunk_size": self.chunk_size, "root": self.root.hex(),
+                "leaves": [leaf.hex() for leaf in self.leaves], "identity": self.identity,
+                "checked": self.checked, "dirty": sorted(self.dirty)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MerkleIndex":
+        index = cls(data["size"], [bytes.fromhex(h) for h in data["leaves"]], data["chunk_size"])
+        if index.root.hex() != data["root"]:
+            raise RuntimeError("Merkle index leaves don't match its root; the index is damaged.")
+        index.identity = data.get("identity")
+        index.checked = data.get("checked") or [0.0] * index.chunks
+        index.dirty = set(data.get("dirty", []))
+        return index
+
+    def save(self, path: Path):
+        path = Path(path)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.to_dict()))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "MerkleIndex":
+        return cls.from_dict(json.loads(Path(path).read_text()))
+
+    # ------------------------------------------------------------------
+    #  Verification
+    # ------------------------------------------------------------------
+    def mark_dirty(self, offset: int, length: int):
+        """Record that we wrote these bytes; the next check() re-reads their chunks."""
+        first, last = offset // self.chunk_size, (offset + max(length, 1) - 1) // self.chunk_size
+        self.dirty.update(range(first, min(last, self.chunks - 1) + 1))
+
+    def verify(self, path: Path, chunks=None, workers: int | None = None, cancelled=None) -> list[int] | None:
+        """Re-hash `chunks` (default: all) of `path` and return the bad ones. None if cancelled."""
+        path = Path(path)
+        if path.stat().st_size != self.size:
+            logging.warning(f"{path.name} is {path.stat().st_size} bytes, expected {self.size}.")
+            return list(range(self.chunks))
+        chunks = list(range(self.chunks)) if chunks is None else sorted(set(chunks))
+        identity = _identity(path)
+        hashes = _hash_chunks(path, chunks, self.chunk_size, self.size, workers, cancelled)
+        if hashes is None:
+            return None
+        now = time.time()
+        bad = [i for i in chunks if hashes[i] != self.leaves[i]]
+        for i in chunks:
+            if hashes[i] == self.leaves[i]:
+                self.checked[i] = now
+        self.dirty -= set(chunks) - set(bad)
+        self.identity = identity
+        return bad
+
+    def check(self, path: Path, scrub: int = SCRUB_CHUNKS, workers: int | None = None) -> list[int]:
+        """Incremental verify: dirty chunks plus the `scrub` stalest ones, or everything if the file changed."""
+        path = Path(path)
+        if self.identity != _identity(path):
+            return self.verify(path, workers=workers)
+        stale = sorted(range(self.chunks), key=lambda i: self.checked[i])[:scrub]
+        return self.verify(path, self.dirty | set(stale), workers=workers)
+
+    # ------------------------------------------------------------------
+    #  Repair
+    # ------------------------------------------------------------------
+    def repair(self, path: Path, bad: list[int], sources: list, cancelled=None) -> list[int]:
+        """Rewrite the `bad` chunks of `path` from `sources`; returns the chunks still bad.
+
+        A source is a callable (offset, length) -> bytes | None. Adjacent
+        bad chunks are requested together, at most MAX_REPAIR_READ bytes
+        (or one chunk) at a time, so even a wholly bad file is rewritten
+        in bounded pieces. Every chunk is checked against its leaf before
+        it's written. Written chunks are marked dirty, so the next
+        check() reads them back from the disk.
+        """
+        path = Path(path)
+        remaining = set(bad)
+        repaired = 0
+        with open(path, "r+b", buffering=0) as f:
+            for source in sources:
+                for offset, length in self.ranges(remaining, MAX_REPAIR_READ):
+                    if cancelled and cancelled():
+                        return sorted(remaining)
+                    try:
+                        data = source(offset, length)
+                    except (OSError, RuntimeError) as e:
+                        logging.info(f"Repair source {getattr(source, 'name', source)} failed for "
+                                     f"bytes {offset}-{offset + length}: {e}")
+                        continue
+                    if not data or len(data) != length:
+                        continue
+                    view = memoryview(data)
+                    for i in range(offset // self.chunk_size, -(-(offset + length) // self.chunk_size)):
+                        start, n = self.chunk_range(i)
+                        piece = view[start - offset:start - offset + n]
+                        if leaf_hash(piece) == self.leaves[i]:
+                            f.seek(start)
+                            f.write(piece)
+                            self.mark_dirty(start, n)
+                            remaining.discard(i)
+                            repaired += n
+                if not remaining:
+                    break
+            if not remaining and os.fstat(f.fileno()).st_size != self.size:
+                f.truncate(self.size)  # Every chunk is right again; drop whatever trails past the end
+            os.fsync(f.fileno())
+        self.identity = _identity(path)  # Only chunks checked against their leaves were written
+        logging.info(f"Repaired {len(bad) - len(remaining)} of {len(bad)} damaged chunk(s) of {path.name} "
+                     f"({repaired / 1024**2:.1f} MB rewritten).")
+        return sorted(remaining)
+
+
+def _hash_chunks(path: Path, chunks, chunk_size: int, size: int, workers: int | None,
+                 cancelled=None) -> dict[int, bytes] | None:
+    def work(i: int) -> tuple[int, bytes | None]:
+        if cancelled and cancelled():
+            return i, None
+        offset = i * chunk_size
+        return i, leaf_hash(_read(path, offset, min(chunk_size, size - offset)))
+
+    workers = workers or min(MAX_WORKERS, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Merkle") as pool:
+        hashes = dict(pool.map(work, chunks))
+    if cancelled and cancelled():
+        return None
+    return hashes
+
+
+# ----------------------------------------------------------------------
+#  Range sources for repair
+# ----------------------------------------------------------------------
+def file_source(path: Path):
+    """Ranges from another copy of the file (a mirror, a share, a peer's export)."""
+    def read(offset: int, length: int) -> bytes | None:
+        return _read(path, offset, length) if os.path.exists(path) else None
+
+    read.name = str(path)
+    return read
+
+
+def http_source(url: str, timeout: int = 60):
+    """Ranges from an HTTP server that honours Range requests."""
+    def read(offset: int, length: int) -> bytes | None:
+        import requests
+
+        try:
+            r = requests.get(url, headers={"Range": f"bytes={offset}-{offset + length - 1}"}, timeout=timeout)
+        except requests.RequestException as e:
+            raise RuntimeError(str(e))
+        return r.content if r.status_code == 206 else None
+
+    read.name = url
+    return read
+
+
+def chunkstore_source(store, key: str):
+    """Ranges rebuilt from a file kept in the chunk store (see flamesnt.chunkstore)."""
+    def read(offset: int, length: int) -> bytes | None:
+        return store.read_range(key, offset, length) if store.has(key) else None
+
+    read.name = f"chunk store ({key})"
+    return read
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build, verify and repair Merkle integrity indexes.")
+    parser.add_argument("action", choices=("build", "verify", "repair"))
+    parser.add_argument("file", type=Path)
+    parser.add_argument("--index", type=Path, help=f"index file (default: FILE{INDEX_SUFFIX})")
+    parser.add_argument("--from", dest="sources", action="append", default=[],
+                        help="repair source: another copy of the file, or an http(s) URL")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    index_path = args.index or args.file.with_name(args.file.name + INDEX_SUFFIX)
+    if args.action == "build":
+        MerkleIndex.build(args.file, args.chunk_size).save(index_path)
+        print(f"Wrote {index_path}")
+        return 0
+    index = MerkleIndex.load(index_path)
+    started = time.monotonic()
+    bad = index.verify(args.file)
+    print(f"{len(bad)} of {index.chunks} chunks bad, checked in {time.monotonic() - started:.2f}s"
+          + "".join(f"\n  bytes {o}-{o + n - 1}" for o, n in index.ranges(bad)))
+    if bad and args.action == "repair":
+        sources = [http_source(s) if s.startswith(("http://", "https://")) else file_source(Path(s))
+                   for s in args.sources]
+        bad = index.repair(args.file, bad, sources)
+        print(f"{len(bad)} chunks still bad")
+    index.save(index_path)
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
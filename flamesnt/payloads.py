@@ -0,0 +1,127 @@
+"""
+Payload store 🧺
+-------------------------------------------------
+Verified UUP payload files, kept by SHA-1 so the next build that ships
+the same cab or ESD (and most of a cumulative build's files are the
+same) finds it locally instead of downloading it again. Signed download
+URLs expire and differ per request, but the SHA-1 in the manifest
+doesn't, so content is the only stable key.
+
+Files live at ROOT/ab/abcdef... and are added by hardlink where the
+volume allows it, so keeping a payload that was just verified costs no
+copy. The directory is the index: a file's mtime is touched whenever
+it's used, and when the store is over its cap the least recently used
+files go first. With no index file to keep in step, the engine and a
+peer cache server (see flamesnt.peercache) can share one store.
+"""
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+from .download import hash_file
+from .staging import place_file
+
+PAYLOAD_DIR_NAME = "payloads"
+DEFAULT_MAX_BYTES = 40 * 1024 ** 3
+SHA1_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+
+
+def is_sha1(value: str) -> bool:
+    return bool(SHA1_PATTERN.match(value or ""))
+
+
+class PayloadStore:
+    """Size-capped LRU store of payload files keyed by SHA-1."""
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def path(self, sha1: str) -> Path:
+        return self.root / sha1[:2] / sha1
+
+    def files(self) -> list[tuple[float, int, Path]]:
+        """(last used, size, path) of every stored payload."""
+        found = []
+        for path in self.root.glob("??/*"):
+            if is_sha1(path.name):
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process just now
+                found.append((st.st_mtime, st.st_size, path))
+        return found
+
+    def total_bytes(self) -> int:
+        return sum(size for _used, size, _path in self.files())
+
+    # ------------------------------------------------------------------
+    #  Lookup and add
+    # ------------------------------------------------------------------
+    def has(self, sha1: str) -> bool:
+        return is_sha1(sha1) and self.path(sha1).exists()
+
+    def have(self, sha1s) -> list[str]:
+        """The subset of `sha1s` that's here."""
+        return [s for s in sha1s if self.has(s)]
+
+    def get(self, sha1: str) -> Path | None:
+        """Path of the payload with this SHA-1, or None. Marks it recently used."""
+        if not is_sha1(sha1):
+            return None
+        path = self.path(sha1)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def add(self, path: Path, sha1: str, verified: bool = False) -> Path | None:
+        """Keep `path` (hardlinked where possible) under `sha1`. Unless `verified`, its SHA-1 is checked first."""
+        path = Path(path)
+        sha1 = sha1.lower()
+        if not is_sha1(sha1):
+            raise RuntimeError(f"'{sha1}' is not a SHA-1.")
+        if self.get(sha1):
+            return self.path(sha1)
+        if not verified and hash_file(path, "sha1") != sha1:
+            logging.warning(f"Not storing {path.name}: its SHA-1 isn't {sha1}.")
+            return None
+        dest = self.path(sha1)
+        dest.parent.mkdir(exist_ok=True)
+        tmp = dest.with_name(f"{sha1}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.unlink(missing_ok=True)
+        place_file(path, tmp, link=True)  # Payloads are never written in place, so sharing the inode is safe
+        os.replace(tmp, dest)
+        os.utime(dest)
+        self.evict(keep=sha1)
+        return dest
+
+    # ------------------------------------------------------------------
+    #  Eviction
+    # ------------------------------------------------------------------
+    def evict(self, keep: str | None = None):
+        """Drop least recently used payloads until we're under the cap."""
+        with self._lock:
+            files = sorted(self.files())
+            total = sum(size for _used, size, _path in files)
+            for _used, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                if path.name == keep:
+                    continue
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.info(f"Could not evict payload {path.name}: {e}")  # In use (Windows)
+                    continue
+                total -= size
+                logging.info(f"Evicted payload {path.name} from the store.")
+        if total > self.max_bytes:
+            logging.warning(f"Payload store is {total / 1024**3:.1f} GiB, over its cap.")
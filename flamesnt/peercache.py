@@ -0,0 +1,342 @@
+"""
+LAN peer cache 🐾
+-------------------------------------------------
+Every build box fetching the same payloads from the internet is wasted
+bandwidth. A peer cache server shares this machine's payload store (see
+flamesnt.payloads) over HTTP, and a job's download stage asks the peers
+on its discovery list before going upstream:
+
+  POST /has              {"sha1": [...]} -> {"have": [...]}: one round
+                         trip per peer for the whole manifest
+  GET  /payloads/SHA1    the file (Range requests honoured); HEAD too
+  GET  /artifacts/KEY    a finished ISO from this machine's ISO cache, by
+                         cache key (Range requests honoured); HEAD too.
+                         Another machine's cache repairs damaged chunks
+                         of the same ISO from it (see flamesnt.artifacts)
+  GET  /peers            the peers this server knows; a client adds them
+                         to its list before asking /has (one hop), so a
+                         discovery list can start from a single seed
+
+Nothing from a peer is trusted: each file is SHA-1'd as it streams in,
+and a mismatch is thrown away and the next peer (or upstream) tried.
+ISO ranges are checked chunk by chunk against the reader's own Merkle
+leaves before anything is written. The
+discovery list is a text file (one http://host:port per line, # for
+comments), the job's "peers" list, or both.
+
+Usage:
+  python -m flamesnt.peercache serve --store DIR [--port 8787] [--peers-file FILE] [--iso-cache DIR]
+  python -m flamesnt.peercache fetch SHA1 DEST --peer http://host:8787 [--peer ...]
+
+Several servers on one machine (different --store and --port) make a
+test LAN.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from .merkle import http_source
+from .payloads import PayloadStore, is_sha1
+
+DEFAULT_PORT = 8787
+PEERS_FILE = "peers.txt"
+CHUNK_SIZE = 1024 * 1024
+LOCATE_TIMEOUT = 3  # Seconds; a peer that's slow to answer /has is skipped for the job
+MAX_QUERY = 4096
+ARTIFACT_KEY = re.compile(r"[0-9a-z-]{1,64}")  # artifact_key() hex, or a farm's "farm-<job id>"
+
+
+def load_peers(path: Path | None, extra=None) -> list[str]:
+    """Peer base URLs from a discovery file plus `extra`, de-duplicated, order kept."""
+    peers = list(extra or [])
+    if path and Path(path).exists():
+        for line in Path(path).read_text().splitlines():
+            line = line.split("#", 1)[0].strip()
+            if line:
+                peers.append(line)
+    return list(dict.fromkeys(p.rstrip("/") if "://" in p else f"http://{p}".rstrip("/") for p in peers))
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """(start, end inclusive) of a single "bytes=" range; None for the whole file. Raises ValueError if invalid."""
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+    else:
+        start, end = size - int(last), size - 1  # Suffix range: the last N bytes
+    start, end = max(start, 0), min(end, size - 1)
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+# ----------------------------------------------------------------------
+#  Server
+# ----------------------------------------------------------------------
+class PeerCacheHandler(BaseHTTPRequestHandler):
+    server_version = "FlamesNT-PeerCache/1"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug(f"Peer cache {self.client_address[0]}: {format % args}")
+
+    def _reply_json(self, data, status: int = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path != "/has":
+            return self._not_found()
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            wanted = json.loads(self.rfile.read(length)).get("sha1", [])[:MAX_QUERY]
+        except (ValueError, AttributeError):
+            return self._reply_json({"error": "expected {\"sha1\": [...]}"}, 400)
+        self._reply_json({"have": self.server.store.have(str(s).lower() for s in wanted)})
+
+    def do_GET(self):
+        if self.path == "/peers":
+            return self._reply_json({"peers": self.server.peers})
+        self._send_file(head=False)
+
+    def do_HEAD(self):
+        self._send_file(head=True)
+
+    def _lookup(self) -> tuple[Path | None, str]:
+        prefix, _, name = self.path.rpartition("/")
+        name = name.lower()
+        if prefix == "/payloads":
+            return self.server.store.get(name), name
+        if prefix == "/artifacts" and self.server.iso_cache and ARTIFACT_KEY.fullmatch(name):
+            return self.server.iso_cache / f"{name}.iso", name
+        return None, name
+
+    def _send_file(self, head: bool):
+        path, name = self._lookup()
+        try:
+            f = open(path, "rb") if path else None
+        except OSError:  # Not cached here, or evicted since
+            f = None
+        if not f:
+            return self._not_found()
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            try:
+                span = parse_range(self.headers.get("Range"), size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                return self.end_headers()
+            start, end = span or (0, size - 1)
+            self.send_response(206 if span else 200)
+            if span:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", f'"{name}"')
+            self.end_headers()
+            if not head and size:
+                self.connection.sendfile(f, start, end - start + 1)  # Zero-copy where the OS has sendfile
+
+
+class PeerCacheServer(ThreadingHTTPServer):
+    """HTTP server sharing a PayloadStore, and optionally an ISO cache directory, with the LAN."""
+
+    daemon_threads = True
+
+    def __init__(self, store: PayloadStore, host: str = "0.0.0.0", port: int = DEFAULT_PORT,
+                 peers: list[str] | None = None, iso_cache: Path | None = None):
+        super().__init__((host, port), PeerCacheHandler)
+        self.store = store
+        self.peers = peers or []
+        self.iso_cache = Path(iso_cache) if iso_cache else None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """Serve on a background thread (shutdown() stops it)."""
+        thread = threading.Thread(target=self.serve_forever, name="PeerCache", daemon=True)
+        thread.start()
+        logging.info(f"Peer cache serving {self.store.root} at {self.url}.")
+        return thread
+
+
+# ----------------------------------------------------------------------
+#  Client
+# ----------------------------------------------------------------------
+def artifact_source(peer: str, timeout: int = 30):
+    """Repair-source factory for an ArtifactCache: ranges of the same cached ISO from `peer`."""
+    def factory(key: str, entry: dict):
+        return http_source(f"{peer}/artifacts/{key}", timeout)
+
+    return factory
+
+
+class PeerClient:
+    """Finds payloads on LAN peers and fetches them with SHA-1 verification."""
+
+    def __init__(self, peers: list[str], timeout: int = 30):
+        self.peers = list(peers)
+        self.timeout = timeout
+        self.located: dict[str, list[str]] = {}
+        self.unreachable: set[str] = set()
+        self.stats = {"files": 0, "bytes": 0, "rejected": 0}
+
+    def discover(self) -> list[str]:
+        """Add the peers each known peer lists on /peers (one hop, so a single seed is enough)."""
+        import requests
+
+        found = []
+        for peer in self.peers:
+            try:
+                r = requests.get(f"{peer}/peers", timeout=LOCATE_TIMEOUT)
+                r.raise_for_status()
+                found += [str(p) for p in r.json().get("peers", [])]
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logging.info(f"Peer {peer} didn't answer ({e}); skipping it for this job.")
+                self.unreachable.add(peer)
+            except (requests.RequestException, ValueError, AttributeError) as e:
+                logging.info(f"Peer {peer} didn't list its peers ({e}).")
+        known = len(self.peers)
+        self.peers = load_peers(None, self.peers + found)
+        if len(self.peers) > known:
+            logging.info(f"Discovered {len(self.peers) - known} more peer(s) through the discovery list.")
+        return self.peers
+
+    def locate(self, sha1s) -> dict[str, list[str]]:
+        """Ask every peer which of `sha1s` it has; returns {sha1: [peer, ...]} for the ones found."""
+        import requests
+
+        wanted = [s.lower() for s in sha1s if is_sha1(s.lower())]
+        self.located = {}
+        self.discover()
+        for peer in self.peers:
+            if peer in self.unreachable:
+                continue
+            have = []
+            for i in range(0, len(wanted), MAX_QUERY):
+                try:
+                    r = requests.post(f"{peer}/has", json={"sha1": wanted[i:i + MAX_QUERY]}, timeout=LOCATE_TIMEOUT)
+                    r.raise_for_status()
+                    have += r.json().get("have", [])
+                except (requests.RequestException, ValueError) as e:
+                    logging.info(f"Peer {peer} didn't answer ({e}); skipping it for this job.")
+                    break
+            for sha1 in have:
+                if sha1 in wanted:
+                    self.located.setdefault(sha1, []).append(peer)
+        if self.peers:
+            found = len(self.located)
+            logging.info(f"Peers have {found} of {len(wanted)} payload(s).")
+        return self.located
+
+    def fetch(self, sha1: str, dest: Path, on_bytes=None, cancelled=None, meter=None) -> Path | None:
+        """Download `sha1` from a peer that has it into `dest`, verified. None if no peer could supply it.
+
+        meter(peer_url), if given, returns the throttle for that peer (see
+        flamesnt.governor).
+        """
+        import requests
+
+        sha1 = sha1.lower()
+        dest = Path(dest)
+        part = dest.with_name(dest.name + ".part")
+        for peer in self.located.get(sha1, []):
+            throttle = meter(peer) if meter else None
+            h = hashlib.sha1()
+            received = 0
+            try:
+                with requests.get(f"{peer}/payloads/{sha1}", stream=True, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    with open(part, "wb") as f:
+                        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                            if cancelled and cancelled():
+                                break
+                            if throttle and not throttle(len(chunk)):
+                                break
+                            f.write(chunk)
+                            h.update(chunk)
+                            received += len(chunk)
+                            if on_bytes:
+                                on_bytes(len(chunk))
+            except (requests.RequestException, OSError) as e:
+                logging.info(f"Fetching {dest.name} from peer {peer} failed: {e}")
+                h = None
+            if cancelled and cancelled():
+                part.unlink(missing_ok=True)
+                return None
+            if h and h.hexdigest() == sha1:
+                os.replace(part, dest)
+                self.stats["files"] += 1
+                self.stats["bytes"] += received
+                logging.info(f"Got {dest.name} from peer {peer} ({received / 1024**2:.0f} MB).")
+                return dest
+            if h:
+                self.stats["rejected"] += 1
+                logging.warning(f"Peer {peer} sent {dest.name} with the wrong SHA-1; discarding it.")
+            part.unlink(missing_ok=True)
+            if on_bytes and received:
+                on_bytes(-received)  # Take back progress for bytes that were thrown away
+        return None
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Share and fetch UUP payloads between machines on the LAN.")
+    sub = parser.add_subparsers(dest="action", required=True)
+    serve = sub.add_parser("serve", help="share a payload store")
+    serve.add_argument("--store", type=Path, required=True)
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--peers-file", type=Path, help=f"discovery list to hand out on /peers ({PEERS_FILE})")
+    serve.add_argument("--iso-cache", type=Path, help="ISO cache directory to serve on /artifacts")
+    fetch = sub.add_parser("fetch", help="fetch one payload from the peers")
+    fetch.add_argument("sha1")
+    fetch.add_argument("dest", type=Path)
+    fetch.add_argument("--peer", action="append", default=[])
+    fetch.add_argument("--peers-file", type=Path)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.action == "serve":
+        server = PeerCacheServer(PayloadStore(args.store), args.host, args.port, load_peers(args.peers_file),
+                                 args.iso_cache)
+        logging.info(f"Peer cache serving {args.store} at {server.url}. Ctrl+C stops it.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+    client = PeerClient(load_peers(args.peers_file, args.peer))
+    client.locate([args.sha1])
+    return 0 if client.fetch(args.sha1, args.dest) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,200 @@
+"""
+Byte-accurate weighted progress and ETA.
+-------------------------------------------------
+Each pipeline stage declares how much real work it has (bytes to fetch,
+bytes to hash, bytes to write, or a plain unit count for things like
+mounting). A stage's share of the bar is its *expected time*: work ×
+seconds-per-unit learned from previous runs (ProgressHistory). While a
+stage runs, its live throughput is smoothed with an EWMA and used for
+the stage ETA; stages still ahead of us use the calibrated rates.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+# Seconds per unit before we have any history; rough figures for a home connection and an SSD
+DEFAULT_SECONDS_PER_UNIT = {
+    "download": 1 / (20 * 1024 * 1024),
+    "verify": 1 / (400 * 1024 * 1024),
+    "convert": 1 / (60 * 1024 * 1024),
+    "mount": 3.0,
+    "prepare": 3.0,
+}
+FALLBACK_SECONDS_PER_UNIT = 1 / (50 * 1024 * 1024)
+
+
+class ProgressHistory:
+    """Per-stage seconds-per-unit, smoothed across runs and kept in a JSON file."""
+
+    def __init__(self, path: Path | None, alpha: float = 0.3):
+        self.path = Path(path) if path else None
+        self.alpha = alpha
+        self.rates: dict[str, float] = {}
+        self._load()
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+            self.rates = {k: float(v) for k, v in data.get("seconds_per_unit", {}).items() if float(v) > 0}
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable progress history {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"seconds_per_unit": self.rates}, indent=2))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save progress history {self.path}: {e}")
+
+    def seconds_per_unit(self, stage: str) -> float:
+        return self.rates.get(stage) or DEFAULT_SECONDS_PER_UNIT.get(stage, FALLBACK_SECONDS_PER_UNIT)
+
+    def record(self, stage: str, work: float, seconds: float):
+        """Fold one finished stage into the calibration."""
+        if work <= 0 or seconds <= 0:
+            return
+        sample = seconds / work
+        old = self.rates.get(stage)
+        self.rates[stage] = sample if old is None else old + self.alpha * (sample - old)
+
+
+class Stage:
+    def __init__(self, name: str, work: float):
+        self.name = name
+        self.work = max(float(work), 0.0)
+        self.done = 0.0
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.rate: float | None = None  # EWMA of units per second
+        self._last_sample: tuple[float, float] | None = None
+
+    @property
+    def fraction(self) -> float:
+        if self.finished_at is not None:
+            return 1.0
+        return min(self.done / self.work, 1.0) if self.work else 0.0
+
+
+class WeightedProgress:
+    """Tracks a list of (stage, work) and turns it into percent and ETAs."""
+
+    def __init__(self, stages: list[tuple[str, float]], history: ProgressHistory | None = None,
+                 alpha: float = 0.2, min_sample_interval: float = 0.25, clock=time.monotonic):
+        self.stages = {name: Stage(name, work) for name, work in stages}
+        self.order = [name for name, _ in stages]
+        self.history = history or ProgressHistory(None)
+        self.alpha = alpha
+        self.min_sample_interval = min_sample_interval
+        self.clock = clock
+        self.current: str | None = None
+
+    # ------------------------------------------------------------------
+    #  Feeding
+    # ------------------------------------------------------------------
+    def set_work(self, stage: str, work: float):
+        """Adjust a stage's size once we know it (e.g. after the manifest arrives)."""
+        self.stages[stage].work = max(float(work), 0.0)
+
+    def start(self, stage: str):
+        """Begin (or restart, e.g. on a retry) a stage from zero."""
+        s = self.stages[stage]
+        s.done = 0.0
+        s.rate = None
+        s.finished_at = None
+        s.started_at = self.clock()
+        s._last_sample = (s.started_at, 0.0)
+        self.current = stage
+
+    def advance(self, stage: str, units: float):
+        s = self.stages[stage]
+        if s.started_at is None:
+            self.start(stage)
+        s.done += units
+        now = self.clock()
+        last_t, last_done = s._last_sample
+        dt = now - last_t
+        if dt >= self.min_sample_interval:
+            inst = (s.done - last_done) / dt
+            s.rate = inst if s.rate is None else s.rate + self.alpha * (inst - s.rate)
+            s._last_sample = (now, s.done)
+
+    def finish(self, stage: str):
+        s = self.stages[stage]
+        if s.started_at is None:
+            s.started_at = self.clock()
+        s.finished_at = self.clock()
+        s.done = max(s.done, s.work)
+        self.history.record(stage, s.work, s.finished_at - s.started_at)
+        if self.current == stage:
+            self.current = None
+
+    # ------------------------------------------------------------------
+    #  Reading
+    # ------------------------------------------------------------------
+    def expected_seconds(self, stage: str) -> float:
+        s = self.stages[stage]
+        return s.work * self.history.seconds_per_unit(stage)
+
+    def fraction(self) -> float:
+        total = sum(self.expected_seconds(n) for n in self.order)
+        if total <= 0:
+            finished = sum(1 for n in self.order if self.stages[n].finished_at is not None)
+            return finished / len(self.order) if self.order else 1.0
+        done = sum(self.expected_seconds(n) * self.stages[n].fraction for n in self.order)
+        return min(done / total, 1.0)
+
+    def stage_eta(self, stage: str) -> float | None:
+        s = self.stages[stage]
+        if s.finished_at is not None:
+            return 0.0
+        remaining = max(s.work - s.done, 0.0)
+        if s.rate:
+            return remaining / s.rate
+        if s.started_at is None or s.done == 0:
+            return remaining * self.history.seconds_per_unit(stage)
+        return None  # Started but not enough samples yet
+
+    def eta(self) -> float | None:
+        total = 0.0
+        for name in self.order:
+            s = self.stages[name]
+            if s.finished_at is not None:
+                continue
+            if s.started_at is None:
+                total += self.expected_seconds(name)
+            else:
+                stage_eta = self.stage_eta(name)
+                if stage_eta is None:
+                    return None
+                total += stage_eta
+        return total
+
+    def snapshot(self) -> dict:
+        """Everything the GUI needs, ready to ride on a progress event."""
+        current = self.current
+        return {
+            "value": round(self.fraction() * 100, 2),
+            "eta": self.eta(),
+            "stage": current,
+            "stage_eta": self.stage_eta(current) if current else None,
+            "rate": self.stages[current].rate if current else None,
+        }
+
+
+def format_eta(seconds: float | None) -> str:
+    """Short human ETA: '42s', '3m 10s', '1h 05m', or '' while unknown."""
+    if seconds is None:
+        return ""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {(seconds % 3600) // 60:02d}m"
@@ -0,0 +1,369 @@
+"""
+Caching payload proxy 🏠
+-------------------------------------------------
+One box on the LAN sits in front of the UUP file hosts and everyone else
+downloads through it. Payload URLs are signed and expire, so caching by
+URL would never hit; the proxy keys its cache by content instead:
+
+  1. the SHA-1 the client sends (?sha1= on /fetch, or an X-Content-SHA1
+     header), which the engine takes from the manifest;
+  2. otherwise a SHA-1 learned from an earlier download of the same URL
+     path (the signature lives in the query string, the path is stable).
+
+Objects are kept in a PayloadStore (see flamesnt.payloads), which
+enforces the disk quota by evicting the least recently used files.
+
+A miss starts exactly one upstream download per object, whether the
+clients name it by SHA-1, by URL, or both (a download is found under
+either). Every client asking for it meanwhile, whole-file or Range, is
+served from the growing file as bytes arrive, so aria2's 16 segments or ten build boxes starting
+the same build cost one trip to the internet. A download whose SHA-1
+doesn't match what was asked for is never stored.
+
+Two ways in:
+  GET /fetch?url=UPSTREAM_URL&sha1=SHA1    gateway form; works for https
+  GET http://host/path... (absolute URI)    plain forward proxy, http only
+  GET /stats                                hit and byte counters as JSON
+
+Only hosts in ALLOWED_HOSTS (or --allow) are fetched, so this isn't an
+open proxy.
+
+Usage:
+  python -m flamesnt.proxy --store DIR [--port 8788] [--quota 200G] [--allow example.com]
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlsplit
+
+from .payloads import PayloadStore, is_sha1
+from .peercache import parse_range
+
+DEFAULT_PORT = 8788
+CHUNK_SIZE = 1024 * 1024
+URL_KEYS_FILE = "url_keys.json"
+INFLIGHT_DIR = "inflight"
+WAIT_TIMEOUT = 120  # Seconds a client waits for the next bytes of an upstream download
+ALLOWED_HOSTS = ("microsoft.com", "windowsupdate.com", "uupdump.net")
+
+
+def url_key(url: str) -> str:
+    """The stable part of a signed URL: scheme, host and path, without the query."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc.lower()}{parts.path}"
+
+
+def proxied_url(proxy: str, url: str, sha1: str | None = None) -> str:
+    """The gateway URL that fetches `url` through the caching proxy at `proxy`."""
+    query = f"url={quote(url, safe='')}" + (f"&sha1={sha1.lower()}" if sha1 else "")
+    return f"{proxy.rstrip('/')}/fetch?{query}"
+
+
+class _Fetch:
+    """One upstream download, shared by every client asking for the same object."""
+
+    def __init__(self, keys: set[str], url: str, sha1: str | None, part: Path):
+        self.keys = keys  # Where it's registered in CachingProxy.inflight: its SHA-1 and/or URL key
+        self.url = url
+        self.sha1 = sha1
+        self.part = part
+        self.path = part  # The stored file once the download is done
+        self.size: int | None = None
+        self.available = 0
+        self.done = False
+        self.error: str | None = None
+        self.cond = threading.Condition()
+
+    def wait(self, predicate) -> bool:
+        with self.cond:
+            return self.cond.wait_for(lambda: predicate() or self.done or self.error, timeout=WAIT_TIMEOUT)
+
+
+# ----------------------------------------------------------------------
+#  Request handling
+# ----------------------------------------------------------------------
+class ProxyHandler(BaseHTTPRequestHandler):
+    server_version = "FlamesNT-Proxy/1"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug(f"Proxy {self.client_address[0]}: {format % args}")
+
+    def _reply(self, status: int, body: bytes = b"", content_type: str = "text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _target(self) -> tuple[str, str | None] | None:
+        """(upstream URL, expected SHA-1) of this request."""
+        sha1 = (self.headers.get("X-Content-SHA1") or "").lower() or None
+        if self.path.startswith("/fetch?"):
+            query = parse_qs(urlsplit(self.path).query)
+            url = (query.get("url") or [""])[0]
+            sha1 = (query.get("sha1") or [sha1 or ""])[0].lower() or None
+        elif self.path.startswith("http://"):
+            url = self.path
+        else:
+            return None
+        return url, sha1 if sha1 and is_sha1(sha1) else None
+
+    def do_CONNECT(self):
+        self._reply(405, b"HTTPS can't be cached through CONNECT; use /fetch?url=...\n")
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head: bool = False):
+        if self.path == "/stats":
+            return self._reply(200, json.dumps(self.server.stats).encode(), "application/json")
+        target = self._target()
+        if not target:
+            return self._reply(404, b"Expected /fetch?url=... or an absolute http:// URI\n")
+        url, sha1 = target
+        if not self.server.allowed(url):
+            return self._reply(403, f"{urlsplit(url).hostname} isn't an allowed upstream host\n".encode())
+        source = self.server.open(url, sha1)
+        if isinstance(source, Path):
+            self._send_file(source, head)
+        else:
+            self._send_growing(source, head)
+
+    # ------------------------------------------------------------------
+    #  Responses
+    # ------------------------------------------------------------------
+    def _range(self, size: int) -> tuple[int, int] | None | bool:
+        """The requested span, None for the whole file, or False after replying 416."""
+        try:
+            return parse_range(self.headers.get("Range"), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return False
+
+    def _headers(self, span, size: int | None, start: int, end: int | None):
+        self.send_response(206 if span else 200)
+        if span:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        if end is not None:
+            self.send_header("Content-Length", str(end - start + 1))
+        else:
+            self.send_header("Connection", "close")  # Length unknown: the end of the body is the end of the stream
+            self.close_connection = True
+        self.end_headers()
+
+    def _send_file(self, path: Path, head: bool):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            span = self._range(size)
+            if span is False:
+                return
+            start, end = span or (0, size - 1)
+            self._headers(span, size, start, end)
+            if not head and size:
+                self.connection.sendfile(f, start, end - start + 1)
+                self.server.count("served_bytes", end - start + 1)
+
+    def _send_growing(self, fetch: _Fetch, head: bool):
+        """Serve an object that's still downloading, sending bytes as they land in the .part file."""
+        if self.headers.get("Range"):
+            fetch.wait(lambda: fetch.size is not None)  # A range needs the total size first
+        with fetch.cond:
+            # Opened under the lock: the downloader swaps the .part file for the stored one under it too
+            error, size, f = fetch.error, fetch.size, None
+            if not error:
+                try:
+                    f = open(fetch.path, "rb")
+                except OSError as e:  # Stored, then evicted before we got to it
+                    error = str(e)
+        if error:
+            return self._reply(502, f"Upstream failed: {error}\n".encode())
+        with f:
+            span = self._range(size) if size is not None else None
+            if span is False:
+                return
+            start, end = span or (0, size - 1 if size is not None else None)
+            self._headers(span, size, start, end)
+            if head or size == 0:
+                return
+            pos = start
+            while end is None or pos <= end:
+                fetch.wait(lambda: fetch.available > pos)
+                with fetch.cond:
+                    available, done, error = fetch.available, fetch.done, fetch.error
+                if error or (available <= pos and not done):
+                    self.close_connection = True  # Upstream failed or stalled; the client sees a short body
+                    return
+                if available <= pos:
+                    break
+                n = available - pos if end is None else min(available, end + 1) - pos
+                self.connection.sendfile(f, pos, n)
+                self.server.count("served_bytes", n)
+                pos += n
+
+
+class CachingProxy(ThreadingHTTPServer):
+    """HTTP proxy caching payloads by SHA-1 in a quota-capped PayloadStore."""
+
+    daemon_threads = True
+
+    def __init__(self, store: PayloadStore, host: str = "0.0.0.0", port: int = DEFAULT_PORT,
+                 allowed_hosts=ALLOWED_HOSTS, timeout: int = 60):
+        super().__init__((host, port), ProxyHandler)
+        self.store = store
+        self.allowed_hosts = tuple(h.lower() for h in allowed_hosts)
+        self.timeout = timeout
+        self.inflight: dict[str, _Fetch] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "upstream_bytes": 0, "served_bytes": 0,
+                      "rejected": 0}
+        self._lock = threading.Lock()
+        (store.root / INFLIGHT_DIR).mkdir(exist_ok=True)
+        self.keys_file = store.root / URL_KEYS_FILE
+        self.keys: dict[str, str] = {}
+        if self.keys_file.exists():
+            try:
+                self.keys = json.loads(self.keys_file.read_text())
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable proxy key map {self.keys_file}: {e}")
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """Serve on a background thread (shutdown() stops it)."""
+        thread = threading.Thread(target=self.serve_forever, name="Proxy", daemon=True)
+        thread.start()
+        logging.info(f"Caching proxy at {self.url}, storing in {self.store.root}.")
+        return thread
+
+    def allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        return parts.scheme in ("http", "https") and any(
+            host == allowed or host.endswith("." + allowed) for allowed in self.allowed_hosts)
+
+    def count(self, stat: str, n: int = 1):
+        with self._lock:
+            self.stats[stat] += n
+
+    def open(self, url: str, sha1: str | None) -> Path | _Fetch:
+        """The cached file for this object, or the (possibly just started) download that will produce it."""
+        ukey = url_key(url)
+        with self._lock:
+            sha1 = sha1 or self.keys.get(ukey)
+            path = self.store.get(sha1) if sha1 else None
+            if path:
+                self.stats["hits"] += 1
+                return path
+            fetch = (self.inflight.get(sha1) if sha1 else None) or self.inflight.get(ukey)
+            if fetch and sha1 and fetch.sha1 not in (None, sha1):
+                fetch = None  # Same path, different content: another object
+            if fetch:
+                if sha1 and not fetch.sha1:
+                    with fetch.cond:
+                        fetch.sha1 = sha1  # A URL-only download learns what it must hash to
+                    self.inflight.setdefault(sha1, fetch)
+                    fetch.keys.add(sha1)
+                self.stats["coalesced"] += 1
+                return fetch
+            self.stats["misses"] += 1
+            key = sha1 or ukey
+            part = self.store.root / INFLIGHT_DIR / f"{hashlib.sha1(key.encode()).hexdigest()}.part"
+            fetch = self.inflight[key] = _Fetch({key}, url, sha1, part)
+            if self.inflight.setdefault(ukey, fetch) is fetch:
+                fetch.keys.add(ukey)
+            part.write_bytes(b"")  # Clients open it before the first byte arrives
+        threading.Thread(target=self._download, args=(fetch,), name="ProxyFetch", daemon=True).start()
+        return fetch
+
+    def _download(self, fetch: _Fetch):
+        import requests
+
+        h = hashlib.sha1()
+        try:
+            with requests.get(fetch.url, stream=True, timeout=self.timeout) as r:
+                r.raise_for_status()
+                with fetch.cond:
+                    length = r.headers.get("Content-Length")
+                    fetch.size = int(length) if length and not r.headers.get("Content-Encoding") else None
+                    fetch.cond.notify_all()
+                with open(fetch.part, "r+b", buffering=0) as f:  # Unbuffered: readers see each chunk at once
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        h.update(chunk)
+                        self.count("upstream_bytes", len(chunk))
+                        with fetch.cond:
+                            fetch.available += len(chunk)
+                            fetch.cond.notify_all()
+            digest = h.hexdigest()
+            with fetch.cond:
+                expected = fetch.sha1
+            if expected and digest != expected:
+                self.count("rejected")
+                raise RuntimeError(f"got SHA-1 {digest}, expected {expected}")
+            stored = self.store.add(fetch.part, digest, verified=True)
+            with self._lock:
+                self.keys[url_key(fetch.url)] = digest
+                tmp = self.keys_file.with_suffix(".tmp")
+                tmp.write_text(json.dumps(self.keys))
+                os.replace(tmp, self.keys_file)
+            with fetch.cond:
+                fetch.path = stored
+                fetch.size = fetch.available
+                fetch.done = True
+                fetch.cond.notify_all()
+            logging.info(f"Proxy cached {url_key(fetch.url)} as {digest} ({fetch.available / 1024**2:.0f} MB).")
+        except (requests.RequestException, OSError, RuntimeError) as e:
+            logging.warning(f"Proxy download of {url_key(fetch.url)} failed: {e}")
+            with fetch.cond:
+                fetch.error = str(e)
+                fetch.cond.notify_all()
+        finally:
+            with self._lock:
+                for key in fetch.keys:
+                    if self.inflight.get(key) is fetch:
+                        del self.inflight[key]
+            try:
+                fetch.part.unlink(missing_ok=True)
+            except OSError:  # Windows: a reader still has it open; the next miss on this object truncates it
+                pass
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    from .mediawriter import parse_size
+
+    parser = argparse.ArgumentParser(description="Caching HTTP proxy for UUP payloads, keyed by content.")
+    parser.add_argument("--store", type=Path, required=True)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--quota", default="200G", help="disk quota for cached payloads, e.g. 200G")
+    parser.add_argument("--allow", action="append", default=[], help="extra upstream host (and its subdomains)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = PayloadStore(args.store, parse_size(args.quota))
+    server = CachingProxy(store, args.host, args.port, ALLOWED_HOSTS + tuple(args.allow))
+    logging.info(f"Caching proxy at {server.url}, storing in {args.store} (quota {args.quota}). Ctrl+C stops it.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,342 @@
+"""
+Persistent PowerShell host 🐚
+-------------------------------------------------
+Starting `powershell -Command` costs about a second each time, and
+scraping its last line of output is fragile. ShellHost starts a single
+PowerShell process on first use and keeps it. Requests and replies are
+one JSON object per line on stdin and stdout:
+
+  → {"id": 1, "op": "mount", "path": "C:\\\\...\\\\Win11.iso"}
+  ← {"id": 1, "ok": true, "result": {"path": "...", "drive": "E"}}
+  ← {"id": 2, "ok": false, "error": "The system cannot find the file specified."}
+
+Operations: ping, mount, dismount, dismount_many, query, exit.
+
+Every image mounted through the host is remembered (optionally in a
+state file, so leftovers from a crash are found on the next run), and
+dismount_all() releases them all in one request. close() does that
+too, and is registered with atexit.
+
+For tests on Linux, run this file with --fake to get a Python host that
+speaks the same protocol. fake_host_argv() builds that command line,
+optionally with a JSON script of per-operation delays and failures.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+DEFAULT_TIMEOUT = 60.0
+
+# Runs inside powershell.exe. One JSON request per stdin line, one compressed JSON reply per stdout line.
+PS_HOST_SCRIPT = r"""
+$ErrorActionPreference = 'Stop'
+$ProgressPreference = 'SilentlyContinue'
+function Get-Drive($path) {
+    for ($i = 0; $i -lt 20; $i++) {
+        $letter = (Get-DiskImage -ImagePath $path | Get-Volume).DriveLetter
+        if ($letter) { return [string]$letter }
+        Start-Sleep -Milliseconds 100
+    }
+    return $null
+}
+while ($null -ne ($line = [Console]::In.ReadLine())) {
+    $req = $null
+    try {
+        $req = $line | ConvertFrom-Json
+        switch ($req.op) {
+            'ping'     { $result = @{ pid = $PID } }
+            'mount'    {
+                Mount-DiskImage -ImagePath $req.path -Access ReadOnly -StorageType ISO | Out-Null
+                $result = @{ path = $req.path; drive = (Get-Drive $req.path) }
+            }
+            'dismount' {
+                Dismount-DiskImage -ImagePath $req.path | Out-Null
+                $result = @{ path = $req.path }
+            }
+            'dismount_many' {
+                $failed = @{}
+                foreach ($p in $req.paths) {
+                    try { Dismount-DiskImage -ImagePath $p | Out-Null } catch { $failed[$p] = $_.Exception.Message }
+                }
+                $result = @{ failed = $failed }
+            }
+            'query'    {
+                $img = Get-DiskImage -ImagePath $req.path
+                $drive = $null
+                if ($img.Attached) { $drive = [string]($img | Get-Volume).DriveLetter }
+                $result = @{ path = $req.path; attached = [bool]$img.Attached; drive = $drive }
+            }
+            'exit'     { $result = @{} }
+            default    { throw "Unknown operation '$($req.op)'" }
+        }
+        $reply = @{ id = $req.id; ok = $true; result = $result }
+    } catch {
+        $reply = @{ id = $(if ($req) { $req.id } else { $null }); ok = $false; error = $_.Exception.Message }
+    }
+    [Console]::Out.WriteLine(($reply | ConvertTo-Json -Compress -Depth 5))
+    [Console]::Out.Flush()
+    if ($req -and $req.op -eq 'exit') { break }
+}
+"""
+
+
+def powershell_argv() -> list[str]:
+    import base64
+
+    encoded = base64.b64encode(PS_HOST_SCRIPT.encode("utf-16-le")).decode("ascii")
+    return ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass",
+            "-EncodedCommand", encoded]
+
+
+def fake_host_argv(script: Path | None = None) -> list[str]:
+    """Command line for the Python stand-in host (see run_fake_host)."""
+    argv = [sys.executable, str(Path(__file__).resolve()), "--fake"]
+    if script:
+        argv += ["--script", str(script)]
+    return argv
+
+
+class ShellHost:
+    """Client for one long-lived host process, started lazily and restarted if it dies."""
+
+    def __init__(self, argv: list[str] | None = None, timeout: float = DEFAULT_TIMEOUT,
+                 state_file: Path | None = None):
+        self.argv = argv
+        self.timeout = timeout
+        self.state_file = Path(state_file) if state_file else None
+        self.mounted: dict[str, str | None] = {}  # image path -> drive letter
+        self._proc = None
+        self._lines: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._atexit = False
+        self._load_state()
+
+    # ------------------------------------------------------------------
+    #  Process management
+    # ------------------------------------------------------------------
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _start(self):
+        argv = self.argv or powershell_argv()
+        kwargs = {}
+        if sys.platform == "win32":
+            kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+        self._proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL, text=True, encoding="utf-8", bufsize=1, **kwargs)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self._proc.stdout, self._lines),
+                         name="ShellHostReader", daemon=True).start()
+        if not self._atexit:
+            atexit.register(self.close)
+            self._atexit = True
+        logging.info(f"Shell host started (pid {self._proc.pid}).")
+
+    @staticmethod
+    def _pump(stream, lines: queue.Queue):
+        for line in stream:
+            lines.put(line)
+        lines.put(None)  # EOF
+
+    def request(self, op: str, **args) -> dict:
+        """Send one operation and wait for its reply; raises RuntimeError if it failed."""
+        with self._lock:
+            if not self.alive:
+                self._start()
+            req_id = self._next_id
+            self._next_id += 1
+            try:
+                self._proc.stdin.write(json.dumps({"id": req_id, "op": op, **args}) + "\n")
+                self._proc.stdin.flush()
+            except OSError as e:
+                self._proc = None
+                raise RuntimeError(f"Shell host went away: {e}")
+            while True:
+                try:
+                    line = self._lines.get(timeout=self.timeout)
+                except queue.Empty:
+                    self._kill()
+                    raise RuntimeError(f"Shell host did not answer '{op}' within {self.timeout:g}s.")
+                if line is None:
+                    self._proc = None
+                    raise RuntimeError(f"Shell host exited during '{op}'.")
+                try:
+                    reply = json.loads(line)
+                except ValueError:
+                    logging.info(f"Shell host noise: {line.rstrip()}")  # Stray output from a cmdlet
+                    continue
+                if reply.get("id") in (req_id, None):
+                    break
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error") or f"Shell host failed '{op}'.")
+        return reply.get("result") or {}
+
+    def _kill(self):
+        if self._proc:
+            self._proc.kill()
+            self._proc = None
+
+    # ------------------------------------------------------------------
+    #  Operations
+    # ------------------------------------------------------------------
+    def ping(self) -> dict:
+        return self.request("ping")
+
+    def mount(self, image: Path) -> str | None:
+        """Mount an ISO read-only and return its drive letter (e.g. 'E')."""
+        path = str(Path(image).resolve())
+        drive = self.request("mount", path=path).get("drive") or None
+        self.mounted[path] = drive
+        self._save_state()
+        logging.info(f"Mounted {path} as {drive}:")
+        return drive
+
+    def dismount(self, image: Path):
+        path = str(Path(image).resolve())
+        self.request("dismount", path=path)
+        self.mounted.pop(path, None)
+        self._save_state()
+        logging.info(f"Dismounted {path}.")
+
+    def dismount_drive(self, drive: str):
+        """Dismount whichever of our images sits on `drive` ('E', 'E:' or 'E:\\')."""
+        letter = drive.rstrip(":\\").upper()
+        for path, mounted_on in list(self.mounted.items()):
+            if (mounted_on or "").upper() == letter:
+                self.dismount(path)
+                return
+        logging.warning(f"No image of ours is mounted on {letter}:")
+
+    def query(self, image: Path) -> dict:
+        return self.request("query", path=str(Path(image).resolve()))
+
+    def dismount_all(self) -> dict:
+        """Dismount every image we mounted, in one request. Returns {path: error} for failures."""
+        if not self.mounted:
+            return {}
+        paths = list(self.mounted)
+        failed = self.request("dismount_many", paths=paths).get("failed") or {}
+        for path in paths:
+            if path not in failed:
+                self.mounted.pop(path, None)
+        self._save_state()
+        if failed:
+            logging.warning(f"Could not dismount {len(failed)} image(s): {failed}")
+        else:
+            logging.info(f"Dismounted {len(paths)} image(s).")
+        return failed
+
+    def close(self):
+        """Dismount everything and stop the host. Safe to call more than once."""
+        try:
+            if self.mounted:
+                self.dismount_all()
+            if self.alive:
+                self.request("exit")
+        except RuntimeError as e:
+            logging.warning(f"Shell host shutdown: {e}")
+        if self._proc:
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+
+    # ------------------------------------------------------------------
+    #  Mount bookkeeping across runs
+    # ------------------------------------------------------------------
+    def _load_state(self):
+        if not self.state_file or not self.state_file.exists():
+            return
+        try:
+            self.mounted = dict(json.loads(self.state_file.read_text()).get("mounted", {}))
+            if self.mounted:
+                logging.info(f"{len(self.mounted)} image(s) still mounted from a previous run.")
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable mount state {self.state_file}: {e}")
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        try:
+            tmp = self.state_file.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"mounted": self.mounted}))
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logging.warning(f"Could not save mount state {self.state_file}: {e}")
+
+
+# ----------------------------------------------------------------------
+#  Fake host for tests
+# ----------------------------------------------------------------------
+def run_fake_host(script: dict | None = None, stdin=None, stdout=None):
+    """Same protocol as the PowerShell host, with drive letters handed out from Z: down.
+
+    `script` maps an operation to {"delay": seconds, "fail": "message", "noise": "text"}
+    so tests can simulate slow cmdlets, errors and stray output.
+    """
+    import time
+
+    script = script or {}
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    mounted: dict[str, str] = {}
+    letters = [chr(c) for c in range(ord("Z"), ord("D"), -1)]
+
+    for line in stdin:
+        req = {}
+        try:
+            req = json.loads(line)
+            op = req.get("op")
+            behaviour = script.get(op, {})
+            time.sleep(behaviour.get("delay", 0))
+            if behaviour.get("noise"):
+                stdout.write(behaviour["noise"] + "\n")
+            if behaviour.get("fail"):
+                raise RuntimeError(behaviour["fail"])
+            if op == "ping":
+                result = {"pid": os.getpid()}
+            elif op == "mount":
+                if not os.path.exists(req["path"]):
+                    raise RuntimeError("The system cannot find the file specified.")
+                if req["path"] not in mounted:
+                    mounted[req["path"]] = next(l for l in letters if l not in mounted.values())
+                result = {"path": req["path"], "drive": mounted[req["path"]]}
+            elif op == "dismount":
+                mounted.pop(req["path"], None)
+                result = {"path": req["path"]}
+            elif op == "dismount_many":
+                for path in req["paths"]:
+                    mounted.pop(path, None)
+                result = {"failed": {}}
+            elif op == "query":
+                result = {"path": req["path"], "attached": req["path"] in mounted, "drive": mounted.get(req["path"])}
+            elif op == "exit":
+                result = {}
+            else:
+                raise RuntimeError(f"Unknown operation '{op}'")
+            reply = {"id": req.get("id"), "ok": True, "result": result}
+        except Exception as e:
+            reply = {"id": req.get("id"), "ok": False, "error": str(e)}
+        stdout.write(json.dumps(reply) + "\n")
+        stdout.flush()
+        if req.get("op") == "exit":
+            break
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stand-in shell host speaking the ShellHost protocol.")
+    parser.add_argument("--fake", action="store_true", required=True)
+    parser.add_argument("--script", type=Path, help="JSON of per-operation delays/failures")
+    args = parser.parse_args()
+    run_fake_host(json.loads(args.script.read_text()) if args.script else None)
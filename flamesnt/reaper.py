@@ -0,0 +1,199 @@
+"""
+Background workspace reclamation 🧹
+-------------------------------------------------
+A workspace can hold tens of GB, and deleting that in place blocks
+whoever asked for it. discard() only renames the directory into a
+trash area on the same volume, which is instant. A low-priority
+reaper thread then deletes the trash one entry at a time, and slows
+down whenever `busy()` says a download is running.
+
+Whatever is still in the trash when the process exits gets picked up
+by the next WorkspaceReaper.start(), so interrupted deletions resume
+on the next launch.
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+TRASH_DIR_NAME = "FlamesISO_trash"
+# Trash folders created next to workspaces on other volumes, so start() can find them again
+EXTRA_ROOTS_FILE = "extra_roots.txt"
+
+
+def default_trash_dir() -> Path:
+    return Path(tempfile.gettempdir()) / TRASH_DIR_NAME
+
+
+def _lower_thread_priority():
+    """Best effort: make the calling thread background priority for CPU and I/O."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000  # Lowers CPU, I/O and memory priority
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        elif hasattr(os, "setpriority") and hasattr(threading, "get_native_id"):
+            # On Linux niceness is per thread, keyed by the thread id
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except Exception as e:
+        logging.info(f"Could not lower reaper thread priority: {e}")
+
+
+class WorkspaceReaper:
+    """Instant discard() by rename, slow and polite deletion in the background."""
+
+    def __init__(self, trash_dir: Path | None = None, busy=None,
+                 batch_size: int = 256, busy_batch_size: int = 16, busy_pause: float = 0.25):
+        self.trash_dir = Path(trash_dir) if trash_dir else default_trash_dir()
+        self.busy = busy or (lambda: False)
+        self.batch_size = batch_size
+        self.busy_batch_size = busy_batch_size
+        self.busy_pause = busy_pause
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    #  Discarding
+    # ------------------------------------------------------------------
+    def discard(self, path) -> bool:
+        """Move `path` out of the way right now; the reaper deletes it later.
+
+        Returns False if there was nothing to discard.
+        """
+        if not path:
+            return False
+        path = Path(path)
+        if not path.exists():
+            return False
+        target_root = self.trash_dir
+        try:
+            target_root.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target_root / f"{path.name}-{uuid.uuid4().hex[:8]}")
+        except OSError:
+            # Different volume (rename can't cross it): keep a trash folder beside the workspace instead
+            target_root = path.parent / f".{TRASH_DIR_NAME}"
+            try:
+                target_root.mkdir(exist_ok=True)
+                os.replace(path, target_root / f"{path.name}-{uuid.uuid4().hex[:8]}")
+                self._remember_root(target_root)
+            except OSError as e:
+                logging.warning(f"Could not move {path} to trash ({e}); deleting it in place.")
+                shutil.rmtree(path, ignore_errors=True)
+                return True
+        logging.info(f"Workspace {path} moved to trash {target_root}.")
+        self._idle.clear()
+        self._wake.set()
+        return True
+
+    def _remember_root(self, root: Path):
+        with self._lock:
+            roots = self._roots()
+            if root not in roots:
+                self.trash_dir.mkdir(parents=True, exist_ok=True)
+                with open(self.trash_dir / EXTRA_ROOTS_FILE, "a", encoding="utf-8") as f:
+                    f.write(f"{root}\n")
+
+    def _roots(self) -> list[Path]:
+        roots = [self.trash_dir]
+        listing = self.trash_dir / EXTRA_ROOTS_FILE
+        if listing.exists():
+            roots += [Path(line) for line in listing.read_text(encoding="utf-8").splitlines() if line.strip()]
+        return roots
+
+    def pending_bytes(self) -> int:
+        """Bytes still waiting in the trash, i.e. space that is about to come back."""
+        total = 0
+        for root in self._roots():
+            for dirpath, _dirnames, filenames in os.walk(root):
+                for name in filenames:
+                    try:
+                        total += os.lstat(os.path.join(dirpath, name)).st_size
+                    except OSError:
+                        pass  # Reaped while we were counting
+        return total
+
+    # ------------------------------------------------------------------
+    #  Reaping
+    # ------------------------------------------------------------------
+    def start(self):
+        """Start the reaper thread; it first resumes anything left from earlier runs."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._idle.clear()
+        self._wake.set()
+        self._thread = threading.Thread(target=self._run, name="WorkspaceReaper", daemon=True)
+        self._thread.start()
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """Block until the trash is empty (handy at shutdown and in scripts)."""
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        _lower_thread_priority()
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self._sweep()
+            except Exception as e:
+                logging.error(f"Workspace reaper sweep failed: {e}")
+            if not self._wake.is_set():
+                self._idle.set()
+
+    def _sweep(self):
+        for root in self._roots():
+            if not root.is_dir():
+                continue
+            for entry in list(os.scandir(root)):
+                if entry.name == EXTRA_ROOTS_FILE:
+                    continue
+                self._delete_tree(Path(entry.path))
+            if root != self.trash_dir:
+                try:
+                    root.rmdir()  # Side trash folders go away once empty
+                except OSError:
+                    pass
+
+    def _delete_tree(self, path: Path):
+        """Delete bottom-up in small batches, yielding to active downloads."""
+        if not path.is_dir() or path.is_symlink():
+            path.unlink(missing_ok=True)
+            return
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+            for name in filenames:
+                try:
+                    os.unlink(os.path.join(dirpath, name))
+                except OSError as e:
+                    logging.warning(f"Reaper could not delete {name}: {e}")
+                removed += 1
+                self._throttle(removed)
+            for name in dirnames:
+                full = os.path.join(dirpath, name)
+                try:
+                    if os.path.islink(full):
+                        os.unlink(full)
+                    else:
+                        os.rmdir(full)
+                except OSError:
+                    pass
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            logging.warning(f"Reaper could not remove {path}: {e}")
+
+    def _throttle(self, removed: int):
+        if self.busy():
+            if removed % self.busy_batch_size == 0:
+                time.sleep(self.busy_pause)
+        elif removed % self.batch_size == 0:
+            time.sleep(0)  # Yield the GIL between batches
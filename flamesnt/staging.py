@@ -0,0 +1,187 @@
+"""
+Zero-copy staging 🔗
+-------------------------------------------------
+Places files into a layout directory without copying their bytes when
+the file system allows it. For each file we try, in order:
+
+  hardlink         a second name for the same inode (same volume only)
+  reflink          FICLONE: a new inode sharing the source's extents
+                   (btrfs, xfs, bcachefs, ...), copy-on-write
+  copy_file_range  an in-kernel copy; NFS and some file systems share
+                   extents here too
+  buffered copy    read/write in large chunks, the last resort
+
+Hardlinks are skipped when the layout will be modified (link=False),
+since writing through one name changes both. A method that fails for a
+pair of volumes (EXDEV, EOPNOTSUPP, ...) isn't tried again for them.
+Stager.stats reports how many bytes each method handled, so "copied"
+means real data movement:
+
+  python -m flamesnt.staging SOURCE_DIR LAYOUT_DIR
+"""
+import errno
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+CHUNK_SIZE = 4 * 1024 * 1024
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+METHODS = ("hardlink", "reflink", "copy_file_range", "copy")
+
+# errno values meaning "this method doesn't work here", as opposed to a real I/O error
+_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EPERM,
+                errno.EMLINK, getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)}
+
+
+def _reflink(src: Path, dest: Path):
+    import fcntl
+
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            dest.unlink(missing_ok=True)
+            raise
+
+
+def _copy_file_range(src: Path, dest: Path, size: int):
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        try:
+            offset = 0
+            while offset < size:
+                n = os.copy_file_range(s.fileno(), d.fileno(), size - offset, offset, offset)
+                if n == 0:
+                    break
+                offset += n
+            if offset != size:
+                raise OSError(errno.EIO, f"copy_file_range stopped at {offset} of {size} bytes")
+        except OSError:
+            d.close()
+            dest.unlink(missing_ok=True)
+            raise
+
+
+def _buffered_copy(src: Path, dest: Path, cancelled=None) -> bool:
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        while n := s.readinto(buf):
+            if cancelled and cancelled():
+                break
+            d.write(view[:n])
+    if cancelled and cancelled():
+        dest.unlink(missing_ok=True)
+        return False
+    return True
+
+
+class Stager:
+    """Places files under `root` by the cheapest method that works, and counts bytes per method."""
+
+    def __init__(self, root: Path, link: bool = True):
+        self.root = Path(root)
+        self.link = link
+        self.stats = {"files": 0, "seconds": 0.0, **{f"{m}_bytes": 0 for m in METHODS}}
+        self._unsupported: set[tuple[int, int, str]] = set()  # (source dev, dest dev, method) known not to work
+
+    def _methods(self) -> list[str]:
+        methods = ["hardlink"] if self.link else []
+        if sys.platform.startswith("linux"):
+            methods.append("reflink")
+        if hasattr(os, "copy_file_range"):
+            methods.append("copy_file_range")
+        return methods + ["copy"]
+
+    def place(self, src: Path, rel_path: str, cancelled=None) -> str | None:
+        """Put `src` at root/rel_path and return the method used. None if cancelled."""
+        src = Path(src)
+        dest = self.root / rel_path
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists() or dest.is_symlink():
+            dest.unlink()
+        st = src.stat()
+        devices = (st.st_dev, dest.parent.stat().st_dev)
+        started = time.monotonic()
+        for method in self._methods():
+            if (*devices, method) in self._unsupported:
+                continue
+            try:
+                if method == "hardlink":
+                    os.link(src, dest)
+                elif method == "reflink":
+                    _reflink(src, dest)
+                elif method == "copy_file_range":
+                    _copy_file_range(src, dest, st.st_size)
+                elif not _buffered_copy(src, dest, cancelled):
+                    return None
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                logging.info(f"{method} not available for {src.parent} -> {self.root} ({e.strerror}); falling back.")
+                self._unsupported.add((*devices, method))
+                continue
+            if method != "hardlink":
+                os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+            self.stats["files"] += 1
+            self.stats[f"{method}_bytes"] += st.st_size
+            self.stats["seconds"] += time.monotonic() - started
+            return method
+        raise RuntimeError(f"Could not stage {src}.")  # Unreachable: buffered copy always applies
+
+    def stage_tree(self, source_dir: Path, prefix: str = "", cancelled=None) -> bool:
+        """Place everything under `source_dir` below root/prefix. False if cancelled."""
+        source_dir = Path(source_dir)
+        for dirpath, _dirnames, filenames in os.walk(source_dir):
+            rel_dir = Path(dirpath).relative_to(source_dir)
+            for name in filenames:
+                if cancelled and cancelled():
+                    return False
+                if self.place(Path(dirpath) / name, str(Path(prefix) / rel_dir / name), cancelled) is None:
+                    return False
+        return True
+
+    @property
+    def copied_bytes(self) -> int:
+        """Bytes that really moved through memory; everything else was linked or cloned."""
+        return self.stats["copy_bytes"] + self.stats["copy_file_range_bytes"]
+
+    @property
+    def linked_bytes(self) -> int:
+        return self.stats["hardlink_bytes"] + self.stats["reflink_bytes"]
+
+    def report(self) -> str:
+        return (f"Staged {self.stats['files']} files in {self.stats['seconds']:.2f}s: "
+                f"{self.linked_bytes / 1024**2:.0f} MB linked/cloned, "
+                f"{self.copied_bytes / 1024**2:.0f} MB copied "
+                f"(hardlink {self.stats['hardlink_bytes'] / 1024**2:.0f}, "
+                f"reflink {self.stats['reflink_bytes'] / 1024**2:.0f}, "
+                f"copy_file_range {self.stats['copy_file_range_bytes'] / 1024**2:.0f}, "
+                f"buffered {self.stats['copy_bytes'] / 1024**2:.0f}).")
+
+
+def place_file(src: Path, dest: Path, link: bool = False) -> str:
+    """Stage a single file at `dest`; returns the method used."""
+    dest = Path(dest)
+    return Stager(dest.parent, link).place(src, dest.name)
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stage a directory tree by hardlink, reflink or in-kernel copy.")
+    parser.add_argument("source", type=Path)
+    parser.add_argument("layout", type=Path)
+    parser.add_argument("--no-hardlinks", action="store_true", help="the layout will be modified; clone or copy")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    stager = Stager(args.layout, link=not args.no_hardlinks)
+    stager.stage_tree(args.source)
+    print(stager.report())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,164 @@
+"""
+Startup benchmark 🏁
+-------------------------------------------------
+Two numbers we track so startup stays snappy:
+  • import cost    – `python -X importtime` over everything a GUI script
+                     imports at module level (i.e. before the window);
+  • first frame    – launch the script and time from process start until
+                     Tk has mapped the main window and gone idle.
+
+Usage:
+  python -m flamesnt.startup_bench --script FlamesNT-V0update0.x-m.py
+  python -m flamesnt.startup_bench --script ... --no-frame --json
+
+Exits with status 1 when a number is over its budget so CI can track it.
+The first-frame probe needs a display (and, for the installer scripts,
+Windows); the import measurement runs anywhere.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+# Only the probe is imported by the GUI scripts, so everything the measuring side needs
+# (argparse, ast, subprocess, ...) is imported inside the functions that use it.
+
+# Budgets in milliseconds. Import cost is for module-level imports only.
+STARTUP_BUDGET_MS = {"import": 150.0, "first_frame": 800.0}
+PROBE_ENV = "FLAMES_STARTUP_PROBE_T0"
+DEFAULT_MODULES = ["tkinter", "tkinter.ttk", "tkinter.messagebox",
+                   "flamesnt.ipc", "flamesnt.events", "flamesnt.progress", "flamesnt.startup_bench"]
+
+
+def install_first_frame_probe(root):
+    """Called by the GUI scripts; does nothing unless the benchmark launched us."""
+    t0 = os.environ.get(PROBE_ENV)
+    if not t0:
+        return
+    t0 = float(t0)
+    seen = []
+
+    def on_map(_event=None):
+        if seen:
+            return
+        seen.append(True)
+
+        def report():
+            print(f"FIRST_FRAME_MS={(time.time() - t0) * 1000:.1f}", flush=True)
+            root.after(0, root.destroy)
+
+        root.after_idle(report)  # Idle means the first paint has been processed
+
+    root.bind("<Map>", on_map, add="+")
+
+
+def top_level_imports(script: Path) -> list[str]:
+    """Modules a script imports at module level, i.e. before any window exists."""
+    import ast
+
+    tree = ast.parse(Path(script).read_text(encoding="utf-8"))
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def measure_imports(modules: list[str], cwd: Path | None = None) -> dict:
+    """Run -X importtime over `modules` in a fresh interpreter and total it up."""
+    import importlib.util
+    import subprocess
+
+    available = []
+    skipped = []
+    for name in modules:
+        try:
+            found = importlib.util.find_spec(name.split(".")[0]) is not None
+        except (ImportError, ValueError):
+            found = False
+        (available if found else skipped).append(name)
+    if not available:
+        return {"total_ms": 0.0, "top": [], "skipped": skipped}
+
+    code = "; ".join(f"import {name}" for name in available)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Import measurement failed:\n{result.stderr[-2000:]}")
+
+    top = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not name[1:].startswith(" "):  # Nested imports are indented further
+            top.append((name.strip(), int(cumulative_us) / 1000))
+    top.sort(key=lambda item: item[1], reverse=True)
+    return {"total_ms": round(sum(ms for _, ms in top), 2), "top": top[:10], "skipped": skipped}
+
+
+def measure_first_frame(script: Path, runs: int = 3, timeout: float = 60.0) -> dict:
+    """Launch `script` `runs` times and report the median time to first frame."""
+    import statistics
+    import subprocess
+
+    samples = []
+    for _ in range(runs):
+        env = dict(os.environ, **{PROBE_ENV: repr(time.time())})
+        result = subprocess.run([sys.executable, str(script)], cwd=Path(script).parent, env=env,
+                                capture_output=True, text=True, timeout=timeout)
+        for line in result.stdout.splitlines():
+            if line.startswith("FIRST_FRAME_MS="):
+                samples.append(float(line.split("=", 1)[1]))
+                break
+        else:
+            raise RuntimeError(f"{script} exited without reporting a first frame:\n{result.stderr[-2000:]}")
+    return {"median_ms": round(statistics.median(samples), 1), "samples_ms": samples}
+
+
+def main(argv=None) -> int:
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Measure Flames NT startup against its budget.")
+    parser.add_argument("--script", type=Path, help="GUI script to measure (default: package modules only)")
+    parser.add_argument("--runs", type=int, default=3, help="first-frame launches to take the median of")
+    parser.add_argument("--no-frame", action="store_true", help="skip the first-frame measurement")
+    parser.add_argument("--import-budget", type=float, default=STARTUP_BUDGET_MS["import"])
+    parser.add_argument("--frame-budget", type=float, default=STARTUP_BUDGET_MS["first_frame"])
+    parser.add_argument("--json", action="store_true", help="print one JSON object instead of a report")
+    args = parser.parse_args(argv)
+
+    repo_dir = Path(__file__).resolve().parent.parent
+    modules = top_level_imports(args.script) if args.script else DEFAULT_MODULES
+    report = {"imports": measure_imports(modules, cwd=args.script.parent if args.script else repo_dir)}
+    if args.script and not args.no_frame:
+        report["first_frame"] = measure_first_frame(args.script, args.runs)
+
+    over = []
+    if report["imports"]["total_ms"] > args.import_budget:
+        over.append(f"imports {report['imports']['total_ms']} ms > {args.import_budget} ms")
+    if "first_frame" in report and report["first_frame"]["median_ms"] > args.frame_budget:
+        over.append(f"first frame {report['first_frame']['median_ms']} ms > {args.frame_budget} ms")
+    report["over_budget"] = over
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"Module-level imports: {report['imports']['total_ms']} ms (budget {args.import_budget} ms)")
+        for name, ms in report["imports"]["top"]:
+            print(f"  {ms:8.2f} ms  {name}")
+        if report["imports"]["skipped"]:
+            print(f"  not installed here: {', '.join(report['imports']['skipped'])}")
+        if "first_frame" in report:
+            print(f"Time to first frame: {report['first_frame']['median_ms']} ms "
+                  f"(budget {args.frame_budget} ms, samples {report['first_frame']['samples_ms']})")
+        for line in over:
+            print(f"OVER BUDGET: {line}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+UUP dump API helpers.
+-------------------------------------------------
+Turns a build id + edition into a manifest: the list of payload files
+with their download URL, SHA-1 and size. Everything downstream (progress
+weights, disk budgeting, caching) works from this manifest.
+"""
+import logging
+
+UUP_GET_API = "https://api.uupdump.net/get.php"
+
+# GUI edition names → UUP edition ids
+EDITION_IDS = {
+    "Professional": "PROFESSIONAL",
+    "Home": "CORE",
+    "Enterprise": "ENTERPRISE",
+    "Education": "EDUCATION",
+}
+
+
+def edition_id(edition: str) -> str:
+    return EDITION_IDS.get(edition, edition.upper())
+
+
+def fetch_manifest(build_id: str, edition: str, lang: str = "en-us", timeout: int = 30) -> list[dict]:
+    """Return [{"name", "url", "sha1", "size"}, ...] for one build/edition, largest first."""
+    import requests  # Deferred: only jobs that actually download need it
+
+    logging.info(f"Fetching UUP manifest for {build_id} ({edition}, {lang})...")
+    response = requests.get(
+        UUP_GET_API,
+        params={"id": build_id, "lang": lang, "edition": edition_id(edition).lower()},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    files = response.json().get("response", {}).get("files", {})
+    if not files:
+        raise RuntimeError(f"UUP dump returned no files for build {build_id} ({edition}).")
+    manifest = [
+        {
+            "name": name,
+            "url": info["url"],
+            "sha1": (info.get("sha1") or "").lower(),
+            "size": int(info.get("size") or 0),
+        }
+        for name, info in files.items()
+    ]
+    manifest.sort(key=lambda f: f["size"], reverse=True)
+    logging.info(f"Manifest has {len(manifest)} files, {manifest_bytes(manifest) / 1024**3:.2f} GiB.")
+    return manifest
+
+
+def manifest_bytes(manifest: list[dict]) -> int:
+    return sum(f["size"] for f in manifest)
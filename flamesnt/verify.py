@@ -0,0 +1,106 @@
+"""
+Verification cache 🔍
+-------------------------------------------------
+Hashing a multi-GB file takes a while, and we keep hashing the same
+files: payloads left over from an earlier attempt, cached ISOs. The
+DigestCache remembers each digest against the file's identity (path,
+size, mtime and inode), so asking again for an unchanged file costs a
+single stat(). Any change to the file changes the identity and forces
+a real re-hash.
+"""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from .download import hash_file
+
+DIGEST_CACHE_FILE = "digest_cache.json"
+
+
+def _identity(path: Path) -> str:
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+
+
+class DigestCache:
+    """Digests memoised by file identity, optionally kept in a JSON file."""
+
+    def __init__(self, path: Path | None = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self.entries: dict[str, dict] = {}
+        self._load()
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            self.entries = json.loads(self.path.read_text()).get("entries", {})
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable digest cache {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            self.entries = {k: v for k, v in self.entries.items() if os.path.exists(k)}  # Drop deleted files
+            data = json.dumps({"entries": self.entries})
+        try:
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save digest cache {self.path}: {e}")
+
+    def cached(self, path: Path, algorithm: str = "sha256") -> str | None:
+        """The remembered digest if `path` hasn't changed since it was hashed."""
+        key = str(Path(path).resolve())
+        try:
+            identity = _identity(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and entry.get("identity") == identity:
+                return entry.get(algorithm)
+        return None
+
+    def remember(self, path: Path, algorithm: str, digest: str):
+        key = str(Path(path).resolve())
+        identity = _identity(path)
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry or entry.get("identity") != identity:
+                entry = self.entries[key] = {"identity": identity}
+            entry[algorithm] = digest
+
+    def digest(self, path: Path, algorithm: str = "sha256", on_bytes=None, cancelled=None) -> str | None:
+        """Digest of `path`, hashing only if it changed since last time. None if cancelled."""
+        digest = self.cached(path, algorithm)
+        if digest:
+            if on_bytes:
+                on_bytes(os.path.getsize(path))  # Credit the skipped work so progress still adds up
+            return digest
+        digest = hash_file(path, algorithm, on_bytes, cancelled)
+        if digest:
+            self.remember(path, algorithm, digest)
+        return digest
+
+    def verify(self, path: Path, expected: str, algorithm: str = "sha256", on_bytes=None, cancelled=None) -> bool:
+        if not expected:
+            logging.warning(f"No {algorithm.upper()} known for {Path(path).name}, skipping verification.")
+            return True
+        digest = self.digest(path, algorithm, on_bytes, cancelled)
+        if digest is None:
+            return False
+        if digest != expected.lower():
+            logging.error(f"{algorithm.upper()} mismatch for {Path(path).name}: expected {expected}, got {digest}")
+            self.forget(path)
+            return False
+        return True
+
+    def forget(self, path: Path):
+        with self._lock:
+            self.entries.pop(str(Path(path).resolve()), None)
@@ -0,0 +1,201 @@
+"""
+VHDX disk images 💽
+-------------------------------------------------
+Wraps a disk image in a dynamic VHDX, the format Hyper-V creates by
+default (qemu, VirtualBox and VMware attach it too). The caller writes
+at virtual-disk offsets. A payload block is allocated at the end of the
+file the first time it is touched, so a sequential writer produces a
+sequential file. Blocks that are never written stay NOT_PRESENT in the
+block allocation table (BAT) and read as zeros: the free space of an
+install disk costs nothing and nothing is zero-filled. Unwritten ranges
+inside an allocated block are holes in the host file.
+
+File layout (regions are 1 MiB aligned):
+
+  0        file type identifier
+  64 KiB   header 1, 128 KiB header 2
+  192 KiB  region table, 256 KiB its copy
+  1 MiB    log (empty; there is no log GUID to replay)
+  2 MiB    metadata: block size, disk size and id, sector sizes
+  3 MiB    BAT
+  ...      payload blocks
+
+The headers are written last, so an interrupted write leaves a file
+hypervisors refuse to open rather than a torn disk. See
+flamesnt.mediawriter for what goes inside.
+"""
+import logging
+import mmap
+import os
+import struct
+import uuid
+
+MIB = 1024 * 1024
+DEFAULT_BLOCK_SIZE = 32 * MIB
+LOGICAL_SECTOR = 512
+PHYSICAL_SECTOR = 4096
+IO_ALIGN = 4096
+
+HEADER_OFFSETS = (64 * 1024, 128 * 1024)
+REGION_TABLE_OFFSETS = (192 * 1024, 256 * 1024)
+REGION_TABLE_SIZE = 64 * 1024
+LOG_OFFSET, LOG_LENGTH = 1 * MIB, 1 * MIB
+METADATA_OFFSET, METADATA_LENGTH = 2 * MIB, 1 * MIB
+METADATA_TABLE_SIZE = 64 * 1024
+BAT_OFFSET = 3 * MIB
+
+BAT_REGION = uuid.UUID("2DC27766-F623-4200-9D64-115E9BFD4A08")
+METADATA_REGION = uuid.UUID("8B7CA206-4790-4B9A-B8FE-575F050F886E")
+FILE_PARAMETERS = uuid.UUID("CAA16737-FA36-4D43-B3B6-33F0AA44E76B")
+VIRTUAL_DISK_SIZE = uuid.UUID("2FA54224-CD1B-4876-B211-5DBED83BF4B8")
+VIRTUAL_DISK_ID = uuid.UUID("BECA12AB-B2E6-4523-93EF-C309E000C746")
+LOGICAL_SECTOR_SIZE = uuid.UUID("8141BF1D-A96F-4709-BA47-F233A8FAAB5F")
+PHYSICAL_SECTOR_SIZE = uuid.UUID("CDA348C7-445D-4471-9CC9-E9885251C556")
+
+METADATA_IS_VIRTUAL_DISK = 0x2
+METADATA_IS_REQUIRED = 0x4
+PAYLOAD_BLOCK_FULLY_PRESENT = 6
+
+
+def _crc32c_table() -> list[int]:
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC32C = _crc32c_table()
+
+
+def crc32c(data: bytes) -> int:
+    """CRC-32C (Castagnoli), which VHDX uses for headers and region tables. Only ever run on a few KiB."""
+    crc = 0xFFFFFFFF
+    for b in data:
+        crc = _CRC32C[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def _with_checksum(data: bytes) -> bytes:
+    return data[:4] + struct.pack("<I", crc32c(data)) + data[8:]
+
+
+class VhdxWriter:
+    """A dynamic VHDX of `size` virtual bytes on `fd`: pwrite() at virtual offsets, then finish()."""
+
+    def __init__(self, fd: int, size: int, block_size: int = DEFAULT_BLOCK_SIZE, creator: str = "FlamesNT"):
+        if size <= 0 or size % LOGICAL_SECTOR:
+            raise RuntimeError(f"A VHDX size must be a positive multiple of {LOGICAL_SECTOR} bytes, not {size}.")
+        if block_size % MIB or not MIB <= block_size <= 256 * MIB or block_size & (block_size - 1):
+            raise RuntimeError(f"VHDX block size must be a power of two from 1 to 256 MiB, not {block_size}.")
+        self.fd = fd
+        self.size = size
+        self.block_size = block_size
+        self.creator = creator
+        self.blocks = -(-size // block_size)
+        # Every chunk_ratio payload entries are followed by one sector-bitmap entry (unused without a parent)
+        self.chunk_ratio = (1 << 23) * LOGICAL_SECTOR // block_size
+        self.bat_entries = self.blocks + (self.blocks - 1) // self.chunk_ratio
+        self.bat_length = -(-self.bat_entries * 8 // MIB) * MIB
+        self.file_offsets: dict[int, int] = {}  # Payload block → its offset in the file
+        self.end = BAT_OFFSET + self.bat_length
+        os.ftruncate(fd, 0)  # Old contents would show through the holes
+        os.ftruncate(fd, self.end)
+
+    @property
+    def allocated_blocks(self) -> int:
+        return len(self.file_offsets)
+
+    def _map(self, offset: int, length: int, allocate: bool):
+        """(file offset, position in the data, length) pieces of a virtual range, split at block edges."""
+        if offset + length > self.blocks * self.block_size:
+            raise RuntimeError(f"Write past the end of the {self.size}-byte virtual disk.")
+        pos = 0
+        while pos < length:
+            block, within = divmod(offset + pos, self.block_size)
+            n = min(length - pos, self.block_size - within)
+            base = self.file_offsets.get(block)
+            if base is None:
+                if not allocate:
+                    raise RuntimeError(f"Virtual block {block} was never written.")
+                base = self.file_offsets[block] = self.end
+                self.end += self.block_size
+                os.ftruncate(self.fd, self.end)  # Allocated blocks start out as holes
+            yield base + within, pos, n
+            pos += n
+
+    def pwrite(self, data, offset: int):
+        data = memoryview(data)
+        for file_offset, start, n in self._map(offset, len(data), allocate=True):
+            written = 0
+            while written < n:
+                written += os.pwrite(self.fd, data[start + written:start + n], file_offset + written)
+
+    def segments(self, offset: int, length: int) -> list[tuple[int, int]]:
+        """Where a written virtual range lives in the file, as (file offset, length) pieces."""
+        return [(file_offset, n) for file_offset, _start, n in self._map(offset, length, allocate=False)]
+
+    # ------------------------------------------------------------------
+    #  Metadata
+    # ------------------------------------------------------------------
+    def _identifier(self) -> bytes:
+        return b"vhdxfile" + self.creator.encode("utf-16-le")[:512].ljust(512, b"\x00")
+
+    def _header(self, sequence: int, file_guid: uuid.UUID, data_guid: uuid.UUID) -> bytes:
+        header = struct.pack("<4sIQ16s16s16sHHIQ", b"head", 0, sequence, file_guid.bytes_le, data_guid.bytes_le,
+                             bytes(16), 0, 1, LOG_LENGTH, LOG_OFFSET)
+        return _with_checksum(header.ljust(4096, b"\x00"))
+
+    def _region_table(self) -> bytes:
+        regions = ((BAT_REGION, BAT_OFFSET, self.bat_length), (METADATA_REGION, METADATA_OFFSET, METADATA_LENGTH))
+        table = struct.pack("<4sIII", b"regi", 0, len(regions), 0) + b"".join(
+            struct.pack("<16sQII", guid.bytes_le, offset, length, 1) for guid, offset, length in regions)
+        return _with_checksum(table.ljust(REGION_TABLE_SIZE, b"\x00"))
+
+    def _metadata(self) -> bytes:
+        disk = METADATA_IS_VIRTUAL_DISK | METADATA_IS_REQUIRED
+        items = ((FILE_PARAMETERS, struct.pack("<II", self.block_size, 0), METADATA_IS_REQUIRED),
+                 (VIRTUAL_DISK_SIZE, struct.pack("<Q", self.size), disk),
+                 (VIRTUAL_DISK_ID, uuid.uuid4().bytes_le, disk),
+                 (LOGICAL_SECTOR_SIZE, struct.pack("<I", LOGICAL_SECTOR), disk),
+                 (PHYSICAL_SECTOR_SIZE, struct.pack("<I", PHYSICAL_SECTOR), disk))
+        table = struct.pack("<8sHH20x", b"metadata", 0, len(items))
+        values = b""
+        for guid, value, flags in items:
+            table += struct.pack("<16sIII4x", guid.bytes_le, METADATA_TABLE_SIZE + len(values), len(value), flags)
+            values += value
+        return table.ljust(METADATA_TABLE_SIZE, b"\x00") + values
+
+    def _bat(self) -> bytes:
+        bat = bytearray(self.bat_entries * 8)
+        for block, file_offset in self.file_offsets.items():
+            entry = block + block // self.chunk_ratio
+            struct.pack_into("<Q", bat, entry * 8, (file_offset // MIB) << 20 | PAYLOAD_BLOCK_FULLY_PRESENT)
+        return bytes(bat)
+
+    def _write_aligned(self, offset: int, data: bytes):
+        """pwrite through a page-aligned buffer, so this works on an O_DIRECT descriptor too."""
+        length = -(-len(data) // IO_ALIGN) * IO_ALIGN
+        with mmap.mmap(-1, length) as buf:
+            buf[:len(data)] = data
+            view = memoryview(buf)
+            written = 0
+            while written < length:
+                written += os.pwrite(self.fd, view[written:], offset + written)
+            view.release()
+
+    def finish(self):
+        """Write the BAT, metadata, region tables and finally the headers."""
+        self._write_aligned(METADATA_OFFSET, self._metadata())
+        self._write_aligned(BAT_OFFSET, self._bat())
+        regions = self._region_table()
+        for offset in REGION_TABLE_OFFSETS:
+            self._write_aligned(offset, regions)
+        self._write_aligned(0, self._identifier())
+        file_guid, data_guid = uuid.uuid4(), uuid.uuid4()
+        for sequence, offset in enumerate(HEADER_OFFSETS, 1):
+            self._write_aligned(offset, self._header(sequence, file_guid, data_guid))
+        logging.info(f"VHDX: {self.size / 1024**3:.1f} GiB virtual disk, {self.allocated_blocks} of {self.blocks} "
+                     f"{self.block_size // MIB} MiB blocks allocated ({self.end / 1024**2:.0f} MB file).")
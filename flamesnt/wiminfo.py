@@ -0,0 +1,250 @@
+"""
+WIM/ESD indexer 🏷️
+-------------------------------------------------
+Tells what a WIM or ESD contains without converting or mounting it. The
+208-byte header points at the resource table and at the XML document
+that describes every image. Three small reads give us the index,
+edition id, name, version, size and file count of each image, in
+milliseconds even for a 4 GB ESD. File data is never touched.
+
+XML data is stored uncompressed as UTF-16. Solid (LZMS) ESDs are read
+the same way. Split (.swm) parts only carry the XML of the whole set in
+part 1.
+
+For tests on Linux, write_synthetic_wim() produces a small but
+well-formed file with the images you describe.
+
+Usage:
+  python -m flamesnt.wiminfo professional_en-us.esd
+"""
+import logging
+import struct
+import uuid
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+WIM_MAGIC = b"MSWIM\x00\x00\x00"
+PWM_MAGIC = b"WLPWM\x00\x00\x00"  # Pipable WIMs written by wimlib
+HEADER_SIZE = 208
+RESHDR = struct.Struct("<7sBQQ")  # Stored size (56 bits), flags, offset, original size
+HEADER = struct.Struct("<8sIIII16sHHI24s24s24sI24s60x")
+TABLE_ENTRY_SIZE = 50  # reshdr + part number (2) + reference count (4) + SHA-1 (20)
+
+WIM_VERSION = 0x10D00
+WIM_VERSION_SOLID = 0xE00
+
+RESHDR_FLAG_METADATA = 0x02
+RESHDR_FLAG_COMPRESSED = 0x04
+RESHDR_FLAG_SOLID = 0x10
+
+HDR_FLAG_COMPRESSION = 0x00000002
+COMPRESSION_FLAGS = {
+    0x00020000: "XPRESS",
+    0x00040000: "LZX",
+    0x00080000: "LZMS",
+    0x00200000: "XPRESS",  # Newer XPRESS flag used by some DISM builds
+}
+
+
+def _reshdr(raw: bytes) -> dict:
+    size, flags, offset, original = RESHDR.unpack(raw)
+    return {"size": int.from_bytes(size, "little"), "flags": flags, "offset": offset, "original_size": original}
+
+
+def _text(node, path: str, default=None):
+    found = node.find(path)
+    return found.text.strip() if found is not None and found.text else default
+
+
+def _int(node, path: str, default: int = 0) -> int:
+    value = _text(node, path)
+    try:
+        return int(value, 0) if value else default
+    except ValueError:
+        return default
+
+
+class WimInfo:
+    """Header fields and per-image metadata of one WIM/ESD file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            raw = f.read(HEADER_SIZE)
+            if len(raw) < HEADER_SIZE or raw[:8] not in (WIM_MAGIC, PWM_MAGIC):
+                raise RuntimeError(f"{self.path.name} is not a WIM or ESD file.")
+            (_magic, header_size, self.version, self.flags, self.chunk_size, guid, self.part, self.total_parts,
+             self.image_count, table, xml, _boot, self.boot_index, _integrity) = HEADER.unpack(raw)
+            if header_size != HEADER_SIZE:
+                raise RuntimeError(f"{self.path.name} has an unexpected WIM header size ({header_size}).")
+            self.guid = str(uuid.UUID(bytes_le=guid))
+            self.table = _reshdr(table)
+            self.xml_resource = _reshdr(xml)
+            self.xml = self._read_xml(f)
+            self.resources = self._read_table(f)
+        self.images = self._parse_images()
+
+    @property
+    def compression(self) -> str | None:
+        if not self.flags & HDR_FLAG_COMPRESSION:
+            return None
+        return next((name for bit, name in COMPRESSION_FLAGS.items() if self.flags & bit), "unknown")
+
+    @property
+    def solid(self) -> bool:
+        return self.version == WIM_VERSION_SOLID or self.resources.get("solid", 0) > 0
+
+    def _read_xml(self, f) -> str:
+        res = self.xml_resource
+        if not res["size"]:
+            return ""
+        if res["flags"] & RESHDR_FLAG_COMPRESSED:
+            raise RuntimeError(f"{self.path.name} has a compressed XML resource; that isn't supported.")
+        f.seek(res["offset"])
+        data = f.read(res["size"])
+        return data.decode("utf-16-le" if not data.startswith(b"\xfe\xff") else "utf-16-be").lstrip("\ufeff")
+
+    def _read_table(self, f) -> dict:
+        """Count the resources by kind. A compressed table (rare) is skipped."""
+        res = self.table
+        counts = {"entries": 0, "metadata": 0, "solid": 0, "stored_bytes": 0}
+        if not res["size"] or res["flags"] & RESHDR_FLAG_COMPRESSED:
+            return counts
+        f.seek(res["offset"])
+        data = f.read(res["size"])
+        for pos in range(0, len(data) - TABLE_ENTRY_SIZE + 1, TABLE_ENTRY_SIZE):
+            entry = _reshdr(data[pos:pos + RESHDR.size])
+            counts["entries"] += 1
+            counts["stored_bytes"] += entry["size"]
+            if entry["flags"] & RESHDR_FLAG_METADATA:
+                counts["metadata"] += 1
+            if entry["flags"] & RESHDR_FLAG_SOLID:
+                counts["solid"] += 1
+        return counts
+
+    def _parse_images(self) -> list[dict]:
+        if not self.xml:
+            return []
+        try:
+            root = ET.fromstring(self.xml)
+        except ET.ParseError as e:
+            raise RuntimeError(f"Unreadable XML metadata in {self.path.name}: {e}")
+        images = []
+        for node in root.findall("IMAGE"):
+            images.append({
+                "index": int(node.get("INDEX", len(images) + 1)),
+                "name": _text(node, "NAME", ""),
+                "display_name": _text(node, "DISPLAYNAME"),
+                "description": _text(node, "DESCRIPTION"),
+                "edition_id": _text(node, "WINDOWS/EDITIONID") or _text(node, "FLAGS"),
+                "installation_type": _text(node, "WINDOWS/INSTALLATIONTYPE"),
+                "arch": {0: "x86", 5: "arm", 9: "x64", 12: "arm64"}.get(_int(node, "WINDOWS/ARCH", -1)),
+                "version": ".".join(str(_int(node, f"WINDOWS/VERSION/{part}"))
+                                    for part in ("MAJOR", "MINOR", "BUILD", "SPBUILD")),
+                "languages": [l.text for l in node.findall("WINDOWS/LANGUAGES/LANGUAGE") if l.text],
+                "total_bytes": _int(node, "TOTALBYTES"),
+                "file_count": _int(node, "FILECOUNT"),
+                "dir_count": _int(node, "DIRCOUNT"),
+            })
+        return sorted(images, key=lambda i: i["index"])
+
+    def find_edition(self, edition_id: str) -> dict | None:
+        """The image whose EDITIONID is `edition_id` (case-insensitive), e.g. 'Professional' or 'Core'.
+
+        UUP ESDs also tag their Setup and WinPE images with the edition, so
+        a full Windows image wins over those.
+        """
+        matches = [i for i in self.images if (i["edition_id"] or "").lower() == edition_id.lower()]
+        full = [i for i in matches if i["installation_type"] != "WindowsPE"]
+        return (full or matches or [None])[-1]
+
+    def install_image(self, edition_id: str | None = None) -> dict | None:
+        """The image to install: the one for `edition_id` if given, else the last full Windows image."""
+        if edition_id:
+            return self.find_edition(edition_id)
+        full = [i for i in self.images if i["installation_type"] and i["installation_type"] != "WindowsPE"]
+        return full[-1] if full else None
+
+    def summary(self) -> dict:
+        return {"path": str(self.path), "version": hex(self.version), "compression": self.compression,
+                "chunk_size": self.chunk_size, "solid": self.solid, "guid": self.guid,
+                "part": f"{self.part}/{self.total_parts}", "image_count": self.image_count,
+                "boot_index": self.boot_index, "resources": self.resources, "images": self.images}
+
+
+def read_wim_info(path: Path) -> WimInfo:
+    info = WimInfo(path)
+    logging.info(f"{info.path.name}: {info.image_count} image(s), {info.compression or 'uncompressed'}"
+                 f"{' solid' if info.solid else ''}: "
+                 + ", ".join(f"{i['index']}={i['edition_id'] or i['name']}" for i in info.images))
+    return info
+
+
+# ----------------------------------------------------------------------
+#  Synthetic images for tests
+# ----------------------------------------------------------------------
+def write_synthetic_wim(path: Path, images: list[dict], compression: str = "LZX", solid: bool = False) -> Path:
+    """Write a small well-formed WIM: header, one metadata entry per image and the XML.
+
+    Each image dict may set name, edition_id, installation_type, arch
+    (9 = x64), build, languages, total_bytes, file_count and dir_count.
+    There is no file data; only what WimInfo reads is real.
+    """
+    path = Path(path)
+    root = ET.Element("WIM")
+    ET.SubElement(root, "TOTALBYTES").text = str(sum(i.get("total_bytes", 0) for i in images))
+    for index, image in enumerate(images, 1):
+        node = ET.SubElement(root, "IMAGE", INDEX=str(index))
+        for tag, key in (("DIRCOUNT", "dir_count"), ("FILECOUNT", "file_count"), ("TOTALBYTES", "total_bytes")):
+            ET.SubElement(node, tag).text = str(image.get(key, 0))
+        windows = ET.SubElement(node, "WINDOWS")
+        ET.SubElement(windows, "ARCH").text = str(image.get("arch", 9))
+        ET.SubElement(windows, "EDITIONID").text = image.get("edition_id", "Professional")
+        ET.SubElement(windows, "INSTALLATIONTYPE").text = image.get("installation_type", "Client")
+        languages = ET.SubElement(windows, "LANGUAGES")
+        for lang in image.get("languages", ["en-US"]):
+            ET.SubElement(languages, "LANGUAGE").text = lang
+        version = ET.SubElement(windows, "VERSION")
+        for tag, value in (("MAJOR", 10), ("MINOR", 0), ("BUILD", image.get("build", 22621)), ("SPBUILD", 1)):
+            ET.SubElement(version, tag).text = str(value)
+        ET.SubElement(node, "NAME").text = image.get("name", f"Image {index}")
+    xml = "\ufeff".encode("utf-16-le") + ET.tostring(root, encoding="unicode").encode("utf-16-le")
+
+    flag = next(bit for bit, name in COMPRESSION_FLAGS.items() if name == compression)
+    table = b"".join(RESHDR.pack((0).to_bytes(7, "little"), RESHDR_FLAG_METADATA | (RESHDR_FLAG_SOLID if solid else 0),
+                                 0, 0) + struct.pack("<HI", 1, 1) + bytes(20) for _ in images)
+    table_offset = HEADER_SIZE
+    xml_offset = table_offset + len(table)
+    header = HEADER.pack(WIM_MAGIC, HEADER_SIZE, WIM_VERSION_SOLID if solid else WIM_VERSION,
+                         HDR_FLAG_COMPRESSION | flag, 32768 if not solid else 64 * 1024 * 1024,
+                         uuid.uuid4().bytes_le, 1, 1, len(images),
+                         RESHDR.pack(len(table).to_bytes(7, "little"), 0, table_offset, len(table)),
+                         RESHDR.pack(len(xml).to_bytes(7, "little"), 0, xml_offset, len(xml)),
+                         bytes(24), 0, bytes(24))
+    path.write_bytes(header + table + xml)
+    return path
+
+
+def main(argv=None) -> int:
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="List the images in a WIM or ESD without extracting it.")
+    parser.add_argument("paths", type=Path, nargs="+")
+    parser.add_argument("--json", action="store_true", help="print the full summary as JSON")
+    args = parser.parse_args(argv)
+    for path in args.paths:
+        info = WimInfo(path)
+        if args.json:
+            print(json.dumps(info.summary(), indent=2))
+            continue
+        print(f"{path.name}: {info.compression or 'uncompressed'}{' solid' if info.solid else ''}, "
+              f"{info.image_count} image(s)")
+        for i in info.images:
+            print(f"  {i['index']:>2}  {i['edition_id'] or '-':<14} {i['arch'] or '-':<6} {i['version']:<14} "
+                  f"{i['file_count']:>8} files  {i['total_bytes'] / 1024**3:6.2f} GiB  {i['name']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
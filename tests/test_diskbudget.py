@@ -0,0 +1,56 @@
+import os
+from collections import namedtuple
+
+import pytest
+
+from flamesnt.diskbudget import GiB, DiskBudget, InsufficientDiskSpace, workspace_footprint
+
+Usage = namedtuple("Usage", "total used free")
+
+
+def _budget(tmp_path, free: dict) -> DiskBudget:
+    return DiskBudget(tmp_path, reserve_bytes=0, disk_usage=lambda _path: Usage(100 * GiB, 0, free["now"]))
+
+
+def test_neighbours_written_bytes_are_not_counted_twice(tmp_path):
+    free = {"now": 20 * GiB}
+    budget = _budget(tmp_path, free)
+    landed = {"b": 0}
+    budget.reserve("b", 10 * GiB, footprint=lambda: landed["b"])
+    budget.reserve("a", 8 * GiB)
+
+    # b writes 8 GiB of its 10: the volume shows it, and b's claim shrinks to the 2 GiB still to come
+    free["now"] -= 8 * GiB
+    landed["b"] = 8 * GiB
+    budget.check("a", 8 * GiB, "Conversion")
+    assert budget.free() == 12 * GiB - 2 * GiB - 8 * GiB
+
+
+def test_reservation_without_footprint_counts_in_full(tmp_path):
+    free = {"now": 20 * GiB}
+    budget = _budget(tmp_path, free)
+    budget.reserve("b", 10 * GiB)
+    budget.reserve("a", 8 * GiB)
+    free["now"] -= 8 * GiB
+
+    with pytest.raises(InsufficientDiskSpace):
+        budget.check("a", 8 * GiB, "Conversion")
+    budget.release("b")
+    budget.check("a", 8 * GiB, "Conversion")
+
+
+def test_footprint_past_the_reservation_claims_nothing_more(tmp_path):
+    free = {"now": 20 * GiB}
+    budget = _budget(tmp_path, free)
+    budget.reserve("b", 4 * GiB, footprint=lambda: 6 * GiB)  # Predicted low; it can't free us space either
+    assert budget.free() == 20 * GiB
+
+
+def test_workspace_footprint_counts_links_once(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.esd").write_bytes(b"x" * 1000)
+    (tmp_path / "sub" / "b.esd").write_bytes(b"y" * 24)
+    os.link(tmp_path / "a.esd", tmp_path / "sub" / "a-link.esd")
+
+    assert workspace_footprint(tmp_path) == 1024
+    assert workspace_footprint(tmp_path / "missing") == 0
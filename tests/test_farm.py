@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from flamesnt import engine, farm  # noqa: E402
+
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    """A coordinator and two workers on ephemeral ports, running the simulated pipeline in a few seconds."""
+    monkeypatch.setattr(farm, "HEARTBEAT_INTERVAL", 0.2)
+    monkeypatch.setattr(engine, "SIMULATED_FILES", 1)
+    monkeypatch.setattr(engine, "SIMULATED_FILE_BYTES", 1024 * 1024)
+    monkeypatch.setattr(engine, "SIMULATED_PHASES", 1)
+    monkeypatch.setattr(engine, "SIMULATED_PHASE_BYTES", 1024 * 1024)
+    coordinator = farm.FarmCoordinator(tmp_path / "coordinator", "127.0.0.1", 0)
+    coordinator.start()
+    workers = [farm.FarmWorker(coordinator.url, tmp_path / name, name, host="127.0.0.1") for name in ("w1", "w2")]
+    threads = [threading.Thread(target=w.run, daemon=True) for w in workers]
+    for thread in threads:
+        thread.start()
+    yield coordinator, workers
+    for w in workers:
+        w.stop()
+    for thread in threads:
+        thread.join(30)
+    coordinator.shutdown()
+    coordinator.server_close()
+
+
+def _submit(coordinator, tmp_path, edition: str = "Professional") -> str:
+    return coordinator.submit({"build": "Sim", "edition": edition, "temp_dir": str(tmp_path / "ignored")})
+
+
+def _wait(coordinator, job_id: str, *statuses: str, timeout: float = 90) -> str:
+    end = time.time() + timeout
+    while time.time() < end:
+        status = coordinator.queue.get(job_id)["status"]
+        if status in statuses:
+            return status
+        time.sleep(0.1)
+    return coordinator.queue.get(job_id)["status"]
+
+
+def test_job_runs_and_its_iso_is_served(tmp_path, cluster):
+    coordinator, _workers = cluster
+    job_id = _submit(coordinator, tmp_path)
+
+    assert _wait(coordinator, job_id, "done", "failed", "cancelled") == "done"
+    result = coordinator.queue.get(job_id)["result"]
+    assert result["artifact"] == f"/artifacts/{job_id}"
+    assert result["worker"] in ("w1", "w2")
+    r = requests.get(f"{coordinator.url}{result['artifact']}", timeout=30)
+    assert r.status_code == 200
+    assert r.content[0x8001:0x8006] == b"CD001"  # The primary volume descriptor of an ISO 9660 image
+    assert requests.get(f"{coordinator.url}/artifacts/nosuchjob", timeout=30).status_code == 404
+    assert not (tmp_path / "ignored").exists()  # Workers bring their own temp dir
+
+
+def test_two_jobs_go_to_two_workers(tmp_path, cluster):
+    coordinator, _workers = cluster
+    jobs = [_submit(coordinator, tmp_path, edition) for edition in ("Professional", "Home")]
+
+    assert [_wait(coordinator, j, "done", "failed", "cancelled") for j in jobs] == ["done", "done"]
+    assert {coordinator.queue.get(j)["result"]["worker"] for j in jobs} == {"w1", "w2"}
+
+
+def test_requeued_job_is_claimed_again(tmp_path, cluster):
+    coordinator, workers = cluster
+    job_id = _submit(coordinator, tmp_path)
+    assert _wait(coordinator, job_id, "done", "failed", "cancelled") == "done"
+
+    coordinator.queue.requeue(job_id)
+    assert _wait(coordinator, job_id, "done", "failed", "cancelled") == "done"
+    # Each claim got a local id of its own, both pointing back at the farm job
+    runs = [e for w in workers for e in w.scheduler.queue.list() if e["job"].get("farm_job_id") == job_id]
+    assert len(runs) == 2
+    assert len({e["id"] for e in runs}) == 2
+    assert job_id not in {e["id"] for e in runs}
+
+
+def test_cancel_reaches_the_worker(tmp_path, cluster, monkeypatch):
+    coordinator, _workers = cluster
+    monkeypatch.setattr(engine, "SIMULATED_PHASES", 10)  # Long enough to cancel mid-run
+    job_id = _submit(coordinator, tmp_path)
+    assert _wait(coordinator, job_id, "running") == "running"
+
+    r = requests.post(f"{coordinator.url}/jobs/{job_id}/cancel", timeout=30)
+    assert r.json()["cancelled"]
+    assert _wait(coordinator, job_id, "done", "failed", "cancelled") == "cancelled"
+    assert job_id not in coordinator.assigned
+
+
+def test_coordinator_rejects_strangers(tmp_path, cluster):
+    coordinator, _workers = cluster
+    assert requests.post(f"{coordinator.url}/workers/nobody/heartbeat", json={}, timeout=30).status_code == 410
+    job_id = _submit(coordinator, tmp_path)
+    r = requests.put(f"{coordinator.url}/artifacts/{job_id}", data=b"not an iso", timeout=30,
+                     headers={"X-Worker-Id": "nobody"})
+    assert r.status_code == 409
+    assert requests.post(f"{coordinator.url}/jobs", json={}, timeout=30).status_code == 400
+
+
+def test_job_dropped_by_its_worker_is_requeued(tmp_path, cluster, monkeypatch):
+    coordinator, workers = cluster
+    monkeypatch.setattr(farm, "CLAIM_GRACE", 0.5)
+    dropped = []
+    for w in workers:
+        submit = w.scheduler.submit
+
+        def flaky_submit(job, priority=0, submit=submit):
+            if not dropped:
+                dropped.append(job["farm_job_id"])
+                raise sqlite3.OperationalError("database is locked")
+            return submit(job, priority)
+
+        monkeypatch.setattr(w.scheduler, "submit", flaky_submit)
+    job_id = _submit(coordinator, tmp_path)
+
+    assert _wait(coordinator, job_id, "done", "failed", "cancelled") == "done"
+    assert dropped == [job_id]
+
+
+def test_finish_report_is_retried(tmp_path, cluster, monkeypatch):
+    coordinator, workers = cluster
+    monkeypatch.setattr(farm, "CLAIM_GRACE", 0.5)  # A lost report must not pass for a lost job
+    failed = []
+    for w in workers:
+        post = w._post
+
+        def flaky_post(path, data=None, post=post, **kwargs):
+            if path.endswith("/finish") and len(failed) < 3:
+                failed.append(path)
+                raise requests.ConnectionError("coordinator restarting")
+            return post(path, data, **kwargs)
+
+        monkeypatch.setattr(w, "_post", flaky_post)
+    job_id = _submit(coordinator, tmp_path)
+
+    assert _wait(coordinator, job_id, "done", "failed", "cancelled") == "done"
+    assert len(failed) == 3
+    runs = [e for w in workers for e in w.scheduler.queue.list() if e["job"].get("farm_job_id") == job_id]
+    assert len(runs) == 1
+    assert not any(w.reports for w in workers)
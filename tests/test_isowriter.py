@@ -0,0 +1,148 @@
+import hashlib
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from flamesnt.isoreader import IsoImage, find_setup
+from flamesnt.isowriter import IsoTree, IsoWriter, write_iso
+
+
+def _staged_tree(root):
+    files = {
+        "setup.exe": os.urandom(70_000),
+        "bootmgr": b"",
+        "boot/etfsboot.com": os.urandom(2048 * 4),
+        "efi/microsoft/boot/efisys.bin": os.urandom(1440 * 1024),
+        "sources/install.wim": os.urandom(3 * 1024 * 1024 + 17),
+        "sources/Ünïcode file name that is rather long.txt": "kitty 🐾".encode(),
+        "sources/en-us/setup.exe.mui": os.urandom(513),
+    }
+    for name, data in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    (root / "support" / "empty").mkdir(parents=True)
+    return files
+
+
+def test_roundtrip_through_udf(tmp_path):
+    staged = tmp_path / "staged"
+    files = _staged_tree(staged)
+    iso = tmp_path / "out.iso"
+
+    stats = write_iso(staged, iso, volume_id="CCCOMA_X64FRE")
+
+    assert stats["files"] == len(files)
+    assert iso.stat().st_size == stats["bytes"]
+    assert iso.stat().st_size % 2048 == 0
+    with IsoImage(iso) as image:
+        assert image.fs == "udf"
+        assert image.label == "CCCOMA_X64FRE"
+        seen = {path: entry for path, entry in image.walk()}
+        for name, data in files.items():
+            assert seen[name].size == len(data)
+            assert image.read_bytes(name) == data
+        assert seen["support/empty"].is_dir
+        assert image.listdir("support/empty") == []
+        assert image.exists("SOURCES/INSTALL.WIM")  # Case-insensitive, like Windows
+
+
+def test_iso9660_side_shares_the_data(tmp_path):
+    staged = tmp_path / "staged"
+    files = _staged_tree(staged)
+    iso = tmp_path / "out.iso"
+    write_iso(staged, iso)
+
+    with IsoImage(iso) as image:
+        image._dir_cache.clear()
+        image._open_iso9660()  # What a reader without UDF support sees
+        assert image.fs == "iso9660"
+        assert image.read_bytes("sources/install.wim") == files["sources/install.wim"]
+        assert image.read_bytes("setup.exe") == files["setup.exe"]
+
+
+def test_find_setup_on_written_image(tmp_path):
+    staged = tmp_path / "staged"
+    files = _staged_tree(staged)
+    iso = tmp_path / "out.iso"
+    write_iso(staged, iso)
+
+    info = find_setup(iso)
+
+    assert info["setup_exe"]
+    assert info["install_image"] == "sources/install.wim"
+    assert info["install_image_size"] == len(files["sources/install.wim"])
+
+
+def test_in_memory_files_and_stream_output(tmp_path):
+    tree = IsoTree()
+    tree.add_file("readme.txt", data=b"purr\n")
+    tree.add_file("deep/er/still/file.bin", data=bytes(range(256)) * 40)
+    dest = tmp_path / "mem.iso"
+
+    with open(dest, "wb") as f:  # A file object, as a pipe would be
+        IsoWriter(tree, timestamp=0).write(f)
+
+    with IsoImage(dest) as image:
+        assert image.read_bytes("readme.txt") == b"purr\n"
+        assert image.read_bytes("deep/er/still/file.bin") == bytes(range(256)) * 40
+
+
+def test_same_input_same_image(tmp_path):
+    staged = tmp_path / "staged"
+    _staged_tree(staged)
+    digests = []
+    for name in ("a.iso", "b.iso"):
+        tree = IsoTree()
+        tree.add_directory(staged)
+        IsoWriter(tree, timestamp=1_700_000_000).write(tmp_path / name)
+        digests.append(hashlib.sha256((tmp_path / name).read_bytes()).hexdigest())
+    assert digests[0] == digests[1]
+
+
+def test_bootable_image_has_el_torito(tmp_path):
+    staged = tmp_path / "staged"
+    _staged_tree(staged)
+    tree = IsoTree()
+    tree.add_directory(staged)
+    writer = IsoWriter(tree, boot_bios="boot/etfsboot.com", boot_uefi="efi/microsoft/boot/efisys.bin")
+    iso = tmp_path / "boot.iso"
+
+    writer.write(iso)
+
+    assert writer.bootable
+    with open(iso, "rb") as f:
+        f.seek(17 * 2048)
+        record = f.read(2048)
+    assert record[0] == 0 and record[1:6] == b"CD001"
+    assert record[7:30].rstrip(b"\0") == b"EL TORITO SPECIFICATION"
+
+
+def test_missing_boot_image_is_an_error(tmp_path):
+    tree = IsoTree()
+    tree.add_file("setup.exe", data=b"x")
+    with pytest.raises(RuntimeError):
+        IsoWriter(tree, boot_bios="boot/etfsboot.com")
+
+
+def test_cancelled_write_leaves_nothing(tmp_path):
+    staged = tmp_path / "staged"
+    _staged_tree(staged)
+    iso = tmp_path / "out.iso"
+
+    assert write_iso(staged, iso, cancelled=lambda: True) is None
+    assert not iso.exists()
+
+
+@pytest.mark.skipif(not shutil.which("isoinfo"), reason="isoinfo (genisoimage) not installed")
+def test_external_reader_lists_the_files(tmp_path):
+    staged = tmp_path / "staged"
+    _staged_tree(staged)
+    iso = tmp_path / "out.iso"
+    write_iso(staged, iso)
+
+    listing = subprocess.run(["isoinfo", "-f", "-i", str(iso)], capture_output=True, text=True, check=True).stdout
+
+    assert "/SOURCES/INSTALL.WIM" in listing.upper()
@@ -0,0 +1,31 @@
+from flamesnt import jobqueue
+from flamesnt.jobqueue import QUEUE_FILE, JobQueue, Scheduler
+
+
+def test_second_scheduler_leaves_running_jobs_alone(tmp_path):
+    queue = JobQueue(tmp_path / QUEUE_FILE)
+    owner = Scheduler(queue, max_jobs=0, workspace=tmp_path / "ws")  # Owns the queue but runs nothing
+    owner.start()
+    try:
+        job_id = queue.add({"build": "Sim", "edition": "Professional"})
+        queue.claim(job_id)  # As if the owner were running it
+
+        other = Scheduler(JobQueue(tmp_path / QUEUE_FILE), workspace=tmp_path / "ws")
+        try:
+            other.start()
+        except RuntimeError as e:
+            assert "already running" in str(e)
+        else:
+            raise AssertionError("a second scheduler started on a queue that has one")
+        assert queue.get(job_id)["status"] == "running"
+        assert jobqueue.main(["run", "--state", str(tmp_path)]) == 1
+        assert queue.get(job_id)["status"] == "running"
+    finally:
+        owner.stop()
+
+    successor = Scheduler(JobQueue(tmp_path / QUEUE_FILE), max_jobs=0, workspace=tmp_path / "ws")
+    successor.start()  # The owner is gone: its running job is queued again
+    try:
+        assert queue.get(job_id)["status"] == "queued"
+    finally:
+        successor.stop()
@@ -0,0 +1,230 @@
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from flamesnt.isowriter import IsoTree
+from flamesnt.mediawriter import (FAT32_MIN_CLUSTERS, MediaWriter, default_cluster_size, image_size_for,
+                                  parse_size, write_media)
+
+
+def _staged_tree(root):
+    files = {
+        "EFI/BOOT/BOOTX64.EFI": os.urandom(1_500_000),
+        "setup.exe": os.urandom(80_000),
+        "bootmgr.efi": os.urandom(4096),
+        "autorun.inf": b"",
+        "sources/install.swm": os.urandom(5 * 1024 * 1024 + 3),
+        "sources/install2.swm": bytes(2 * 1024 * 1024),  # All zeros: skipped on a sparse image
+        "sources/A long file name with spaces.txt": b"kitty",
+        "sources/lowercase.txt": b"purr",
+        "sources/Ünïcode.xml": "<x>🐾</x>".encode(),
+    }
+    for name, data in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return files
+
+
+def _lfn_checksum(short: bytes) -> int:
+    total = 0
+    for b in short:
+        total = (((total & 1) << 7) + (total >> 1) + b) & 0xFF
+    return total
+
+
+def _read_fat32(image):
+    """Minimal FAT32 reader: returns the volume facts and {path: bytes} of every file."""
+    with open(image, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as disk:
+        assert disk[510:512] == b"\x55\xaa"
+        status, part_type, lba, sectors = struct.unpack_from("<B3xB3xII", disk, 446)
+        base = lba * 512
+        boot = disk[base:base + 512]
+        assert boot[510:512] == b"\x55\xaa" and boot[82:90] == b"FAT32   "
+        assert disk[base + 6 * 512:base + 7 * 512] == boot  # Backup boot sector
+        bytes_per_sector, spc, reserved, fats = struct.unpack_from("<HBHB", boot, 11)
+        total, fat_sectors, _flags, _version, root_cluster = struct.unpack_from("<IIHHI", boot, 32)
+        fat_start = base + reserved * 512
+        fat = disk[fat_start:fat_start + fat_sectors * 512]
+        assert fat == disk[fat_start + fat_sectors * 512:fat_start + 2 * fat_sectors * 512]  # Both FATs agree
+        data_start = fat_start + fats * fat_sectors * 512
+        cluster_bytes = spc * bytes_per_sector
+
+        def chain(cluster):
+            while 2 <= cluster < 0x0FFFFFF8:
+                yield cluster
+                cluster = struct.unpack_from("<I", fat, 4 * cluster)[0] & 0x0FFFFFFF
+
+        def read(cluster, size=None):
+            data = b"".join(disk[data_start + (c - 2) * cluster_bytes:data_start + (c - 1) * cluster_bytes]
+                            for c in chain(cluster))
+            return data if size is None else data[:size]
+
+        files = {}
+
+        def walk(cluster, prefix):
+            raw, lfn, checksum = read(cluster), [], None
+            for i in range(0, len(raw), 32):
+                entry = raw[i:i + 32]
+                if entry[0] == 0:
+                    break
+                if entry[11] == 0x0F:
+                    if entry[0] & 0x40:
+                        lfn = []
+                    checksum = entry[13]
+                    lfn.insert(0, entry[1:11] + entry[14:26] + entry[28:32])
+                    continue
+                if entry[11] & 0x08:  # Volume label
+                    lfn = []
+                    continue
+                if lfn:
+                    assert _lfn_checksum(entry[:11]) == checksum
+                    name = b"".join(lfn).decode("utf-16-le").split("\0")[0]
+                else:
+                    stem, ext = entry[:8].decode().rstrip(), entry[8:11].decode().rstrip()
+                    name = f"{stem}.{ext}" if ext else stem
+                lfn = []
+                if name in (".", ".."):
+                    continue
+                first = struct.unpack_from("<H", entry, 20)[0] << 16 | struct.unpack_from("<H", entry, 26)[0]
+                size = struct.unpack_from("<I", entry, 28)[0]
+                path = f"{prefix}/{name}" if prefix else name
+                if entry[11] & 0x10:
+                    walk(first, path)
+                else:
+                    files[path] = read(first, size) if size else b""
+
+        walk(root_cluster, "")
+        volume = {"active": status == 0x80, "type": part_type, "start": base, "sectors": sectors,
+                  "total": total, "cluster_bytes": cluster_bytes, "label": boot[71:82].decode().rstrip(),
+                  "clusters": (total - reserved - fats * fat_sectors) // spc}
+        return volume, files
+
+
+def test_raw_image_roundtrip(tmp_path):
+    staged = tmp_path / "staged"
+    files = _staged_tree(staged)
+    image = tmp_path / "stick.img"
+
+    stats = write_media(staged, image, size="1G", label="cccoma_x64")
+
+    assert image.stat().st_size == parse_size("1G")
+    assert stats["verified_bytes"] > 0
+    volume, seen = _read_fat32(image)
+    assert volume["active"] and volume["type"] == 0x0C
+    assert volume["start"] == 1024 * 1024  # Partition aligned at 1 MiB
+    assert volume["label"] == "CCCOMA_X64"
+    assert volume["clusters"] >= FAT32_MIN_CLUSTERS
+    assert seen == files
+
+
+def test_image_is_sparse(tmp_path):
+    staged = tmp_path / "staged"
+    _staged_tree(staged)
+    image = tmp_path / "stick.img"
+
+    stats = write_media(staged, image, size="2G")
+
+    allocated = os.stat(image).st_blocks * 512
+    if allocated >= image.stat().st_size:
+        pytest.skip("this file system doesn't keep holes")
+    assert allocated < 64 * 1024 * 1024
+    assert stats["sparse_bytes"] >= 2 * 1024 * 1024  # At least the all-zero install2.swm
+    assert stats["allocated_bytes"] == stats["bytes"]
+
+
+def test_rewriting_an_image_clears_old_contents(tmp_path):
+    staged = tmp_path / "staged"
+    files = _staged_tree(staged)
+    image = tmp_path / "stick.img"
+    image.write_bytes(b"\xff" * (4 * 1024 * 1024))
+    with open(image, "r+b") as f:
+        f.truncate(parse_size("1G"))
+
+    write_media(staged, image)  # Keeps the old file's size
+
+    assert image.stat().st_size == parse_size("1G")
+    assert _read_fat32(image)[1] == files
+
+
+@pytest.fixture
+def loop_device(tmp_path):
+    """A loop device over a 300 MiB file, for the block-device path (root and losetup only)."""
+    if not shutil.which("losetup") or not hasattr(os, "geteuid") or os.geteuid() != 0:
+        pytest.skip("needs root and losetup")
+    backing = tmp_path / "loop.img"
+    with open(backing, "wb") as f:  # Old contents at both ends, as a used stick has (MBR, backup GPT)
+        f.write(b"\xff" * (4 * 1024 * 1024))
+        f.seek(299 * 1024 * 1024)
+        f.write(b"\xff" * (1024 * 1024))
+    attach = subprocess.run(["losetup", "-f", "--show", str(backing)], capture_output=True, text=True)
+    if attach.returncode:
+        pytest.skip(f"no loop device: {attach.stderr.strip()}")
+    device = attach.stdout.strip()
+    try:
+        yield device, backing
+    finally:
+        subprocess.run(["losetup", "-d", device], check=False)
+
+
+def test_block_device_roundtrip(tmp_path, loop_device):
+    device, backing = loop_device
+    staged = tmp_path / "staged"
+    files = _staged_tree(staged)
+
+    stats = write_media(staged, device)
+
+    assert stats["format"] == "raw"
+    assert stats["sparse_bytes"] == 0  # Zeros inside the layout are written; the old contents would show
+    subprocess.run(["losetup", "-d", device], check=False)
+    volume, seen = _read_fat32(backing)
+    assert volume["sectors"] * 512 + volume["start"] <= 300 * 1024 * 1024
+    assert seen == files
+    with open(backing, "rb") as f:
+        f.seek(-1024 * 1024, os.SEEK_END)
+        assert f.read() == bytes(1024 * 1024)  # A stale backup GPT would make firmware ignore the MBR
+
+
+def test_vhdx_target(tmp_path):
+    staged = tmp_path / "staged"
+    _staged_tree(staged)
+    disk = tmp_path / "install.vhdx"
+
+    stats = write_media(staged, disk, size="1G")
+
+    assert stats["format"] == "vhdx"
+    assert disk.read_bytes()[:8] == b"vhdxfile"
+    if shutil.which("qemu-img"):
+        subprocess.run(["qemu-img", "check", "-f", "vhdx", str(disk)], check=True, capture_output=True)
+
+
+def test_cancel_returns_none(tmp_path):
+    staged = tmp_path / "staged"
+    _staged_tree(staged)
+
+    assert write_media(staged, tmp_path / "stick.img", size="1G", cancelled=lambda: True) is None
+
+
+def test_file_over_4_gib_is_refused():
+    tree = IsoTree()
+    node = tree.add_file("sources/install.wim", data=b"")
+    node.size = 5 * 1024 ** 3
+    with pytest.raises(RuntimeError, match="Split it first"):
+        MediaWriter(tree)
+
+
+@pytest.mark.parametrize("text, expected", [("8G", 8 * 1024 ** 3), ("512MiB", 512 * 1024 ** 2), ("1.5k", 1536),
+                                            ("4096", 4096)])
+def test_parse_size(text, expected):
+    assert parse_size(text) == expected
+
+
+def test_sizes_for_new_images():
+    assert image_size_for(1024) == 8 * 1024 ** 3
+    assert image_size_for(9 * 1024 ** 3) % 1024 ** 3 == 0
+    for volume in (parse_size("300M"), parse_size("8G"), parse_size("64G")):
+        assert volume // default_cluster_size(volume) >= FAT32_MIN_CLUSTERS
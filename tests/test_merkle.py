@@ -0,0 +1,59 @@
+import os
+
+from flamesnt import merkle
+from flamesnt.merkle import MerkleIndex, file_source
+
+CHUNK = 4096
+
+
+def _pair(tmp_path, size: int):
+    data = os.urandom(size)
+    (tmp_path / "good.iso").write_bytes(data)
+    (tmp_path / "bad.iso").write_bytes(data)
+    return data, MerkleIndex.build(tmp_path / "good.iso", chunk_size=CHUNK)
+
+
+def test_ranges_merge_adjacent_chunks_up_to_the_limit(tmp_path):
+    _data, index = _pair(tmp_path, 10 * CHUNK + 100)
+
+    assert index.ranges([0, 1, 2, 5, 10]) == [(0, 3 * CHUNK), (5 * CHUNK, CHUNK), (10 * CHUNK, 100)]
+    assert index.ranges(range(6), limit=2 * CHUNK) == [(0, 2 * CHUNK), (2 * CHUNK, 2 * CHUNK), (4 * CHUNK, 2 * CHUNK)]
+    assert index.ranges([3], limit=1) == [(3 * CHUNK, CHUNK)]  # Never less than a chunk
+
+
+def test_repair_of_a_wholly_bad_file_reads_in_bounded_pieces(tmp_path, monkeypatch):
+    monkeypatch.setattr(merkle, "MAX_REPAIR_READ", 3 * CHUNK)
+    data, index = _pair(tmp_path, 20 * CHUNK + 7)
+    with open(tmp_path / "bad.iso", "ab") as f:
+        f.write(b"trailing junk")  # Wrong size: every chunk counts as bad
+    bad = index.verify(tmp_path / "bad.iso")
+    assert bad == list(range(index.chunks))
+
+    source = file_source(tmp_path / "good.iso")
+    asked = []
+
+    def recording(offset, length):
+        asked.append(length)
+        return source(offset, length)
+
+    assert index.repair(tmp_path / "bad.iso", bad, [recording]) == []
+    assert max(asked) <= 3 * CHUNK
+    assert sum(asked) == len(data)
+    assert (tmp_path / "bad.iso").read_bytes() == data
+    assert index.check(tmp_path / "bad.iso") == []
+
+
+def test_repair_skips_chunks_a_source_gets_wrong(tmp_path):
+    data, index = _pair(tmp_path, 8 * CHUNK)
+    with open(tmp_path / "bad.iso", "r+b") as f:
+        f.seek(2 * CHUNK + 10)
+        f.write(b"\0" * (2 * CHUNK))
+    bad = index.verify(tmp_path / "bad.iso")
+    assert bad == [2, 3, 4]
+
+    def liar(offset, length):
+        return b"\xff" * length
+
+    assert index.repair(tmp_path / "bad.iso", bad, [liar]) == [2, 3, 4]
+    assert index.repair(tmp_path / "bad.iso", bad, [liar, file_source(tmp_path / "good.iso")]) == []
+    assert (tmp_path / "bad.iso").read_bytes() == data
@@ -0,0 +1,154 @@
+import hashlib
+import os
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from flamesnt.merkle import MerkleIndex  # noqa: E402
+from flamesnt.payloads import PayloadStore  # noqa: E402
+from flamesnt.peercache import PeerCacheServer, PeerClient, artifact_source, load_peers, parse_range  # noqa: E402
+
+
+def _payload(tmp_path, name: str, size: int) -> tuple[bytes, str]:
+    data = os.urandom(size)
+    (tmp_path / name).write_bytes(data)
+    return data, hashlib.sha1(data).hexdigest()
+
+
+@pytest.fixture
+def servers(tmp_path):
+    """Two peer caches on ephemeral ports; the first lists the second on /peers."""
+    second = PeerCacheServer(PayloadStore(tmp_path / "store2"), "127.0.0.1", 0, iso_cache=tmp_path / "isos2")
+    first = PeerCacheServer(PayloadStore(tmp_path / "store1"), "127.0.0.1", 0, peers=[second.url])
+    for server in (first, second):
+        server.start()
+    yield first, second
+    for server in (first, second):
+        server.shutdown()
+        server.server_close()
+
+
+def test_locate_and_fetch(tmp_path, servers):
+    first, second = servers
+    data, sha1 = _payload(tmp_path, "a.esd", 3 * 1024 * 1024 + 5)
+    first.store.add(tmp_path / "a.esd", sha1)
+    _other, missing = _payload(tmp_path, "b.esd", 10)
+    client = PeerClient([first.url])
+    got = []
+
+    located = client.locate([sha1, missing.upper(), "not-a-sha1"])
+    dest = client.fetch(sha1, tmp_path / "a.out", on_bytes=got.append)
+
+    assert located == {sha1: [first.url]}
+    assert dest.read_bytes() == data
+    assert sum(got) == len(data)
+    assert client.stats == {"files": 1, "bytes": len(data), "rejected": 0}
+    assert client.fetch(missing, tmp_path / "b.out") is None
+
+
+def test_discovery_through_a_single_seed(tmp_path, servers):
+    first, second = servers
+    data, sha1 = _payload(tmp_path, "a.esd", 4096)
+    second.store.add(tmp_path / "a.esd", sha1)
+    client = PeerClient([first.url])
+
+    located = client.locate([sha1])
+
+    assert client.peers == [first.url, second.url]
+    assert located == {sha1: [second.url]}
+    assert client.fetch(sha1, tmp_path / "a.out").read_bytes() == data
+
+
+def test_bad_copy_is_rejected_and_next_peer_used(tmp_path, servers):
+    first, second = servers
+    data, sha1 = _payload(tmp_path, "a.esd", 100_000)
+    bad = first.store.path(sha1)
+    bad.parent.mkdir(parents=True)
+    bad.write_bytes(b"x" * len(data))  # Right name, wrong bytes
+    second.store.add(tmp_path / "a.esd", sha1)
+    client = PeerClient([first.url, second.url])
+    progress = []
+
+    client.locate([sha1])
+    dest = client.fetch(sha1, tmp_path / "a.out", on_bytes=progress.append)
+
+    assert dest.read_bytes() == data
+    assert client.stats["rejected"] == 1
+    assert sum(progress) == len(data)  # Bytes of the bad copy were taken back
+    assert not (tmp_path / "a.out.part").exists()
+
+
+def test_dead_peer_is_skipped(tmp_path, servers):
+    first, _second = servers
+    _data, sha1 = _payload(tmp_path, "a.esd", 10)
+    first.store.add(tmp_path / "a.esd", sha1)
+    client = PeerClient(["http://127.0.0.1:9", first.url])
+
+    assert client.locate([sha1]) == {sha1: [first.url]}
+    assert "http://127.0.0.1:9" in client.unreachable
+
+
+def test_range_requests(tmp_path, servers):
+    first, _second = servers
+    data, sha1 = _payload(tmp_path, "a.esd", 10_000)
+    first.store.add(tmp_path / "a.esd", sha1)
+    url = f"{first.url}/payloads/{sha1}"
+
+    part = requests.get(url, headers={"Range": "bytes=100-199"}, timeout=10)
+    tail = requests.get(url, headers={"Range": "bytes=-10"}, timeout=10)
+    head = requests.head(url, timeout=10)
+    bad = requests.get(url, headers={"Range": "bytes=20000-"}, timeout=10)
+
+    assert part.status_code == 206 and part.content == data[100:200]
+    assert part.headers["Content-Range"] == f"bytes 100-199/{len(data)}"
+    assert tail.content == data[-10:]
+    assert head.status_code == 200 and int(head.headers["Content-Length"]) == len(data) and not head.content
+    assert bad.status_code == 416
+    assert requests.get(f"{first.url}/payloads/../../etc/passwd", timeout=10).status_code == 404
+
+
+def test_cached_iso_ranges_repair_another_copy(tmp_path, servers):
+    _first, second = servers
+    key = "0123456789abcdef01234567"
+    data = os.urandom(3 * 1024 * 1024 + 77)
+    (tmp_path / "isos2").mkdir()
+    (tmp_path / "isos2" / f"{key}.iso").write_bytes(data)
+    damaged = tmp_path / "mine.iso"
+    damaged.write_bytes(data)
+    index = MerkleIndex.build(damaged, chunk_size=1024 * 1024)
+    with open(damaged, "r+b") as f:
+        f.seek(1024 * 1024 + 10)
+        f.write(b"rotten")
+
+    bad = index.verify(damaged)
+    still_bad = index.repair(damaged, bad, [artifact_source(second.url)(key, {})])
+
+    assert bad == [1] and still_bad == []
+    assert damaged.read_bytes() == data
+    assert index.dirty == {1}  # Read back from the disk on the next check
+    assert index.check(damaged) == []
+    assert artifact_source(second.url)("feedfacefeedfacefeedface", {})(0, 10) is None  # Not cached there
+    assert requests.get(f"{second.url}/artifacts/..%2f..%2fx", timeout=10).status_code == 404
+
+
+def test_load_peers(tmp_path):
+    peers_file = tmp_path / "peers.txt"
+    peers_file.write_text("# build boxes\nhttp://box1:8787/\nbox2:8787  # no scheme\n\nhttp://box1:8787\n")
+
+    assert load_peers(peers_file, ["http://seed:8787"]) == ["http://seed:8787", "http://box1:8787", "http://box2:8787"]
+    assert load_peers(tmp_path / "missing.txt") == []
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None), ("bytes=0-99", (0, 99)), ("bytes=900-", (900, 999)), ("bytes=-100", (900, 999)),
+    ("bytes=950-5000", (950, 999)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "items=0-1", "bytes=1000-", "bytes=5-2"])
+def test_parse_range_rejects(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
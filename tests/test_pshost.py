@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from flamesnt.pshost import ShellHost, fake_host_argv
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for name in ("a.iso", "b.iso"):
+        path = tmp_path / name
+        path.write_bytes(b"\0" * 2048)
+        paths.append(path)
+    return paths
+
+
+def _host(tmp_path, script=None, **kwargs):
+    script_file = None
+    if script:
+        script_file = tmp_path / "script.json"
+        script_file.write_text(json.dumps(script))
+    return ShellHost(fake_host_argv(script_file), **kwargs)
+
+
+def test_one_process_serves_every_request(tmp_path, images):
+    host = _host(tmp_path)
+    try:
+        pid = host.ping()["pid"]
+        assert host.mount(images[0]) == "Z"
+        assert host.mount(images[1]) == "Y"
+        assert host.query(images[0])["attached"]
+        assert host.ping()["pid"] == pid
+    finally:
+        host.close()
+    assert not host.alive
+    assert host.mounted == {}
+
+
+def test_dismount_drive_and_dismount_all(tmp_path, images):
+    host = _host(tmp_path)
+    try:
+        host.mount(images[0])
+        host.mount(images[1])
+        host.dismount_drive("Z:\\")
+        assert not host.query(images[0])["attached"]
+        assert host.dismount_all() == {}
+        assert not host.query(images[1])["attached"]
+        assert host.mounted == {}
+    finally:
+        host.close()
+
+
+def test_errors_become_runtime_errors(tmp_path):
+    host = _host(tmp_path)
+    try:
+        with pytest.raises(RuntimeError, match="cannot find the file"):
+            host.mount(tmp_path / "missing.iso")
+        assert host.mounted == {}
+        assert host.ping()  # The host survives a failed operation
+    finally:
+        host.close()
+
+
+def test_stray_output_is_skipped(tmp_path, images):
+    host = _host(tmp_path, {"mount": {"noise": "WARNING: something chatty"}})
+    try:
+        assert host.mount(images[0]) == "Z"
+    finally:
+        host.close()
+
+
+def test_scripted_failure(tmp_path, images):
+    host = _host(tmp_path, {"mount": {"fail": "Access is denied."}})
+    try:
+        with pytest.raises(RuntimeError, match="Access is denied"):
+            host.mount(images[0])
+    finally:
+        host.close()
+
+
+def test_slow_host_times_out_and_is_restarted(tmp_path, images):
+    host = _host(tmp_path, {"query": {"delay": 5}}, timeout=0.5)
+    try:
+        first = host.ping()["pid"]
+        with pytest.raises(RuntimeError, match="did not answer"):
+            host.query(images[0])
+        assert not host.alive
+        assert host.ping()["pid"] != first  # Started again on the next request
+    finally:
+        host.close()
+
+
+def test_dead_host_is_restarted(tmp_path):
+    host = _host(tmp_path)
+    try:
+        first = host.ping()["pid"]
+        host._proc.kill()
+        host._proc.wait()
+        assert not host.alive
+        assert host.ping()["pid"] != first  # The next request starts a new host
+    finally:
+        host.close()
+
+
+def test_mounts_survive_a_crash_in_the_state_file(tmp_path, images):
+    state = tmp_path / "mounted_images.json"
+    host = _host(tmp_path, state_file=state)
+    host.mount(images[0])
+    host._kill()  # Crash: nothing dismounted
+
+    again = _host(tmp_path, state_file=state)
+    try:
+        assert str(images[0].resolve()) in again.mounted
+        assert again.dismount_all() == {}
+        assert json.loads(state.read_text())["mounted"] == {}
+    finally:
+        again.close()
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from flamesnt.wiminfo import HEADER_SIZE, main, read_wim_info, write_synthetic_wim
+
+UUP_ESD = [
+    {"name": "Windows Setup Media", "edition_id": "Professional", "installation_type": "WindowsPE"},
+    {"name": "Microsoft Windows PE (x64)", "edition_id": "Professional", "installation_type": "WindowsPE"},
+    {"name": "Windows 11 Pro", "edition_id": "Professional", "build": 26100, "languages": ["en-US"],
+     "total_bytes": 18 * 1024**3, "file_count": 120_000, "dir_count": 30_000},
+]
+
+
+def test_header_and_images(tmp_path):
+    wim = write_synthetic_wim(tmp_path / "install.wim", [
+        {"name": "Windows 11 Home", "edition_id": "Core", "build": 22631, "total_bytes": 100},
+        {"name": "Windows 11 Pro", "edition_id": "Professional", "build": 22631, "arch": 12,
+         "languages": ["en-US", "de-DE"], "file_count": 7, "dir_count": 3},
+    ])
+
+    info = read_wim_info(wim)
+
+    assert info.image_count == 2
+    assert info.compression == "LZX"
+    assert not info.solid
+    assert info.resources["metadata"] == 2
+    home, pro = info.images
+    assert (home["index"], home["edition_id"], home["version"]) == (1, "Core", "10.0.22631.1")
+    assert home["arch"] == "x64" and home["total_bytes"] == 100
+    assert (pro["arch"], pro["languages"], pro["file_count"], pro["dir_count"]) == ("arm64", ["en-US", "de-DE"], 7, 3)
+
+
+def test_solid_esd(tmp_path):
+    esd = write_synthetic_wim(tmp_path / "professional.esd", UUP_ESD, compression="LZMS", solid=True)
+
+    info = read_wim_info(esd)
+
+    assert info.compression == "LZMS"
+    assert info.solid
+    assert info.chunk_size == 64 * 1024 * 1024
+
+
+def test_full_image_wins_over_setup_and_pe(tmp_path):
+    info = read_wim_info(write_synthetic_wim(tmp_path / "p.esd", UUP_ESD, compression="LZMS", solid=True))
+
+    assert info.find_edition("professional")["index"] == 3
+    assert info.install_image()["name"] == "Windows 11 Pro"
+    assert info.install_image("Enterprise") is None
+
+
+def test_only_header_and_xml_are_read(tmp_path):
+    wim = write_synthetic_wim(tmp_path / "install.wim", UUP_ESD)
+    with open(wim, "ab") as f:
+        f.truncate(4 * 1024**3)  # A big, sparse body full of "file data" nothing should touch
+
+    info = read_wim_info(wim)
+
+    assert [i["index"] for i in info.images] == [1, 2, 3]
+
+
+@pytest.mark.parametrize("data", [b"", b"not a wim at all" * 20, b"MSWIM\0\0\0" + b"\0" * 20])
+def test_not_a_wim(tmp_path, data):
+    path = tmp_path / "bad.wim"
+    path.write_bytes(data)
+    with pytest.raises(RuntimeError, match="not a WIM"):
+        read_wim_info(path)
+
+
+def test_bad_header_size(tmp_path):
+    wim = write_synthetic_wim(tmp_path / "install.wim", UUP_ESD[:1])
+    raw = bytearray(wim.read_bytes())
+    raw[8:12] = (HEADER_SIZE + 8).to_bytes(4, "little")
+    wim.write_bytes(raw)
+    with pytest.raises(RuntimeError, match="header size"):
+        read_wim_info(wim)
+
+
+def test_cli_json(tmp_path, capsys):
+    wim = write_synthetic_wim(tmp_path / "install.wim", UUP_ESD)
+
+    assert main([str(wim), "--json"]) == 0
+
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["image_count"] == 3
+    assert summary["images"][2]["version"] == "10.0.26100.1"